@@ -0,0 +1,72 @@
+"""
+Admin Endpoints
+Owner dashboard data served from precomputed rollups
+"""
+
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from app.models.schemas import AdminAnalyticsResponse, AdminUsageResponse, ErrorResponse
+from app.services.analytics_service import analytics_service
+from app.services.usage_meter import usage_meter
+from app.middleware.auth import require_admin
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get(
+    "/analytics",
+    response_model=AdminAnalyticsResponse,
+    summary="Admin Analytics",
+    description="Scan totals, failures, confidence, active users and tier counts with daily and hourly series",
+    responses={
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        403: {"model": ErrorResponse, "description": "Admin access required"},
+        503: {"model": ErrorResponse, "description": "Analytics are disabled"}
+    }
+)
+async def get_analytics(
+    days: int = Query(7, ge=1, le=90, description="Days of daily buckets"),
+    hours: int = Query(24, ge=1, le=336, description="Hours of hourly buckets"),
+    current_user: dict = Depends(require_admin)
+):
+    """Get dashboard analytics"""
+    if not analytics_service:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analytics are disabled"
+        )
+    # A few SQLite reads: off the event loop
+    return await asyncio.to_thread(analytics_service.summary, days=days, hours=hours)
+
+
+@router.get(
+    "/usage",
+    response_model=AdminUsageResponse,
+    response_model_exclude_none=True,
+    summary="Token Usage and Cost",
+    description="Model calls, tokens, image bytes and estimated cost by day, tier, document type, model and user",
+    responses={
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        403: {"model": ErrorResponse, "description": "Admin access required"},
+        503: {"model": ErrorResponse, "description": "Usage metering is disabled"}
+    }
+)
+async def get_usage(
+    days: int = Query(7, ge=1, le=400, description="Days of daily buckets"),
+    user_id: Optional[str] = Query(None, description="Restrict the report to one user"),
+    top: int = Query(20, ge=1, le=200, description="Number of top users by tokens"),
+    current_user: dict = Depends(require_admin)
+):
+    """Get token and cost accounting"""
+    if not usage_meter:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Usage metering is disabled"
+        )
+    # Flushes this worker's counters and aggregates in SQLite: off the event loop
+    return await asyncio.to_thread(usage_meter.summary, days=days, user_id=user_id, top=top)
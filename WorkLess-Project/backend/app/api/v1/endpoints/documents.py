@@ -3,20 +3,54 @@ Document Processing Endpoints
 Handles file uploads and document intelligence processing
 """
 
+import asyncio
+import json
+import math
 import os
 import uuid
 from pathlib import Path
-from typing import Optional
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, status, Request
-from fastapi.responses import FileResponse, JSONResponse
-from datetime import datetime
+from typing import Optional, Dict, Any, Awaitable
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, status, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from datetime import date, datetime, time, timedelta
 
-from app.models.schemas import DocumentProcessResponse, ErrorResponse
-from app.services.gemini_service import gemini_service
+from app.models.schemas import (
+    DocumentProcessResponse,
+    ErrorResponse,
+    ExportFormat,
+    ExtractionSearchResponse,
+    ProcessingStatus,
+    ScanHistoryResponse,
+)
+from app.services.analytics_service import analytics_service
+from app.services.extraction_index import extraction_index
+from app.services.export_service import MEDIA_TYPES, ExportUnavailable, ExtractionExport
+from app.services.admission import AdmissionRejected, AdmissionTicket, admission_controller
+from app.services.document_classifier import UnreadableDocumentError
+from app.services.drain import ServiceDraining, drain_coordinator
+from app.services.gemini_service import PreparedDocument, gemini_service
+from app.services.job_journal import JournaledJob, job_journal
+from app.services.request_recorder import current_recording, stage
+from app.services.result_cache import dump_result
+from app.services.resilience import UpstreamError, DeadlineExceededError
+from app.services.scan_history import (
+    InvalidCursorError,
+    decode_cursor,
+    encode_cursor,
+    project_columns,
+    scan_history_cache,
+)
 from app.services.supabase_service import supabase_service
+from app.services.upload_sessions import upload_sessions
+from app.services.usage_meter import usage_meter
+from app.services.webhooks import webhook_dispatcher
 from app.services.auth_service import AuthService
-from app.middleware.auth import get_current_user
+from app.middleware.auth import get_current_user, require_auth
 from app.core.config import settings
+from app.core.responses import model_response
+from app.core.workers import LAUNCH_TIME, HostSemaphore
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,6 +61,14 @@ router = APIRouter()
 UPLOAD_DIR = Path(settings.UPLOAD_DIR)
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Retry-After hint when the model upstream is degraded
+UPSTREAM_RETRY_AFTER_SECONDS = 30
+
+# Retry-After hint while the instance drains for a restart
+DRAIN_RETRY_AFTER_SECONDS = 5
+
 
 def validate_file(file: UploadFile) -> None:
     """Validate uploaded file"""
@@ -40,36 +82,532 @@ def validate_file(file: UploadFile) -> None:
     # File size will be checked when reading the file content
 
 
+def check_file_size(content: bytes, max_size: Optional[int] = None) -> None:
+    """Reject uploads above MAX_FILE_SIZE (or ``max_size``)"""
+    max_size = max_size or settings.MAX_FILE_SIZE
+    if len(content) > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File size exceeds maximum allowed size of {max_size / (1024*1024)}MB"
+        )
+
+
+async def prepare_upload(
+    file_content: bytes,
+    mime_type: str,
+    document_type: Optional[str],
+    max_size: Optional[int] = None
+) -> PreparedDocument:
+    """Decode and classify an upload, rejecting blank or unreadable ones before any model call"""
+    check_file_size(file_content, max_size)
+    try:
+        # Image decoding, PDF rendering and classification are CPU-bound: off the event loop
+        with stage("prepare"):
+            return await asyncio.to_thread(gemini_service.prepare_document, file_content, mime_type, document_type)
+    except UnreadableDocumentError as e:
+        logger.info(f"Rejected upload before inference: {e.reason}")
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+
+
+def new_upload_path(file_name: Optional[str]) -> tuple[Path, str]:
+    """
+    Pick a unique location in UPLOAD_DIR for an upload
+    Returns: (file_path, file_url)
+    """
+    file_ext = Path(file_name).suffix if file_name else ".bin"
+    unique_filename = f"{uuid.uuid4()}{file_ext}"
+    # In production, use cloud storage URL
+    return UPLOAD_DIR / unique_filename, f"/uploads/{unique_filename}"
+
+
 def save_uploaded_file(file: UploadFile, user_id: str) -> tuple[str, str]:
     """
     Save uploaded file to disk
     Returns: (file_path, file_url)
     """
-    # Generate unique filename
-    file_ext = Path(file.filename).suffix if file.filename else ".bin"
-    unique_filename = f"{uuid.uuid4()}{file_ext}"
-    file_path = UPLOAD_DIR / unique_filename
+    file_path, file_url = new_upload_path(file.filename)
     
-    # Read and save file
+    # Read and save file (rewind: the endpoint already consumed the stream)
+    file.file.seek(0)
     content = file.file.read()
-    
-    # Check file size
-    if len(content) > settings.MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File size exceeds maximum allowed size of {settings.MAX_FILE_SIZE / (1024*1024)}MB"
-        )
+    check_file_size(content)
     
     # Save file
     with open(file_path, "wb") as f:
         f.write(content)
     
-    # Generate URL (in production, use cloud storage URL)
-    file_url = f"/uploads/{unique_filename}"
-    
     return str(file_path), file_url
 
 
+def verify_user(current_user: Optional[dict], user_id: str) -> None:
+    """Verify user_id matches authenticated user (if JWT is present)"""
+    if current_user:
+        token_user_id = current_user.get("sub") or current_user.get("user_id")
+        if token_user_id and token_user_id != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="User ID mismatch"
+            )
+
+
+async def check_scan_limit(user_id: str) -> Optional[dict]:
+    """
+    Check scan limits (if Supabase is configured) and the tier's daily token budget
+    Returns: user metadata, if any
+    """
+    user_metadata = None
+    if supabase_service:
+        can_scan, user_metadata = await asyncio.to_thread(supabase_service.check_scan_limit, user_id)
+        if not can_scan:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Daily scan limit reached. Upgrade to Pro for unlimited scans."
+            )
+    # Reads the stored day total when this worker's cached one is stale
+    tier = admission_controller.resolve_tier(user_metadata)
+    if usage_meter and await asyncio.to_thread(usage_meter.over_budget, user_id, tier):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Daily token budget reached. Try again tomorrow or upgrade your plan."
+        )
+    return user_metadata
+
+
+def start_scan(
+    user_id: str,
+    file_name: Optional[str],
+    file_size: Optional[int],
+    user_metadata: Optional[dict] = None
+) -> Optional[dict]:
+    """Create scan record (if Supabase is configured)"""
+    if analytics_service:
+        tier = (user_metadata or {}).get("subscription_tier") or "basic"
+        analytics_service.record_scan_started(user_id, tier)
+    
+    scan_record = None
+    if supabase_service:
+        scan_record = supabase_service.create_scan_record(
+            user_id=user_id,
+            file_name=file_name,
+            file_size=file_size,
+            status="processing"
+        )
+        
+        if not scan_record:
+            logger.error(f"Failed to create scan record for user {user_id}")
+    return scan_record
+
+
+def complete_scan(
+    scan_record: Optional[dict],
+    user_id: str,
+    user_metadata: Optional[dict],
+    processing_result: dict
+) -> None:
+    """Mark scan completed and update user statistics (if Supabase is configured)"""
+    if analytics_service:
+        analytics_service.record_scan_completed(processing_result["confidence_score"])
+    
+    if not supabase_service:
+        return
+    
+    if scan_record:
+        supabase_service.update_scan_status(
+            scan_id=scan_record["id"],
+            status="completed",
+            metadata={
+                "confidence_score": processing_result["confidence_score"],
+                "fields_extracted": len(processing_result["refined_data"])
+            },
+            user_id=user_id
+        )
+    
+    today = datetime.utcnow().date().isoformat()
+    is_today = user_metadata and user_metadata.get("last_scan_date") == today
+    scans_today = (user_metadata.get("scans_today", 0) + 1) if is_today else 1
+    total_scans = (user_metadata.get("total_scans", 0) if user_metadata else 0) + 1
+    
+    supabase_service.update_user_scan_stats(
+        user_id=user_id,
+        scans_today=scans_today,
+        total_scans=total_scans,
+        last_scan_date=today
+    )
+
+
+def index_extraction(
+    scan_record: Optional[dict],
+    user_id: str,
+    file_name: Optional[str],
+    document_type: Optional[str],
+    processing_result: dict
+) -> None:
+    """Persist extracted fields in the searchable extraction index"""
+    if not extraction_index:
+        return
+    extraction_index.index_document(
+        user_id=user_id,
+        fields=processing_result["refined_data"],
+        scan_id=scan_record["id"] if scan_record else None,
+        file_name=file_name,
+        document_type=processing_result.get("document_type") or document_type,
+        model=processing_result.get("model"),
+        confidence_score=processing_result["confidence_score"]
+    )
+
+
+def fail_scan(scan_record: Optional[dict]) -> None:
+    """Mark scan failed (if Supabase is configured)"""
+    if analytics_service:
+        analytics_service.record_scan_failed()
+    
+    if supabase_service and scan_record:
+        supabase_service.update_scan_status(
+            scan_id=scan_record["id"],
+            status="failed",
+            user_id=scan_record.get("user_id")
+        )
+
+
+class ProcessingJob:
+    """One document extraction: the upload, its scan and what recording the result needs"""
+    
+    __slots__ = (
+        "job_id", "user_id", "user_metadata", "scan_record", "file_name", "file_path",
+        "mime_type", "document_type", "file_content", "prepared", "session_id"
+    )
+    
+    def __init__(
+        self,
+        user_id: str,
+        user_metadata: Optional[dict],
+        scan_record: Optional[dict],
+        file_name: Optional[str],
+        file_path: str,
+        mime_type: str,
+        document_type: Optional[str],
+        file_content: Optional[bytes] = None,
+        prepared: Optional[PreparedDocument] = None,
+        job_id: Optional[str] = None,
+        session_id: Optional[str] = None
+    ):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.user_metadata = user_metadata
+        self.scan_record = scan_record
+        self.file_name = file_name
+        self.file_path = file_path
+        self.mime_type = mime_type
+        self.document_type = document_type
+        self.file_content = file_content
+        self.prepared = prepared
+        # Upload session completed by this job, if it came through one
+        self.session_id = session_id
+    
+    @classmethod
+    def from_journal(cls, entry: JournaledJob) -> "ProcessingJob":
+        """Rebuild an interrupted job from its journal entry"""
+        scan_record = {"id": entry.scan_id, "user_id": entry.user_id} if entry.scan_id else None
+        return cls(
+            user_id=entry.user_id,
+            user_metadata=entry.user_metadata,
+            scan_record=scan_record,
+            file_name=entry.file_name,
+            file_path=entry.file_path,
+            mime_type=entry.mime_type,
+            document_type=entry.document_type,
+            job_id=entry.job_id,
+            session_id=entry.session_id
+        )
+    
+    def journal(self) -> None:
+        """Record the job durably before the model is called"""
+        if job_journal:
+            self.job_id = job_journal.start(
+                user_id=self.user_id,
+                file_path=self.file_path,
+                file_name=self.file_name,
+                mime_type=self.mime_type,
+                document_type=self.document_type,
+                scan_id=self.scan_record["id"] if self.scan_record else None,
+                user_metadata=self.user_metadata,
+                session_id=self.session_id
+            )
+    
+    def checkpoint(self, processing_result: dict) -> None:
+        """Keep the model result until it has been recorded"""
+        if job_journal and self.job_id:
+            job_journal.checkpoint(self.job_id, processing_result)
+    
+    def finish(self) -> None:
+        """Drop the job from the journal"""
+        if job_journal and self.job_id:
+            job_journal.finish(self.job_id)
+
+
+def record_result(job: ProcessingJob, processing_result: dict) -> None:
+    """Complete the scan, index the fields, queue the callback and close the job"""
+    complete_scan(job.scan_record, job.user_id, job.user_metadata, processing_result)
+    index_extraction(job.scan_record, job.user_id, job.file_name, job.document_type, processing_result)
+    if webhook_dispatcher:
+        file_url = webhook_dispatcher.file_url(f"/uploads/{Path(job.file_path).name}")
+        webhook_dispatcher.enqueue(
+            job.user_id,
+            ProcessingStatus.COMPLETED,
+            scan_id=job.scan_record["id"] if job.scan_record else None,
+            data=document_response(file_url, processing_result)
+        )
+    if job.session_id and upload_sessions:
+        upload_sessions.settle(job.session_id, dump_result(processing_result))
+    job.finish()
+
+
+def abandon_job(job: ProcessingJob) -> None:
+    """Fail the scan of a job that won't be finished, queue the callback and close it"""
+    fail_scan(job.scan_record)
+    if webhook_dispatcher:
+        webhook_dispatcher.enqueue(
+            job.user_id,
+            ProcessingStatus.FAILED,
+            scan_id=job.scan_record["id"] if job.scan_record else None
+        )
+    if job.session_id and upload_sessions:
+        upload_sessions.settle(job.session_id, None)
+    job.finish()
+
+
+def checkpoint_and_record(job: ProcessingJob, processing_result: dict) -> None:
+    """
+    Checkpoint a model result and record it; if that fails the job stays
+    journaled and is recorded on the next start, never abandoned
+    """
+    try:
+        job.checkpoint(processing_result)
+        record_result(job, processing_result)
+    except Exception as e:
+        logger.error(f"Recording result of job {job.job_id} failed, left for replay: {e}")
+
+
+async def run_job(job: ProcessingJob) -> Dict[str, Any]:
+    """
+    Call the model for a job and record the outcome
+    
+    Runs as its own task (see drain_coordinator.run), so it completes even
+    if the request that started it is cancelled.
+    """
+    try:
+        if job.file_content is None:
+            job.file_content = await asyncio.to_thread(Path(job.file_path).read_bytes)
+        with stage("extract"):
+            processing_result = await gemini_service.process_document(
+                file_content=job.file_content,
+                mime_type=job.mime_type,
+                user_id=job.user_id,
+                document_type=job.document_type,
+                prepared=job.prepared,
+                subscription_tier=admission_controller.resolve_tier(job.user_metadata)
+            )
+    except Exception:
+        await asyncio.to_thread(abandon_job, job)
+        raise
+    with stage("record"):
+        await asyncio.to_thread(checkpoint_and_record, job, processing_result)
+    return processing_result
+
+
+async def resume_interrupted_jobs() -> None:
+    """
+    Finish the jobs the previous process left in the journal, then fail
+    scans stuck in processing that no job will ever complete and release
+    the upload sessions it held
+    
+    Jobs whose model result was checkpointed are only recorded; the others
+    are processed again from their saved upload, one at a time. With several
+    workers, one of them does this for the jobs of the previous generation.
+    """
+    lock = HostSemaphore("recovery", 1) if settings.SHARED_STATE_ENABLED else None
+    if lock and lock.try_acquire() is None:
+        return
+    try:
+        if job_journal:
+            await _replay_journal()
+        await asyncio.to_thread(reconcile_stale_scans)
+        await asyncio.to_thread(release_lost_uploads)
+    finally:
+        if lock:
+            lock.close()
+
+
+async def _replay_journal() -> None:
+    # Only jobs from before this generation of workers was launched: later
+    # ones belong to live workers
+    for entry in job_journal.pending(created_before=LAUNCH_TIME):
+        if drain_coordinator.draining:
+            return
+        job = ProcessingJob.from_journal(entry)
+        if entry.result is not None:
+            logger.info(f"Recording checkpointed result of interrupted job {job.job_id}")
+            await asyncio.to_thread(_record_checkpointed, job, entry)
+            continue
+        if not Path(entry.file_path).is_file():
+            logger.warning(f"Giving up on interrupted job {job.job_id}: upload is gone")
+            await asyncio.to_thread(abandon_job, job)
+            continue
+        if entry.attempts >= job_journal.max_attempts:
+            logger.warning(f"Giving up on interrupted job {job.job_id} after {entry.attempts} replays")
+            await asyncio.to_thread(abandon_job, job)
+            continue
+        logger.info(f"Replaying interrupted job {job.job_id}")
+        job_journal.record_attempt(job.job_id)
+        try:
+            await asyncio.shield(drain_coordinator.run(run_job(job)))
+        except Exception as e:
+            logger.warning(f"Replay of job {job.job_id} failed: {e}")
+
+
+def _record_checkpointed(job: ProcessingJob, entry: JournaledJob) -> None:
+    """
+    Record a checkpointed result, keeping it journaled for the next start if
+    that fails; after max_attempts starts the scan is failed instead
+    """
+    try:
+        record_result(job, entry.result)
+        return
+    except Exception as e:
+        logger.error(f"Recording checkpointed result of job {job.job_id} failed: {e}")
+    if entry.attempts + 1 < job_journal.max_attempts:
+        job_journal.record_attempt(job.job_id)
+        return
+    logger.warning(f"Giving up on interrupted job {job.job_id} after {entry.attempts + 1} recording attempts")
+    try:
+        abandon_job(job)
+    except Exception as e:
+        logger.error(f"Abandoning job {job.job_id} failed: {e}")
+
+
+def reconcile_stale_scans() -> int:
+    """Fail scans left in processing by a lost process; returns how many"""
+    if not supabase_service:
+        return 0
+    cutoff = (datetime.utcnow() - timedelta(seconds=settings.STALE_SCAN_SECONDS)).isoformat()
+    journaled = job_journal.scan_ids() if job_journal else set()
+    stale = [
+        scan for scan in supabase_service.list_scans_by_status("processing", cutoff)
+        if scan["id"] not in journaled
+    ]
+    for scan in stale:
+        fail_scan(scan)
+        if webhook_dispatcher and scan.get("user_id"):
+            webhook_dispatcher.enqueue(scan["user_id"], ProcessingStatus.FAILED, scan_id=scan["id"])
+    if stale:
+        logger.warning(f"Marked {len(stale)} stale processing scan(s) as failed")
+    return len(stale)
+
+
+def release_lost_uploads() -> int:
+    """Reopen upload sessions a lost process left in processing with no journaled job; returns how many"""
+    if not upload_sessions:
+        return 0
+    journaled = job_journal.session_ids() if job_journal else set()
+    return upload_sessions.recover(LAUNCH_TIME, journaled)
+
+
+async def admit_request(user_metadata: Optional[dict]) -> AdmissionTicket:
+    """Wait for a processing slot by subscription tier, or shed the request"""
+    try:
+        drain_coordinator.check_accepting()
+    except ServiceDraining:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The service is restarting. Please retry shortly.",
+            headers={"Retry-After": str(DRAIN_RETRY_AFTER_SECONDS)}
+        )
+    tier = admission_controller.resolve_tier(user_metadata)
+    recording = current_recording()
+    if recording:
+        recording.note(tier=tier)
+    try:
+        with stage("admission"):
+            return await admission_controller.acquire(tier)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The service is busy. Please retry shortly.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+
+def upstream_http_error(error: UpstreamError) -> HTTPException:
+    """Map an upstream model failure to a retryable HTTP error"""
+    if isinstance(error, DeadlineExceededError):
+        status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    else:
+        status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return HTTPException(
+        status_code=status_code,
+        detail="The document AI service is temporarily unavailable. Please retry shortly.",
+        headers={"Retry-After": str(UPSTREAM_RETRY_AFTER_SECONDS)}
+    )
+
+
+def build_response(request: Request, file_url: str, processing_result: dict) -> DocumentProcessResponse:
+    """Build the document processing response"""
+    # In production, file_url should be a full URL (e.g., from cloud storage)
+    return document_response(str(request.base_url).rstrip("/") + file_url, processing_result)
+
+
+def document_response(full_file_url: str, processing_result: dict) -> DocumentProcessResponse:
+    """The document processing response for a result, outside of a request"""
+    # Fields and changes were validated when the model output was parsed
+    return DocumentProcessResponse.model_construct(
+        original_image_url=full_file_url,
+        refined_data=processing_result["refined_data"],
+        ai_explanation=processing_result["ai_explanation"],
+        formatting_changes=processing_result["formatting_changes"],
+        confidence_score=processing_result["confidence_score"],
+        processing_time=processing_result.get("processing_time")
+    )
+
+
+async def run_admitted_job(
+    request: Request,
+    job: ProcessingJob,
+    ticket: AdmissionTicket,
+    file_url: str,
+    work: Optional[Awaitable[Dict[str, Any]]] = None
+) -> DocumentProcessResponse:
+    """
+    Process a journaled job with Gemini and build the response
+    
+    The job (``run_job(job)`` unless ``work`` wraps it) outlives the request
+    if it is cancelled, and holds the admission slot until it finishes.
+    """
+    task = drain_coordinator.run(work or run_job(job))
+    task.add_done_callback(lambda _: ticket.release())
+    try:
+        processing_result = await asyncio.shield(task)
+        response = build_response(request, file_url, processing_result)
+        
+        logger.info(
+            f"Document processed successfully for user {job.user_id}. "
+            f"Fields extracted: {len(processing_result['refined_data'])}"
+        )
+        
+        return response
+        
+    except UpstreamError as e:
+        raise upstream_http_error(e)
+    except Exception as e:
+        logger.error(f"Error processing document: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Document processing failed: {str(e)}"
+        )
+
+
 @router.post(
     "/process-document",
     response_model=DocumentProcessResponse,
@@ -80,14 +618,21 @@ def save_uploaded_file(file: UploadFile, user_id: str) -> tuple[str, str]:
         200: {"description": "Document processed successfully"},
         400: {"model": ErrorResponse, "description": "Invalid file or request"},
         401: {"model": ErrorResponse, "description": "Unauthorized"},
+        422: {"model": ErrorResponse, "description": "Blank or unreadable document"},
         429: {"model": ErrorResponse, "description": "Rate limit exceeded"},
-        500: {"model": ErrorResponse, "description": "Internal server error"}
+        500: {"model": ErrorResponse, "description": "Internal server error"},
+        503: {"model": ErrorResponse, "description": "Document AI service unavailable or busy (request shed)"},
+        504: {"model": ErrorResponse, "description": "Document AI service timed out"}
     }
 )
 async def process_document(
     request: Request,
     file: UploadFile = File(..., description="Document file (JPG, PNG, or PDF)"),
     user_id: str = Form(..., description="User ID from authentication"),
+    document_type: Optional[str] = Form(
+        None,
+        description="Optional document type hint (receipt, invoice, id, form); overrides the local classifier"
+    ),
     current_user: Optional[dict] = Depends(get_current_user)
 ):
     """
@@ -100,123 +645,363 @@ async def process_document(
     try:
         # Validate file
         validate_file(file)
+        verify_user(current_user, user_id)
+        user_metadata = await check_scan_limit(user_id)
+        ticket = await admit_request(user_metadata)
         
-        # Verify user_id matches authenticated user (if JWT is present)
-        if current_user:
-            token_user_id = current_user.get("sub") or current_user.get("user_id")
-            if token_user_id and token_user_id != user_id:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="User ID mismatch"
-                )
-        
-        # Check scan limits (if Supabase is configured)
-        user_metadata = None
-        can_scan = True
-        if supabase_service:
-            can_scan, user_metadata = supabase_service.check_scan_limit(user_id)
-            if not can_scan:
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail="Daily scan limit reached. Upgrade to Pro for unlimited scans."
-                )
-        
-        # Create scan record (if Supabase is configured)
-        scan_record = None
-        if supabase_service:
-            scan_record = supabase_service.create_scan_record(
+        try:
+            # Read file content
+            file.file.seek(0)  # Reset file pointer
+            file_content = await file.read()
+            
+            # Blank or unreadable uploads are rejected before a scan is counted
+            document = await prepare_upload(file_content, file.content_type, document_type)
+            scan_record = await asyncio.to_thread(start_scan, user_id, file.filename, file.size, user_metadata)
+            
+            # Save file to disk
+            file_path, file_url = save_uploaded_file(file, user_id)
+            
+            job = ProcessingJob(
                 user_id=user_id,
+                user_metadata=user_metadata,
+                scan_record=scan_record,
                 file_name=file.filename,
-                file_size=file.size,
-                status="processing"
+                file_path=file_path,
+                mime_type=file.content_type,
+                document_type=document_type,
+                file_content=file_content,
+                prepared=document
             )
-            
-            if not scan_record:
-                logger.error(f"Failed to create scan record for user {user_id}")
+            await asyncio.to_thread(job.journal)
+        except BaseException:
+            ticket.release()
+            raise
         
-        # Read file content
+        return model_response(await run_admitted_job(request, job, ticket, file_url))
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error in process_document: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred while processing your document"
+        )
+
+
+@router.post(
+    "/process-document/stream",
+    status_code=status.HTTP_200_OK,
+    summary="Process Document with AI (streamed)",
+    description=(
+        "Upload and process a document, streaming each extracted field as "
+        "newline-delimited JSON as soon as the model produces it"
+    ),
+    responses={
+        200: {
+            "description": "NDJSON stream of field events followed by a result event",
+            "content": {NDJSON_MEDIA_TYPE: {}}
+        },
+        400: {"model": ErrorResponse, "description": "Invalid file or request"},
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        422: {"model": ErrorResponse, "description": "Blank or unreadable document"},
+        429: {"model": ErrorResponse, "description": "Rate limit exceeded"},
+        503: {"model": ErrorResponse, "description": "Service busy; request shed by admission control"}
+    }
+)
+async def process_document_stream(
+    request: Request,
+    file: UploadFile = File(..., description="Document file (JPG, PNG, or PDF)"),
+    user_id: str = Form(..., description="User ID from authentication"),
+    document_type: Optional[str] = Form(
+        None,
+        description="Optional document type hint (receipt, invoice, id, form); overrides the local classifier"
+    ),
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """
+    Process a document and stream results as NDJSON
+    
+    Each line is one JSON event:
+    - `{"type": "field", "data": {...}}` as soon as a field is extracted
+    - `{"type": "result", "data": {...}}` once, with the full response
+    - `{"type": "error", "message": "..."}` if processing fails mid-stream
+    """
+    # Validation and limits fail fast with a regular HTTP error
+    validate_file(file)
+    verify_user(current_user, user_id)
+    user_metadata = await check_scan_limit(user_id)
+    # The slot is held until the stream finishes
+    ticket = await admit_request(user_metadata)
+    
+    try:
         file.file.seek(0)  # Reset file pointer
         file_content = await file.read()
-        
-        # Save file to disk
+        document = await prepare_upload(file_content, file.content_type, document_type)
+        scan_record = await asyncio.to_thread(start_scan, user_id, file.filename, file.size, user_metadata)
         file_path, file_url = save_uploaded_file(file, user_id)
-        
-        # Process document with Gemini
+        job = ProcessingJob(
+            user_id=user_id,
+            user_metadata=user_metadata,
+            scan_record=scan_record,
+            file_name=file.filename,
+            file_path=file_path,
+            mime_type=file.content_type,
+            document_type=document_type
+        )
+        await asyncio.to_thread(job.journal)
+    except BaseException:
+        ticket.release()
+        raise
+    
+    async def event_stream():
+        # Once the model result is in, the job is recorded or left for replay, never abandoned
+        has_result = False
         try:
-            processing_result = await gemini_service.process_document(
+            async for event in gemini_service.stream_document(
                 file_content=file_content,
                 mime_type=file.content_type,
-                user_id=user_id
-            )
-            
-            # Update scan record to completed (if Supabase is configured)
-            if supabase_service and scan_record:
-                supabase_service.update_scan_status(
-                    scan_id=scan_record["id"],
-                    status="completed",
-                    metadata={
-                        "confidence_score": processing_result["confidence_score"],
-                        "fields_extracted": len(processing_result["refined_data"])
-                    }
-                )
-            
-            # Update user statistics (if Supabase is configured)
-            if supabase_service:
-                today = datetime.utcnow().date().isoformat()
-                is_today = user_metadata and user_metadata.get("last_scan_date") == today
-                scans_today = (user_metadata.get("scans_today", 0) + 1) if is_today else 1
-                total_scans = (user_metadata.get("total_scans", 0) if user_metadata else 0) + 1
-                
-                supabase_service.update_user_scan_stats(
-                    user_id=user_id,
-                    scans_today=scans_today,
-                    total_scans=total_scans,
-                    last_scan_date=today
-                )
-            
-            # Build response
-            # In production, file_url should be a full URL (e.g., from cloud storage)
-            base_url = request.base_url
-            full_file_url = str(base_url).rstrip("/") + file_url
-            
-            response = DocumentProcessResponse(
-                original_image_url=full_file_url,
-                refined_data=processing_result["refined_data"],
-                ai_explanation=processing_result["ai_explanation"],
-                formatting_changes=processing_result["formatting_changes"],
-                confidence_score=processing_result["confidence_score"],
-                processing_time=processing_result.get("processing_time")
-            )
-            
-            logger.info(
-                f"Document processed successfully for user {user_id}. "
-                f"Fields extracted: {len(processing_result['refined_data'])}"
-            )
-            
-            return response
-            
+                user_id=user_id,
+                document_type=document_type,
+                prepared=document,
+                subscription_tier=admission_controller.resolve_tier(user_metadata)
+            ):
+                if event["type"] == "field":
+                    yield _ndjson_event("field", event["data"])
+                else:
+                    processing_result = event["data"]
+                    has_result = True
+                    await asyncio.to_thread(checkpoint_and_record, job, processing_result)
+                    response = build_response(request, file_url, processing_result)
+                    yield _ndjson_event("result", response)
+                    
+                    logger.info(
+                        f"Document streamed successfully for user {user_id}. "
+                        f"Fields extracted: {len(processing_result['refined_data'])}"
+                    )
+        except UpstreamError as e:
+            if not has_result:
+                await asyncio.to_thread(abandon_job, job)
+            yield _ndjson_line({"type": "error", "message": str(e), "retryable": True})
+        except (GeneratorExit, asyncio.CancelledError):
+            # A stream can't outlive its connection: when the instance is
+            # draining the journaled job is replayed on the next startup,
+            # otherwise the client went away
+            if not has_result and not drain_coordinator.draining:
+                # Not awaited: the stream is being torn down
+                asyncio.get_running_loop().run_in_executor(None, abandon_job, job)
+            raise
         except Exception as e:
-            # Update scan record to failed (if Supabase is configured)
-            if supabase_service and scan_record:
-                supabase_service.update_scan_status(
-                    scan_id=scan_record["id"],
-                    status="failed"
-                )
-            
-            logger.error(f"Error processing document: {e}", exc_info=True)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Document processing failed: {str(e)}"
-            )
+            if not has_result:
+                await asyncio.to_thread(abandon_job, job)
+            logger.error(f"Error streaming document: {e}", exc_info=True)
+            yield _ndjson_line({
+                "type": "error",
+                "message": f"Document processing failed: {str(e)}",
+                "retryable": False
+            })
+        finally:
+            ticket.release()
     
-    except HTTPException:
-        raise
+    return StreamingResponse(
+        event_stream(),
+        media_type=NDJSON_MEDIA_TYPE,
+        # Stop reverse proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the slot if the stream never started
+        background=BackgroundTask(ticket.release)
+    )
+
+
+def _ndjson_line(payload: dict) -> bytes:
+    """Serialize one NDJSON event"""
+    return (json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def _ndjson_event(event_type: str, model: BaseModel) -> bytes:
+    """Serialize one NDJSON event carrying a model, without an intermediate dict"""
+    return b'{"type":"' + event_type.encode("ascii") + b'","data":' + model.model_dump_json().encode("utf-8") + b"}\n"
+
+
+@router.get(
+    "/scans",
+    response_model=ScanHistoryResponse,
+    summary="List Scan History",
+    description="The authenticated user's scans, newest first, with cursor pagination and field projection",
+    responses={
+        400: {"model": ErrorResponse, "description": "Invalid cursor or fields"},
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        503: {"model": ErrorResponse, "description": "Database not configured"}
+    }
+)
+async def list_scans(
+    limit: int = Query(
+        settings.SCAN_HISTORY_DEFAULT_LIMIT,
+        ge=1,
+        le=settings.SCAN_HISTORY_MAX_LIMIT,
+        description="Page size"
+    ),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(
+        None,
+        description="Comma-separated fields to return (id and created_at are always included)"
+    ),
+    status_filter: Optional[ProcessingStatus] = Query(None, alias="status", description="Only scans in this status"),
+    current_user: dict = Depends(require_auth)
+):
+    """
+    List scan history
+    
+    Pages are keyed on (created_at, id), so deep pages cost the same as the
+    first one. The first page is cached per user until one of their scans
+    is written.
+    """
+    if not supabase_service:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Scan history is unavailable: database not configured"
+        )
+    
+    user_id = current_user.get("sub") or current_user.get("user_id")
+    try:
+        columns = project_columns(fields)
+        key = decode_cursor(cursor) if cursor else None
+    except (InvalidCursorError, ValueError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    status_value = status_filter.value if status_filter else None
+    cache_key = (tuple(columns), status_value, limit)
+    if key is None:
+        cached = scan_history_cache.get(user_id, cache_key)
+        if cached is not None:
+            return cached
+    
+    try:
+        # One extra row tells whether another page follows
+        rows = await asyncio.to_thread(
+            supabase_service.list_scans, user_id, columns, limit + 1, cursor=key, status=status_value
+        )
     except Exception as e:
-        logger.error(f"Unexpected error in process_document: {e}", exc_info=True)
+        logger.error(f"Error listing scans for user {user_id}: {e}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An unexpected error occurred while processing your document"
+            detail="Failed to load scan history"
         )
+    
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    page = {
+        "items": items,
+        "next_cursor": encode_cursor(items[-1]) if has_more else None,
+        "has_more": has_more
+    }
+    if key is None:
+        scan_history_cache.put(user_id, cache_key, page)
+    return page
+
+
+@router.get(
+    "/search",
+    response_model=ExtractionSearchResponse,
+    summary="Search Past Extractions",
+    description="Search the authenticated user's extracted fields by field name and value",
+    responses={
+        400: {"model": ErrorResponse, "description": "Missing query"},
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        503: {"model": ErrorResponse, "description": "Extraction index disabled"}
+    }
+)
+async def search_extractions(
+    q: Optional[str] = Query(None, description="Words to find in field values (prefix match)"),
+    field: Optional[str] = Query(None, description="Only fields with this name, e.g. Vendor"),
+    date_from: Optional[date] = Query(None, alias="from", description="First day (UTC, inclusive)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Last day (UTC, inclusive)"),
+    limit: int = Query(50, ge=1, le=settings.EXTRACTION_SEARCH_MAX_LIMIT),
+    current_user: dict = Depends(require_auth)
+):
+    """
+    Search past extractions
+    
+    Example: every invoice from vendor ACME last quarter is
+    `?field=Vendor&q=acme&from=2026-07-01&to=2026-09-30`.
+    """
+    if not extraction_index:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Extraction search is disabled"
+        )
+    if not q and not field:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide q, field, or both"
+        )
+    
+    user_id = current_user.get("sub") or current_user.get("user_id")
+    results = await asyncio.to_thread(
+        extraction_index.search,
+        user_id,
+        q=q,
+        field=field,
+        date_from=datetime.combine(date_from, time.min) if date_from else None,
+        date_to=datetime.combine(date_to + timedelta(days=1), time.min) if date_to else None,
+        limit=limit
+    )
+    return {"results": results, "count": len(results)}
+
+
+@router.get(
+    "/export",
+    summary="Export Extractions",
+    description="Stream the authenticated user's extractions as CSV, JSON Lines or Parquet",
+    response_class=StreamingResponse,
+    responses={
+        200: {"content": {media_type: {} for media_type in MEDIA_TYPES.values()}},
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        501: {"model": ErrorResponse, "description": "Format not supported on this server"},
+        503: {"model": ErrorResponse, "description": "Extraction index disabled"}
+    }
+)
+async def export_extractions(
+    date_from: Optional[date] = Query(None, alias="from", description="First day (UTC, inclusive)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Last day (UTC, inclusive)"),
+    export_format: ExportFormat = Query(ExportFormat.CSV, alias="format", description="csv, jsonl or parquet"),
+    current_user: dict = Depends(require_auth)
+):
+    """
+    Export extractions
+    
+    One row per document, oldest first: scan_id, created_at, file_name,
+    document_type, model and confidence_score, then one column per field
+    name found in the range. The body is streamed chunk by chunk, so memory
+    stays constant however large the export is.
+    """
+    if not extraction_index:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Extraction export is disabled"
+        )
+    
+    user_id = current_user.get("sub") or current_user.get("user_id")
+    # Resolving the field columns queries the index
+    export = await asyncio.to_thread(
+        ExtractionExport,
+        extraction_index,
+        user_id,
+        date_from=datetime.combine(date_from, time.min) if date_from else None,
+        date_to=datetime.combine(date_to + timedelta(days=1), time.min) if date_to else None,
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+    try:
+        body = export.stream(export_format.value)
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    
+    filename = f"extractions-{datetime.utcnow().strftime('%Y%m%d')}.{export_format.value}"
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[export_format.value],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 
 @router.get(
@@ -0,0 +1,53 @@
+"""
+Metrics Endpoints
+Operational metrics for admission control, model routing, usage and upstream health
+"""
+
+from fastapi import APIRouter
+
+from app.core.http import http_transport
+from app.services.admission import admission_controller
+from app.services.document_classifier import document_classifier
+from app.services.local_ocr import local_text_extractor
+from app.services.drain import drain_coordinator
+from app.services.gemini_service import gemini_service
+from app.services.job_journal import job_journal
+from app.services.model_router import routing_recorder
+from app.services.prompt_registry import prompt_registry
+from app.services.request_recorder import request_recorder
+from app.services.result_cache import result_cache
+from app.services.scan_history import scan_history_cache
+from app.services.usage_meter import usage_meter
+from app.services.webhooks import webhook_dispatcher
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get(
+    "",
+    summary="Service Metrics",
+    description="Queue depths, wait times, routing, prompt versions, caches, token usage, upstream circuit state and outbound connection pool utilization"
+)
+async def get_metrics():
+    """Get a snapshot of service metrics"""
+    return {
+        "admission": admission_controller.snapshot(),
+        "routing": routing_recorder.summary(),
+        "classifier": document_classifier.snapshot(),
+        "local_ocr": local_text_extractor.snapshot() if local_text_extractor else None,
+        "upstream": gemini_service.resilience_snapshot(),
+        "http_pool": http_transport.snapshot(),
+        "prompts": prompt_registry.snapshot(),
+        "result_cache": result_cache.snapshot(),
+        "scan_history_cache": scan_history_cache.snapshot(),
+        "usage": usage_meter.snapshot() if usage_meter else None,
+        "recorder": request_recorder.snapshot() if request_recorder else None,
+        "webhooks": webhook_dispatcher.snapshot() if webhook_dispatcher else None,
+        "jobs": {
+            **drain_coordinator.snapshot(),
+            "journal": job_journal.snapshot() if job_journal else None
+        }
+    }
@@ -0,0 +1,285 @@
+"""
+Resumable Upload Endpoints
+Chunked upload sessions for large documents and flaky connections; a
+completed session is processed like a single-request upload
+"""
+
+import asyncio
+from pathlib import Path
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Path as PathParam, Request, status
+
+from app.models.schemas import (
+    ChunkUploadResponse,
+    DocumentProcessResponse,
+    ErrorResponse,
+    UploadSessionCreate,
+    UploadSessionResponse,
+)
+from app.api.v1.endpoints.documents import (
+    ProcessingJob,
+    admit_request,
+    build_response,
+    check_scan_limit,
+    new_upload_path,
+    prepare_upload,
+    run_admitted_job,
+    run_job,
+    start_scan,
+    verify_user,
+)
+from app.services.result_cache import dump_result, load_result
+from app.services.upload_sessions import (
+    COMPLETED,
+    FAILED,
+    OPEN,
+    PROCESSING,
+    UploadSession,
+    UploadSessionError,
+    upload_sessions,
+)
+from app.middleware.auth import get_current_user
+from app.core.config import settings
+from app.core.responses import model_response
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Retry-After hint while a completed session is still being processed
+PROCESSING_RETRY_AFTER_SECONDS = 5
+
+
+def session_http_error(error: UploadSessionError) -> HTTPException:
+    """Map an upload session error to its HTTP error"""
+    return HTTPException(status_code=error.status_code, detail=str(error))
+
+
+def load_session(session_id: str, current_user: Optional[dict]) -> UploadSession:
+    """Fetch a session owned by the authenticated user (if JWT is present)"""
+    if not upload_sessions:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Resumable uploads are disabled"
+        )
+    try:
+        session = upload_sessions.get(session_id)
+    except UploadSessionError as e:
+        raise session_http_error(e)
+    verify_user(current_user, session.user_id)
+    return session
+
+
+def session_file_url(session: UploadSession) -> str:
+    """Public URL of a session's assembled file"""
+    return f"/uploads/{Path(session.file_path).name}"
+
+
+async def run_session_job(session: UploadSession, job: ProcessingJob) -> dict:
+    """
+    Process the job and keep its result on the session, for retried completes
+
+    Recording the result settles the session as well (so a job replayed
+    after a restart does too); completing it here again covers a recording
+    that failed and was left for replay.
+    """
+    try:
+        processing_result = await run_job(job)
+    except BaseException:
+        upload_sessions.release(session, FAILED)
+        raise
+    await asyncio.to_thread(upload_sessions.complete, session, dump_result(processing_result))
+    return processing_result
+
+
+@router.post(
+    "",
+    response_model=UploadSessionResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Create Upload Session",
+    description=(
+        "Open a resumable upload for a file of up to UPLOAD_SESSION_MAX_FILE_SIZE bytes; "
+        "upload its chunks with PUT, then complete the session to process the document"
+    ),
+    responses={
+        400: {"model": ErrorResponse, "description": "Invalid file type"},
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        413: {"model": ErrorResponse, "description": "File too large"},
+        429: {"model": ErrorResponse, "description": "Too many open sessions or scan limit reached"},
+        503: {"model": ErrorResponse, "description": "Resumable uploads are disabled"}
+    }
+)
+async def create_upload_session(
+    body: UploadSessionCreate,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """Create a resumable upload session"""
+    if not upload_sessions:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Resumable uploads are disabled"
+        )
+    if body.mime_type not in settings.ALLOWED_FILE_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid file type. Allowed types: {', '.join(settings.ALLOWED_FILE_TYPES)}"
+        )
+    verify_user(current_user, body.user_id)
+    # Fail before the client spends its bandwidth
+    await check_scan_limit(body.user_id)
+    try:
+        session = upload_sessions.create(
+            user_id=body.user_id,
+            file_name=body.file_name,
+            mime_type=body.mime_type,
+            size=body.size,
+            chunk_size=body.chunk_size,
+            sha256=body.sha256,
+            document_type=body.document_type
+        )
+    except UploadSessionError as e:
+        raise session_http_error(e)
+    return upload_sessions.describe(session)
+
+
+@router.get(
+    "/{session_id}",
+    response_model=UploadSessionResponse,
+    summary="Get Upload Session",
+    description="Session state, including the offsets of chunks still missing (to resume an upload)",
+    responses={
+        403: {"model": ErrorResponse, "description": "Session belongs to another user"},
+        404: {"model": ErrorResponse, "description": "Session not found or expired"}
+    }
+)
+async def get_upload_session(
+    session_id: str,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """Get the state of an upload session"""
+    return upload_sessions.describe(load_session(session_id, current_user))
+
+
+@router.put(
+    "/{session_id}/chunks/{offset}",
+    response_model=ChunkUploadResponse,
+    summary="Upload Chunk",
+    description=(
+        "Upload the chunk starting at a byte offset as the raw request body, with its hex "
+        "SHA-256 in X-Chunk-SHA256. Re-sending a received chunk succeeds without re-reading it."
+    ),
+    responses={
+        400: {"model": ErrorResponse, "description": "Misaligned offset or wrong chunk length"},
+        404: {"model": ErrorResponse, "description": "Session not found or expired"},
+        409: {"model": ErrorResponse, "description": "Session not open, or a different chunk was received here"},
+        413: {"model": ErrorResponse, "description": "Chunk longer than expected"},
+        422: {"model": ErrorResponse, "description": "Chunk SHA-256 mismatch"}
+    }
+)
+async def upload_chunk(
+    request: Request,
+    session_id: str,
+    offset: int = PathParam(..., ge=0, description="Byte offset of the chunk"),
+    chunk_sha256: str = Header(..., alias="X-Chunk-SHA256", description="Hex SHA-256 of the chunk"),
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """Upload one chunk of a session"""
+    session = load_session(session_id, current_user)
+    try:
+        stored = await upload_sessions.write_chunk(session, offset, chunk_sha256, request.stream())
+    except UploadSessionError as e:
+        raise session_http_error(e)
+    return {
+        "offset": offset,
+        "length": session.chunk_length(offset),
+        "duplicate": not stored,
+        "chunks_remaining": len(upload_sessions.missing_offsets(session)),
+    }
+
+
+@router.post(
+    "/{session_id}/complete",
+    response_model=DocumentProcessResponse,
+    summary="Complete Upload Session",
+    description=(
+        "Assemble the uploaded chunks and process the document. Retrying a completed "
+        "session returns the same result without processing it again."
+    ),
+    responses={
+        404: {"model": ErrorResponse, "description": "Session not found or expired"},
+        409: {"model": ErrorResponse, "description": "Chunks missing or the session is being processed"},
+        422: {"model": ErrorResponse, "description": "File SHA-256 mismatch, or blank or unreadable document"},
+        429: {"model": ErrorResponse, "description": "Scan limit reached"},
+        503: {"model": ErrorResponse, "description": "Document AI service unavailable or busy (request shed)"}
+    }
+)
+async def complete_upload_session(
+    request: Request,
+    session_id: str,
+    current_user: Optional[dict] = Depends(get_current_user)
+):
+    """Process the document uploaded through a session"""
+    session = load_session(session_id, current_user)
+    if session.status == COMPLETED:
+        return model_response(build_response(request, session_file_url(session), load_result(session.response)))
+    if session.status == PROCESSING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The upload is being processed",
+            headers={"Retry-After": str(PROCESSING_RETRY_AFTER_SECONDS)}
+        )
+    if session.status == OPEN:
+        missing = upload_sessions.missing_offsets(session)
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"{len(missing)} chunk(s) missing, first at offset {missing[0]}"
+            )
+
+    user_metadata = await check_scan_limit(session.user_id)
+    ticket = await admit_request(user_metadata)
+    try:
+        if not upload_sessions.claim(session):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The upload is being processed",
+                headers={"Retry-After": str(PROCESSING_RETRY_AFTER_SECONDS)}
+            )
+        try:
+            file_content = await asyncio.to_thread(upload_sessions.assemble, session)
+            # Blank or unreadable uploads are rejected before a scan is counted
+            document = await prepare_upload(
+                file_content, session.mime_type, session.document_type, settings.UPLOAD_SESSION_MAX_FILE_SIZE
+            )
+            upload_sessions.promote(session, new_upload_path(session.file_name)[0])
+            scan_record = await asyncio.to_thread(
+                start_scan, session.user_id, session.file_name, session.size, user_metadata
+            )
+            job = ProcessingJob(
+                user_id=session.user_id,
+                user_metadata=user_metadata,
+                scan_record=scan_record,
+                file_name=session.file_name,
+                file_path=session.file_path,
+                mime_type=session.mime_type,
+                document_type=session.document_type,
+                file_content=file_content,
+                prepared=document,
+                session_id=session.session_id
+            )
+            await asyncio.to_thread(job.journal)
+        except UploadSessionError as e:
+            # assemble reopened the session for a new upload
+            raise session_http_error(e)
+        except BaseException:
+            upload_sessions.release(session, FAILED if session.file_path else OPEN)
+            raise
+    except BaseException:
+        ticket.release()
+        raise
+
+    response = await run_admitted_job(
+        request, job, ticket, session_file_url(session), work=run_session_job(session, job)
+    )
+    return model_response(response)
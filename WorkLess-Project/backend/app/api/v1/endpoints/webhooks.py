@@ -0,0 +1,126 @@
+"""
+Webhook Endpoints
+Register a callback URL that receives a signed POST when one of the user's
+scans is completed or failed, instead of holding a connection or polling
+"""
+
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+
+from app.models.schemas import ErrorResponse, WebhookRegistration, WebhookResponse
+from app.services.webhooks import Webhook, WebhookDispatcher, WebhookError, webhook_dispatcher
+from app.middleware.auth import require_auth
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def get_dispatcher() -> WebhookDispatcher:
+    """The webhook dispatcher, or 503 when webhooks are disabled"""
+    if not webhook_dispatcher:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Webhooks are disabled"
+        )
+    return webhook_dispatcher
+
+
+def authenticated_user_id(current_user: dict) -> str:
+    """User ID from the JWT"""
+    return current_user.get("sub") or current_user.get("user_id")
+
+
+def webhook_response(dispatcher: WebhookDispatcher, webhook: Webhook, secret: bool = False) -> WebhookResponse:
+    """A registration with its delivery state (and its secret, when just issued)"""
+    return WebhookResponse(
+        url=webhook.url,
+        events=webhook.events,
+        secret=webhook.secret if secret else None,
+        created_at=webhook.created_at,
+        updated_at=webhook.updated_at,
+        **dispatcher.delivery_state(webhook.user_id)
+    )
+
+
+@router.put(
+    "",
+    response_model=WebhookResponse,
+    summary="Register Webhook",
+    description=(
+        "Set the URL called back when one of your scans is completed or failed. The signing "
+        "secret is returned on first registration and when rotated; keep it to verify callbacks."
+    ),
+    responses={
+        400: {"model": ErrorResponse, "description": "URL not https or not publicly reachable"},
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        503: {"model": ErrorResponse, "description": "Webhooks disabled"}
+    }
+)
+async def register_webhook(
+    registration: WebhookRegistration,
+    current_user: dict = Depends(require_auth)
+):
+    """
+    Register or update the user's webhook
+
+    Each callback is a POST of a WebhookEvent (the DocumentProcessResponse
+    under `data` for completed scans) with headers X-WorkLess-Event,
+    X-WorkLess-Delivery and X-WorkLess-Signature (`t=<unix time>,v1=<hex
+    HMAC-SHA256 of "<t>.<body>">`). Failed deliveries are retried with
+    backoff, so the same delivery ID can arrive more than once.
+    """
+    dispatcher = get_dispatcher()
+    user_id = authenticated_user_id(current_user)
+    try:
+        webhook, issued = await asyncio.to_thread(
+            dispatcher.register,
+            user_id,
+            registration.url,
+            [event.value for event in registration.events],
+            registration.rotate_secret
+        )
+    except WebhookError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    logger.info(f"Webhook registered for user {user_id}")
+    return await asyncio.to_thread(webhook_response, dispatcher, webhook, secret=issued)
+
+
+@router.get(
+    "",
+    response_model=WebhookResponse,
+    summary="Get Webhook",
+    description="The registered webhook (without its secret) and its pending and failed deliveries",
+    responses={
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        404: {"model": ErrorResponse, "description": "No webhook registered"},
+        503: {"model": ErrorResponse, "description": "Webhooks disabled"}
+    }
+)
+async def get_webhook(current_user: dict = Depends(require_auth)):
+    """Get the user's webhook"""
+    dispatcher = get_dispatcher()
+    webhook = await asyncio.to_thread(dispatcher.get, authenticated_user_id(current_user))
+    if not webhook:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No webhook registered")
+    return await asyncio.to_thread(webhook_response, dispatcher, webhook)
+
+
+@router.delete(
+    "",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Delete Webhook",
+    description="Stop callbacks; queued deliveries are dropped",
+    responses={
+        401: {"model": ErrorResponse, "description": "Unauthorized"},
+        404: {"model": ErrorResponse, "description": "No webhook registered"},
+        503: {"model": ErrorResponse, "description": "Webhooks disabled"}
+    }
+)
+async def delete_webhook(current_user: dict = Depends(require_auth)):
+    """Delete the user's webhook"""
+    dispatcher = get_dispatcher()
+    if not await asyncio.to_thread(dispatcher.delete, authenticated_user_id(current_user)):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No webhook registered")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -4,7 +4,7 @@ Main router that includes all v1 endpoints
 """
 
 from fastapi import APIRouter
-from app.api.v1.endpoints import documents
+from app.api.v1.endpoints import admin, documents, metrics, uploads, webhooks
 
 api_router = APIRouter()
 
@@ -14,3 +14,27 @@ api_router.include_router(
     prefix="/documents",
     tags=["documents"]
 )
+
+api_router.include_router(
+    uploads.router,
+    prefix="/documents/upload-sessions",
+    tags=["uploads"]
+)
+
+api_router.include_router(
+    webhooks.router,
+    prefix="/webhooks",
+    tags=["webhooks"]
+)
+
+api_router.include_router(
+    metrics.router,
+    prefix="/metrics",
+    tags=["metrics"]
+)
+
+api_router.include_router(
+    admin.router,
+    prefix="/admin",
+    tags=["admin"]
+)
@@ -5,7 +5,7 @@ Environment-based configuration management
 
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 from functools import lru_cache
 import os
 
@@ -70,21 +70,183 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     SUPABASE_SERVICE_ROLE_KEY: Optional[str] = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
     
+    # Outbound HTTP (one keep-alive connection pool shared by every outbound client)
+    HTTP_POOL_MAX_CONNECTIONS: int = 20  # Open connections across all hosts
+    HTTP_POOL_MAX_KEEPALIVE: int = 10  # Idle connections kept open for reuse
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0  # Idle connections are closed after this; keep above HEALTH_PROBE_INTERVAL_SECONDS
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_READ_TIMEOUT_SECONDS: float = 30.0
+    HTTP_WRITE_TIMEOUT_SECONDS: float = 30.0
+    HTTP_POOL_TIMEOUT_SECONDS: float = 5.0  # Wait for a free connection when the pool is full
+    HTTP_CONNECT_RETRIES: int = 1  # Retries of failed connection attempts (requests themselves are never re-sent)
+    HTTP2_ENABLED: bool = True  # Needs the optional h2 package; HTTP/1.1 without it
+    
     # Gemini 1.5 Pro Configuration
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     GEMINI_MODEL: str = "gemini-1.5-pro"
     
+    # Model Routing (fast model first, escalate to GEMINI_MODEL when needed)
+    MODEL_ROUTING_ENABLED: bool = True
+    GEMINI_FAST_MODEL: str = "gemini-1.5-flash"
+    ROUTING_MIN_OVERALL_CONFIDENCE: float = 80.0  # Escalate below this overall confidence
+    ROUTING_MIN_FIELD_CONFIDENCE: float = 60.0  # Escalate if any field is below this
+    ROUTING_PRO_DOCUMENT_TYPES: List[str] = ["id", "form"]  # Always use the pro model
+    ROUTING_LOG_PATH: Optional[str] = os.getenv("ROUTING_LOG_PATH")  # JSONL decision log
+    
+    # Gemini Resilience
+    GEMINI_DEADLINE_SECONDS: float = 60.0  # Per-request deadline, across retries
+    GEMINI_ATTEMPT_TIMEOUT_SECONDS: float = 30.0  # Per-attempt timeout
+    GEMINI_MAX_RETRIES: int = 2  # Retries for retryable (429/5xx/timeout) errors
+    GEMINI_RETRY_BASE_DELAY: float = 0.5  # Seconds; full-jitter exponential backoff
+    GEMINI_RETRY_MAX_DELAY: float = 8.0
+    GEMINI_HEDGE_ENABLED: bool = False  # Send a duplicate call after the p95 latency
+    GEMINI_CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failures to open the circuit
+    GEMINI_CIRCUIT_RECOVERY_SECONDS: float = 30.0  # Open time before a probe call
+    
+    # Document Classifier (local pre-inference stage)
+    CLASSIFIER_ENABLED: bool = True  # Label uploads to pick prompt and routing tier
+    CLASSIFIER_REJECT_BLANK: bool = True  # Reject blank/unreadable uploads before the model call
+    
+    # Page Tiling (crop margins, split large pages into overlapping tiles read concurrently)
+    TILING_ENABLED: bool = True
+    ROI_CROP_ENABLED: bool = True  # Cut page margins before sending the image
+    TILE_MAX_SIDE: int = 1536  # Longest tile side in pixels; smaller pages are sent whole
+    TILE_OVERLAP: float = 0.12  # Share of a tile's side shared with its neighbours
+    TILING_MAX_TILES: int = 6  # Pages needing more tiles are scaled down to fit
+    TILING_MIN_EDGE_DENSITY: float = 0.25  # Only pages this densely printed are tiled; others are sent whole
+    TILING_MAX_CONCURRENCY: int = 4  # Concurrent tile calls per document
+    
+    # Local OCR (CPU-only text extraction before the model call; optional pypdf / pytesseract)
+    LOCAL_OCR_ENABLED: bool = True
+    OCR_ENGINE: str = "tesseract"  # Registered engine or "package.module:Class"; "none" reads PDF text layers only
+    OCR_LANGUAGES: str = "eng"
+    OCR_PROCESS_WORKERS: int = 1  # Extraction processes per server worker; 0 runs it in a thread
+    OCR_TIMEOUT_SECONDS: float = 20.0  # A timed-out extraction has its pool processes killed
+    OCR_TEXT_ONLY_ENABLED: bool = True  # Send the extracted text instead of the image when it suffices
+    OCR_TEXT_ONLY_MIN_CHARS: int = 80
+    OCR_TEXT_ONLY_MIN_CONFIDENCE: float = 85.0  # Mean OCR word confidence (0-100)
+    OCR_MAX_TEXT_CHARS: int = 20000  # Longer text (or more PDF pages) is never sent text-only
+    OCR_MAX_PDF_PAGES: int = 20
+    
+    # Prompts (versioned per document type) and extraction result cache
+    PROMPT_VERSIONS: Dict[str, str] = {}  # Active version per type, e.g. {"invoice": "v2-compact"}
+    PROMPT_EXPERIMENTS: Dict[str, Dict[str, float]] = {}  # Share of users per variant, e.g. {"invoice": {"v2-compact": 0.5}}
+    RESULT_CACHE_MAX_ENTRIES: int = 512  # Results of identical uploads; 0 disables
+    RESULT_CACHE_TTL_SECONDS: float = 3600.0
+    
+    # Field Normalization (local post-processing of extracted values)
+    NORMALIZATION_ENABLED: bool = True
+    NORMALIZATION_DAY_FIRST: bool = False  # Read ambiguous 01/02/2026 as 1 Feb instead of 2 Jan
+    
+    # Admission Control (priority scheduling of model calls by subscription tier)
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENCY: int = 16  # Documents processed at once
+    ADMISSION_TIER_PRIORITY: List[str] = ["pro", "basic"]  # Highest priority first
+    ADMISSION_TIER_SHARES: Dict[str, float] = {"pro": 1.0, "basic": 0.5}  # Max share of slots
+    ADMISSION_QUEUE_TIMEOUTS: Dict[str, float] = {"pro": 30.0, "basic": 10.0}  # Max queue wait
+    ADMISSION_MAX_QUEUE_DEPTH: Dict[str, int] = {"pro": 200, "basic": 50}
+    ADMISSION_DEFAULT_TIER: str = "basic"  # Anonymous users and unknown tiers
+    
+    # Multi-Worker Mode (`python main.py`; workers share limits and caches through DATA_DIR)
+    WORKERS: int = 1  # Worker processes; 0 = one per available CPU
+    SHARED_STATE_ENABLED: bool = False  # Set by the launcher when it starts more than one worker
+    HOST_INFERENCE_CONCURRENCY: int = 0  # Documents processed at once by all workers; 0 = ADMISSION_MAX_CONCURRENCY
+    
+    # Response Compression (gzip for JSON/CSV bodies above the minimum size)
+    GZIP_ENABLED: bool = True
+    GZIP_MINIMUM_SIZE: int = 1024  # Bytes
+    GZIP_COMPRESS_LEVEL: int = 5  # 1 (fastest) - 9 (smallest)
+    
     # File Upload Settings
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_FILE_TYPES: List[str] = ["image/jpeg", "image/png", "application/pdf"]
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
     
+    # Resumable Uploads (chunked sessions staged in DATA_DIR/upload_sessions)
+    UPLOAD_SESSIONS_ENABLED: bool = True
+    UPLOAD_SESSION_MAX_FILE_SIZE: int = 50 * 1024 * 1024  # 50MB; single-request uploads keep MAX_FILE_SIZE
+    UPLOAD_SESSION_CHUNK_SIZE: int = 2 * 1024 * 1024  # Default chunk size; clients may ask for 64KB up to the max
+    UPLOAD_SESSION_MAX_CHUNK_SIZE: int = 8 * 1024 * 1024
+    UPLOAD_SESSION_TTL_SECONDS: int = 24 * 3600  # Unfinished sessions and their staged files are deleted after this
+    
     # Logging
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     
+    # Scan History API
+    SCAN_HISTORY_DEFAULT_LIMIT: int = 20
+    SCAN_HISTORY_MAX_LIMIT: int = 100
+    SCAN_HISTORY_CACHE_TTL_SECONDS: float = 30.0  # First-page cache; 0 disables
+    
+    # Local data directory (SQLite stores owned by the backend)
+    DATA_DIR: str = os.getenv("DATA_DIR", "./data")
+    
+    # Admin Analytics (rollups maintained from scan status transitions)
+    ANALYTICS_ENABLED: bool = True
+    ANALYTICS_HOURLY_RETENTION_DAYS: int = 14
+    ANALYTICS_ACTIVE_USER_RETENTION_DAYS: int = 90
+    
+    # Extraction Index (searchable store of extracted fields)
+    EXTRACTION_INDEX_ENABLED: bool = True
+    EXTRACTION_SEARCH_MAX_LIMIT: int = 200
+    EXPORT_CHUNK_SIZE: int = 500  # Documents read and flushed per export chunk
+    
     # Database (if using additional database beyond Supabase)
     DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
     
+    # Startup Warm-up (slower boot, no first-request penalty for SDK/client/decoder setup)
+    WARMUP_ENABLED: bool = False
+    
+    # Graceful Shutdown (in-flight jobs are drained, the rest replayed from DATA_DIR/jobs.db)
+    DRAIN_TIMEOUT_SECONDS: float = 10.0  # Added to uvicorn's --timeout-graceful-shutdown; keep the sum under the host's kill delay
+    JOB_JOURNAL_ENABLED: bool = True
+    JOB_REPLAY_MAX_ATTEMPTS: int = 3  # Startups that may retry an interrupted job
+    STALE_SCAN_SECONDS: int = 900  # Processing scans older than this with no job are failed
+    
+    # Usage Metering (tokens, image bytes and estimated cost per user, tier and day)
+    USAGE_METERING_ENABLED: bool = True
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 30.0  # In-memory totals are written to DATA_DIR/usage.db this often
+    USAGE_RETENTION_DAYS: int = 400
+    TOKEN_DAILY_BUDGETS: Dict[str, int] = {}  # Tokens per user per UTC day by tier, e.g. {"basic": 200000}; missing or 0 = unlimited
+    
+    # Health Probes (/ready and /health/deep serve results cached by a background task)
+    HEALTH_PROBE_INTERVAL_SECONDS: float = 15.0  # Model, database and disk probes
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = 5.0
+    HEALTH_LOOP_LAG_INTERVAL_SECONDS: float = 0.5  # Event loop lag sampling period
+    HEALTH_MIN_FREE_DISK_MB: int = 500  # Free space required in UPLOAD_DIR
+    READY_REQUIRED_PROBES: List[str] = ["model", "database", "disk"]  # Probes whose failure makes /ready fail
+    READY_MAX_LOOP_LAG_MS: float = 250.0  # Worst recent loop lag before /ready fails
+    READY_MAX_QUEUE_PRESSURE: float = 0.8  # Fullest admission queue, as a fraction of its max depth
+    
+    # Request Recorder (sampled, sanitized request records for benchmarks/replay_traffic.py)
+    RECORDER_ENABLED: bool = False
+    RECORDER_SAMPLE_RATE: float = 0.01  # Share of requests on RECORDER_ROUTES that are recorded
+    RECORDER_ROUTES: List[str] = ["/v1/documents/process-document", "/v1/documents/process-document/stream"]
+    RECORDER_LOG_PATH: str = ""  # Defaults to DATA_DIR/requests.wrlog
+    RECORDER_BATCH_SIZE: int = 50  # Records buffered per compressed log frame
+    RECORDER_MAX_LOG_MB: int = 256  # The log is rotated to <path>.1 past this size
+    
+    # Webhooks (signed callbacks when a scan completes or fails, queued in DATA_DIR/webhooks.db)
+    WEBHOOKS_ENABLED: bool = True
+    WEBHOOK_PUBLIC_BASE_URL: str = ""  # Prefix for original_image_url in callbacks (e.g. https://api.example.com)
+    WEBHOOK_TIMEOUT_SECONDS: float = 10.0  # Per delivery attempt
+    WEBHOOK_MAX_ATTEMPTS: int = 8  # Then the delivery is marked dead
+    WEBHOOK_RETRY_BASE_SECONDS: float = 10.0  # Backoff doubles per failed attempt, with jitter
+    WEBHOOK_RETRY_MAX_SECONDS: float = 3600.0
+    WEBHOOK_MAX_CONCURRENCY: int = 8  # Deliveries in flight per worker
+    WEBHOOK_POLL_INTERVAL_SECONDS: float = 5.0  # Outbox check when idle (retries, other workers' deliveries)
+    WEBHOOK_DEAD_RETENTION_DAYS: int = 7  # Dead deliveries are kept this long for the status endpoint
+    WEBHOOK_ALLOW_INSECURE_URLS: bool = False  # Accept http:// and loopback/private addresses (local development)
+    
+    # Backends ("fake"/"memory" run fully in-process, for benchmarks and local dev)
+    MODEL_BACKEND: str = os.getenv("MODEL_BACKEND", "gemini")  # gemini | fake
+    DATABASE_BACKEND: str = os.getenv("DATABASE_BACKEND", "supabase")  # supabase | memory | none
+    FAKE_MODEL_LATENCY_MS: float = 1200.0  # Median pro-model latency (lognormal)
+    FAKE_MODEL_LATENCY_SIGMA: float = 0.35  # Lognormal shape; higher = heavier tail
+    FAKE_MODEL_FAST_LATENCY_RATIO: float = 0.4  # Fast-model latency relative to pro
+    FAKE_MODEL_ERROR_RATE: float = 0.0  # Fraction of calls failing with a retryable error
+    FAKE_DB_LATENCY_MS: float = 25.0  # Median latency per database call
+    FAKE_SEED: int = 42
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
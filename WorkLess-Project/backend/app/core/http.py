@@ -0,0 +1,356 @@
+"""
+HTTP Transport
+One shared connection pool for outbound HTTP (keep-alive, HTTP/2, pool
+limits and timeouts from settings), with pool utilization metrics
+"""
+
+import importlib.util
+import threading
+import time
+from typing import Dict, Any, Optional, Type
+import httpx
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# httpcore trace events that open a connection
+CONNECT_STEPS = ("connection.connect_tcp", "connection.start_tls")
+
+
+def http2_available() -> bool:
+    """Whether the optional h2 package (HTTP/2 for httpx) is installed"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class _ConnectTimer:
+    """Counts the connections one request opens, from its httpcore trace events"""
+
+    __slots__ = ("manager", "started")
+
+    def __init__(self, manager: "TransportManager"):
+        self.manager = manager
+        self.started: Dict[str, float] = {}
+
+    def event(self, event: str) -> None:
+        step, _, phase = event.rpartition(".")
+        if step in CONNECT_STEPS:
+            if phase == "started":
+                self.started[step] = time.perf_counter()
+            elif phase == "complete" and step in self.started:
+                self.manager.record_connect(step, (time.perf_counter() - self.started.pop(step)) * 1000)
+
+
+def _connection_counts(pool: Any) -> Dict[str, int]:
+    """Open connections in an httpx transport's pool, split into idle and in use"""
+    try:
+        connections = list(pool._pool.connections)
+    except AttributeError:
+        return {}
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {"open": len(connections), "idle": idle, "in_use": len(connections) - idle}
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """Response body that reports when it is closed (the connection is free again)"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    """Async response body that reports when it is closed"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._release()
+
+
+class PooledTransport(httpx.BaseTransport):
+    """
+    The shared connection pool, as seen by each client
+
+    Every client built by the manager sends through this one transport, so
+    connections to a host are reused across clients. Closing a client leaves
+    the pool open; the manager closes it at shutdown. Each request carries
+    an httpcore trace hook that counts the connections opened and the time
+    spent opening them (TCP connect plus TLS handshake).
+    """
+
+    def __init__(self, manager: "TransportManager", pool: httpx.HTTPTransport):
+        self._manager = manager
+        self._pool = pool
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        manager = self._manager
+        previous = request.extensions.get("trace")
+        timer = _ConnectTimer(manager)
+
+        def trace(event: str, info: Dict[str, Any]) -> None:
+            timer.event(event)
+            if previous is not None:
+                previous(event, info)
+
+        request.extensions["trace"] = trace
+        manager.request_started()
+        try:
+            response = self._pool.handle_request(request)
+        except BaseException as e:
+            manager.request_finished(e)
+            raise
+        response.stream = _ReleasingStream(response.stream, manager.request_finished)
+        return response
+
+    def connection_counts(self) -> Dict[str, int]:
+        """Open connections in the pool, split into idle and in use"""
+        return _connection_counts(self._pool)
+
+    def close(self) -> None:
+        # Clients share the pool; only the manager closes it
+        pass
+
+    def shutdown(self) -> None:
+        """Close every pooled connection"""
+        self._pool.close()
+
+
+class AsyncPooledTransport(httpx.AsyncBaseTransport):
+    """The shared pool for async clients: same limits, counters and lifetime as PooledTransport"""
+
+    def __init__(self, manager: "TransportManager", pool: httpx.AsyncHTTPTransport):
+        self._manager = manager
+        self._pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        manager = self._manager
+        previous = request.extensions.get("trace")
+        timer = _ConnectTimer(manager)
+
+        async def trace(event: str, info: Dict[str, Any]) -> None:
+            timer.event(event)
+            if previous is not None:
+                await previous(event, info)
+
+        request.extensions["trace"] = trace
+        manager.request_started()
+        try:
+            response = await self._pool.handle_async_request(request)
+        except BaseException as e:
+            manager.request_finished(e)
+            raise
+        response.stream = _AsyncReleasingStream(response.stream, manager.request_finished)
+        return response
+
+    def connection_counts(self) -> Dict[str, int]:
+        """Open connections in the pool, split into idle and in use"""
+        return _connection_counts(self._pool)
+
+    async def aclose(self) -> None:
+        # Clients share the pool; only the manager closes it
+        pass
+
+    async def shutdown(self) -> None:
+        """Close every pooled connection"""
+        await self._pool.aclose()
+
+
+class TransportManager:
+    """
+    Owns the process-wide outbound connection pool
+
+    Outbound services build their HTTP clients with ``client()`` instead of
+    letting each SDK open its own, so every client gets the same limits,
+    timeouts and HTTP/2 setting, and connections (with their DNS lookup and
+    TLS handshake) are paid once per host and then kept alive between
+    requests. The pool is opened in the app's lifespan, or on first use by
+    scripts that run without it. Async clients (``async_client()``) get a
+    pool of their own, since connections belong to one event loop, with the
+    same limits and counted in the same metrics.
+    """
+
+    def __init__(self, max_connections: int = 20, max_keepalive: int = 10,
+                 keepalive_expiry: float = 60.0, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, write_timeout: float = 30.0,
+                 pool_timeout: float = 5.0, http2: bool = True, retries: int = 1):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_keepalive, max_connections),
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(
+            read_timeout, connect=connect_timeout, write=write_timeout, pool=pool_timeout
+        )
+        self.http2_requested = http2
+        self.http2 = http2 and http2_available()
+        self.retries = retries
+        self._transport: Optional[PooledTransport] = None
+        self._async_transport: Optional[AsyncPooledTransport] = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections_opened = 0
+        self.connect_ms: Dict[str, float] = {step: 0.0 for step in CONNECT_STEPS}
+        self.pool_timeouts = 0
+        self.errors = 0
+
+    @classmethod
+    def from_settings(cls) -> "TransportManager":
+        """Build the manager from application settings"""
+        return cls(
+            max_connections=settings.HTTP_POOL_MAX_CONNECTIONS,
+            max_keepalive=settings.HTTP_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            connect_timeout=settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+            read_timeout=settings.HTTP_READ_TIMEOUT_SECONDS,
+            write_timeout=settings.HTTP_WRITE_TIMEOUT_SECONDS,
+            pool_timeout=settings.HTTP_POOL_TIMEOUT_SECONDS,
+            http2=settings.HTTP2_ENABLED,
+            retries=settings.HTTP_CONNECT_RETRIES,
+        )
+
+    @property
+    def transport(self) -> PooledTransport:
+        """The shared pool, opened on first use"""
+        with self._lock:
+            if self._transport is None:
+                self._transport = PooledTransport(self, httpx.HTTPTransport(
+                    limits=self.limits, http2=self.http2, retries=self.retries
+                ))
+            return self._transport
+
+    @property
+    def async_transport(self) -> AsyncPooledTransport:
+        """The shared pool for async clients, opened on first use"""
+        with self._lock:
+            if self._async_transport is None:
+                self._async_transport = AsyncPooledTransport(self, httpx.AsyncHTTPTransport(
+                    limits=self.limits, http2=self.http2, retries=self.retries
+                ))
+            return self._async_transport
+
+    def start(self) -> None:
+        """Open the pool (app startup)"""
+        if self.http2_requested and not self.http2:
+            logger.warning("HTTP2_ENABLED is set but h2 is not installed; using HTTP/1.1")
+        self.transport
+        logger.info(
+            f"Outbound HTTP pool: {self.limits.max_connections} connections, "
+            f"{'HTTP/2' if self.http2 else 'HTTP/1.1'}, keep-alive {self.limits.keepalive_expiry}s"
+        )
+
+    def client(self, base_url: str = "", headers: Optional[Dict[str, str]] = None,
+               timeout: Optional[httpx.Timeout] = None,
+               client_class: Type[httpx.Client] = httpx.Client) -> httpx.Client:
+        """An HTTP client for one service that sends through the shared pool"""
+        return client_class(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout or self.timeout,
+            transport=self.transport
+        )
+
+    def async_client(self, base_url: str = "", headers: Optional[Dict[str, str]] = None,
+                     timeout: Optional[httpx.Timeout] = None) -> httpx.AsyncClient:
+        """An async HTTP client that sends through the shared async pool"""
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout or self.timeout,
+            transport=self.async_transport
+        )
+
+    def close(self) -> None:
+        """Close the pool's connections (scripts without an event loop)"""
+        with self._lock:
+            transport, self._transport = self._transport, None
+        if transport is not None:
+            transport.shutdown()
+
+    async def aclose(self) -> None:
+        """Close both pools' connections (app shutdown)"""
+        with self._lock:
+            transport, self._async_transport = self._async_transport, None
+        if transport is not None:
+            await transport.shutdown()
+        self.close()
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def request_finished(self, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if isinstance(error, httpx.PoolTimeout):
+                self.pool_timeouts += 1
+            elif error is not None:
+                self.errors += 1
+
+    def record_connect(self, step: str, elapsed_ms: float) -> None:
+        with self._lock:
+            if step == CONNECT_STEPS[0]:
+                self.connections_opened += 1
+            self.connect_ms[step] += elapsed_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Pool utilization and connection reuse"""
+        with self._lock:
+            transports = [t for t in (self._transport, self._async_transport) if t is not None]
+            requests, opened = self.requests, self.connections_opened
+            connect_ms = sum(self.connect_ms.values())
+            snapshot = {
+                "http2": self.http2,
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "requests": requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "connections_opened": opened,
+                "connection_reuse_ratio": round(1 - opened / requests, 3) if requests else None,
+                "avg_connect_ms": round(connect_ms / opened, 1) if opened else None,
+                "tls_ms_total": round(self.connect_ms[CONNECT_STEPS[1]], 1),
+                "pool_timeouts": self.pool_timeouts,
+                "errors": self.errors,
+            }
+        counts = {}
+        for transport in transports:
+            for key, value in transport.connection_counts().items():
+                counts[key] = counts.get(key, 0) + value
+        snapshot["connections"] = counts or None
+        snapshot["utilization"] = (
+            round(counts["in_use"] / self.limits.max_connections, 3) if counts else 0.0
+        )
+        return snapshot
+
+
+# Global transport manager instance
+http_transport = TransportManager.from_settings()
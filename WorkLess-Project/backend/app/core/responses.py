@@ -0,0 +1,60 @@
+"""
+Response Helpers
+Fast JSON response classes and response compression
+"""
+
+from typing import Iterable
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as DefaultJSONResponse
+except ImportError:  # pragma: no cover - orjson is optional
+    DefaultJSONResponse = JSONResponse
+
+
+def model_response(model: BaseModel, status_code: int = 200) -> Response:
+    """
+    JSON response serialized straight from a model
+
+    pydantic-core writes the JSON in one pass, and returning a Response
+    makes FastAPI skip re-validating the model against ``response_model``.
+    Only use it for models built from already-validated data.
+    """
+    return Response(
+        content=model.model_dump_json(),
+        status_code=status_code,
+        media_type="application/json"
+    )
+
+
+class CompressionMiddleware:
+    """
+    Gzip compression for large responses, except on excluded paths
+
+    Event streams should be excluded, as gzip holds back small events until
+    its buffer fills, and so should already-compressed files (uploads).
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        compresslevel: int = 5,
+        exclude_prefixes: Iterable[str] = (),
+        exclude_suffixes: Iterable[str] = ()
+    ):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.exclude_suffixes = tuple(exclude_suffixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path.startswith(self.exclude_prefixes) or path.endswith(self.exclude_suffixes):
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
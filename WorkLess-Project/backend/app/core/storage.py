@@ -0,0 +1,90 @@
+"""
+Local Storage
+Small SQLite databases under DATA_DIR for state owned by the backend
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Any, Iterable, Iterator, Optional
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStore:
+    """
+    Thread-safe wrapper around one SQLite database file
+
+    WAL mode lets readers proceed while a write is in progress; writes are
+    serialized through a lock so the connection can be shared across the
+    threads FastAPI runs sync code in.
+    """
+
+    def __init__(self, path: str, schema: Optional[str] = None):
+        self.path = path
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        if schema:
+            self._conn.executescript(schema)
+
+    def execute(self, sql: str, params: Iterable[Any] = ()) -> int:
+        """Run a write statement, returning the affected row count"""
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).rowcount
+
+    def executescript(self, script: str) -> None:
+        """Run several DDL statements"""
+        with self._lock:
+            self._conn.executescript(script)
+
+    def transaction(self, statements: Iterable[tuple]) -> None:
+        """Run (sql, params) statements atomically"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, tuple(params))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @contextmanager
+    def write_transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Hold the write lock for a read-modify-write
+
+        BEGIN IMMEDIATE takes the database write lock up front, so the block
+        is atomic across processes sharing the file, not just threads.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def query(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        """Run a read statement and fetch all rows"""
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def close(self) -> None:
+        """Close the underlying connection"""
+        with self._lock:
+            self._conn.close()
+
+
+def data_path(filename: str) -> str:
+    """Path of a file in the backend's data directory"""
+    return str(Path(settings.DATA_DIR) / filename)
@@ -0,0 +1,158 @@
+"""
+Multi-Worker Support
+Worker sizing for the launcher and state shared by the worker processes of
+one host (SQLite under DATA_DIR and flock-based host semaphores)
+"""
+
+import asyncio
+import fcntl
+import math
+import os
+import random
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set
+from app.core.config import settings
+from app.core.storage import SQLiteStore, data_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Set by the launcher for its workers: when the current generation of workers
+# was started (workers restarted by uvicorn keep the original value)
+LAUNCH_TIME_ENV = "WORKLESS_LAUNCH_TIME"
+LAUNCH_TIME = float(os.environ.get(LAUNCH_TIME_ENV) or time.time())
+
+SHARED_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    client_id TEXT PRIMARY KEY,
+    tokens INTEGER NOT NULL,
+    refilled_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS result_cache (
+    key TEXT PRIMARY KEY,
+    result TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS result_cache_used ON result_cache (used_at);
+"""
+
+_shared_store: Optional[SQLiteStore] = None
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: affinity mask, capped by a cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover - not available on macOS
+        cpus = os.cpu_count() or 1
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def resolve_worker_count(configured: int) -> int:
+    """Worker processes to run: ``configured``, or one per available CPU when 0"""
+    return configured if configured > 0 else available_cpus()
+
+
+def shared_store() -> SQLiteStore:
+    """The SQLite database shared by all workers of this host (opened once per process)"""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = SQLiteStore(data_path("shared.db"), SHARED_SCHEMA)
+    return _shared_store
+
+
+class HostSemaphore:
+    """
+    Counting semaphore shared by every process on the host
+
+    Each slot is a lock file held with ``flock``, so the kernel frees the
+    slots of a worker that dies. Waiters poll with a short jittered backoff;
+    the order in which they are served is not fair.
+    """
+
+    def __init__(self, name: str, slots: int, directory: Optional[str] = None):
+        self.name = name
+        self.slots = max(1, slots)
+        lock_dir = Path(directory or data_path("locks"))
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        # One descriptor per slot, opened once; flock state belongs to the open file
+        self._fds: List[int] = [
+            os.open(str(lock_dir / f"{name}-{slot}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            for slot in range(self.slots)
+        ]
+        # Slots this process holds: flock on a descriptor we already hold succeeds again
+        self._held: Set[int] = set()
+        self.waits = 0
+        self.timeouts = 0
+
+    def try_acquire(self) -> Optional[int]:
+        """Take a free slot without waiting, or return None"""
+        start = random.randrange(self.slots)
+        for offset in range(self.slots):
+            slot = (start + offset) % self.slots
+            if slot in self._held:
+                continue
+            try:
+                fcntl.flock(self._fds[slot], fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            self._held.add(slot)
+            return slot
+        return None
+
+    async def acquire(self, timeout: float) -> int:
+        """Wait up to ``timeout`` seconds for a slot; raises asyncio.TimeoutError"""
+        slot = self.try_acquire()
+        if slot is not None:
+            return slot
+        self.waits += 1
+        deadline = time.monotonic() + timeout
+        delay = 0.005
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.timeouts += 1
+                raise asyncio.TimeoutError(f"No {self.name} slot free within {timeout}s")
+            await asyncio.sleep(min(remaining, delay * random.uniform(0.5, 1.5)))
+            slot = self.try_acquire()
+            if slot is not None:
+                return slot
+            delay = min(delay * 2, 0.05)
+
+    def release(self, slot: int) -> None:
+        """Free a slot taken by this process"""
+        if slot in self._held:
+            self._held.discard(slot)
+            fcntl.flock(self._fds[slot], fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        """Close the slot files, freeing any slot still held"""
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self._held.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Slots held by this worker and wait counts, for metrics"""
+        return {
+            "slots": self.slots,
+            "held_by_worker": len(self._held),
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+        }
+
+
+def create_inference_budget() -> Optional[HostSemaphore]:
+    """Host-wide cap on concurrent model jobs, or None outside shared-state mode"""
+    if not settings.SHARED_STATE_ENABLED:
+        return None
+    slots = settings.HOST_INFERENCE_CONCURRENCY or settings.ADMISSION_MAX_CONCURRENCY
+    return HostSemaphore("inference", slots)
@@ -3,10 +3,12 @@ Authentication Middleware
 JWT token validation and user extraction
 """
 
+import asyncio
 from typing import Optional
 from fastapi import Request, HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.services.auth_service import AuthService
+from app.services.supabase_service import supabase_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -59,3 +61,20 @@ async def require_auth(
             headers={"WWW-Authenticate": "Bearer"}
         )
     return current_user
+
+
+async def require_admin(
+    current_user: dict = Depends(require_auth)
+) -> dict:
+    """Dependency that requires an admin user (users_metadata.role)"""
+    user_id = current_user.get("sub") or current_user.get("user_id")
+    metadata = (
+        await asyncio.to_thread(supabase_service.get_user_metadata, user_id)
+        if supabase_service and user_id else None
+    )
+    if not metadata or metadata.get("role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
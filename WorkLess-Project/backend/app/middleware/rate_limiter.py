@@ -6,25 +6,114 @@ Token bucket algorithm for rate limiting
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
-from collections import defaultdict
-from datetime import datetime, timedelta
+from app.core.workers import shared_store
+import asyncio
 import logging
+import sqlite3
+import time
 from typing import Dict, Tuple
 
 logger = logging.getLogger(__name__)
 
 
+def refill(tokens: int, refilled_at: float, now: float, calls: int, period: int) -> Tuple[int, float]:
+    """Bucket state after refilling whole tokens for the time elapsed"""
+    tokens_to_add = int(((now - refilled_at) / period) * calls)
+    if tokens_to_add > 0:
+        return min(calls, tokens + tokens_to_add), now
+    return tokens, refilled_at
+
+
+class MemoryTokenBuckets:
+    """Token buckets of one process"""
+    
+    def __init__(self, calls: int, period: int):
+        self.calls = calls
+        self.period = period
+        # Store: {client_id: (tokens, last_refill)}
+        self.buckets: Dict[str, Tuple[int, float]] = {}
+    
+    def take(self, client_id: str) -> Tuple[bool, int]:
+        """Consume a token if one is left; returns (allowed, tokens remaining)"""
+        now = time.time()
+        tokens, refilled_at = refill(
+            *self.buckets.get(client_id, (self.calls, now)), now, self.calls, self.period
+        )
+        if tokens <= 0:
+            self.buckets[client_id] = (tokens, refilled_at)
+            return False, 0
+        self.buckets[client_id] = (tokens - 1, refilled_at)
+        return True, tokens - 1
+
+
+class SharedTokenBuckets:
+    """
+    Token buckets shared by all workers of a host (SQLite in DATA_DIR)
+    
+    Each take is one short write transaction, so N workers enforce one limit
+    instead of N separate ones. It blocks on the database lock, so it is run
+    off the event loop; when the database stays locked (or fails) the request
+    is let through rather than failed.
+    """
+    
+    # Buckets idle this many periods are full again and can be dropped
+    PRUNE_AFTER_PERIODS = 2
+    PRUNE_EVERY = 1000
+    
+    def __init__(self, calls: int, period: int):
+        self.calls = calls
+        self.period = period
+        self.store = shared_store()
+        self._takes = 0
+        self.errors = 0
+    
+    def take(self, client_id: str) -> Tuple[bool, int]:
+        """Consume a token if one is left; returns (allowed, tokens remaining)"""
+        try:
+            return self._take(client_id)
+        except sqlite3.OperationalError as e:
+            # "database is locked" past the busy timeout: fail open
+            self.errors += 1
+            logger.warning(f"Rate limit check skipped for {client_id}: {e}")
+            return True, self.calls
+    
+    def _take(self, client_id: str) -> Tuple[bool, int]:
+        now = time.time()
+        with self.store.write_transaction() as conn:
+            row = conn.execute(
+                "SELECT tokens, refilled_at FROM rate_buckets WHERE client_id = ?", (client_id,)
+            ).fetchone()
+            tokens, refilled_at = refill(
+                *(tuple(row) if row else (self.calls, now)), now, self.calls, self.period
+            )
+            allowed = tokens > 0
+            if allowed:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (client_id, tokens, refilled_at) VALUES (?, ?, ?)",
+                (client_id, tokens, refilled_at)
+            )
+        self._takes += 1
+        if self._takes % self.PRUNE_EVERY == 0:
+            try:
+                self.store.execute(
+                    "DELETE FROM rate_buckets WHERE refilled_at < ?",
+                    (now - self.PRUNE_AFTER_PERIODS * self.period,)
+                )
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Error pruning rate limit buckets: {e}")
+        return allowed, max(0, tokens)
+
+
 class RateLimitMiddleware(BaseHTTPMiddleware):
     """Rate limiting middleware using token bucket algorithm"""
     
-    def __init__(self, app, calls: int = 100, period: int = 60):
+    def __init__(self, app, calls: int = 100, period: int = 60, shared: bool = False):
         super().__init__(app)
         self.calls = calls
         self.period = period
-        # Store: {client_id: (tokens, last_refill)}
-        self.buckets: Dict[str, Tuple[int, datetime]] = defaultdict(
-            lambda: (calls, datetime.utcnow())
-        )
+        self.shared = shared
+        self.buckets = (SharedTokenBuckets if shared else MemoryTokenBuckets)(calls, period)
     
     def _get_client_id(self, request: Request) -> str:
         """Get client identifier for rate limiting"""
@@ -41,32 +130,19 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         
         return f"ip:{client_ip}"
     
-    def _refill_tokens(self, client_id: str) -> int:
-        """Refill tokens based on time elapsed"""
-        tokens, last_refill = self.buckets[client_id]
-        now = datetime.utcnow()
-        
-        # Calculate tokens to add
-        time_passed = (now - last_refill).total_seconds()
-        tokens_to_add = int((time_passed / self.period) * self.calls)
-        
-        if tokens_to_add > 0:
-            # Refill tokens
-            new_tokens = min(self.calls, tokens + tokens_to_add)
-            self.buckets[client_id] = (new_tokens, now)
-            return new_tokens
-        
-        return tokens
-    
     async def dispatch(self, request: Request, call_next):
         # Skip rate limiting for health checks
-        if request.url.path in ["/health", "/docs", "/redoc", "/openapi.json"]:
+        if request.url.path in ["/health", "/health/deep", "/ready", "/docs", "/redoc", "/openapi.json"]:
             return await call_next(request)
         
         client_id = self._get_client_id(request)
-        tokens = self._refill_tokens(client_id)
+        if self.shared:
+            # A database write transaction: off the event loop
+            allowed, tokens = await asyncio.to_thread(self.buckets.take, client_id)
+        else:
+            allowed, tokens = self.buckets.take(client_id)
         
-        if tokens <= 0:
+        if not allowed:
             logger.warning(f"Rate limit exceeded for {client_id}")
             return JSONResponse(
                 status_code=429,
@@ -82,14 +158,9 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                 }
             )
         
-        # Consume token
-        tokens -= 1
-        _, last_refill = self.buckets[client_id]
-        self.buckets[client_id] = (tokens, last_refill)
-        
         # Add rate limit headers
         response = await call_next(request)
         response.headers["X-RateLimit-Limit"] = str(self.calls)
-        response.headers["X-RateLimit-Remaining"] = str(max(0, tokens))
+        response.headers["X-RateLimit-Remaining"] = str(tokens)
         
         return response
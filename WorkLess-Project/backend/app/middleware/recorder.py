@@ -0,0 +1,49 @@
+"""
+Request Recorder Middleware
+Records a sampled share of requests on the recorded routes for replay
+"""
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.services.request_recorder import RequestRecorder
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RecorderMiddleware:
+    """
+    Makes a sampled request's recording current while the app handles it
+
+    Pure ASGI, so the recording covers streamed bodies: it is finished when
+    the last body chunk has been sent (or the request fails).
+    """
+
+    def __init__(self, app: ASGIApp, recorder: RequestRecorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        recording = self.recorder.sample(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if recording is None:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        response_bytes = 0
+
+        async def send_recorded(message: Message) -> None:
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        token = self.recorder.activate(recording)
+        try:
+            await self.app(scope, receive, send_recorded)
+        finally:
+            self.recorder.deactivate(token)
+            # The router leaves the matched route in the scope: record its template
+            route = getattr(scope.get("route"), "path", None)
+            self.recorder.finish(recording, route, status_code, response_bytes)
@@ -16,6 +16,13 @@ class ProcessingStatus(str, Enum):
     FAILED = "failed"
 
 
+class ExportFormat(str, Enum):
+    """Bulk export format enumeration"""
+    CSV = "csv"
+    JSONL = "jsonl"
+    PARQUET = "parquet"
+
+
 class FieldData(BaseModel):
     """Extracted field data schema"""
     field: str = Field(..., description="Field name")
@@ -99,3 +106,182 @@ class HealthResponse(BaseModel):
     status: str
     service: str
     version: str
+
+
+class AnalyticsBucket(BaseModel):
+    """Scan activity for one hour or day"""
+    bucket: str = Field(..., description="UTC hour (YYYY-MM-DDTHH) or day (YYYY-MM-DD)")
+    scans: int = Field(0, description="Scans started")
+    completed: int = Field(0, description="Scans completed")
+    failed: int = Field(0, description="Scans failed")
+    average_confidence: Optional[float] = Field(None, description="Mean confidence of completed scans")
+    active_users: Optional[int] = Field(None, description="Distinct users with a scan (daily buckets)")
+
+
+class AdminAnalyticsResponse(BaseModel):
+    """Admin dashboard analytics served from precomputed rollups"""
+    total_scans: int
+    total_completed: int
+    total_failed: int
+    average_confidence: Optional[float] = None
+    total_users: int = Field(..., description="Distinct users seen by the backend")
+    active_today: int
+    tier_counts: Dict[str, int] = Field(default_factory=dict)
+    daily: List[AnalyticsBucket] = Field(default_factory=list)
+    hourly: List[AnalyticsBucket] = Field(default_factory=list)
+    generated_at: datetime
+
+
+class UsageTotals(BaseModel):
+    """Model usage summed over a group of calls"""
+    calls: int = Field(0, description="Model calls made")
+    cached: int = Field(0, description="Extractions served from the result cache (no model call)")
+    errors: int = Field(0, description="Model calls that failed")
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+    image_bytes: int = Field(0, description="Page image bytes sent to the model")
+    cost_usd: float = Field(0.0, description="Estimated cost from list prices")
+    avg_latency_ms: Optional[float] = Field(None, description="Mean model call latency")
+
+
+class UsageGroup(UsageTotals):
+    """Usage for one day, tier, document type, model or user"""
+    day: Optional[str] = None
+    tier: Optional[str] = None
+    document_type: Optional[str] = None
+    model: Optional[str] = None
+    user_id: Optional[str] = None
+
+
+class AdminUsageResponse(BaseModel):
+    """Token and cost accounting served from daily usage rollups"""
+    days: int
+    user_id: Optional[str] = Field(None, description="User the report is restricted to, if any")
+    totals: UsageTotals
+    daily: List[UsageGroup] = Field(default_factory=list)
+    by_tier: List[UsageGroup] = Field(default_factory=list)
+    by_document_type: List[UsageGroup] = Field(default_factory=list)
+    by_model: List[UsageGroup] = Field(default_factory=list)
+    top_users: List[UsageGroup] = Field(default_factory=list, description="Users by tokens, highest first")
+    budgets: Dict[str, int] = Field(default_factory=dict, description="Daily token budget per tier")
+    generated_at: datetime
+
+
+class UploadSessionCreate(BaseModel):
+    """Request to open a resumable upload session"""
+    user_id: str = Field(..., description="User ID from authentication")
+    file_name: Optional[str] = Field(None, description="Original file name")
+    mime_type: str = Field(..., description="File type (JPG, PNG, or PDF)")
+    size: int = Field(..., gt=0, description="Total file size in bytes")
+    chunk_size: Optional[int] = Field(None, gt=0, description="Preferred chunk size in bytes (server may adjust)")
+    sha256: Optional[str] = Field(None, description="Hex SHA-256 of the whole file, verified on completion")
+    document_type: Optional[str] = Field(None, description="Optional document type hint")
+
+
+class UploadSessionResponse(BaseModel):
+    """State of a resumable upload session"""
+    session_id: str
+    status: str = Field(..., description="open, processing, completed or failed")
+    size: int
+    chunk_size: int = Field(..., description="Every chunk but the last must be exactly this long")
+    chunk_count: int
+    received_bytes: int
+    missing_offsets: List[int] = Field(default_factory=list, description="Offsets of chunks still to upload")
+    expires_at: float = Field(..., description="Unix time after which the session is deleted")
+
+
+class ChunkUploadResponse(BaseModel):
+    """Outcome of one chunk upload"""
+    offset: int
+    length: int
+    duplicate: bool = Field(False, description="The chunk had already been received; its body was not read")
+    chunks_remaining: int
+
+
+class ScanHistoryResponse(BaseModel):
+    """One page of a user's scan history"""
+    items: List[Dict[str, Any]] = Field(..., description="Scans, newest first, with the requested fields")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, if any")
+    has_more: bool = Field(False, description="Whether more scans follow")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "items": [
+                    {
+                        "id": "0b6f3c1e-2f4d-4a51-9d43-6f1f8f0b9a10",
+                        "created_at": "2026-01-02T10:15:00+00:00",
+                        "file_name": "invoice.pdf",
+                        "status": "completed",
+                        "confidence_score": 96.5
+                    }
+                ],
+                "next_cursor": "WyIyMDI2LTAxLTAyVDEwOjE1OjAwKzAwOjAwIiwiMGI2ZiJd",
+                "has_more": True
+            }
+        }
+
+
+class ExtractionMatch(BaseModel):
+    """A stored field that matched a search"""
+    scan_id: str
+    field: str
+    value: str
+    confidence: float
+    file_name: Optional[str] = None
+    document_type: Optional[str] = None
+    created_at: str
+
+
+class ExtractionSearchResponse(BaseModel):
+    """Search results over a user's past extractions"""
+    results: List[ExtractionMatch]
+    count: int
+
+
+class WebhookRegistration(BaseModel):
+    """Callback endpoint for the authenticated user's finished scans"""
+    url: str = Field(..., max_length=2048, description="HTTPS URL that receives a signed POST per event")
+    events: List[ProcessingStatus] = Field(
+        default_factory=lambda: [ProcessingStatus.COMPLETED, ProcessingStatus.FAILED],
+        description="Scan statuses to be called back for (completed, failed)"
+    )
+    rotate_secret: bool = Field(False, description="Issue a new signing secret; the old one stops working")
+    
+    @validator("events")
+    def validate_events(cls, v):
+        """Only final statuses are called back"""
+        finals = {ProcessingStatus.COMPLETED, ProcessingStatus.FAILED}
+        if not v or not set(v) <= finals:
+            raise ValueError("events must be a non-empty subset of: completed, failed")
+        return sorted(set(v), key=lambda event: event.value)
+
+
+class WebhookResponse(BaseModel):
+    """A user's webhook registration and the state of its deliveries"""
+    url: str
+    events: List[ProcessingStatus]
+    secret: Optional[str] = Field(
+        None,
+        description="HMAC-SHA256 signing secret; only returned when it is issued (first registration or rotation)"
+    )
+    created_at: datetime
+    updated_at: datetime
+    pending_deliveries: int = Field(0, description="Callbacks queued or waiting to be retried")
+    dead_deliveries: int = Field(0, description="Callbacks given up on after WEBHOOK_MAX_ATTEMPTS (kept for a while)")
+    last_error: Optional[str] = Field(None, description="Latest delivery failure, if any")
+
+
+class WebhookEvent(BaseModel):
+    """
+    Body of a webhook callback
+    
+    Sent with X-WorkLess-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of "<t>.<body>">
+    """
+    id: str = Field(..., description="Delivery ID (also in X-WorkLess-Delivery); retries reuse it")
+    event: str = Field(..., description="scan.completed or scan.failed")
+    created_at: datetime
+    scan_id: Optional[str] = Field(None, description="Scan record, when the database is configured")
+    status: ProcessingStatus
+    data: Optional[DocumentProcessResponse] = Field(None, description="The processing result (completed scans)")
@@ -0,0 +1,296 @@
+"""
+Admission Control Service
+Priority scheduling of document processing by subscription tier, with
+per-tier concurrency shares, queue deadlines and early load shedding
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, AsyncIterator
+from app.core.config import settings
+from app.core.workers import HostSemaphore, create_inference_budget
+from app.services.resilience import LatencyTracker
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """A request was shed instead of being queued or admitted"""
+
+    def __init__(self, tier: str, reason: str, retry_after: float):
+        super().__init__(f"Request shed for tier '{tier}': {reason}")
+        self.tier = tier
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """A granted processing slot; release exactly once (idempotent)"""
+
+    __slots__ = ("controller", "tier", "granted_at", "released", "host_slot")
+
+    def __init__(self, controller: "AdmissionController", tier: str):
+        self.controller = controller
+        self.tier = tier
+        self.granted_at = time.monotonic()
+        self.released = False
+        # Slot of the host-wide inference budget, in multi-worker mode
+        self.host_slot: Optional[int] = None
+
+    def release(self) -> None:
+        """Return the slot to the controller"""
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class _TierState:
+    """Queue, limits and counters for one subscription tier"""
+
+    def __init__(self, limit: int, queue_timeout: float, max_queue_depth: int):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.max_queue_depth = max_queue_depth
+        self.waiters: deque = deque()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self.wait_times = LatencyTracker(window=1000)
+
+    def reject(self, reason: str) -> None:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+
+class AdmissionController:
+    """
+    Strict-priority admission with per-tier concurrency caps
+
+    A freed slot goes to the oldest waiter of the highest-priority tier that is
+    below its cap (``share`` x ``max_concurrency`` slots). Capping lower tiers
+    keeps capacity in reserve for higher ones, so bursts of basic traffic queue
+    and are shed first while pro requests are admitted immediately. Requests
+    whose estimated wait exceeds their tier's queue timeout are rejected up
+    front rather than after waiting.
+
+    With several workers on a host, each has its own controller; the
+    optional ``host_budget`` additionally caps the documents processed at
+    once by all of them. It is taken after the local slot, waiting up to the
+    tier's queue timeout.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        tier_priority: List[str],
+        tier_shares: Dict[str, float],
+        queue_timeouts: Dict[str, float],
+        max_queue_depth: Dict[str, int],
+        default_tier: str = "basic",
+        enabled: bool = True,
+        host_budget: Optional[HostSemaphore] = None
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.tier_priority = list(tier_priority)
+        self.default_tier = default_tier if default_tier in tier_priority else tier_priority[-1]
+        self.enabled = enabled
+        self.host_budget = host_budget
+        self.in_flight = 0
+        self.service_times = LatencyTracker()
+        self.tiers: Dict[str, _TierState] = {
+            tier: _TierState(
+                limit=max(1, math.ceil(self.max_concurrency * tier_shares.get(tier, 1.0))),
+                queue_timeout=queue_timeouts.get(tier, 30.0),
+                max_queue_depth=max_queue_depth.get(tier, 100),
+            )
+            for tier in self.tier_priority
+        }
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        """Build the controller from application settings"""
+        return cls(
+            max_concurrency=settings.ADMISSION_MAX_CONCURRENCY,
+            tier_priority=settings.ADMISSION_TIER_PRIORITY,
+            tier_shares=settings.ADMISSION_TIER_SHARES,
+            queue_timeouts=settings.ADMISSION_QUEUE_TIMEOUTS,
+            max_queue_depth=settings.ADMISSION_MAX_QUEUE_DEPTH,
+            default_tier=settings.ADMISSION_DEFAULT_TIER,
+            enabled=settings.ADMISSION_ENABLED,
+            host_budget=create_inference_budget(),
+        )
+
+    def resolve_tier(self, user_metadata: Optional[Dict[str, Any]]) -> str:
+        """Map users_metadata to a scheduling tier"""
+        tier = (user_metadata or {}).get("subscription_tier")
+        return tier if tier in self.tiers else self.default_tier
+
+    def _can_run(self, tier: str) -> bool:
+        return self.in_flight < self.max_concurrency and self.tiers[tier].in_flight < self.tiers[tier].limit
+
+    def _grant(self, tier: str) -> AdmissionTicket:
+        state = self.tiers[tier]
+        self.in_flight += 1
+        state.in_flight += 1
+        state.admitted += 1
+        return AdmissionTicket(self, tier)
+
+    def _estimated_wait(self, tier: str) -> Optional[float]:
+        """Rough queueing delay for a new request of ``tier``, if known"""
+        service_time = self.service_times.percentile(50)
+        if service_time is None:
+            return None
+        # Everyone queued at this priority or above is served first
+        ahead = 0
+        for name in self.tier_priority:
+            ahead += len(self.tiers[name].waiters)
+            if name == tier:
+                break
+        slots = min(self.max_concurrency, self.tiers[tier].limit)
+        return (ahead // slots + 1) * service_time
+
+    def _shed(self, tier: str, reason: str) -> AdmissionRejected:
+        state = self.tiers[tier]
+        state.reject(reason)
+        logger.warning(f"Admission rejected ({tier}): {reason}, queued={len(state.waiters)}")
+        return AdmissionRejected(tier, reason, retry_after=state.queue_timeout)
+
+    async def acquire(self, tier: str) -> AdmissionTicket:
+        """Wait for a processing slot or raise AdmissionRejected"""
+        ticket = await self._acquire_local(tier)
+        if self.host_budget is not None:
+            try:
+                ticket.host_slot = await self.host_budget.acquire(self.tiers[ticket.tier].queue_timeout)
+            except asyncio.TimeoutError:
+                ticket.release()
+                raise self._shed(ticket.tier, "host_budget_exhausted")
+            except BaseException:
+                ticket.release()
+                raise
+        return ticket
+
+    async def _acquire_local(self, tier: str) -> AdmissionTicket:
+        """Wait for a slot of this worker"""
+        tier = tier if tier in self.tiers else self.default_tier
+        state = self.tiers[tier]
+
+        if not self.enabled:
+            return self._grant(tier)
+
+        # Fast path: capacity available and nobody of equal or higher priority waiting
+        ahead = any(self.tiers[name].waiters for name in self.tier_priority[:self.tier_priority.index(tier) + 1])
+        if not ahead and self._can_run(tier):
+            state.wait_times.add(0.0)
+            return self._grant(tier)
+
+        if len(state.waiters) >= state.max_queue_depth:
+            raise self._shed(tier, "queue_full")
+        estimate = self._estimated_wait(tier)
+        if estimate is not None and estimate > state.queue_timeout:
+            raise self._shed(tier, "estimated_wait_exceeds_deadline")
+
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append(future)
+        enqueued_at = time.monotonic()
+        try:
+            ticket = await asyncio.wait_for(asyncio.shield(future), state.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Granted in the same tick as the timeout fired; keep the slot
+                ticket = future.result()
+            else:
+                future.cancel()
+                self._discard(state, future)
+                raise self._shed(tier, "queue_timeout")
+        except asyncio.CancelledError:
+            # Client went away while queued; hand back a slot granted meanwhile
+            if future.done() and not future.cancelled():
+                future.result().release()
+            else:
+                future.cancel()
+                self._discard(state, future)
+            raise
+
+        state.wait_times.add(time.monotonic() - enqueued_at)
+        return ticket
+
+    @staticmethod
+    def _discard(state: _TierState, future: asyncio.Future) -> None:
+        try:
+            state.waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        if ticket.host_slot is not None:
+            self.host_budget.release(ticket.host_slot)
+        self.in_flight -= 1
+        self.tiers[ticket.tier].in_flight -= 1
+        self.service_times.add(time.monotonic() - ticket.granted_at)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, highest priority first"""
+        for tier in self.tier_priority:
+            state = self.tiers[tier]
+            while state.waiters and self._can_run(tier):
+                future = state.waiters.popleft()
+                if not future.done():
+                    future.set_result(self._grant(tier))
+            if self.in_flight >= self.max_concurrency:
+                return
+
+    @asynccontextmanager
+    async def slot(self, tier: str) -> AsyncIterator[AdmissionTicket]:
+        """Hold a processing slot for the duration of the block"""
+        ticket = await self.acquire(tier)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def queue_depth(self) -> int:
+        """Requests waiting for a slot, all tiers"""
+        return sum(len(state.waiters) for state in self.tiers.values())
+
+    def queue_pressure(self) -> float:
+        """Fullest tier queue as a fraction of its maximum depth (1.0 = shedding)"""
+        return max(
+            (len(state.waiters) / state.max_queue_depth if state.max_queue_depth > 0 else 0.0)
+            for state in self.tiers.values()
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Queue depth, concurrency and wait-time metrics"""
+        service_time = self.service_times.percentile(50)
+        return {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "service_time_p50_ms": round(service_time * 1000, 1) if service_time is not None else None,
+            "tiers": {
+                tier: {
+                    "limit": state.limit,
+                    "in_flight": state.in_flight,
+                    "queue_depth": len(state.waiters),
+                    "admitted": state.admitted,
+                    "rejected": dict(state.rejected),
+                    "wait_p50_ms": _ms(state.wait_times.percentile(50)),
+                    "wait_p95_ms": _ms(state.wait_times.percentile(95)),
+                    "wait_p99_ms": _ms(state.wait_times.percentile(99)),
+                }
+                for tier, state in self.tiers.items()
+            },
+            "host_budget": self.host_budget.snapshot() if self.host_budget else None,
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+# Global admission controller instance
+admission_controller = AdmissionController.from_settings()
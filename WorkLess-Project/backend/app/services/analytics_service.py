@@ -0,0 +1,272 @@
+"""
+Analytics Service
+Incrementally maintained scan rollups (hourly, daily, all-time) for the
+admin dashboard, persisted in a local SQLite store
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+from app.core.config import settings
+from app.core.storage import SQLiteStore, data_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+HOUR = "hour"
+DAY = "day"
+TOTAL = "total"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_rollups (
+    granularity TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    scans INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    confidence_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (granularity, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS daily_active_users (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (day, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_tiers (
+    user_id TEXT PRIMARY KEY,
+    tier TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS analytics_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+BACKFILLED_AT = "backfilled_at"
+# Users are copied from the database this many at a time
+BACKFILL_PAGE_SIZE = 1000
+
+_UPSERT_ROLLUP = """
+INSERT INTO scan_rollups (granularity, bucket, scans, completed, failed, confidence_sum)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (granularity, bucket) DO UPDATE SET
+    scans = scans + excluded.scans,
+    completed = completed + excluded.completed,
+    failed = failed + excluded.failed,
+    confidence_sum = confidence_sum + excluded.confidence_sum
+"""
+
+
+def _buckets(at: datetime) -> List[tuple]:
+    """(granularity, bucket) keys a timestamp contributes to"""
+    return [
+        (HOUR, at.strftime("%Y-%m-%dT%H")),
+        (DAY, at.strftime("%Y-%m-%d")),
+        (TOTAL, "all"),
+    ]
+
+
+def _bucket_dict(row, active_users: Optional[int] = None) -> Dict[str, Any]:
+    completed = row["completed"]
+    return {
+        "bucket": row["bucket"],
+        "scans": row["scans"],
+        "completed": completed,
+        "failed": row["failed"],
+        "average_confidence": round(row["confidence_sum"] / completed, 2) if completed else None,
+        "active_users": active_users,
+    }
+
+
+class AnalyticsService:
+    """
+    Scan activity rollups updated on every scan status transition
+
+    Each transition is a handful of keyed upserts, so reads never scan raw
+    scan rows: the dashboard query touches at most a few hundred rollup rows
+    regardless of table size. Hourly buckets and daily active users are pruned
+    after their retention period; daily and all-time rollups are kept.
+
+    Scans and users from before the rollups existed are copied once from the
+    database by ``backfill``, so the all-time scan total, user count and tier
+    counts are exact; completions, failures, confidence and the series only
+    cover what was recorded since.
+    """
+
+    def __init__(self, store: SQLiteStore, hourly_retention_days: int = 14, active_user_retention_days: int = 90):
+        self.store = store
+        self.hourly_retention_days = hourly_retention_days
+        self.active_user_retention_days = active_user_retention_days
+        self._last_prune: Optional[str] = None
+        self._prune_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> Optional["AnalyticsService"]:
+        """Open the analytics store, or None when analytics are disabled"""
+        if not settings.ANALYTICS_ENABLED:
+            return None
+        try:
+            store = SQLiteStore(data_path("analytics.db"), SCHEMA)
+        except Exception as e:
+            logger.warning(f"Analytics disabled: cannot open store: {e}")
+            return None
+        return cls(
+            store,
+            hourly_retention_days=settings.ANALYTICS_HOURLY_RETENTION_DAYS,
+            active_user_retention_days=settings.ANALYTICS_ACTIVE_USER_RETENTION_DAYS,
+        )
+
+    def _record(self, at: datetime, scans: int = 0, completed: int = 0, failed: int = 0,
+                confidence: float = 0.0, extra: Optional[List[tuple]] = None) -> None:
+        statements = [
+            (_UPSERT_ROLLUP, (granularity, bucket, scans, completed, failed, confidence))
+            for granularity, bucket in _buckets(at)
+        ]
+        statements.extend(extra or [])
+        try:
+            self.store.transaction(statements)
+        except Exception as e:
+            # Analytics must never fail a document request
+            logger.error(f"Error updating analytics rollups: {e}")
+            return
+        self._maybe_prune(at)
+
+    def record_scan_started(self, user_id: str, tier: str = "basic", at: Optional[datetime] = None) -> None:
+        """A scan moved to processing"""
+        at = at or datetime.utcnow()
+        self._record(at, scans=1, extra=[
+            (
+                "INSERT OR IGNORE INTO daily_active_users (day, user_id) VALUES (?, ?)",
+                (at.strftime("%Y-%m-%d"), user_id),
+            ),
+            (
+                "INSERT INTO user_tiers (user_id, tier, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET tier = excluded.tier, updated_at = excluded.updated_at",
+                (user_id, tier, at.isoformat()),
+            ),
+        ])
+
+    def record_scan_completed(self, confidence: float, at: Optional[datetime] = None) -> None:
+        """A scan completed with an overall confidence score"""
+        self._record(at or datetime.utcnow(), completed=1, confidence=float(confidence))
+
+    def record_scan_failed(self, at: Optional[datetime] = None) -> None:
+        """A scan failed"""
+        self._record(at or datetime.utcnow(), failed=1)
+
+    def backfilled(self) -> bool:
+        """Whether the totals were copied from the database"""
+        return bool(self.store.query("SELECT 1 FROM analytics_meta WHERE key = ?", (BACKFILLED_AT,)))
+
+    def backfill(self, database: Any) -> bool:
+        """
+        Copy the all-time scan total and every user's tier from the database,
+        once (blocking; run off the event loop)
+
+        The total is replaced, not added to: scans started since the rollups
+        existed are in the database count too. Returns whether it ran here;
+        failures are logged and retried on the next start.
+        """
+        if self.backfilled():
+            return False
+        try:
+            scans = database.count_scans()
+            users: List[Dict[str, Any]] = []
+            while True:
+                page = database.list_user_tiers(BACKFILL_PAGE_SIZE, users[-1]["user_id"] if users else None)
+                users.extend(page)
+                if len(page) < BACKFILL_PAGE_SIZE:
+                    break
+            now = datetime.utcnow().isoformat()
+            # One worker of the host backfills; the others find it done
+            with self.store.write_transaction() as conn:
+                if conn.execute("SELECT 1 FROM analytics_meta WHERE key = ?", (BACKFILLED_AT,)).fetchone():
+                    return False
+                conn.execute(
+                    "INSERT INTO scan_rollups (granularity, bucket, scans) VALUES (?, 'all', ?) "
+                    "ON CONFLICT (granularity, bucket) DO UPDATE SET scans = excluded.scans",
+                    (TOTAL, scans),
+                )
+                conn.executemany(
+                    "INSERT INTO user_tiers (user_id, tier, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET tier = excluded.tier, updated_at = excluded.updated_at",
+                    [(user["user_id"], user.get("subscription_tier") or "basic", now) for user in users],
+                )
+                conn.execute("INSERT INTO analytics_meta (key, value) VALUES (?, ?)", (BACKFILLED_AT, now))
+        except Exception as e:
+            logger.error(f"Error backfilling analytics: {e}")
+            return False
+        logger.info(f"Analytics backfilled: {scans} scans, {len(users)} users")
+        return True
+
+    def _maybe_prune(self, at: datetime) -> None:
+        """Drop expired hourly buckets and active-user rows, at most hourly"""
+        hour = at.strftime("%Y-%m-%dT%H")
+        with self._prune_lock:
+            if self._last_prune == hour:
+                return
+            self._last_prune = hour
+        hourly_cutoff = (at - timedelta(days=self.hourly_retention_days)).strftime("%Y-%m-%dT%H")
+        active_cutoff = (at - timedelta(days=self.active_user_retention_days)).strftime("%Y-%m-%d")
+        try:
+            self.store.transaction([
+                ("DELETE FROM scan_rollups WHERE granularity = ? AND bucket < ?", (HOUR, hourly_cutoff)),
+                ("DELETE FROM daily_active_users WHERE day < ?", (active_cutoff,)),
+            ])
+        except Exception as e:
+            logger.warning(f"Error pruning analytics rollups: {e}")
+
+    def summary(self, days: int = 7, hours: int = 24, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Dashboard analytics for the last ``days`` days and ``hours`` hours"""
+        now = now or datetime.utcnow()
+        today = now.strftime("%Y-%m-%d")
+        day_start = (now - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        hour_start = (now - timedelta(hours=hours - 1)).strftime("%Y-%m-%dT%H")
+
+        totals = self.store.query(
+            "SELECT * FROM scan_rollups WHERE granularity = ? AND bucket = 'all'", (TOTAL,)
+        )
+        daily_rows = self.store.query(
+            "SELECT * FROM scan_rollups WHERE granularity = ? AND bucket >= ? ORDER BY bucket",
+            (DAY, day_start),
+        )
+        hourly_rows = self.store.query(
+            "SELECT * FROM scan_rollups WHERE granularity = ? AND bucket >= ? ORDER BY bucket",
+            (HOUR, hour_start),
+        )
+        active = {
+            row["day"]: row["users"]
+            for row in self.store.query(
+                "SELECT day, COUNT(*) AS users FROM daily_active_users WHERE day >= ? GROUP BY day",
+                (day_start,),
+            )
+        }
+        tiers = {
+            row["tier"]: row["users"]
+            for row in self.store.query("SELECT tier, COUNT(*) AS users FROM user_tiers GROUP BY tier")
+        }
+        total_users = self.store.query("SELECT COUNT(*) AS users FROM user_tiers")[0]["users"]
+
+        total = _bucket_dict(totals[0]) if totals else {
+            "scans": 0, "completed": 0, "failed": 0, "average_confidence": None
+        }
+        return {
+            "total_scans": total["scans"],
+            "total_completed": total["completed"],
+            "total_failed": total["failed"],
+            "average_confidence": total["average_confidence"],
+            "total_users": total_users,
+            "active_today": active.get(today, 0),
+            "tier_counts": tiers,
+            "daily": [_bucket_dict(row, active.get(row["bucket"], 0)) for row in daily_rows],
+            "hourly": [_bucket_dict(row) for row in hourly_rows],
+            "generated_at": now,
+        }
+
+
+# Global analytics service instance (None when analytics are disabled)
+analytics_service = AnalyticsService.from_settings()
@@ -0,0 +1,245 @@
+"""
+Document Classifier
+Fast local classification of uploads (receipt, invoice, ID, multi-page form,
+blank/unreadable) from cheap image features, run before any model call
+"""
+
+import io
+import re
+import threading
+from typing import Dict, Any, Optional, TYPE_CHECKING
+from app.core.config import settings
+import logging
+
+# PIL is imported on first use, keeping it off the startup path
+if TYPE_CHECKING:
+    import PIL.Image
+
+logger = logging.getLogger(__name__)
+
+RECEIPT = "receipt"
+INVOICE = "invoice"
+ID_CARD = "id"
+FORM = "form"
+BLANK = "blank"
+
+KNOWN_TYPES = {RECEIPT, INVOICE, ID_CARD, FORM}
+
+# Features are computed on a thumbnail of at most this many pixels a side
+THUMBNAIL_SIZE = 256
+# Below these a page has no readable content
+MIN_SIDE_PIXELS = 100
+MIN_CONTRAST = 6.0
+MIN_EDGE_DENSITY = 0.004
+MIN_BRIGHTNESS = 35.0
+# Thumbnail pixels brighter than this after FIND_EDGES count as edges
+EDGE_THRESHOLD = 40
+# ID-1 cards are 85.6 x 54mm (1.585:1); 16:9 (1.78) and 4:3 (1.33) photos fall outside
+ID_MIN_RATIO = 1 / 1.68
+ID_MAX_RATIO = 1 / 1.48
+# A scanned or cropped card; camera photos of whole scenes are larger
+ID_MAX_LONG_SIDE = 2400
+ID_MIN_EDGE_DENSITY = 0.02
+
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?!s)")
+
+
+class UnreadableDocumentError(ValueError):
+    """The upload is blank or unreadable; no model call is made"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Document appears blank or unreadable ({reason})")
+        self.reason = reason
+
+
+def count_pdf_pages(file_content: bytes) -> int:
+    """
+    Page count of a PDF without rendering it
+
+    Counts page objects in the raw bytes; PDFs that hide them in compressed
+    object streams report a single page.
+    """
+    return max(1, len(_PDF_PAGE_RE.findall(file_content)))
+
+
+class DocumentFeatures:
+    """Cheap per-document features the classifier decides on"""
+
+    __slots__ = ("page_count", "width", "height", "brightness", "contrast", "edge_density")
+
+    def __init__(self, page_count: int, width: int, height: int, brightness: float,
+                 contrast: float, edge_density: float):
+        self.page_count = page_count
+        self.width = width
+        self.height = height
+        self.brightness = brightness
+        self.contrast = contrast
+        self.edge_density = edge_density
+
+    @classmethod
+    def from_image(cls, image: "PIL.Image.Image", page_count: int = 1,
+                   file_content: Optional[bytes] = None) -> "DocumentFeatures":
+        """
+        Measure a page image, downscaled before any full-resolution conversion
+
+        A not yet decoded JPEG is measured on a grayscale copy decoded at
+        reduced scale from ``file_content`` (the image itself is left as it
+        is for the model); other images are box-reduced before conversion.
+        """
+        import PIL.ImageFilter
+        import PIL.ImageStat
+        width, height = image.size
+        thumbnail = _thumbnail(image, file_content)
+        stat = PIL.ImageStat.Stat(thumbnail)
+        edges = thumbnail.filter(PIL.ImageFilter.FIND_EDGES).histogram()
+        # FIND_EDGES leaves a one-pixel border of zeros; it only lowers density
+        edge_density = sum(edges[EDGE_THRESHOLD:]) / max(1, thumbnail.width * thumbnail.height)
+        return cls(
+            page_count=page_count,
+            width=width,
+            height=height,
+            brightness=stat.mean[0],
+            contrast=stat.stddev[0],
+            edge_density=edge_density,
+        )
+
+    @property
+    def aspect_ratio(self) -> float:
+        """Height over width (> 1 is portrait)"""
+        return self.height / max(1, self.width)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "page_count": self.page_count,
+            "width": self.width,
+            "height": self.height,
+            "aspect_ratio": round(self.aspect_ratio, 3),
+            "brightness": round(self.brightness, 1),
+            "contrast": round(self.contrast, 1),
+            "edge_density": round(self.edge_density, 4),
+        }
+
+
+def _thumbnail(image: "PIL.Image.Image", file_content: Optional[bytes]) -> "PIL.Image.Image":
+    """Grayscale copy of at most THUMBNAIL_SIZE pixels a side"""
+    import PIL.Image
+    size = (THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+    if image.format == "JPEG" and file_content is not None:
+        # DCT scaling decodes 1/2 to 1/8 of the pixels, straight to grayscale
+        draft = PIL.Image.open(io.BytesIO(file_content))
+        draft.draft("L", size)
+        small = draft.convert("L")
+    else:
+        factor = max(1, max(image.size) // (2 * THUMBNAIL_SIZE))
+        try:
+            small = image.reduce(factor) if factor > 1 else image
+        except ValueError:
+            # Modes reduce() doesn't support (palette, bilevel)
+            small = image
+        small = small.convert("L")
+    if small is image:
+        small = small.copy()
+    small.thumbnail(size)
+    return small
+
+
+class Classification:
+    """Outcome of classifying one upload"""
+
+    __slots__ = ("label", "confidence", "reason", "features")
+
+    def __init__(self, label: Optional[str], confidence: float, reason: str,
+                 features: Optional[DocumentFeatures] = None):
+        self.label = label
+        self.confidence = confidence
+        self.reason = reason
+        self.features = features
+
+    @property
+    def is_blank(self) -> bool:
+        return self.label == BLANK
+
+    @property
+    def document_type(self) -> Optional[str]:
+        """Type used for prompt selection and routing (None: generic)"""
+        return self.label if self.label in KNOWN_TYPES else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "label": self.label,
+            "confidence": self.confidence,
+            "reason": self.reason,
+            "features": self.features.to_dict() if self.features else None,
+        }
+
+
+class DocumentClassifier:
+    """
+    Rule-based classifier over page geometry and text density
+
+    Geometry separates the common cases cheaply: a card-sized, densely
+    printed landscape image of ID-1 proportions is an ID, a long narrow
+    strip is a receipt, several pages are a form and a letter/A4 page with
+    text is an invoice. Anything else stays unlabeled and gets the generic
+    prompt.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "DocumentClassifier":
+        """Create a classifier from settings"""
+        return cls(enabled=settings.CLASSIFIER_ENABLED)
+
+    def classify(self, image: Optional["PIL.Image.Image"], page_count: int = 1,
+                 file_content: Optional[bytes] = None) -> Classification:
+        """Classify a document from its first page image (and the upload it was opened from)"""
+        if not self.enabled:
+            return Classification(None, 0.0, "disabled")
+        if image is None:
+            # Nothing to measure (e.g. PDFs without a rasterizer); page count still tells forms apart
+            if page_count > 1:
+                result = Classification(FORM, 0.5, "multiple_pages")
+            else:
+                result = Classification(None, 0.0, "no_image")
+        else:
+            result = self._classify(DocumentFeatures.from_image(image, page_count, file_content))
+        with self._lock:
+            key = result.label or "unknown"
+            self._counts[key] = self._counts.get(key, 0) + 1
+        return result
+
+    def _classify(self, features: DocumentFeatures) -> Classification:
+        if min(features.width, features.height) < MIN_SIDE_PIXELS:
+            return Classification(BLANK, 1.0, "too_small", features)
+        if features.brightness < MIN_BRIGHTNESS and features.contrast < 2 * MIN_CONTRAST:
+            return Classification(BLANK, 0.9, "too_dark", features)
+        if features.contrast < MIN_CONTRAST or features.edge_density < MIN_EDGE_DENSITY:
+            return Classification(BLANK, 0.9, "no_content", features)
+
+        ratio = features.aspect_ratio
+        if features.page_count > 1:
+            return Classification(FORM, 0.6, "multiple_pages", features)
+        if (
+            ID_MIN_RATIO <= ratio <= ID_MAX_RATIO
+            and max(features.width, features.height) <= ID_MAX_LONG_SIDE
+            and features.edge_density >= ID_MIN_EDGE_DENSITY
+        ):
+            return Classification(ID_CARD, 0.6, "card_like_page", features)
+        if ratio >= 2.0:
+            return Classification(RECEIPT, 0.7, "tall_narrow_page", features)
+        if 1.2 <= ratio <= 1.55 and features.edge_density >= 0.02:
+            return Classification(INVOICE, 0.5, "text_page", features)
+        return Classification(None, 0.0, "no_match", features)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Classification counts by label, for metrics"""
+        with self._lock:
+            return {"enabled": self.enabled, "labels": dict(self._counts)}
+
+
+# Global document classifier instance
+document_classifier = DocumentClassifier.from_settings()
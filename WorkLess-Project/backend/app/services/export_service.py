@@ -0,0 +1,198 @@
+"""
+Export Service
+Streams a user's stored extractions as CSV, JSON Lines or Parquet with one
+row per document and one column per field
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional
+from app.services.extraction_index import ExtractionIndex
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Document columns that precede the pivoted field columns
+DOCUMENT_COLUMNS = ["scan_id", "created_at", "file_name", "document_type", "model", "confidence_score"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Separator when a document has the same field more than once
+MULTI_VALUE_SEPARATOR = "; "
+
+# Leading characters that make spreadsheets evaluate a CSV cell as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class ExportUnavailable(Exception):
+    """The requested export format cannot be produced on this server"""
+
+
+def parquet_available() -> bool:
+    """Whether the optional pyarrow dependency is installed"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def csv_cell(value: Any) -> Any:
+    """
+    A CSV cell that spreadsheets show as text
+
+    Field names and values come from uploaded documents, so one starting
+    with a formula character is quoted with a leading apostrophe instead of
+    being run when the export is opened.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+class ExtractionExport:
+    """
+    One export of a user's documents in a date range
+
+    The field columns are resolved once up front from the distinct field
+    names in the range (sorted by normalized name), so every chunk, and every
+    export of the same range, shares one schema. Rows are then produced
+    chunk by chunk, keeping memory constant however many documents match.
+    """
+
+    def __init__(
+        self,
+        index: ExtractionIndex,
+        user_id: str,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        chunk_size: int = 500
+    ):
+        self.index = index
+        self.user_id = user_id
+        self.date_from = date_from
+        self.date_to = date_to
+        self.chunk_size = chunk_size
+        self.field_keys: List[str] = []
+        self.columns: List[str] = list(DOCUMENT_COLUMNS)
+        for column in index.field_columns(user_id, date_from, date_to):
+            self.field_keys.append(column["key"])
+            self.columns.append(self._unique_header(column["field"]))
+
+    def _unique_header(self, name: str) -> str:
+        """Header for a field column that doesn't clash with earlier columns"""
+        header = name if name not in self.columns else f"field:{name}"
+        suffix = 2
+        while header in self.columns:
+            header = f"field:{name} ({suffix})"
+            suffix += 1
+        return header
+
+    def rows(self) -> Iterator[List[List[Any]]]:
+        """Chunks of rows in column order"""
+        for documents in self.index.iter_documents(
+            self.user_id, self.date_from, self.date_to, chunk_size=self.chunk_size
+        ):
+            chunk = []
+            for document in documents:
+                values: Dict[str, List[str]] = {}
+                for item in document["fields"]:
+                    values.setdefault(item["field_key"], []).append(item["value"])
+                chunk.append(
+                    [document[column] for column in DOCUMENT_COLUMNS]
+                    + [
+                        MULTI_VALUE_SEPARATOR.join(values[key]) if key in values else None
+                        for key in self.field_keys
+                    ]
+                )
+            yield chunk
+
+    def stream(self, fmt: str) -> Iterator[bytes]:
+        """Encoded export body, one piece per chunk"""
+        if fmt == "csv":
+            return self._csv()
+        if fmt == "jsonl":
+            return self._jsonl()
+        if fmt == "parquet":
+            if not parquet_available():
+                raise ExportUnavailable("Parquet export requires pyarrow")
+            return self._parquet()
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    def _csv(self) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([csv_cell(column) for column in self.columns])
+        for chunk in self.rows():
+            writer.writerows([csv_cell(value) for value in row] for row in chunk)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    def _jsonl(self) -> Iterator[bytes]:
+        for chunk in self.rows():
+            yield "".join(
+                json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n" for row in chunk
+            ).encode("utf-8")
+
+    def _parquet(self) -> Iterator[bytes]:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema(
+            [(column, pa.float64() if column == "confidence_score" else pa.string()) for column in self.columns]
+        )
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema)
+        try:
+            for chunk in self.rows():
+                # Each chunk becomes one row group, flushed straight to the client
+                columns = list(zip(*chunk)) if chunk else [[] for _ in self.columns]
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(list(values), type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema,
+                ))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+        yield sink.drain()
+
+
+class _ChunkSink:
+    """Write-only file object whose buffered bytes are handed out and dropped"""
+
+    def __init__(self):
+        self._buffer = io.BytesIO()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._buffer.write(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer = io.BytesIO()
+        return data
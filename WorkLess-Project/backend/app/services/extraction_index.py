@@ -0,0 +1,286 @@
+"""
+Extraction Index Service
+Persists extracted fields in a local SQLite store with an FTS5 index for
+searching a user's past documents by field name and value
+"""
+
+import re
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from app.core.config import settings
+from app.core.storage import SQLiteStore, data_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    scan_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    file_name TEXT,
+    document_type TEXT,
+    model TEXT,
+    confidence_score REAL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_user_created ON documents (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS fields (
+    id INTEGER PRIMARY KEY,
+    scan_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    field_key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    confidence REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fields_user_key ON fields (user_id, field_key);
+CREATE INDEX IF NOT EXISTS fields_scan ON fields (scan_id, position);
+"""
+
+# External-content FTS table over fields, kept in sync by triggers. The owner
+# is indexed too so a search only walks the posting lists of one user.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS fields_fts USING fts5(
+    user_id, field, value, content='fields', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS fields_ai AFTER INSERT ON fields BEGIN
+    INSERT INTO fields_fts (rowid, user_id, field, value)
+    VALUES (new.id, new.user_id, new.field, new.value);
+END;
+CREATE TRIGGER IF NOT EXISTS fields_ad AFTER DELETE ON fields BEGIN
+    INSERT INTO fields_fts (fields_fts, rowid, user_id, field, value)
+    VALUES ('delete', old.id, old.user_id, old.field, old.value);
+END;
+"""
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def field_key(name: str) -> str:
+    """Normalized field name used for exact field filters ("Invoice No." -> "invoice no")"""
+    return " ".join(_TOKEN_RE.findall(name.lower()))
+
+
+def fts_query(text: str) -> Optional[str]:
+    """
+    Turn free text into a safe FTS5 query
+
+    Every word must match (as a prefix), so "acme corp" finds "ACME
+    Corporation"; FTS operators typed by users are treated as plain words.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+class ExtractionIndex:
+    """Local store of extraction results, searchable by field and value"""
+
+    def __init__(self, store: SQLiteStore):
+        self.store = store
+        self.fts_enabled = True
+        try:
+            self.store.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 fall back to LIKE matching
+            logger.warning(f"FTS5 unavailable, extraction search uses LIKE: {e}")
+            self.fts_enabled = False
+
+    @classmethod
+    def from_settings(cls) -> Optional["ExtractionIndex"]:
+        """Open the extraction index, or None when disabled"""
+        if not settings.EXTRACTION_INDEX_ENABLED:
+            return None
+        try:
+            return cls(SQLiteStore(data_path("extractions.db"), SCHEMA))
+        except Exception as e:
+            logger.warning(f"Extraction index disabled: cannot open store: {e}")
+            return None
+
+    def index_document(
+        self,
+        user_id: str,
+        fields: List[Any],
+        scan_id: Optional[str] = None,
+        file_name: Optional[str] = None,
+        document_type: Optional[str] = None,
+        model: Optional[str] = None,
+        confidence_score: Optional[float] = None,
+        created_at: Optional[datetime] = None
+    ) -> Optional[str]:
+        """Store one document's extracted fields; returns its scan id"""
+        scan_id = scan_id or str(uuid.uuid4())
+        created = (created_at or datetime.utcnow()).isoformat()
+        statements = [
+            # Re-indexing a scan replaces its fields
+            ("DELETE FROM fields WHERE scan_id = ?", (scan_id,)),
+            (
+                "INSERT OR REPLACE INTO documents "
+                "(scan_id, user_id, file_name, document_type, model, confidence_score, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scan_id, user_id, file_name, document_type, model, confidence_score, created),
+            ),
+        ]
+        for position, item in enumerate(fields):
+            name, value, confidence = (
+                (item.field, item.value, item.confidence) if hasattr(item, "field")
+                else (item["field"], item["value"], item["confidence"])
+            )
+            statements.append((
+                "INSERT INTO fields (scan_id, user_id, position, field, field_key, value, confidence) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scan_id, user_id, position, name, field_key(name), value, confidence),
+            ))
+        try:
+            self.store.transaction(statements)
+        except Exception as e:
+            # Indexing must never fail a document request
+            logger.error(f"Error indexing extraction for scan {scan_id}: {e}")
+            return None
+        return scan_id
+
+    def search(
+        self,
+        user_id: str,
+        q: Optional[str] = None,
+        field: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Matching fields with their document, best matches (or newest) first
+        
+        ``date_from`` is inclusive and ``date_to`` exclusive.
+        """
+        where = ["f.user_id = ?"]
+        params: List[Any] = [user_id]
+        if field:
+            where.append("f.field_key = ?")
+            params.append(field_key(field))
+        if date_from:
+            where.append("d.created_at >= ?")
+            params.append(date_from.isoformat())
+        if date_to:
+            where.append("d.created_at < ?")
+            params.append(date_to.isoformat())
+
+        match = fts_query(q) if q else None
+        if q and not match:
+            return []
+
+        if match and self.fts_enabled:
+            # Match values only when filtering by field, so "vendor" in q
+            # doesn't match every Vendor field
+            columns = "value" if field else "{field value}"
+            owner = user_id.replace('"', '""')
+            sql = (
+                "SELECT f.scan_id, f.field, f.value, f.confidence, d.file_name, d.document_type, d.created_at "
+                "FROM fields_fts JOIN fields f ON f.id = fields_fts.rowid "
+                "JOIN documents d ON d.scan_id = f.scan_id "
+                f"WHERE fields_fts MATCH ? AND {' AND '.join(where)} "
+                # Exact value matches first, then by relevance and recency
+                "ORDER BY lower(f.value) = lower(?) DESC, fields_fts.rank, d.created_at DESC LIMIT ?"
+            )
+            params = [f'user_id : "{owner}" AND {columns} : ({match})'] + params + [q.strip(), limit]
+        else:
+            if match:
+                for token in _TOKEN_RE.findall(q):
+                    where.append("(f.value LIKE ? OR f.field LIKE ?)")
+                    params.extend([f"%{token}%", f"%{token}%"])
+            sql = (
+                "SELECT f.scan_id, f.field, f.value, f.confidence, d.file_name, d.document_type, d.created_at "
+                "FROM fields f JOIN documents d ON d.scan_id = f.scan_id "
+                f"WHERE {' AND '.join(where)} ORDER BY d.created_at DESC, f.position LIMIT ?"
+            )
+            params.append(limit)
+
+        return [dict(row) for row in self.store.query(sql, params)]
+
+    def field_columns(
+        self,
+        user_id: str,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> List[Dict[str, str]]:
+        """Distinct fields of a user's documents in a date range, ordered by key"""
+        where, params = self._document_filter(user_id, date_from, date_to)
+        rows = self.store.query(
+            "SELECT f.field_key, MIN(f.field) AS field FROM fields f "
+            "JOIN documents d ON d.scan_id = f.scan_id "
+            f"WHERE {' AND '.join(where)} GROUP BY f.field_key ORDER BY f.field_key",
+            params,
+        )
+        return [{"key": row["field_key"], "field": row["field"]} for row in rows]
+
+    def iter_documents(
+        self,
+        user_id: str,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        chunk_size: int = 500
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield a user's documents, with their fields, in chunks
+        
+        Documents come oldest first in (created_at, scan_id) order. Each chunk
+        is a keyset-paginated query, so no read is held open between chunks
+        and memory is bounded by ``chunk_size`` whatever the range.
+        """
+        after: Optional[tuple] = None
+        while True:
+            where, params = self._document_filter(user_id, date_from, date_to)
+            if after:
+                where.append("(d.created_at > ? OR (d.created_at = ? AND d.scan_id > ?))")
+                params.extend([after[0], after[0], after[1]])
+            documents = [
+                dict(row) for row in self.store.query(
+                    "SELECT d.scan_id, d.created_at, d.file_name, d.document_type, d.model, d.confidence_score "
+                    f"FROM documents d WHERE {' AND '.join(where)} "
+                    "ORDER BY d.created_at, d.scan_id LIMIT ?",
+                    params + [chunk_size],
+                )
+            ]
+            if not documents:
+                return
+            by_scan = {document["scan_id"]: document for document in documents}
+            for document in documents:
+                document["fields"] = []
+            placeholders = ", ".join("?" * len(by_scan))
+            for row in self.store.query(
+                f"SELECT scan_id, field, field_key, value, confidence FROM fields "
+                f"WHERE scan_id IN ({placeholders}) ORDER BY scan_id, position",
+                list(by_scan),
+            ):
+                by_scan[row["scan_id"]]["fields"].append(dict(row))
+            yield documents
+            if len(documents) < chunk_size:
+                return
+            after = (documents[-1]["created_at"], documents[-1]["scan_id"])
+
+    @staticmethod
+    def _document_filter(
+        user_id: str,
+        date_from: Optional[datetime],
+        date_to: Optional[datetime]
+    ) -> Tuple[List[str], List[Any]]:
+        """WHERE clauses selecting a user's documents in [date_from, date_to)"""
+        where = ["d.user_id = ?"]
+        params: List[Any] = [user_id]
+        if date_from:
+            where.append("d.created_at >= ?")
+            params.append(date_from.isoformat())
+        if date_to:
+            where.append("d.created_at < ?")
+            params.append(date_to.isoformat())
+        return where, params
+
+
+# Global extraction index instance (None when disabled)
+extraction_index = ExtractionIndex.from_settings()
@@ -0,0 +1,388 @@
+"""
+Fake Backends
+Deterministic in-process stand-ins for Gemini and Supabase with configurable
+latency distributions, for benchmarks and local development
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple, Iterator, Deque
+from app.core.config import settings
+from app.services.scan_history import scan_history_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+_FIELD_NAMES = [
+    "Name", "Date", "Amount", "Currency", "Vendor", "Invoice Number",
+    "Reference", "Description", "Tax", "Total", "Address", "Phone",
+    "Email", "Due Date", "Account Number", "ID Number", "Quantity",
+    "Unit Price", "Payment Method", "Signature Date",
+]
+
+
+class ServiceUnavailable(Exception):
+    """Injected retryable upstream error (matches the SDK exception name)"""
+
+
+class LatencyModel:
+    """Lognormal latency distribution with a deterministic seed"""
+
+    def __init__(self, median_ms: float, sigma: float = 0.35, seed: int = 0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """Draw one latency, in seconds"""
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            factor = self._rng.lognormvariate(0, self.sigma) if self.sigma > 0 else 1.0
+        return self.median_ms * factor / 1000
+
+
+class ReplayScript:
+    """
+    Recorded upstream behaviour of one request, played back by the fakes
+
+    Built from a request recorder log entry (see benchmarks/replay_traffic.py).
+    While a script is current, each fake model call returns the next
+    recorded output of that model after its recorded latency (or fails
+    like it did), and each database call takes the recorded latency of the
+    next call of that name. Latencies are multiplied by ``latency_scale``.
+    Calls beyond what was recorded fall back to the synthetic behaviour.
+    """
+
+    def __init__(self, model_calls: List[Dict[str, Any]], db_calls: List[Dict[str, Any]],
+                 latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._model: Dict[str, Deque[Dict[str, Any]]] = {}
+        for call in model_calls:
+            self._model.setdefault(call["model"], deque()).append(call)
+        self._db: Dict[str, Deque[float]] = {}
+        for call in db_calls:
+            self._db.setdefault(call["call"], deque()).append(call["ms"] / 1000)
+        self._lock = threading.Lock()
+
+    def next_model_call(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """The next recorded call of a model, if any are left"""
+        with self._lock:
+            calls = self._model.get(model_name)
+            return calls.popleft() if calls else None
+
+    def db_latency(self, call: str) -> Optional[float]:
+        """Scaled latency of the next recorded database call of this name, in seconds"""
+        with self._lock:
+            latencies = self._db.get(call)
+            return latencies.popleft() * self.latency_scale if latencies else None
+
+
+# The script of the request being replayed (set per request by the replay tool)
+replay_script: ContextVar[Optional[ReplayScript]] = ContextVar("replay_script", default=None)
+
+
+class _FakeUsage:
+    """Mimics the SDK's usage metadata"""
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class _FakeResponse:
+    """Mimics a (streamed) GenerateContentResponse chunk"""
+
+    def __init__(self, text: str, usage: Optional[_FakeUsage] = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+def _content_signature(content_parts: List[Any]) -> Tuple[str, int]:
+    """Stable signature and rough pixel count of the request content"""
+    digest = hashlib.sha256()
+    pixels = 0
+    for part in content_parts:
+        if isinstance(part, str):
+            digest.update(part.encode("utf-8"))
+        elif hasattr(part, "size") and hasattr(part, "tobytes"):
+            width, height = part.size
+            pixels += width * height
+            digest.update(f"{part.mode}:{width}x{height}".encode())
+            # A thumbnail keeps hashing cheap while still varying with content
+            digest.update(part.resize((16, 16)).tobytes())
+        else:
+            digest.update(repr(part).encode("utf-8"))
+    return digest.hexdigest(), pixels
+
+
+class FakeGenerativeModel:
+    """
+    Drop-in for ``genai.GenerativeModel``
+
+    Output is a deterministic function of the model name and request content;
+    the fast model reports lower confidences so routing escalations happen.
+    Calls block like the real SDK and are run in worker threads by callers.
+    """
+
+    def __init__(self, model_name: str, latency: LatencyModel, error_rate: float = 0.0, seed: int = 0):
+        self.model_name = model_name
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, model_name: str) -> "FakeGenerativeModel":
+        """Build a fake model from application settings"""
+        median = settings.FAKE_MODEL_LATENCY_MS
+        if model_name != settings.GEMINI_MODEL:
+            median *= settings.FAKE_MODEL_FAST_LATENCY_RATIO
+        return cls(
+            model_name,
+            LatencyModel(median, settings.FAKE_MODEL_LATENCY_SIGMA, settings.FAKE_SEED),
+            error_rate=settings.FAKE_MODEL_ERROR_RATE,
+            seed=settings.FAKE_SEED,
+        )
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def render(self, content_parts: List[Any]) -> Tuple[str, _FakeUsage]:
+        """Deterministic response text and usage for a request"""
+        signature, pixels = _content_signature(content_parts)
+        rng = random.Random(f"{self.model_name}:{signature}")
+        is_pro = self.model_name == settings.GEMINI_MODEL
+        low = 85 if is_pro else 55
+
+        # Denser (larger) pages yield more fields
+        count = min(len(_FIELD_NAMES), 4 + pixels // 250_000 + rng.randrange(4))
+        fields = [
+            {
+                "field": name,
+                "value": f"{name.lower().replace(' ', '-')}-{rng.randrange(10_000):04d}",
+                "confidence": round(rng.uniform(low, 99), 1),
+            }
+            for name in rng.sample(_FIELD_NAMES, count)
+        ]
+        payload = {
+            "fields": fields,
+            "explanation": f"Synthetic extraction of {count} fields by {self.model_name}.",
+            "formatting_changes": [],
+            "overall_confidence": round(sum(f["confidence"] for f in fields) / count, 1),
+        }
+        text = "```json\n" + json.dumps(payload, indent=2) + "\n```"
+        # Image tokens plus roughly four characters per prompt token
+        text_chars = sum(len(part) for part in content_parts if isinstance(part, str))
+        prompt_tokens = 258 * max(1, pixels // 600_000) + text_chars // 4
+        return text, _FakeUsage(prompt_tokens, len(text) // 4)
+
+    def generate_content(self, content_parts, generation_config=None, stream: bool = False):
+        """Block for a sampled latency, then return a fake response"""
+        script = replay_script.get()
+        recorded = script.next_model_call(self.model_name) if script else None
+        if recorded is not None:
+            return self._replay(recorded, script.latency_scale, stream)
+        
+        delay = self.latency.sample()
+        if self._should_fail():
+            time.sleep(delay / 4)
+            raise ServiceUnavailable(f"503 injected failure from fake {self.model_name}")
+
+        text, usage = self.render(content_parts)
+        if not stream:
+            time.sleep(delay)
+            return _FakeResponse(text, usage)
+        return self._stream(text, usage, delay)
+
+    def _replay(self, recorded: Dict[str, Any], latency_scale: float, stream: bool):
+        """Play back a recorded call: its latency, then its output or failure"""
+        delay = recorded["ms"] / 1000 * latency_scale
+        if recorded["error"]:
+            time.sleep(delay)
+            raise ServiceUnavailable(f"503 replayed failure from fake {self.model_name}")
+        usage = _FakeUsage(recorded["prompt_tokens"], recorded["output_tokens"])
+        if not stream:
+            time.sleep(delay)
+            return _FakeResponse(recorded["text"], usage)
+        return self._stream(recorded["text"], usage, delay)
+
+    def _stream(self, text: str, usage: _FakeUsage, delay: float) -> Iterator[_FakeResponse]:
+        """Yield the response in chunks spread over the sampled latency"""
+        # Roughly a quarter of the latency is time-to-first-token
+        time.sleep(delay / 4)
+        chunk_size = 64
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        per_chunk = (delay * 3 / 4) / max(1, len(chunks))
+        for chunk in chunks:
+            time.sleep(per_chunk)
+            yield _FakeResponse(chunk, usage)
+
+
+class InMemoryDatabaseService:
+    """
+    In-process stand-in for SupabaseService
+
+    Implements the same methods over dicts guarded by a lock, sleeping for a
+    sampled latency on every call to mimic the network round trip.
+    """
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.scans: Dict[str, Dict[str, Any]] = {}
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "InMemoryDatabaseService":
+        """Build the in-memory database from application settings"""
+        return cls(LatencyModel(settings.FAKE_DB_LATENCY_MS, 0.25, settings.FAKE_SEED))
+
+    def _round_trip(self, call: str) -> None:
+        script = replay_script.get()
+        latency = script.db_latency(call) if script else None
+        time.sleep(self.latency.sample() if latency is None else latency)
+
+    def create_scan_record(
+        self,
+        user_id: str,
+        file_name: str,
+        file_size: int,
+        status: str = "pending"
+    ) -> Optional[Dict[str, Any]]:
+        """Create a new scan record"""
+        self._round_trip("create_scan_record")
+        record = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "file_name": file_name,
+            "file_size": file_size,
+            "status": status,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        with self._lock:
+            self.scans[record["id"]] = record
+        scan_history_cache.invalidate(user_id)
+        return dict(record)
+
+    def update_scan_status(
+        self,
+        scan_id: str,
+        status: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        user_id: Optional[str] = None
+    ) -> bool:
+        """Update scan status and metadata"""
+        self._round_trip("update_scan_status")
+        with self._lock:
+            record = self.scans.get(scan_id)
+            if record is None:
+                return False
+            record["status"] = status
+            if metadata:
+                record.update(metadata)
+        scan_history_cache.invalidate(user_id or record["user_id"])
+        return True
+    
+    def list_scans(
+        self,
+        user_id: str,
+        columns: List[str],
+        limit: int,
+        cursor: Optional[Tuple[str, str]] = None,
+        status: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """List a user's scans newest first, keyset-paginated on (created_at, id)"""
+        self._round_trip("list_scans")
+        with self._lock:
+            rows = [
+                r for r in self.scans.values()
+                if r["user_id"] == user_id
+                and (not status or r["status"] == status)
+                and (not cursor or (r["created_at"], r["id"]) < cursor)
+            ]
+        rows.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+        return [{c: r.get(c) for c in columns} for r in rows[:limit]]
+
+    def list_scans_by_status(
+        self,
+        status: str,
+        created_before: str,
+        limit: int = 500
+    ) -> List[Dict[str, Any]]:
+        """Scans of any user in a status, created before an ISO timestamp"""
+        self._round_trip("list_scans_by_status")
+        with self._lock:
+            rows = [
+                r for r in self.scans.values()
+                if r["status"] == status and r["created_at"] < created_before
+            ]
+        rows.sort(key=lambda r: r["created_at"])
+        return [{c: r[c] for c in ("id", "user_id", "created_at")} for r in rows[:limit]]
+
+    def count_scans(self) -> int:
+        """Number of scans of all users"""
+        self._round_trip("count_scans")
+        with self._lock:
+            return len(self.scans)
+
+    def list_user_tiers(self, limit: int = 1000, after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Users' subscription tiers, keyset-paginated on user_id"""
+        self._round_trip("list_user_tiers")
+        with self._lock:
+            rows = sorted(
+                (user_id, metadata.get("subscription_tier") or "basic")
+                for user_id, metadata in self.users.items()
+                if not after or user_id > after
+            )
+        return [{"user_id": user_id, "subscription_tier": tier} for user_id, tier in rows[:limit]]
+
+    def ping(self) -> None:
+        """Cheapest round trip to the database, for health probes"""
+        self._round_trip("ping")
+
+    def get_user_metadata(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get user metadata"""
+        self._round_trip("get_user_metadata")
+        with self._lock:
+            metadata = self.users.get(user_id)
+            return dict(metadata) if metadata else None
+
+    def update_user_scan_stats(
+        self,
+        user_id: str,
+        scans_today: int,
+        total_scans: int,
+        last_scan_date: str
+    ) -> bool:
+        """Update user scan statistics"""
+        self._round_trip("update_user_scan_stats")
+        with self._lock:
+            metadata = self.users.setdefault(user_id, {"user_id": user_id, "subscription_tier": "basic"})
+            metadata.update({
+                "scans_today": scans_today,
+                "total_scans": total_scans,
+                "last_scan_date": last_scan_date,
+            })
+        return True
+
+    def check_scan_limit(self, user_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Check if user has reached scan limit"""
+        # Its own round trip (not get_user_metadata's), as recorded from the real service
+        self._round_trip("check_scan_limit")
+        with self._lock:
+            metadata = dict(self.users[user_id]) if user_id in self.users else None
+        if not metadata:
+            return True, None
+        if metadata.get("subscription_tier", "basic") == "basic" and metadata.get("scans_today", 0) >= 3:
+            return False, metadata
+        return True, metadata
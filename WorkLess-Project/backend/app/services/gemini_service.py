@@ -3,26 +3,200 @@ Gemini 1.5 Pro Document Intelligence Service
 Handles document processing using Google's Gemini API
 """
 
+import asyncio
 import base64
+import contextvars
 import io
+import threading
 import time
-import json
-import re
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
-import PIL.Image
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterator, Tuple, TYPE_CHECKING
 from app.core.config import settings
-from app.models.schemas import FieldData, FormattingChange
+from app.models.schemas import FieldData
+from app.services.model_router import (
+    FAST_TIER,
+    PRO_TIER,
+    RoutingDecision,
+    routing_policy,
+    routing_recorder,
+)
+from app.services.document_classifier import (
+    Classification,
+    DocumentFeatures,
+    UnreadableDocumentError,
+    count_pdf_pages,
+    document_classifier,
+)
+from app.services.local_ocr import LocalText, local_text_extractor
+from app.services.normalizer import field_normalizer
+from app.services.page_tiling import TILE_PROMPT_NOTE, PagePlan, TileMerger, page_tiler
+from app.services.prompt_registry import PromptTemplate, prompt_registry
+from app.services.request_recorder import current_recording, record_model_call, stage
+from app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    ResilientCaller,
+    UpstreamError,
+    is_retryable,
+)
+from app.services.response_parser import (
+    IncrementalFieldParser,
+    ParsedModelResponse,
+    parse_model_response,
+)
+from app.services.result_cache import result_cache, result_cache_key
+from app.services.usage_meter import usage_meter
 import logging
 
+# google.generativeai (~0.5s) and PIL are imported on first use rather than
+# at startup: cold-start time is user-visible on scale-to-zero hosts
+if TYPE_CHECKING:
+    import PIL.Image
+
 logger = logging.getLogger(__name__)
 
+# Generation parameters shared by all extraction calls (the SDK accepts a
+# plain mapping, so building them needs no SDK import)
+GENERATION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+}
+
+
+def _overall_confidence(parsed_response: ParsedModelResponse) -> float:
+    """Calculate overall confidence (average of field confidences)"""
+    if parsed_response.fields:
+        return sum(f.confidence for f in parsed_response.fields) / len(parsed_response.fields)
+    return parsed_response.overall_confidence or 0
+
+
+def _usage_counts(response: Any) -> Tuple[int, int]:
+    """Prompt and output token counts reported with a response, if any"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return 0, 0
+    return (
+        getattr(usage, "prompt_token_count", 0) or 0,
+        getattr(usage, "candidates_token_count", 0) or 0,
+    )
+
+
+async def _iterate_in_thread(
+    iterator: Iterator[Any],
+    deadline: Optional[float] = None
+) -> AsyncIterator[Any]:
+    """
+    Drive a blocking iterator in a worker thread without blocking the loop
+    
+    ``deadline`` is a ``time.monotonic()`` timestamp; once it passes,
+    DeadlineExceededError is raised and the worker's output is abandoned.
+    If the consumer stops early (a disconnected client closes the
+    generator), the worker is told to stop after the item it is reading and
+    is not waited for.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stop = threading.Event()
+    
+    def post(item: Any) -> None:
+        if stop.is_set():
+            return
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass  # Loop closed: nobody is reading any more
+    
+    def pump():
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    break
+                post(item)
+        except BaseException as e:
+            post(e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if stop.is_set() and close is not None:
+                close()
+            post(done)
+    
+    # Run with the caller's context (like asyncio.to_thread) so the worker
+    # sees the request's recording
+    loop.run_in_executor(None, contextvars.copy_context().run, pump)
+    try:
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError("Streamed generation exceeded its deadline")
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+class PreparedDocument:
+    """An upload decoded and classified, ready for extraction"""
+    
+    __slots__ = (
+        "file_content", "mime_type", "image", "classification", "document_type", "plan",
+        "local_text", "local_text_read"
+    )
+    
+    def __init__(
+        self,
+        file_content: bytes,
+        mime_type: str,
+        image: Optional["PIL.Image.Image"],
+        classification: Classification,
+        document_type: Optional[str]
+    ):
+        self.file_content = file_content
+        self.mime_type = mime_type
+        self.image = image
+        self.classification = classification
+        self.document_type = document_type
+        # Crop and tiling, decided on first use off the event loop
+        self.plan: Optional[PagePlan] = None
+        # Text read by local OCR (or a PDF's text layer), once per document
+        self.local_text: Optional[LocalText] = None
+        self.local_text_read = False
+    
+    def _render_page(self) -> List["PIL.Image.Image"]:
+        if self.plan is None:
+            self.plan = page_tiler.plan(self.image)
+            if not self.plan.is_identity:
+                logger.debug(f"Page plan: {self.plan.to_dict()}")
+        return self.plan.render(self.image)
+    
+    async def page_images(self) -> List[Optional["PIL.Image.Image"]]:
+        """The page as sent to the model: cropped, or cut into tiles, when tiling is enabled"""
+        if self.image is None or page_tiler is None:
+            return [self.image]
+        # Content detection and cropping are CPU-bound; keep them off the event loop
+        with stage("render"):
+            return await asyncio.to_thread(self._render_page)
+    
+    @property
+    def image_bytes(self) -> int:
+        """Upload size sent with each model call as the page image (0 for prompt-only calls)"""
+        return len(self.file_content) if self.image is not None else 0
+
 
 class GeminiService:
     """Gemini 1.5 Pro document intelligence service"""
     
     def __init__(self):
-        self._model = None
+        self._models: Dict[str, Any] = {}
+        self._callers: Dict[str, ResilientCaller] = {}
         self._initialized = False
     
     def _ensure_initialized(self):
@@ -30,19 +204,123 @@ class GeminiService:
         if self._initialized:
             return
         
+        if settings.MODEL_BACKEND == "fake":
+            logger.info("Using the fake model backend")
+            self._initialized = True
+            return
+        
         if not settings.GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY must be configured")
         
         # Configure Gemini API
+        import google.generativeai as genai
         genai.configure(api_key=settings.GEMINI_API_KEY)
-        self._model = genai.GenerativeModel(settings.GEMINI_MODEL)
         self._initialized = True
     
+    def get_model(self, model_name: str):
+        """Get a Gemini model by name (lazy initialization, cached)"""
+        self._ensure_initialized()
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = self._create_model(model_name)
+        return model
+    
+    @staticmethod
+    def _create_model(model_name: str):
+        """Instantiate a model client for the configured backend"""
+        if settings.MODEL_BACKEND == "fake":
+            from app.services.fake_backends import FakeGenerativeModel
+            return FakeGenerativeModel.from_settings(model_name)
+        import google.generativeai as genai
+        return genai.GenerativeModel(model_name)
+    
+    def caller_for(self, model_name: str) -> ResilientCaller:
+        """Resilience wrapper (deadline, retries, circuit) for one model"""
+        caller = self._callers.get(model_name)
+        if caller is None:
+            caller = self._callers[model_name] = ResilientCaller(
+                name=model_name,
+                deadline=settings.GEMINI_DEADLINE_SECONDS,
+                attempt_timeout=settings.GEMINI_ATTEMPT_TIMEOUT_SECONDS,
+                max_retries=settings.GEMINI_MAX_RETRIES,
+                base_delay=settings.GEMINI_RETRY_BASE_DELAY,
+                max_delay=settings.GEMINI_RETRY_MAX_DELAY,
+                hedge_enabled=settings.GEMINI_HEDGE_ENABLED,
+                breaker=CircuitBreaker(
+                    model_name,
+                    failure_threshold=settings.GEMINI_CIRCUIT_FAILURE_THRESHOLD,
+                    recovery_timeout=settings.GEMINI_CIRCUIT_RECOVERY_SECONDS
+                )
+            )
+        return caller
+    
+    def warm_up(self) -> Dict[str, float]:
+        """
+        Pay first-request costs ahead of traffic (blocking; run in a thread)
+        
+        Imports the SDK, creates the client for every model tier and loads
+        the image decoders and classifier filters. Returns the time each
+        step took, in milliseconds.
+        """
+        timings: Dict[str, float] = {}
+        
+        start = time.perf_counter()
+        try:
+            for model_name in {settings.GEMINI_MODEL, settings.GEMINI_FAST_MODEL}:
+                self.get_model(model_name)
+        except ValueError as e:
+            logger.warning(f"Model warm-up skipped: {e}")
+        timings["model_clients"] = round((time.perf_counter() - start) * 1000, 1)
+        
+        start = time.perf_counter()
+        import PIL.Image
+        PIL.Image.init()
+        DocumentFeatures.from_image(PIL.Image.new("L", (64, 64)))
+        try:
+            import pdf2image  # noqa: F401
+        except ImportError:
+            pass
+        timings["imaging"] = round((time.perf_counter() - start) * 1000, 1)
+        
+        return timings
+    
+    def probe(self) -> None:
+        """
+        Check that the model API answers, without generating (blocking; run in a thread)
+        
+        Fetches the fast model's metadata, which costs no tokens. Raises on
+        failure.
+        """
+        self.get_model(settings.GEMINI_FAST_MODEL)
+        if settings.MODEL_BACKEND == "fake":
+            return
+        import google.generativeai as genai
+        genai.get_model(f"models/{settings.GEMINI_FAST_MODEL}")
+    
+    def open_circuits(self) -> List[str]:
+        """Models whose circuit breaker currently rejects calls"""
+        return [name for name, caller in self._callers.items() if caller.breaker.state == CircuitBreaker.OPEN]
+    
+    def resilience_snapshot(self) -> Dict[str, Any]:
+        """Circuit and latency state per model, for metrics"""
+        return {name: caller.snapshot() for name, caller in self._callers.items()}
+    
     @property
     def model(self):
-        """Get the Gemini model (lazy initialization)"""
-        self._ensure_initialized()
-        return self._model
+        """Get the pro Gemini model (lazy initialization)"""
+        return self.get_model(settings.GEMINI_MODEL)
+    
+    @staticmethod
+    def model_for_tier(tier: str) -> str:
+        """Model name serving a routing tier"""
+        return settings.GEMINI_MODEL if tier == PRO_TIER else settings.GEMINI_FAST_MODEL
+    
+    @staticmethod
+    def initial_tier(document_type: Optional[str]) -> str:
+        """Tier for the first model call on a document"""
+        if not settings.MODEL_ROUTING_ENABLED:
+            return PRO_TIER
+        return routing_policy.initial_tier(document_type)
     
     def _encode_image(self, image_data: bytes) -> str:
         """Encode image to base64"""
@@ -66,163 +344,615 @@ class GeminiService:
                 "data": base64_image
             }
     
+    def _load_page(self, file_content: bytes, mime_type: str) -> Optional["PIL.Image.Image"]:
+        """Decode the (first) page image sent to Gemini, if any"""
+        if mime_type.startswith("image/"):
+            # For images, use PIL Image
+            import PIL.Image
+            try:
+                return PIL.Image.open(io.BytesIO(file_content))
+            except PIL.UnidentifiedImageError:
+                raise UnreadableDocumentError("undecodable_image")
+        elif mime_type == "application/pdf":
+            # For PDF, convert first page to image (simplified approach)
+            # In production, you might want to extract all pages
+            try:
+                from pdf2image import convert_from_bytes
+                images = convert_from_bytes(file_content, first_page=1, last_page=1)
+                if images:
+                    return images[0]
+                else:
+                    raise UnreadableDocumentError("empty_pdf")
+            except ImportError:
+                # Fallback: treat as text (won't work well, but better than error)
+                logger.warning("pdf2image not installed, PDF processing may be limited")
+                return None
+        else:
+            # Fallback to text-only
+            return None
+    
+    def prepare_document(
+        self,
+        file_content: bytes,
+        mime_type: str,
+        document_type: Optional[str] = None
+    ) -> PreparedDocument:
+        """
+        Decode and classify an upload before any model call
+        
+        The classifier's label picks the prompt and routing tier unless the
+        client gave a type hint. PDFs with a text layer are not rendered when
+        their text may be sent instead. Raises UnreadableDocumentError for
+        blank or unreadable uploads.
+        """
+        if (
+            local_text_extractor is not None
+            and local_text_extractor.text_only
+            and local_text_extractor.has_text_layer(file_content, mime_type)
+        ):
+            image = None
+        else:
+            image = self._load_page(file_content, mime_type)
+        if mime_type == "application/pdf":
+            page_count = count_pdf_pages(file_content)
+        else:
+            page_count = getattr(image, "n_frames", 1)
+        classification = document_classifier.classify(image, page_count, file_content)
+        recording = current_recording()
+        if recording:
+            recording.note(
+                file_size=len(file_content),
+                mime_type=mime_type,
+                pages=page_count,
+                document_type=document_type or classification.document_type,
+                type_hinted=document_type is not None,
+                label=classification.label
+            )
+        if classification.is_blank and settings.CLASSIFIER_REJECT_BLANK:
+            raise UnreadableDocumentError(classification.reason)
+        return PreparedDocument(
+            file_content,
+            mime_type,
+            image,
+            classification,
+            document_type or classification.document_type
+        )
+    
+    async def _read_locally(self, prepared: PreparedDocument) -> Optional[LocalText]:
+        """
+        Local text of the document, read once in the OCR process pool
+        
+        A PDF left unrendered for its text layer is rendered now if that
+        text turns out not to be enough to send instead.
+        """
+        if local_text_extractor is None:
+            return None
+        if not prepared.local_text_read:
+            with stage("local_text"):
+                prepared.local_text = await local_text_extractor.extract(
+                    prepared.file_content, prepared.mime_type, prepared.image
+                )
+            prepared.local_text_read = True
+        if (
+            prepared.image is None
+            and prepared.mime_type == "application/pdf"
+            and not local_text_extractor.sufficient(prepared.local_text)
+        ):
+            prepared.image = await asyncio.to_thread(self._load_page, prepared.file_content, prepared.mime_type)
+        return prepared.local_text
+    
+    @staticmethod
+    def _text_only(local_text: Optional[LocalText]) -> bool:
+        """Whether the local text is sent instead of the page image"""
+        return local_text_extractor is not None and local_text_extractor.sufficient(local_text)
+    
+    def _build_content_parts(self, image: Optional["PIL.Image.Image"], prompt: PromptTemplate) -> List[Any]:
+        """Build the content parts (document image + prompt) for Gemini"""
+        if image is None:
+            return [prompt.text]
+        return [image, prompt.text]
+    
+    def _build_result(
+        self,
+        parsed_response: ParsedModelResponse,
+        response_text: str,
+        start_time: float
+    ) -> Dict[str, Any]:
+        """Turn a parsed model response into the service result dict"""
+        refined_data, normalization_changes = field_normalizer.normalize(parsed_response.fields)
+        if parsed_response.is_empty:
+            # Nothing structured could be recovered; surface the raw text
+            explanation = response_text
+        else:
+            explanation = parsed_response.explanation or "Document processed successfully."
+        
+        overall_confidence = _overall_confidence(parsed_response)
+        processing_time = time.time() - start_time
+        
+        return {
+            "refined_data": refined_data,
+            "ai_explanation": explanation,
+            "formatting_changes": parsed_response.formatting_changes + normalization_changes,
+            "confidence_score": round(overall_confidence, 2),
+            "processing_time": round(processing_time, 2)
+        }
+    
+    def _stream_texts(self, model_name: str, content_parts: List[Any], usage: Dict[str, int]) -> Iterator[str]:
+        """Issue a streamed generation request and yield each chunk's text"""
+        response = self.get_model(model_name).generate_content(
+            content_parts,
+            generation_config=GENERATION_CONFIG,
+            stream=True
+        )
+        for chunk in response:
+            # Usage metadata is cumulative; the last chunk carries the totals
+            prompt_tokens, output_tokens = _usage_counts(chunk)
+            if prompt_tokens or output_tokens:
+                usage["prompt_tokens"], usage["output_tokens"] = prompt_tokens, output_tokens
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety metadata only)
+                continue
+            if text:
+                yield text
+    
+    @staticmethod
+    def _meter(
+        user_id: Optional[str],
+        subscription_tier: Optional[str],
+        document_type: Optional[str],
+        model_name: Optional[str],
+        **usage: Any
+    ) -> None:
+        """Add a model call or cache hit to the usage meter"""
+        if usage_meter:
+            usage_meter.record(user_id, subscription_tier, document_type, model_name, **usage)
+    
+    async def _attempt(
+        self,
+        decision: RoutingDecision,
+        tier: str,
+        content_parts: List[Any],
+        subscription_tier: Optional[str] = None,
+        image_bytes: int = 0
+    ) -> Tuple[ParsedModelResponse, str]:
+        """Run one extraction call on a tier's model and record it"""
+        model_name = self.model_for_tier(tier)
+        attempt_start = time.time()
+        try:
+            model = self.get_model(model_name)
+            response = await self.caller_for(model_name).call(
+                model.generate_content,
+                content_parts,
+                generation_config=GENERATION_CONFIG
+            )
+            response_text = response.text
+        except Exception as e:
+            latency = time.time() - attempt_start
+            record_model_call(model_name, latency, error=True)
+            decision.add_attempt(tier, model_name, latency, image_bytes=image_bytes, error=str(e))
+            self._meter(
+                decision.user_id, subscription_tier, decision.document_type, model_name,
+                image_bytes=image_bytes, latency=latency, error=True
+            )
+            raise
+        
+        latency = time.time() - attempt_start
+        parsed_response = parse_model_response(response_text)
+        prompt_tokens, output_tokens = _usage_counts(response)
+        record_model_call(model_name, latency, response_text, prompt_tokens, output_tokens)
+        self._meter(
+            decision.user_id, subscription_tier, decision.document_type, model_name,
+            prompt_tokens=prompt_tokens, output_tokens=output_tokens, image_bytes=image_bytes, latency=latency
+        )
+        confidences = [f.confidence for f in parsed_response.fields]
+        decision.add_attempt(
+            tier,
+            model_name,
+            latency,
+            prompt_tokens=prompt_tokens,
+            output_tokens=output_tokens,
+            image_bytes=image_bytes,
+            overall_confidence=_overall_confidence(parsed_response),
+            min_field_confidence=min(confidences) if confidences else None,
+            fields_extracted=len(confidences)
+        )
+        return parsed_response, response_text
+    
+    async def _extract(
+        self,
+        decision: RoutingDecision,
+        tier: str,
+        content_parts: List[Any],
+        subscription_tier: Optional[str] = None,
+        image_bytes: int = 0,
+        allow_empty: bool = False
+    ) -> Tuple[ParsedModelResponse, str]:
+        """
+        Extract with the tier's model, escalating to the pro model when needed
+        
+        ``allow_empty`` accepts a fast-model result without fields instead of
+        escalating it (a page tile can legitimately hold none).
+        """
+        parsed_response = None
+        escalation_reason = None
+        try:
+            parsed_response, response_text = await self._attempt(
+                decision, tier, content_parts, subscription_tier, image_bytes
+            )
+        except Exception as e:
+            if tier == PRO_TIER:
+                raise
+            logger.warning(f"Fast model failed, escalating to pro model: {e}")
+            escalation_reason = "fast_model_error"
+        
+        if tier == FAST_TIER and parsed_response is not None:
+            confidences = [f.confidence for f in parsed_response.fields]
+            if confidences or not allow_empty:
+                escalation_reason = routing_policy.escalation_reason(
+                    _overall_confidence(parsed_response),
+                    min(confidences) if confidences else None,
+                    len(confidences)
+                )
+        
+        if escalation_reason:
+            decision.escalation_reason = decision.escalation_reason or escalation_reason
+            parsed_response, response_text = await self._attempt(
+                decision, PRO_TIER, content_parts, subscription_tier, image_bytes
+            )
+        return parsed_response, response_text
+    
+    async def _extract_tiles(
+        self,
+        decision: RoutingDecision,
+        tier: str,
+        prepared: PreparedDocument,
+        tiles: List["PIL.Image.Image"],
+        prompt: PromptTemplate,
+        subscription_tier: Optional[str] = None
+    ) -> AsyncIterator[Tuple[int, ParsedModelResponse, str]]:
+        """
+        Extract every tile of a page concurrently, yielding results as they finish
+        
+        Each tile is routed on its own, so only tiles with low-confidence
+        reads are escalated. A tile that fails fails the document.
+        """
+        plan = prepared.plan
+        decision.tiles = len(tiles)
+        semaphore = asyncio.Semaphore(max(1, settings.TILING_MAX_CONCURRENCY))
+        
+        async def extract_tile(index: int) -> Tuple[int, ParsedModelResponse, str]:
+            note = TILE_PROMPT_NOTE.format(index=index + 1, count=len(tiles))
+            async with semaphore:
+                parsed_response, response_text = await self._extract(
+                    decision,
+                    tier,
+                    [tiles[index], f"{prompt.text}\n\n{note}"],
+                    subscription_tier,
+                    plan.byte_share(plan.tiles[index], prepared.image_bytes),
+                    allow_empty=True
+                )
+            return index, parsed_response, response_text
+        
+        tasks = [asyncio.create_task(extract_tile(index)) for index in range(len(tiles))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
     async def process_document(
         self,
         file_content: bytes,
         mime_type: str,
-        user_id: Optional[str] = None
+        user_id: Optional[str] = None,
+        document_type: Optional[str] = None,
+        prepared: Optional[PreparedDocument] = None,
+        subscription_tier: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        Process document using Gemini 1.5 Pro
+        Process document using Gemini
+        
+        Runs the fast model first and escalates to the pro model when the
+        result's confidence is below the routing thresholds (or the document
+        type always needs the pro model). When local OCR or a PDF text layer
+        reads the document well enough, that text is sent instead of the
+        image; otherwise tiled pages are extracted tile by tile, concurrently,
+        and the fields merged. The local text also backs the fallback when
+        the upstream fails. Pass ``prepared`` from ``prepare_document`` to
+        reuse its decoded page and classification. Token usage is metered per
+        user and ``subscription_tier``.
         
         Returns structured data with extracted fields, explanations, and confidence scores
         """
         start_time = time.time()
+        prepared = prepared or await asyncio.to_thread(self.prepare_document, file_content, mime_type, document_type)
+        document_type = prepared.document_type
+        prompt = prompt_registry.select(document_type, user_id)
+        cache_key = result_cache_key(file_content, mime_type, prompt)
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached is not None:
+            logger.info(f"Serving cached extraction ({prompt.key})")
+            self._meter(user_id, subscription_tier, document_type, cached.get("model"), cached=True)
+            cached["processing_time"] = round(time.time() - start_time, 2)
+            return cached
+        
+        tier = self.initial_tier(document_type)
+        decision = RoutingDecision(user_id, document_type, tier, prompt_version=prompt.key)
         
         try:
-            # Prepare the image/document for Gemini
-            image_data = self._prepare_image_for_gemini(file_content, mime_type)
-            
-            # Construct the prompt for document intelligence
-            prompt = """Analyze this document and extract structured data. 
-
-Please:
-1. Extract all relevant fields (Name, Date, Amount, Description, Reference, etc.)
-2. Standardize date formats to ISO 8601 (YYYY-MM-DD)
-3. Identify any OCR errors or inconsistencies
-4. Provide confidence scores for each extracted field (0-100)
-5. Explain what data points you identified and any formatting changes made
-
-Return your analysis in the following JSON format:
-{
-  "fields": [
-    {
-      "field": "field_name",
-      "value": "extracted_value",
-      "confidence": 95
-    }
-  ],
-  "explanation": "Brief explanation of what was found and processed",
-  "formatting_changes": [
-    {
-      "type": "formatting|correction|structure",
-      "message": "Description of change"
-    }
-  ],
-  "overall_confidence": 95
-}
-
-Focus on accuracy and provide clear, structured data."""
-
-            # Prepare content parts for Gemini
-            if mime_type.startswith("image/"):
-                # For images, use PIL Image
-                image = PIL.Image.open(io.BytesIO(file_content))
-                content_parts = [image, prompt]
-            elif mime_type == "application/pdf":
-                # For PDF, convert first page to image (simplified approach)
-                # In production, you might want to extract all pages
-                try:
-                    from pdf2image import convert_from_bytes
-                    images = convert_from_bytes(file_content, first_page=1, last_page=1)
-                    if images:
-                        content_parts = [images[0], prompt]
-                    else:
-                        raise ValueError("Failed to convert PDF to image")
-                except ImportError:
-                    # Fallback: treat as text (won't work well, but better than error)
-                    logger.warning("pdf2image not installed, PDF processing may be limited")
-                    content_parts = [prompt]
-            else:
-                # Fallback to text-only
-                content_parts = [prompt]
-            
-            # Generate content using Gemini
-            generation_config = genai.types.GenerationConfig(
-                temperature=0.1,
-                top_p=0.95,
-                top_k=40,
-                max_output_tokens=2048,
-            )
-            
-            response = self.model.generate_content(
-                content_parts,
-                generation_config=generation_config
-            )
-            
-            # Parse the response
-            response_text = response.text
-            
-            # Extract JSON from response (handle cases where response includes markdown code blocks)
-            # Try to find JSON in the response
-            json_match = re.search(r'\{[\s\S]*\}', response_text)
-            if json_match:
-                json_str = json_match.group(0)
-                parsed_response = json.loads(json_str)
+            local_text = await self._read_locally(prepared)
+            text_only = self._text_only(local_text)
+            images = [] if text_only else await prepared.page_images()
+            if text_only:
+                # Compact text instead of the page image: a smaller, faster call
+                local_text_extractor.record("text_only")
+                decision.local_text = local_text.source
+                parsed_response, response_text = await self._extract(
+                    decision, tier, [local_text.to_prompt(prompt.text)], subscription_tier
+                )
+            elif len(images) > 1:
+                merger = TileMerger(prepared.plan)
+                async for index, tile_response, tile_text in self._extract_tiles(
+                    decision, tier, prepared, images, prompt, subscription_tier
+                ):
+                    merger.add(index, tile_response, tile_text)
+                parsed_response, response_text = merger.result()
             else:
-                # Fallback: try to parse entire response as JSON
-                try:
-                    parsed_response = json.loads(response_text)
-                except json.JSONDecodeError:
-                    # If JSON parsing fails, create a fallback response
-                    logger.warning("Failed to parse Gemini response as JSON, using fallback")
-                    parsed_response = {
-                        "fields": [],
-                        "explanation": response_text,
-                        "formatting_changes": [],
-                        "overall_confidence": 0
-                    }
-            
-            # Extract fields
-            fields = parsed_response.get("fields", [])
-            refined_data = [
-                FieldData(
-                    field=field.get("field", "Unknown"),
-                    value=field.get("value", ""),
-                    confidence=float(field.get("confidence", 0))
+                parsed_response, response_text = await self._extract(
+                    decision,
+                    tier,
+                    self._build_content_parts(images[0], prompt),
+                    subscription_tier,
+                    prepared.image_bytes
                 )
-                for field in fields
-            ]
             
-            # Extract formatting changes
-            formatting_changes = [
-                FormattingChange(
-                    type=change.get("type", "formatting"),
-                    message=change.get("message", "")
-                )
-                for change in parsed_response.get("formatting_changes", [])
-            ]
+            result = self._build_result(parsed_response, response_text, start_time)
+            result["model"] = decision.final_model
+            result["document_type"] = document_type
+            result["prompt_version"] = prompt.key
+            await asyncio.to_thread(result_cache.put, cache_key, result)
+            return result
             
-            # Calculate overall confidence (average of field confidences)
-            if refined_data:
-                overall_confidence = sum(f.confidence for f in refined_data) / len(refined_data)
+        except CircuitOpenError as e:
+            # Upstream is degraded: fail fast instead of queueing more calls
+            logger.warning(f"{e}; serving fallback extraction")
+            return self._fallback_extraction(prepared.local_text)
+        except UpstreamError as e:
+            logger.error(f"Gemini upstream failure: {e}")
+            fallback = self._fallback_extraction(prepared.local_text)
+            if fallback["refined_data"]:
+                logger.warning("Serving locally read fields as the fallback extraction")
+                return fallback
+            raise
+        except Exception as e:
+            logger.error(f"Error processing document with Gemini: {e}", exc_info=True)
+            raise Exception(f"Document processing failed: {str(e)}")
+        finally:
+            if decision.attempts:
+                routing_recorder.record(decision)
+    
+    async def stream_document(
+        self,
+        file_content: bytes,
+        mime_type: str,
+        user_id: Optional[str] = None,
+        document_type: Optional[str] = None,
+        prepared: Optional[PreparedDocument] = None,
+        subscription_tier: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Process document with streamed generation
+        
+        Yields ``{"type": "field", "data": FieldData}`` as soon as each field's
+        JSON object closes in the model output, then a single
+        ``{"type": "result", "data": {...}}`` with the same shape as
+        ``process_document`` returns. Tiled pages yield each tile's new
+        fields when the tile is read.
+        """
+        start_time = time.time()
+        prepared = prepared or await asyncio.to_thread(self.prepare_document, file_content, mime_type, document_type)
+        document_type = prepared.document_type
+        prompt = prompt_registry.select(document_type, user_id)
+        cache_key = result_cache_key(file_content, mime_type, prompt)
+        cached = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached is not None:
+            logger.info(f"Serving cached extraction ({prompt.key})")
+            self._meter(user_id, subscription_tier, document_type, cached.get("model"), cached=True)
+            for field in cached["refined_data"]:
+                yield {"type": "field", "data": field}
+            cached["processing_time"] = round(time.time() - start_time, 2)
+            yield {"type": "result", "data": cached}
+            return
+        
+        local_text = await self._read_locally(prepared)
+        text_only = self._text_only(local_text)
+        images = [] if text_only else await prepared.page_images()
+        if len(images) > 1:
+            async for event in self._stream_tiles(
+                prepared, images, prompt, cache_key, start_time, user_id, subscription_tier
+            ):
+                yield event
+            return
+        
+        # Fields are sent as they arrive, so a streamed result is never
+        # escalated; the first-attempt tier is used directly
+        model_name = self.model_for_tier(self.initial_tier(document_type))
+        
+        caller = self.caller_for(model_name)
+        
+        try:
+            caller.check()
+        except CircuitOpenError as e:
+            logger.warning(f"{e}; serving fallback extraction")
+            yield {"type": "result", "data": self._fallback_extraction(local_text)}
+            return
+        
+        # Filled from the chunks' usage metadata; metered however the stream ends
+        usage = {"prompt_tokens": 0, "output_tokens": 0}
+        stream_start = time.time()
+        completed = False
+        # Whether the breaker was told the outcome (a half-open probe is freed)
+        settled = False
+        sent_fields = False
+        parser = IncrementalFieldParser()
+        try:
+            if text_only:
+                local_text_extractor.record("text_only")
+                content_parts = [local_text.to_prompt(prompt.text)]
             else:
-                overall_confidence = parsed_response.get("overall_confidence", 0)
+                content_parts = self._build_content_parts(images[0], prompt)
             
-            processing_time = time.time() - start_time
+            # The request itself is issued lazily inside the worker thread.
+            # Streams are not retried: fields may already have been sent.
+            chunks = self._stream_texts(model_name, content_parts, usage)
+            deadline = time.monotonic() + settings.GEMINI_DEADLINE_SECONDS
+            # Closed as soon as this generator is, so the worker stops with it
+            async with aclosing(_iterate_in_thread(chunks, deadline)) as chunk_texts:
+                async for chunk_text in chunk_texts:
+                    fields = parser.feed_fields(chunk_text)
+                    if fields:
+                        # Same normalization as the final result, so streamed
+                        # values match it
+                        for field in field_normalizer.normalize(fields)[0]:
+                            sent_fields = True
+                            yield {"type": "field", "data": field}
+            caller.breaker.record_success()
+            settled = True
             
-            return {
-                "refined_data": refined_data,
-                "ai_explanation": parsed_response.get("explanation", "Document processed successfully."),
-                "formatting_changes": formatting_changes,
-                "confidence_score": round(overall_confidence, 2),
-                "processing_time": round(processing_time, 2)
-            }
+            parsed_response = parser.finish()
+            result = self._build_result(parsed_response, parser.text, start_time)
+            result["model"] = model_name
+            result["document_type"] = document_type
+            result["prompt_version"] = prompt.key
+            await asyncio.to_thread(result_cache.put, cache_key, result)
+            completed = True
+            yield {"type": "result", "data": result}
             
+        except UpstreamError as e:
+            caller.breaker.record_failure()
+            settled = True
+            logger.error(f"Gemini upstream failure while streaming: {e}")
+            fallback = self._fallback_extraction(local_text)
+            if sent_fields or not fallback["refined_data"]:
+                raise
+            yield {"type": "result", "data": fallback}
         except Exception as e:
-            logger.error(f"Error processing document with Gemini: {e}", exc_info=True)
+            if is_retryable(e):
+                caller.breaker.record_failure()
+                settled = True
+                logger.error(f"Gemini upstream failure while streaming: {e}")
+                fallback = self._fallback_extraction(local_text)
+                if sent_fields or not fallback["refined_data"]:
+                    raise UpstreamError(f"Upstream '{model_name}' failed: {e}") from e
+                yield {"type": "result", "data": fallback}
+                return
+            # Not an outage; release a half-open probe slot if this held one
+            caller.breaker.record_success()
+            settled = True
+            logger.error(f"Error streaming document with Gemini: {e}", exc_info=True)
             raise Exception(f"Document processing failed: {str(e)}")
+        finally:
+            if not settled:
+                # Abandoned mid-stream (client gone, request cancelled)
+                caller.breaker.release_probe()
+            latency = time.time() - stream_start
+            record_model_call(
+                model_name, latency, parser.text, usage["prompt_tokens"], usage["output_tokens"],
+                error=not completed, stream=True
+            )
+            self._meter(
+                user_id, subscription_tier, document_type, model_name,
+                image_bytes=0 if text_only else prepared.image_bytes, latency=latency,
+                error=not completed, **usage
+            )
     
-    def _fallback_extraction(self, file_content: bytes) -> Dict[str, Any]:
-        """Fallback extraction method (basic OCR simulation)"""
-        # This is a placeholder for a fallback method
-        # In production, you might integrate with other OCR services
+    async def _stream_tiles(
+        self,
+        prepared: PreparedDocument,
+        tiles: List["PIL.Image.Image"],
+        prompt: PromptTemplate,
+        cache_key: str,
+        start_time: float,
+        user_id: Optional[str] = None,
+        subscription_tier: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a tiled page: each tile's fields not already sent, then the merged result"""
+        document_type = prepared.document_type
+        tier = self.initial_tier(document_type)
+        # Only looked at: each tile's call takes the half-open probe itself
+        model_name = self.model_for_tier(tier)
+        if not self.caller_for(model_name).breaker.available():
+            logger.warning(f"Upstream '{model_name}' is temporarily unavailable; serving fallback extraction")
+            yield {"type": "result", "data": self._fallback_extraction(prepared.local_text)}
+            return
+        
+        decision = RoutingDecision(user_id, document_type, tier, prompt_version=prompt.key)
+        merger = TileMerger(prepared.plan)
+        sent_fields = False
+        try:
+            async for index, tile_response, tile_text in self._extract_tiles(
+                decision, tier, prepared, tiles, prompt, subscription_tier
+            ):
+                for field in field_normalizer.normalize(merger.add(index, tile_response, tile_text))[0]:
+                    sent_fields = True
+                    yield {"type": "field", "data": field}
+            
+            # A complete reading may have replaced a fragment already sent;
+            # the result carries the merged fields
+            parsed_response, response_text = merger.result()
+            result = self._build_result(parsed_response, response_text, start_time)
+            result["model"] = decision.final_model
+            result["document_type"] = document_type
+            result["prompt_version"] = prompt.key
+            await asyncio.to_thread(result_cache.put, cache_key, result)
+            yield {"type": "result", "data": result}
+        except UpstreamError as e:
+            logger.error(f"Gemini upstream failure while streaming tiles: {e}")
+            fallback = self._fallback_extraction(prepared.local_text)
+            if sent_fields or not fallback["refined_data"]:
+                raise
+            yield {"type": "result", "data": fallback}
+        except Exception as e:
+            logger.error(f"Error streaming document with Gemini: {e}", exc_info=True)
+            raise Exception(f"Document processing failed: {str(e)}")
+        finally:
+            if decision.attempts:
+                routing_recorder.record(decision)
+    
+    def _fallback_extraction(self, local_text: Optional[LocalText] = None) -> Dict[str, Any]:
+        """
+        Extraction served when the model is unavailable
+        
+        Labelled values ("Total: 12.50") found in the local OCR or PDF text,
+        normalized like model output but otherwise unrefined; no fields when
+        there is no local text.
+        """
+        fields = local_text.labelled_fields() if local_text is not None else []
+        if not fields:
+            return {
+                "refined_data": [],
+                "ai_explanation": "Document processing is temporarily unavailable.",
+                "formatting_changes": [],
+                "confidence_score": 0,
+                "processing_time": 0,
+                "model": None
+            }
+        local_text_extractor.record("fallbacks")
+        refined_data, normalization_changes = field_normalizer.normalize(fields)
         return {
-            "refined_data": [],
-            "ai_explanation": "Document processing is temporarily unavailable.",
-            "formatting_changes": [],
-            "confidence_score": 0,
-            "processing_time": 0
+            "refined_data": refined_data,
+            "ai_explanation": (
+                "Document processing is temporarily unavailable. These values were read locally "
+                f"({local_text.source}) without AI refinement; please review them."
+            ),
+            "formatting_changes": normalization_changes,
+            "confidence_score": round(sum(f.confidence for f in fields) / len(fields), 2),
+            "processing_time": 0,
+            "model": None
         }
 
 
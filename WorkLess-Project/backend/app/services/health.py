@@ -0,0 +1,238 @@
+"""
+Health Monitor
+Background probes of the model backend, database and upload disk, plus event
+loop lag sampling, cached for the readiness and deep health endpoints
+"""
+
+import asyncio
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Callable, Optional
+from app.core.config import settings
+from app.services.admission import admission_controller
+from app.services.drain import drain_coordinator
+from app.services.gemini_service import gemini_service
+from app.services.supabase_service import supabase_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Probe results older than this many intervals mean the probe loop is stuck
+STALE_AFTER_INTERVALS = 3
+
+
+def probe_model() -> Dict[str, Any]:
+    """The model API answers a metadata request"""
+    gemini_service.probe()
+    return {"backend": settings.MODEL_BACKEND}
+
+
+def probe_database() -> Dict[str, Any]:
+    """The database answers a one-row read"""
+    if supabase_service is None:
+        return {"backend": "none"}
+    supabase_service.ping()
+    return {"backend": settings.DATABASE_BACKEND}
+
+
+def probe_disk() -> Dict[str, Any]:
+    """UPLOAD_DIR is writable and has the minimum free space"""
+    usage = shutil.disk_usage(settings.UPLOAD_DIR)
+    free_mb = usage.free // (1024 * 1024)
+    if not os.access(settings.UPLOAD_DIR, os.W_OK):
+        raise OSError(f"{settings.UPLOAD_DIR} is not writable")
+    if free_mb < settings.HEALTH_MIN_FREE_DISK_MB:
+        raise OSError(f"{free_mb} MB free, {settings.HEALTH_MIN_FREE_DISK_MB} MB required")
+    return {"free_mb": free_mb, "used_percent": round(usage.used / usage.total * 100, 1)}
+
+
+PROBES: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "model": probe_model,
+    "database": probe_database,
+    "disk": probe_disk,
+}
+
+
+class HealthMonitor:
+    """
+    Dependency probes and event loop lag, refreshed in the background
+
+    Probes run every ``probe_interval`` seconds on their own small thread
+    pool, so a slow dependency or a busy default pool can't delay them, and
+    the endpoints only read the cached results: checking health costs the
+    request path nothing. Loop lag is how late a periodic sleep wakes up,
+    which grows when CPU-bound work or blocking calls hold the event loop.
+    """
+
+    def __init__(
+        self,
+        probes: Dict[str, Callable[[], Dict[str, Any]]],
+        probe_interval: float = 15.0,
+        probe_timeout: float = 5.0,
+        lag_interval: float = 0.5,
+        required_probes: Optional[List[str]] = None,
+        max_loop_lag_ms: float = 250.0,
+        max_queue_pressure: float = 0.8
+    ):
+        self.probes = probes
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.lag_interval = lag_interval
+        self.required_probes = list(probes) if required_probes is None else list(required_probes)
+        self.max_loop_lag_ms = max_loop_lag_ms
+        self.max_queue_pressure = max_queue_pressure
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.probed_at: Optional[float] = None
+        self.loop_lag_ms = 0.0
+        # About five seconds of samples: a single late wake-up shouldn't flap readiness
+        self._lag_samples = deque(maxlen=max(1, int(5 / max(lag_interval, 0.01))))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def from_settings(cls) -> "HealthMonitor":
+        """Build the monitor from application settings"""
+        return cls(
+            PROBES,
+            probe_interval=settings.HEALTH_PROBE_INTERVAL_SECONDS,
+            probe_timeout=settings.HEALTH_PROBE_TIMEOUT_SECONDS,
+            lag_interval=settings.HEALTH_LOOP_LAG_INTERVAL_SECONDS,
+            required_probes=settings.READY_REQUIRED_PROBES,
+            max_loop_lag_ms=settings.READY_MAX_LOOP_LAG_MS,
+            max_queue_pressure=settings.READY_MAX_QUEUE_PRESSURE,
+        )
+
+    def start(self) -> None:
+        """Start probing and lag sampling (call from the running event loop)"""
+        if self._tasks:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=len(self.probes), thread_name_prefix="health-probe")
+        self._tasks = [
+            asyncio.create_task(self._probe_loop()),
+            asyncio.create_task(self._lag_loop()),
+        ]
+
+    async def stop(self) -> None:
+        """Stop the background tasks"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            # Don't wait for a probe stuck on a dead dependency
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(self.probe_interval)
+
+    async def _lag_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            self.loop_lag_ms = max(0.0, (loop.time() - start - self.lag_interval) * 1000)
+            self._lag_samples.append(self.loop_lag_ms)
+
+    async def probe_all(self) -> None:
+        """Run every probe concurrently and cache the results"""
+        names = list(self.probes)
+        results = await asyncio.gather(*(self._run_probe(name) for name in names))
+        self.results = dict(zip(names, results))
+        self.probed_at = time.monotonic()
+
+    async def _run_probe(self, name: str) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        result: Dict[str, Any] = {"ok": True}
+        try:
+            details = await asyncio.wait_for(
+                loop.run_in_executor(self._executor, self.probes[name]),
+                timeout=self.probe_timeout
+            )
+            result.update(details or {})
+        except asyncio.TimeoutError:
+            result = {"ok": False, "error": f"No answer within {self.probe_timeout}s"}
+        except Exception as e:
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        previous = self.results.get(name)
+        if not result["ok"] and (previous is None or previous["ok"]):
+            logger.warning(f"Health probe '{name}' failing: {result['error']}")
+        elif result["ok"] and previous is not None and not previous["ok"]:
+            logger.info(f"Health probe '{name}' recovered")
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["checked_at"] = datetime.now(timezone.utc).isoformat()
+        return result
+
+    @property
+    def recent_loop_lag_ms(self) -> float:
+        """Worst loop lag over the last few seconds"""
+        return max(self._lag_samples, default=0.0)
+
+    def not_ready_reasons(self) -> List[str]:
+        """Why this worker should not receive traffic (empty when ready)"""
+        reasons = []
+        if drain_coordinator.draining:
+            reasons.append("draining")
+        if self.probed_at is None:
+            reasons.append("starting")
+        elif time.monotonic() - self.probed_at > self.probe_interval * STALE_AFTER_INTERVALS + self.probe_timeout:
+            reasons.append("probes_stale")
+        for name in self.required_probes:
+            result = self.results.get(name)
+            if result is not None and not result["ok"]:
+                reasons.append(f"{name}_unavailable")
+        if self.recent_loop_lag_ms > self.max_loop_lag_ms:
+            reasons.append("event_loop_lagging")
+        if admission_controller.queue_pressure() >= self.max_queue_pressure:
+            reasons.append("queue_saturated")
+        return reasons
+
+    def readiness(self) -> Dict[str, Any]:
+        """Readiness verdict for load balancers"""
+        reasons = self.not_ready_reasons()
+        return {"status": "ready" if not reasons else "not_ready", "reasons": reasons}
+
+    def report(self) -> Dict[str, Any]:
+        """Full cached health report: probes, loop lag, queue and jobs"""
+        reasons = self.not_ready_reasons()
+        failing = [name for name, result in self.results.items() if not result["ok"]]
+        open_circuits = gemini_service.open_circuits()
+        if reasons:
+            status = "unhealthy"
+        elif failing or open_circuits:
+            status = "degraded"
+        else:
+            status = "healthy"
+        return {
+            "status": status,
+            "ready": not reasons,
+            "reasons": reasons,
+            "worker_pid": os.getpid(),
+            "probes": self.results,
+            "probe_age_seconds": (
+                round(time.monotonic() - self.probed_at, 1) if self.probed_at is not None else None
+            ),
+            "loop_lag_ms": {
+                "current": round(self.loop_lag_ms, 1),
+                "recent_max": round(self.recent_loop_lag_ms, 1),
+            },
+            "queue": {
+                "depth": admission_controller.queue_depth(),
+                "pressure": round(admission_controller.queue_pressure(), 3),
+                "in_flight": admission_controller.in_flight,
+                "max_concurrency": admission_controller.max_concurrency,
+            },
+            "open_circuits": open_circuits,
+            "jobs": drain_coordinator.snapshot(),
+        }
+
+
+# Global health monitor instance
+health_monitor = HealthMonitor.from_settings()
@@ -0,0 +1,147 @@
+"""
+Job Journal
+Durable local record of in-flight document jobs, so work interrupted by a
+shutdown is finished on the next startup instead of being lost
+"""
+
+import json
+import time
+import uuid
+from typing import List, Dict, Any, Optional, Set
+from app.core.config import settings
+from app.core.storage import SQLiteStore, data_path
+from app.services.result_cache import dump_result, load_result
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    scan_id TEXT,
+    session_id TEXT,
+    user_id TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    file_name TEXT,
+    mime_type TEXT NOT NULL,
+    document_type TEXT,
+    user_metadata TEXT,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class JournaledJob:
+    """One unfinished job read back from the journal"""
+
+    __slots__ = (
+        "job_id", "scan_id", "session_id", "user_id", "file_path", "file_name", "mime_type",
+        "document_type", "user_metadata", "result", "attempts", "created_at",
+    )
+
+    def __init__(self, row):
+        self.job_id = row["job_id"]
+        self.scan_id = row["scan_id"]
+        self.session_id = row["session_id"]
+        self.user_id = row["user_id"]
+        self.file_path = row["file_path"]
+        self.file_name = row["file_name"]
+        self.mime_type = row["mime_type"]
+        self.document_type = row["document_type"]
+        self.user_metadata = json.loads(row["user_metadata"]) if row["user_metadata"] else None
+        # Set once the model call finished: replay only has to record it
+        self.result = load_result(row["result"]) if row["result"] else None
+        self.attempts = row["attempts"]
+        self.created_at = row["created_at"]
+
+
+class JobJournal:
+    """
+    Write-ahead record of document jobs
+
+    A job is written once its upload is on disk and its scan record exists,
+    updated with the model result as soon as the model returns, and removed
+    when the scan is completed or failed. Whatever is left at startup was
+    interrupted: jobs with a result only need recording, the others are
+    processed again from the saved upload.
+    """
+
+    def __init__(self, store: SQLiteStore, max_attempts: int = 3):
+        self.store = store
+        self.max_attempts = max_attempts
+
+    @classmethod
+    def from_settings(cls) -> Optional["JobJournal"]:
+        """Open the job journal, or None when disabled"""
+        if not settings.JOB_JOURNAL_ENABLED:
+            return None
+        try:
+            return cls(SQLiteStore(data_path("jobs.db"), SCHEMA), settings.JOB_REPLAY_MAX_ATTEMPTS)
+        except Exception as e:
+            logger.warning(f"Job journal disabled: cannot open store: {e}")
+            return None
+
+    def start(
+        self,
+        user_id: str,
+        file_path: str,
+        file_name: Optional[str],
+        mime_type: str,
+        document_type: Optional[str] = None,
+        scan_id: Optional[str] = None,
+        user_metadata: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None
+    ) -> str:
+        """Record a job about to call the model (for an upload session's complete, if any); returns its id"""
+        job_id = str(uuid.uuid4())
+        self.store.execute(
+            "INSERT INTO jobs (job_id, scan_id, session_id, user_id, file_path, file_name, mime_type, "
+            "document_type, user_metadata, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id, scan_id, session_id, user_id, file_path, file_name, mime_type, document_type,
+                json.dumps(user_metadata, default=str) if user_metadata else None, time.time(),
+            )
+        )
+        return job_id
+
+    def checkpoint(self, job_id: str, result: Dict[str, Any]) -> None:
+        """Keep the model result of a job until it has been recorded"""
+        self.store.execute("UPDATE jobs SET result = ? WHERE job_id = ?", (dump_result(result), job_id))
+
+    def record_attempt(self, job_id: str) -> None:
+        """Count a replay of a job"""
+        self.store.execute("UPDATE jobs SET attempts = attempts + 1 WHERE job_id = ?", (job_id,))
+
+    def finish(self, job_id: str) -> None:
+        """Forget a completed or failed job"""
+        self.store.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def pending(self, created_before: Optional[float] = None) -> List[JournaledJob]:
+        """Unfinished jobs (started before a time.time() timestamp), oldest first"""
+        rows = self.store.query(
+            "SELECT * FROM jobs WHERE created_at < ? ORDER BY created_at",
+            (created_before if created_before is not None else time.time(),)
+        )
+        return [JournaledJob(row) for row in rows]
+
+    def scan_ids(self) -> Set[str]:
+        """Scan ids of unfinished jobs"""
+        return {row["scan_id"] for row in self.store.query("SELECT scan_id FROM jobs WHERE scan_id IS NOT NULL")}
+
+    def session_ids(self) -> Set[str]:
+        """Upload sessions of unfinished jobs"""
+        rows = self.store.query("SELECT session_id FROM jobs WHERE session_id IS NOT NULL")
+        return {row["session_id"] for row in rows}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Unfinished job counts, for metrics"""
+        row = self.store.query(
+            "SELECT COUNT(*) AS pending, COUNT(result) AS checkpointed FROM jobs"
+        )[0]
+        return {"pending": row["pending"], "checkpointed": row["checkpointed"]}
+
+
+# Global job journal instance (None when disabled)
+job_journal = JobJournal.from_settings()
@@ -0,0 +1,469 @@
+"""
+Local OCR
+Pluggable CPU-only text extraction run in a process pool before any model
+call: the text layer of text-native PDFs (no rasterization), or OCR of the
+page image. The text replaces the image when it is good enough and backs the
+fallback extraction when the model is unavailable.
+"""
+
+import asyncio
+import importlib
+import io
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Type, TYPE_CHECKING
+from app.core.config import settings
+from app.models.schemas import FieldData
+import logging
+
+# PIL is imported on first use, keeping it off the startup path
+if TYPE_CHECKING:
+    import PIL.Image
+
+logger = logging.getLogger(__name__)
+
+PDF_TEXT = "pdf_text"
+
+# Fonts are only referenced by PDFs with a text layer; scans hold images only.
+# PDFs hiding every font in compressed object streams are rasterized as before.
+_FONT_RE = re.compile(rb"/Font\b")
+# "Label: value" lines in the local text, used by the fallback extraction
+_LABELLED_LINE_RE = re.compile(r"^\s*([A-Za-z][\w .#&/()'-]{0,39}?)\s*[:=]\s*(\S.{0,199}?)\s*$")
+# Fallback fields are unrefined reads: their confidence is scaled down by this
+FALLBACK_CONFIDENCE_FACTOR = 0.6
+MAX_FALLBACK_FIELDS = 50
+
+LOCAL_TEXT_NOTE = (
+    "No image is attached. The document's text was extracted locally ({source}) and "
+    "follows between the markers; extract the fields from it."
+)
+
+
+class LocalText:
+    """Text extracted locally from a document"""
+
+    __slots__ = ("text", "source", "confidence", "pages", "truncated", "elapsed_ms")
+
+    def __init__(self, text: str, source: str, confidence: float, pages: int = 1,
+                 truncated: bool = False, elapsed_ms: float = 0.0):
+        self.text = text
+        self.source = source
+        self.confidence = confidence
+        self.pages = pages
+        self.truncated = truncated
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def chars(self) -> int:
+        """Characters of text, whitespace excluded"""
+        return sum(1 for c in self.text if not c.isspace())
+
+    def to_prompt(self, prompt_text: str) -> str:
+        """The extraction prompt followed by the text, sent instead of the page image"""
+        note = LOCAL_TEXT_NOTE.format(source=self.source)
+        return f"{prompt_text}\n\n{note}\n\n<<<DOCUMENT TEXT\n{self.text}\nDOCUMENT TEXT>>>"
+
+    def labelled_fields(self) -> List[FieldData]:
+        """Fields read from "Label: value" lines, for the fallback extraction"""
+        confidence = round(min(100.0, self.confidence) * FALLBACK_CONFIDENCE_FACTOR, 1)
+        fields: List[FieldData] = []
+        seen = set()
+        for line in self.text.splitlines():
+            match = _LABELLED_LINE_RE.match(line)
+            if not match:
+                continue
+            label, value = match.group(1).strip(), match.group(2).strip()
+            if label.casefold() in seen:
+                continue
+            seen.add(label.casefold())
+            fields.append(FieldData(field=label, value=value, confidence=confidence))
+            if len(fields) >= MAX_FALLBACK_FIELDS:
+                break
+        return fields
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize (results cross the process pool as plain dicts)"""
+        return {
+            "text": self.text,
+            "source": self.source,
+            "confidence": self.confidence,
+            "pages": self.pages,
+            "truncated": self.truncated,
+            "elapsed_ms": self.elapsed_ms,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LocalText":
+        """Deserialize a result from the process pool"""
+        return cls(**data)
+
+
+class OCREngine:
+    """
+    A local OCR engine
+
+    Subclasses implement ``recognize`` and, when they need an optional
+    package or binary, ``available``. Register them in ``ENGINES`` or name
+    them in OCR_ENGINE as ``"package.module:ClassName"``. Engines are built
+    once per pool process and must be CPU-only.
+    """
+
+    name = "base"
+
+    @classmethod
+    def available(cls) -> bool:
+        """Whether the engine's dependencies are installed"""
+        return True
+
+    def recognize(self, image: "PIL.Image.Image") -> Tuple[str, float]:
+        """Text of a page image and its mean confidence (0-100)"""
+        raise NotImplementedError
+
+
+class TesseractEngine(OCREngine):
+    """Tesseract through pytesseract (pip install pytesseract, plus the tesseract binary)"""
+
+    name = "tesseract"
+
+    def __init__(self, languages: Optional[str] = None):
+        self.languages = languages or settings.OCR_LANGUAGES
+
+    @classmethod
+    def available(cls) -> bool:
+        """pytesseract is installed and finds the tesseract binary"""
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+        except Exception:
+            return False
+        return True
+
+    def recognize(self, image: "PIL.Image.Image") -> Tuple[str, float]:
+        """Words grouped back into lines, with the length-weighted mean word confidence"""
+        import pytesseract
+        data = pytesseract.image_to_data(
+            image.convert("L"), lang=self.languages, output_type=pytesseract.Output.DICT
+        )
+        lines: Dict[Tuple[int, int, int], List[str]] = {}
+        weighted, total = 0.0, 0
+        for i, word in enumerate(data["text"]):
+            word = word.strip()
+            confidence = float(data["conf"][i])
+            if not word or confidence < 0:
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append(word)
+            weighted += confidence * len(word)
+            total += len(word)
+        text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+        return text, (weighted / total if total else 0.0)
+
+
+ENGINES: Dict[str, Type[OCREngine]] = {
+    "tesseract": TesseractEngine,
+}
+
+
+def engine_class(name: Optional[str]) -> Optional[Type[OCREngine]]:
+    """Resolve an OCR_ENGINE value to its class (None for "none")"""
+    if not name or name == "none":
+        return None
+    if name in ENGINES:
+        return ENGINES[name]
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError(f"Unknown OCR engine '{name}' (registered: {', '.join(ENGINES)})")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def pdf_text_available() -> bool:
+    """Whether the optional pypdf dependency is installed"""
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _readable_share(text: str) -> float:
+    """Share of characters that read as text (broken font encodings produce symbols)"""
+    if not text:
+        return 0.0
+    readable = sum(1 for c in text if c.isalnum() or c.isspace() or c in ".,:;/-$%#()&'\"@+*")
+    return readable / len(text)
+
+
+def extract_pdf_text(file_content: bytes, max_pages: int, max_chars: int) -> LocalText:
+    """Text layer of a PDF, without rendering it"""
+    import pypdf
+    reader = pypdf.PdfReader(io.BytesIO(file_content))
+    parts: List[str] = []
+    length = 0
+    truncated = len(reader.pages) > max_pages
+    for page in reader.pages[:max_pages]:
+        text = (page.extract_text() or "").strip()
+        if not text:
+            continue
+        if length + len(text) > max_chars:
+            parts.append(text[:max_chars - length])
+            truncated = True
+            break
+        parts.append(text)
+        length += len(text)
+    text = "\n\n".join(parts)
+    return LocalText(
+        text,
+        PDF_TEXT,
+        round(100 * _readable_share(text), 1),
+        pages=min(len(reader.pages), max_pages),
+        truncated=truncated
+    )
+
+
+# Engines built in this process (each pool process builds its own once)
+_engines: Dict[str, OCREngine] = {}
+
+
+def _engine(name: str) -> OCREngine:
+    if name not in _engines:
+        _engines[name] = engine_class(name)()
+    return _engines[name]
+
+
+def run_extraction(
+    file_content: bytes,
+    mime_type: str,
+    image: Optional["PIL.Image.Image"],
+    engine_name: Optional[str],
+    max_pages: int,
+    max_chars: int,
+    min_chars: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Extract a document's text (runs in a pool process)
+
+    PDFs with a text layer are read directly; anything else is OCRed from
+    ``image`` (or the decoded upload) when an engine is configured.
+    """
+    start = time.perf_counter()
+    result: Optional[LocalText] = None
+    if mime_type == "application/pdf" and _FONT_RE.search(file_content) and pdf_text_available():
+        result = extract_pdf_text(file_content, max_pages, max_chars)
+    if (result is None or result.chars < min_chars) and engine_name:
+        if image is None and mime_type.startswith("image/"):
+            import PIL.Image
+            image = PIL.Image.open(io.BytesIO(file_content))
+        if image is not None:
+            text, confidence = _engine(engine_name).recognize(image)
+            result = LocalText(
+                text[:max_chars], engine_name, round(confidence, 1), truncated=len(text) > max_chars
+            )
+    if result is None:
+        return None
+    result.elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    return result.to_dict()
+
+
+def _ready() -> bool:
+    return True
+
+
+class LocalTextExtractor:
+    """
+    Runs local text extraction off the event loop and judges its output
+
+    Extraction is CPU-bound and holds the GIL (pypdf) or blocks on a
+    subprocess (tesseract), so it runs in a small process pool of its own
+    (``workers`` processes; 0 runs it in a thread). A result is ``sufficient``
+    to replace the page image when it has enough text at high enough
+    confidence and nothing was cut off; text layers of PDFs within the page
+    and character limits nearly always are. An extraction that times out has
+    its pool processes killed, so a stuck engine can't hold up later ones.
+    """
+
+    def __init__(
+        self,
+        engine_name: Optional[str] = "tesseract",
+        workers: int = 1,
+        timeout: float = 20.0,
+        text_only: bool = True,
+        min_chars: int = 80,
+        min_confidence: float = 85.0,
+        max_chars: int = 20000,
+        max_pdf_pages: int = 20
+    ):
+        self.engine_name = engine_name if engine_name and engine_name != "none" else None
+        self.workers = max(0, workers)
+        self.timeout = timeout
+        self.text_only = text_only
+        self.min_chars = min_chars
+        self.min_confidence = min_confidence
+        self.max_chars = max_chars
+        self.max_pdf_pages = max_pdf_pages
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._engine_ready: Optional[bool] = None
+        self._pdf_ready: Optional[bool] = None
+        self._counts = {
+            "runs": 0, "text_only": 0, "fallbacks": 0, "errors": 0, "timeouts": 0, "pool_restarts": 0
+        }
+        self._elapsed_ms = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "LocalTextExtractor":
+        """Build the extractor from application settings"""
+        return cls(
+            engine_name=settings.OCR_ENGINE,
+            workers=settings.OCR_PROCESS_WORKERS,
+            timeout=settings.OCR_TIMEOUT_SECONDS,
+            text_only=settings.OCR_TEXT_ONLY_ENABLED,
+            min_chars=settings.OCR_TEXT_ONLY_MIN_CHARS,
+            min_confidence=settings.OCR_TEXT_ONLY_MIN_CONFIDENCE,
+            max_chars=settings.OCR_MAX_TEXT_CHARS,
+            max_pdf_pages=settings.OCR_MAX_PDF_PAGES,
+        )
+
+    @property
+    def engine_available(self) -> bool:
+        """Whether the configured OCR engine can run here (checked once)"""
+        if self._engine_ready is None:
+            try:
+                engine = engine_class(self.engine_name)
+                self._engine_ready = engine is not None and engine.available()
+            except Exception as e:
+                logger.warning(f"OCR engine '{self.engine_name}' unusable: {e}")
+                self._engine_ready = False
+            if self.engine_name and not self._engine_ready:
+                logger.warning(f"OCR engine '{self.engine_name}' not available; only PDF text layers are read")
+        return self._engine_ready
+
+    @property
+    def pdf_available(self) -> bool:
+        """Whether PDF text layers can be read (pypdf installed)"""
+        if self._pdf_ready is None:
+            self._pdf_ready = pdf_text_available()
+        return self._pdf_ready
+
+    def has_text_layer(self, file_content: bytes, mime_type: str) -> bool:
+        """A PDF whose text can be read without rendering it"""
+        return mime_type == "application/pdf" and self.pdf_available and bool(_FONT_RE.search(file_content))
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers == 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                # Not fork: the server process has threads (and their locks).
+                # Pool processes fork from a fork server that imports the main
+                # module and this one once, instead of each process doing so.
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["__main__", __name__])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    async def extract(
+        self,
+        file_content: bytes,
+        mime_type: str,
+        image: Optional["PIL.Image.Image"] = None
+    ) -> Optional[LocalText]:
+        """Extract a document's text; None when there is nothing to read or extraction failed"""
+        has_text_layer = self.has_text_layer(file_content, mime_type)
+        engine_name = self.engine_name if self.engine_available else None
+        if not has_text_layer and (engine_name is None or (image is None and not mime_type.startswith("image/"))):
+            return None
+        if has_text_layer:
+            # The text layer is read in the pool; no page image needs to cross over
+            image = None
+        elif image is not None and mime_type.startswith("image/"):
+            # The pool decodes the (smaller) upload itself
+            image = None
+
+        loop = asyncio.get_running_loop()
+        self._counts["runs"] += 1
+        try:
+            data = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._executor(), run_extraction, file_content, mime_type, image, engine_name,
+                    self.max_pdf_pages, self.max_chars, self.min_chars
+                ),
+                timeout=self.timeout
+            )
+        except asyncio.TimeoutError:
+            self._counts["timeouts"] += 1
+            logger.warning(f"Local text extraction timed out after {self.timeout}s")
+            self._restart_pool()
+            return None
+        except Exception as e:
+            self._counts["errors"] += 1
+            logger.warning(f"Local text extraction failed: {type(e).__name__}: {e}")
+            return None
+        if data is None:
+            return None
+        local_text = LocalText.from_dict(data)
+        self._elapsed_ms += local_text.elapsed_ms
+        return local_text
+
+    def sufficient(self, local_text: Optional[LocalText]) -> bool:
+        """Whether the text can be sent instead of the page image"""
+        return (
+            self.text_only
+            and local_text is not None
+            and local_text.chars >= self.min_chars
+            and local_text.confidence >= self.min_confidence
+            # Cut at OCR_MAX_PDF_PAGES or OCR_MAX_TEXT_CHARS: the rest would be lost
+            and not local_text.truncated
+        )
+
+    def record(self, outcome: str) -> None:
+        """Count a use of local text ("text_only" or "fallbacks")"""
+        self._counts[outcome] += 1
+
+    async def warm_up(self) -> None:
+        """Start the pool processes before traffic arrives"""
+        executor = self._executor()
+        if executor is not None:
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(executor, _ready) for _ in range(self.workers)))
+
+    def _restart_pool(self) -> None:
+        """
+        Kill the pool processes after a timeout, since wait_for doesn't stop
+        the work; the next extraction starts a new pool. Extractions still
+        running in the old pool fail and fall back to the page image.
+        (Threads, with ``workers`` 0, can't be stopped.)
+        """
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is None:
+            return
+        self._counts["pool_restarts"] += 1
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        """Stop the pool processes"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Engine availability and usage counts, for metrics"""
+        runs = self._counts["runs"] - self._counts["errors"] - self._counts["timeouts"]
+        return {
+            "engine": self.engine_name,
+            "engine_available": bool(self._engine_ready),
+            "pdf_text_available": self.pdf_available,
+            "process_workers": self.workers,
+            **self._counts,
+            "avg_extraction_ms": round(self._elapsed_ms / runs, 1) if runs > 0 else None,
+        }
+
+
+# Global local text extractor instance
+local_text_extractor = LocalTextExtractor.from_settings() if settings.LOCAL_OCR_ENABLED else None
@@ -0,0 +1,358 @@
+"""
+Model Routing Service
+Runs the fast model first and escalates to the pro model on low confidence
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Iterable, Set
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+FAST_TIER = "fast"
+PRO_TIER = "pro"
+
+# USD per 1M tokens (input, output); used for cost estimates only
+MODEL_PRICING: Dict[str, tuple] = {
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, output_tokens: int) -> float:
+    """Estimate the USD cost of a single model call"""
+    input_price, output_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class RoutingPolicy:
+    """Thresholds that decide when a fast-model result needs the pro model"""
+
+    def __init__(
+        self,
+        min_overall_confidence: float,
+        min_field_confidence: float,
+        pro_document_types: Iterable[str] = ()
+    ):
+        self.min_overall_confidence = min_overall_confidence
+        self.min_field_confidence = min_field_confidence
+        self.pro_document_types = {t.lower() for t in pro_document_types}
+
+    @classmethod
+    def from_settings(cls) -> "RoutingPolicy":
+        """Build the policy from application settings"""
+        return cls(
+            min_overall_confidence=settings.ROUTING_MIN_OVERALL_CONFIDENCE,
+            min_field_confidence=settings.ROUTING_MIN_FIELD_CONFIDENCE,
+            pro_document_types=settings.ROUTING_PRO_DOCUMENT_TYPES,
+        )
+
+    def initial_tier(self, document_type: Optional[str]) -> str:
+        """Pick the tier for the first attempt"""
+        if document_type and document_type.lower() in self.pro_document_types:
+            return PRO_TIER
+        return FAST_TIER
+
+    def escalation_reason(
+        self,
+        overall_confidence: float,
+        min_field_confidence: Optional[float],
+        fields_extracted: int
+    ) -> Optional[str]:
+        """Return why a fast-model result should be escalated, or None"""
+        if fields_extracted == 0:
+            return "no_fields"
+        if overall_confidence < self.min_overall_confidence:
+            return "low_overall_confidence"
+        if min_field_confidence is not None and min_field_confidence < self.min_field_confidence:
+            return "low_field_confidence"
+        return None
+
+
+class RoutingDecision:
+    """Record of how one document was routed"""
+
+    def __init__(
+        self,
+        user_id: Optional[str],
+        document_type: Optional[str],
+        initial_tier: str,
+        prompt_version: Optional[str] = None
+    ):
+        self.timestamp = time.time()
+        self.user_id = user_id
+        self.document_type = document_type
+        self.initial_tier = initial_tier
+        self.prompt_version = prompt_version
+        self.attempts: List[Dict[str, Any]] = []
+        self.escalation_reason: Optional[str] = None
+        # Page tiles extracted separately (each with its own attempts)
+        self.tiles = 1
+        # Source of the local text sent instead of the page image, if any
+        self.local_text: Optional[str] = None
+
+    def add_attempt(
+        self,
+        tier: str,
+        model: str,
+        latency: float,
+        prompt_tokens: int = 0,
+        output_tokens: int = 0,
+        image_bytes: int = 0,
+        overall_confidence: Optional[float] = None,
+        min_field_confidence: Optional[float] = None,
+        fields_extracted: int = 0,
+        error: Optional[str] = None
+    ) -> None:
+        """Record a single model call"""
+        self.attempts.append({
+            "tier": tier,
+            "model": model,
+            "latency_ms": round(latency * 1000, 1),
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "image_bytes": image_bytes,
+            "cost_usd": estimate_cost(model, prompt_tokens, output_tokens),
+            "overall_confidence": overall_confidence,
+            "min_field_confidence": min_field_confidence,
+            "fields_extracted": fields_extracted,
+            "error": error,
+        })
+
+    @property
+    def escalated(self) -> bool:
+        """Whether a call (for a tiled page, any tile's) was escalated to the pro tier"""
+        return self.escalation_reason is not None
+
+    @property
+    def final_model(self) -> Optional[str]:
+        """Model whose result was returned (the pro model if any tile escalated)"""
+        if not self.attempts:
+            return None
+        answered = [a for a in self.attempts if a["error"] is None] or self.attempts
+        pro = [a for a in answered if a["tier"] == PRO_TIER]
+        return (pro or answered)[-1]["model"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize for the decision log"""
+        return {
+            "timestamp": self.timestamp,
+            "user_id": self.user_id,
+            "document_type": self.document_type,
+            "prompt_version": self.prompt_version,
+            "initial_tier": self.initial_tier,
+            "tiles": self.tiles,
+            "local_text": self.local_text,
+            "escalated": self.escalated,
+            "escalation_reason": self.escalation_reason,
+            "final_model": self.final_model,
+            "total_latency_ms": round(sum(a["latency_ms"] for a in self.attempts), 1),
+            "total_cost_usd": sum(a["cost_usd"] for a in self.attempts),
+            "attempts": self.attempts,
+        }
+
+
+class RoutingRecorder:
+    """
+    Keeps recent routing decisions in memory and appends them to a JSONL log
+
+    Log lines are buffered and written ``batch_size`` at a time in a worker
+    thread, so recording a decision never touches the disk on the event
+    loop; the partial batch is written at shutdown.
+    """
+
+    def __init__(self, log_path: Optional[str] = None, max_recent: int = 1000, batch_size: int = 50):
+        self.log_path = log_path
+        self.batch_size = max(1, batch_size)
+        self._recent: deque = deque(maxlen=max_recent)
+        self._buffer: List[str] = []
+        self._writes: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def record(self, decision: RoutingDecision) -> None:
+        """Store a routing decision"""
+        entry = decision.to_dict()
+        batch = None
+        with self._lock:
+            self._recent.append(entry)
+            if self.log_path:
+                self._buffer.append(json.dumps(entry) + "\n")
+                if len(self._buffer) >= self.batch_size:
+                    batch, self._buffer = self._buffer, []
+        if batch:
+            self._write_soon(batch)
+
+        logger.info(
+            f"Routed document (type={decision.document_type}) to {decision.final_model}"
+            f"{' after escalation: ' + decision.escalation_reason if decision.escalated else ''} "
+            f"in {entry['total_latency_ms']}ms, est. ${entry['total_cost_usd']:.5f}"
+        )
+
+    def _write_soon(self, lines: List[str]) -> None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Scripts without an event loop write in place
+            self._write(lines)
+            return
+        task = asyncio.create_task(asyncio.to_thread(self._write, lines))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _write(self, lines: List[str]) -> None:
+        with self._write_lock:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError as e:
+                logger.warning(f"Failed to write {len(lines)} entries to the routing log: {e}")
+
+    async def stop(self) -> None:
+        """Write pending batches and the partial one (app shutdown)"""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Return a copy of recent decisions"""
+        with self._lock:
+            return list(self._recent)
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate recent decisions: escalation rate, latency and cost"""
+        return summarize(self.recent())
+
+
+def summarize(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate routing decision entries"""
+    total = len(entries)
+    if not total:
+        return {"documents": 0}
+
+    escalated = sum(1 for e in entries if e["escalated"])
+    reasons: Dict[str, int] = {}
+    for e in entries:
+        if e["escalation_reason"]:
+            reasons[e["escalation_reason"]] = reasons.get(e["escalation_reason"], 0) + 1
+
+    return {
+        "documents": total,
+        "escalated": escalated,
+        "escalation_rate": round(escalated / total, 4),
+        "escalation_reasons": reasons,
+        "avg_latency_ms": round(sum(e["total_latency_ms"] for e in entries) / total, 1),
+        "total_cost_usd": round(sum(e["total_cost_usd"] for e in entries), 6),
+        "prompts": summarize_prompts(entries),
+    }
+
+
+def summarize_prompts(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Latency and token usage per prompt version, for comparing prompt variants"""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for e in entries:
+        groups.setdefault(e.get("prompt_version") or "unknown", []).append(e)
+
+    summary = {}
+    for version, group in groups.items():
+        attempts = [a for e in group for a in e["attempts"] if not a["error"]]
+        summary[version] = {
+            "documents": len(group),
+            "escalation_rate": round(sum(1 for e in group if e["escalated"]) / len(group), 4),
+            "avg_latency_ms": round(sum(e["total_latency_ms"] for e in group) / len(group), 1),
+            "avg_prompt_tokens": round(sum(a["prompt_tokens"] for a in attempts) / len(attempts), 1) if attempts else None,
+            "avg_output_tokens": round(sum(a["output_tokens"] for a in attempts) / len(attempts), 1) if attempts else None,
+        }
+    return summary
+
+
+def replay(entries: List[Dict[str, Any]], policy: RoutingPolicy) -> Dict[str, Any]:
+    """
+    Re-evaluate recorded decisions under a different policy
+
+    Fast-tier attempts carry their confidences, so the escalation decision can
+    be recomputed offline. When a document would now escalate but never did,
+    its pro-tier latency and cost are estimated from the recorded pro calls.
+    Tiled pages are kept as recorded (counted in ``not_replayed``): each tile
+    was routed on its own, and the attempts don't say which tile they read.
+    """
+    pro_attempts = [
+        a for e in entries if e.get("tiles", 1) == 1
+        for a in e["attempts"] if a["tier"] == PRO_TIER and not a["error"]
+    ]
+    if pro_attempts:
+        pro_latency = sum(a["latency_ms"] for a in pro_attempts) / len(pro_attempts)
+        pro_cost = sum(a["cost_usd"] for a in pro_attempts) / len(pro_attempts)
+    else:
+        pro_latency = pro_cost = 0.0
+
+    replayed = []
+    not_replayed = 0
+    for e in entries:
+        if e.get("tiles", 1) > 1:
+            replayed.append(e)
+            not_replayed += 1
+            continue
+
+        attempts = e["attempts"]
+        first = attempts[0] if attempts else None
+        recorded_pro = next((a for a in attempts if a["tier"] == PRO_TIER), None)
+        pro_call_latency = recorded_pro["latency_ms"] if recorded_pro else pro_latency
+        pro_call_cost = recorded_pro["cost_usd"] if recorded_pro else pro_cost
+
+        if not first or first["tier"] != FAST_TIER:
+            # No fast-tier observation to re-evaluate; keep as recorded
+            replayed.append(e)
+            continue
+
+        if policy.initial_tier(e["document_type"]) == PRO_TIER:
+            # The new policy sends this type straight to the pro model
+            replayed.append({
+                **e,
+                "escalated": False,
+                "escalation_reason": None,
+                "total_latency_ms": pro_call_latency,
+                "total_cost_usd": pro_call_cost,
+            })
+            continue
+
+        if first["error"]:
+            reason = "fast_model_error"
+        else:
+            reason = policy.escalation_reason(
+                first["overall_confidence"] or 0,
+                first["min_field_confidence"],
+                first["fields_extracted"],
+            )
+
+        latency = first["latency_ms"]
+        cost = first["cost_usd"]
+        if reason:
+            latency += pro_call_latency
+            cost += pro_call_cost
+
+        replayed.append({
+            **e,
+            "escalated": bool(reason),
+            "escalation_reason": reason,
+            "total_latency_ms": latency,
+            "total_cost_usd": cost,
+        })
+
+    summary = summarize(replayed)
+    if summary["documents"]:
+        summary["not_replayed"] = not_replayed
+    return summary
+
+
+# Global routing instances
+routing_policy = RoutingPolicy.from_settings()
+routing_recorder = RoutingRecorder(log_path=settings.ROUTING_LOG_PATH)
@@ -0,0 +1,355 @@
+"""
+Field Normalization Engine
+Deterministic post-processing of extracted fields: dates, amounts,
+currencies, phone numbers and IDs, plus common OCR digit confusions
+"""
+
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache, partial
+from typing import List, Dict, Optional, Tuple
+from app.core.config import settings
+from app.models.schemas import FieldData, FormattingChange
+import logging
+
+logger = logging.getLogger(__name__)
+
+DATE = "date"
+AMOUNT = "amount"
+CURRENCY = "currency"
+PHONE = "phone"
+IDENTIFIER = "identifier"
+TEXT = "text"
+
+# Field-name words deciding how a value is normalized, checked in this order
+# ("Account Balance" is an amount)
+_KIND_WORDS = [
+    (DATE, {"date", "dob", "birthday", "dated", "expiry", "expires", "expiration"}),
+    (PHONE, {"phone", "telephone", "tel", "mobile", "cell", "fax"}),
+    (CURRENCY, {"currency"}),
+    (AMOUNT, {
+        "amount", "total", "subtotal", "tax", "price", "balance", "fee", "fees", "cost",
+        "charge", "paid", "due", "gst", "discount", "net", "gross",
+    }),
+    (IDENTIFIER, {
+        "id", "number", "no", "nr", "num", "ref", "reference", "iban", "swift", "bic",
+        "ssn", "passport", "license", "licence", "code", "account", "vat", "ein", "tin",
+    }),
+]
+# Words marking a field as an identifier even next to amount words ("Tax ID", "GST Number")
+_ID_MARKER_WORDS = {"id", "number", "no", "nr", "num", "ref", "reference"}
+# Identifiers compared without spaces and in upper case
+_COMPACT_ID_WORDS = {"iban", "swift", "bic", "vat"}
+
+_WORD_RE = re.compile(r"[a-z]+")
+_SPACES_RE = re.compile(r"[ \t ]+")
+
+MONTH_NAMES = [
+    "january", "february", "march", "april", "may", "june",
+    "july", "august", "september", "october", "november", "december",
+]
+# Full names and their common abbreviations ("sep" and "sept")
+MONTHS = {name: number for number, name in enumerate(MONTH_NAMES, start=1)}
+MONTHS.update({name[:3]: number for name, number in list(MONTHS.items())})
+MONTHS["sept"] = 9
+_ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_YMD_RE = re.compile(r"^(\d{4})[./-](\d{1,2})[./-](\d{1,2})$")
+_NUMERIC_DATE_RE = re.compile(r"^(\d{1,2})[./-](\d{1,2})[./-](\d{4}|\d{2})$")
+_DATE_TOKEN_RE = re.compile(r"[a-z]+|\d+")
+
+CURRENCY_CODES = {
+    "USD", "EUR", "GBP", "JPY", "INR", "CAD", "AUD", "CHF", "CNY", "SEK", "NOK", "DKK",
+    "NZD", "ZAR", "BRL", "MXN", "SGD", "HKD", "PLN", "AED", "SAR",
+}
+# Longest symbols first so "US$" wins over "$". A bare "$" (any dollar or
+# peso) or "¥" (yen or yuan) doesn't tell the currency: it is stripped from
+# amounts without a code rather than guessed.
+CURRENCY_SYMBOLS = [
+    ("US$", "USD"), ("CA$", "CAD"), ("C$", "CAD"), ("AU$", "AUD"), ("A$", "AUD"),
+    ("NZ$", "NZD"), ("HK$", "HKD"), ("S$", "SGD"), ("R$", "BRL"),
+    ("$", None), ("€", "EUR"), ("£", "GBP"), ("¥", None), ("₹", "INR"), ("zł", "PLN"),
+]
+CURRENCY_NAMES = {
+    "dollar": None, "dollars": None, "euro": "EUR", "euros": "EUR",
+    "pound": "GBP", "pounds": "GBP", "sterling": "GBP", "yen": "JPY",
+    "rupee": "INR", "rupees": "INR", "franc": "CHF", "francs": "CHF",
+}
+_AMOUNT_RE = re.compile(r"^(-)?\(?(-)?([\d.,'  ]*\d)\)?(-)?$")
+
+# Letters OCR commonly reads in place of digits
+_OCR_DIGITS = str.maketrans({"O": "0", "o": "0", "D": "0", "I": "1", "l": "1", "|": "1", "S": "5", "B": "8", "Z": "2"})
+_ALNUM_RUN_RE = re.compile(r"[0-9A-Za-z|]+")
+
+
+def field_kind(name: str) -> str:
+    """Normalization kind for a field name (e.g. "Due Date" -> date)"""
+    return _field_kind(name.lower())
+
+
+@lru_cache(maxsize=4096)
+def _field_kind(name: str) -> str:
+    words = set(_WORD_RE.findall(name))
+    for kind, keywords in _KIND_WORDS:
+        if kind == AMOUNT and words & _ID_MARKER_WORDS:
+            continue
+        if words & keywords:
+            return kind
+    return TEXT
+
+
+def fix_ocr_digits(value: str) -> str:
+    """
+    Replace letters misread for digits inside mostly-numeric runs
+
+    "2O26" -> "2026" and "1,2S0.00" -> "1,250.00", while words such as
+    "INV" or "ACME" are left alone. A run starting with letters ("SO0001")
+    is only fixed when almost all of it is digits, as it may be a prefix.
+    Only meant for dates, amounts and phone numbers, and only kept when the
+    result parses as one: letters are legitimate in identifiers.
+    """
+    def fix(match: "re.Match") -> str:
+        run = match.group(0)
+        digits = sum(ch.isdigit() for ch in run)
+        if digits == len(run) or digits * 2 < len(run):
+            return run
+        if not run[0].isdigit() and digits * 4 < len(run) * 3:
+            return run
+        fixed = run.translate(_OCR_DIGITS)
+        return fixed if fixed.isdigit() else run
+    return _ALNUM_RUN_RE.sub(fix, value)
+
+
+def _expand_year(year: str) -> int:
+    """Two-digit years pivot at 69 (POSIX strptime convention)"""
+    value = int(year)
+    if len(year) == 2:
+        value += 2000 if value < 69 else 1900
+    return value
+
+
+def _iso_date(year: int, month: int, day: int) -> Optional[str]:
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def normalize_date(value: str, day_first: bool = False) -> Optional[str]:
+    """ISO 8601 form of a date, or None when it isn't a recognizable date"""
+    text = value.strip()
+    if _ISO_DATE_RE.match(text):
+        return text
+    match = _YMD_RE.match(text)
+    if match:
+        return _iso_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    match = _NUMERIC_DATE_RE.match(text)
+    if match:
+        first, second = int(match.group(1)), int(match.group(2))
+        year = _expand_year(match.group(3))
+        # An unambiguous day (> 12) decides the order; otherwise use the setting
+        if first > 12 or (day_first and second <= 12):
+            return _iso_date(year, second, first)
+        return _iso_date(year, first, second)
+
+    tokens = _DATE_TOKEN_RE.findall(text.lower())
+    tokens = [t for t in tokens if t not in ("st", "nd", "rd", "th", "of")]
+    months = [MONTHS[t] for t in tokens if t in MONTHS]
+    numbers = [t for t in tokens if t.isdigit()]
+    if len(tokens) != 3 or len(months) != 1 or len(numbers) != 2:
+        return None
+    month = months[0]
+    year, day = sorted(numbers, key=len, reverse=True)
+    if len(year) != 4 or len(day) > 2:
+        return None
+    return _iso_date(int(year), month, int(day))
+
+
+def normalize_currency(value: str) -> Optional[str]:
+    """ISO 4217 code for a currency symbol, code or name"""
+    text = value.strip()
+    if text.upper() in CURRENCY_CODES:
+        return text.upper()
+    for symbol, code in CURRENCY_SYMBOLS:
+        if text == symbol:
+            return code
+    return CURRENCY_NAMES.get(text.lower())
+
+
+def _split_currency(text: str) -> Tuple[str, Optional[str]]:
+    """Strip a leading or trailing currency marker from an amount, with its code if unambiguous"""
+    for word in re.findall(r"[A-Za-z]+", text):
+        if word.upper() in CURRENCY_CODES or word.lower() in CURRENCY_NAMES:
+            return text.replace(word, "", 1).strip(), normalize_currency(word)
+    for symbol, code in CURRENCY_SYMBOLS:
+        if text.startswith(symbol) or text.endswith(symbol) or text.startswith("-" + symbol):
+            return text.replace(symbol, "", 1).strip(), code
+    return text, None
+
+
+def _canonical_number(number: str) -> Optional[str]:
+    """Resolve thousands/decimal separators into a plain decimal string"""
+    number = re.sub(r"['  ]", "", number)
+    if "," in number and "." in number:
+        decimal_mark = "," if number.rfind(",") > number.rfind(".") else "."
+        grouping = "." if decimal_mark == "," else ","
+        number = number.replace(grouping, "").replace(decimal_mark, ".")
+    elif "," in number:
+        whole, _, fraction = number.rpartition(",")
+        # "12,50" is a decimal comma; "1,250" and "1,250,000" are grouping
+        if number.count(",") == 1 and len(fraction) != 3:
+            number = f"{whole}.{fraction}"
+        else:
+            number = number.replace(",", "")
+    elif number.count(".") > 1:
+        number = number.replace(".", "")
+    try:
+        Decimal(number)
+    except InvalidOperation:
+        return None
+    return number if re.match(r"^\d+(\.\d+)?$", number) else None
+
+
+def normalize_amount(value: str) -> Optional[str]:
+    """
+    Canonical amount: plain decimal, then the ISO currency code if any
+
+    "US$1,234.50" -> "1234.50 USD", "1.234,50 €" -> "1234.50 EUR",
+    "$1,234.50" -> "1234.50", "(45.00)" -> "-45.00". None when the value
+    isn't a single amount.
+    """
+    text, code = _split_currency(value.strip())
+    match = _AMOUNT_RE.match(text.strip())
+    if not match:
+        return None
+    number = _canonical_number(match.group(3))
+    if number is None:
+        return None
+    # Accounting notation writes negatives as "(45.00)"
+    negative = bool(match.group(1) or match.group(2) or match.group(4)) or text.strip().startswith("(")
+    amount = f"-{number}" if negative else number
+    return f"{amount} {code}" if code else amount
+
+
+def normalize_phone(value: str) -> Optional[str]:
+    """Phone number as digits, with a leading + for international numbers"""
+    text = value.strip()
+    if re.search(r"[^\d\s()+./-]", text):
+        return None
+    digits = re.sub(r"\D", "", text)
+    international = text.startswith("+") or digits.startswith("00")
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if not 7 <= len(digits) <= 15:
+        return None
+    return f"+{digits}" if international else digits
+
+
+def normalize_identifier(value: str, compact: bool = False) -> str:
+    """Identifier with collapsed whitespace (removed, and upper-cased, if compact)"""
+    text = _SPACES_RE.sub(" ", value.strip())
+    return text.replace(" ", "").upper() if compact else text
+
+
+def collapse_spaces(value: str) -> str:
+    """Free text with trimmed and collapsed whitespace"""
+    return _SPACES_RE.sub(" ", value.strip())
+
+
+@lru_cache(maxsize=16384)
+def _normalize_value(kind: str, compact: bool, value: str, day_first: bool) -> Tuple[str, Optional[str], Optional[str]]:
+    """(new value, change type, description) for one value; pure and cached"""
+    new = value
+    change_type = None
+    notes = []
+
+    if kind == DATE:
+        parse = partial(normalize_date, day_first=day_first)
+        label = "standardized date to ISO 8601 (YYYY-MM-DD)"
+    elif kind == AMOUNT:
+        parse = normalize_amount
+        label = "standardized amount"
+    elif kind == CURRENCY:
+        parse = normalize_currency
+        label = "standardized currency to ISO 4217"
+    elif kind == PHONE:
+        parse = normalize_phone
+        label = "standardized phone number"
+    elif kind == IDENTIFIER:
+        parse = partial(normalize_identifier, compact=compact)
+        label = "normalized identifier spacing"
+    else:
+        parse = collapse_spaces
+        label = "trimmed whitespace"
+
+    result = parse(new)
+    if result is None and kind in (DATE, AMOUNT, PHONE):
+        # Retry with OCR digit confusions fixed, keeping the fix only if it parses
+        fixed = fix_ocr_digits(new)
+        if fixed != new:
+            result = parse(fixed)
+            if result is not None:
+                new = fixed
+                change_type = "correction"
+                notes.append("corrected OCR digit confusions")
+
+    if result is None:
+        # Not a recognizable value of its kind: leave it exactly as extracted
+        return value, None, None
+    if result != new:
+        new = result
+        change_type = change_type or "formatting"
+        notes.append(label)
+    if new == value:
+        return value, None, None
+    return new, change_type, "; ".join(notes)
+
+
+class FieldNormalizer:
+    """
+    Normalizes all fields of a document in one batched pass
+
+    Fields are grouped by kind (derived from the field name, memoized), and
+    each value is normalized by a pure, memoized function, so repeated
+    values across documents cost a dictionary lookup.
+    """
+
+    def __init__(self, enabled: bool = True, day_first: bool = False):
+        self.enabled = enabled
+        self.day_first = day_first
+
+    @classmethod
+    def from_settings(cls) -> "FieldNormalizer":
+        """Create a normalizer from settings"""
+        return cls(enabled=settings.NORMALIZATION_ENABLED, day_first=settings.NORMALIZATION_DAY_FIRST)
+
+    def normalize(self, fields: List[FieldData]) -> Tuple[List[FieldData], List[FormattingChange]]:
+        """Normalized copies of ``fields`` and one FormattingChange per changed value"""
+        if not self.enabled or not fields:
+            return list(fields), []
+
+        groups: Dict[Tuple[str, bool], List[int]] = {}
+        for position, item in enumerate(fields):
+            name = item.field.lower()
+            compact = bool(set(_WORD_RE.findall(name)) & _COMPACT_ID_WORDS)
+            groups.setdefault((_field_kind(name), compact), []).append(position)
+
+        normalized = list(fields)
+        changes: List[Tuple[int, FormattingChange]] = []
+        for (kind, compact), positions in groups.items():
+            for position in positions:
+                item = fields[position]
+                value, change_type, note = _normalize_value(kind, compact, item.value, self.day_first)
+                if change_type is None:
+                    continue
+                normalized[position] = item.model_copy(update={"value": value})
+                changes.append((position, FormattingChange(
+                    type=change_type,
+                    message=f"{item.field}: {note} ('{item.value}' -> '{value}')",
+                )))
+        changes.sort(key=lambda change: change[0])
+        return normalized, [change for _, change in changes]
+
+
+# Global field normalizer instance
+field_normalizer = FieldNormalizer.from_settings()
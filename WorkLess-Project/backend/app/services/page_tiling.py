@@ -0,0 +1,362 @@
+"""
+Page Tiling
+Crops page margins and splits large or tall pages densely covered in print
+into overlapping tiles, so fine print reaches the model at its native
+resolution, and merges the tiles' extracted fields back into one result
+"""
+
+import math
+import re
+from difflib import SequenceMatcher
+from typing import List, Dict, Any, Optional, Tuple, TYPE_CHECKING
+from app.core.config import settings
+from app.models.schemas import FieldData, FormattingChange
+from app.services.response_parser import ParsedModelResponse
+import logging
+
+# PIL is imported on first use, keeping it off the startup path
+if TYPE_CHECKING:
+    import PIL.Image
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[int, int, int, int]
+
+# Content is located on a mask reduced to at most this many pixels a side
+ROI_DETECTION_SIZE = 512
+# Grey levels a pixel must differ from the page background to count as content
+ROI_INK_THRESHOLD = 48
+# Padding kept around the detected content, as a share of the shorter page side
+ROI_PADDING = 0.02
+# Crops that would remove less than this share of the page are skipped
+ROI_MIN_AREA_SAVED = 0.05
+# Pages up to this multiple of the tile size are still sent whole: splitting
+# them would mostly duplicate the overlap
+SINGLE_TILE_SLACK = 1.25
+# Print density is measured as edge density with the page reduced to at most
+# this many pixels a side, where fine print still shows as strokes
+DENSITY_DETECTION_SIZE = 768
+# Thresholds a pixel must pass after FIND_EDGES to count as an edge
+DENSITY_EDGE_THRESHOLD = 40
+# Two readings of a field in overlapping tiles at least this similar are one
+# field (OCR misreads); shorter values, such as amounts, must match exactly
+DUPLICATE_VALUE_SIMILARITY = 0.85
+SIMILAR_VALUE_MIN_CHARS = 8
+
+TILE_PROMPT_NOTE = (
+    "This image is tile {index} of {count} cut from one page, in reading order; "
+    "neighbouring tiles overlap. Extract only the fields legible in this tile. "
+    "A value cut off at the tile's edge appears whole in the neighbouring tile."
+)
+
+_NON_ALNUM_RE = re.compile(r"[\W_]+")
+
+
+def _axis_spans(length: int, tile: int, overlap: int) -> List[Tuple[int, int]]:
+    """Evenly spaced, overlapping spans of at most ``tile`` covering ``length``"""
+    if length <= tile * SINGLE_TILE_SLACK:
+        return [(0, length)]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    size = math.ceil((length + (count - 1) * overlap) / count)
+    return [(start, start + size) for start in (round(i * (length - size) / (count - 1)) for i in range(count))]
+
+
+def _boxes_overlap(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _normalize_text(text: str) -> str:
+    return _NON_ALNUM_RE.sub("", text.casefold())
+
+
+def _words(text: str) -> List[str]:
+    return [word for word in (_normalize_text(token) for token in text.split()) if word]
+
+
+class PagePlan:
+    """How one page image is cropped, scaled and tiled before extraction"""
+
+    __slots__ = ("width", "height", "content_box", "scale", "tiles", "edge_density")
+
+    def __init__(self, width: int, height: int, content_box: Box, scale: float = 1.0,
+                 tiles: Optional[List[Box]] = None, edge_density: Optional[float] = None):
+        self.width = width
+        self.height = height
+        self.content_box = content_box
+        self.scale = scale
+        # Tile boxes in the cropped (and scaled) region, in reading order
+        self.tiles = tiles or []
+        # Print density of the content, measured only on pages large enough to tile
+        self.edge_density = edge_density
+
+    @property
+    def cropped(self) -> bool:
+        """Whether margins are cut off"""
+        return self.content_box != (0, 0, self.width, self.height)
+
+    @property
+    def tiled(self) -> bool:
+        """Whether the page is sent as several tiles"""
+        return len(self.tiles) > 1
+
+    @property
+    def is_identity(self) -> bool:
+        """The page is sent exactly as uploaded"""
+        return not self.cropped and not self.tiles and self.scale == 1.0
+
+    def render(self, image: "PIL.Image.Image") -> List["PIL.Image.Image"]:
+        """Images to send for the page (CPU-bound; run off the event loop)"""
+        import PIL.Image
+        if self.is_identity:
+            return [image]
+        region = image.crop(self.content_box) if self.cropped else image
+        if self.scale < 1.0:
+            size = (max(1, round(region.width * self.scale)), max(1, round(region.height * self.scale)))
+            region = region.resize(size, PIL.Image.LANCZOS)
+        # Crops are re-encoded as JPEG by the SDK, which has no alpha or palette
+        if region.mode not in ("RGB", "L"):
+            region = region.convert("RGB")
+        if not self.tiles:
+            return [region]
+        return [region.crop(box) for box in self.tiles]
+
+    def byte_share(self, box: Box, total_bytes: int) -> int:
+        """Upload bytes attributed to a tile, in proportion to the page area it covers"""
+        tile_area = (box[2] - box[0]) * (box[3] - box[1]) / (self.scale * self.scale)
+        return round(total_bytes * min(1.0, tile_area / (self.width * self.height)))
+
+    def overlapping(self) -> List[List[int]]:
+        """For each tile, the indexes of the other tiles it shares pixels with"""
+        return [
+            [j for j, other in enumerate(self.tiles) if j != i and _boxes_overlap(box, other)]
+            for i, box in enumerate(self.tiles)
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Describe the plan for logs"""
+        return {
+            "size": [self.width, self.height],
+            "content_box": list(self.content_box),
+            "scale": round(self.scale, 3),
+            "tiles": len(self.tiles) or 1,
+            "edge_density": round(self.edge_density, 4) if self.edge_density is not None else None,
+        }
+
+
+class PageTiler:
+    """
+    Plans the crop and tiling of page images
+
+    The model downsizes large images, so on a dense 300 DPI form small print
+    is lost before it is read. Cropping the margins and cutting what is left
+    into tiles of at most ``tile_max_side`` pixels keeps each call's image no
+    larger than a normal page while every tile is read at full resolution.
+    Pages that would need more than ``max_tiles`` tiles are scaled down just
+    enough to fit.
+
+    Each tile is a model call, so only pages densely covered in print are
+    tiled: large pages whose content has an edge density below
+    ``min_edge_density`` (photos, letters, invoices in normal print) are
+    only cropped and sent whole.
+    """
+
+    def __init__(self, tile_max_side: int = 1536, overlap: float = 0.12, max_tiles: int = 6,
+                 crop: bool = True, min_edge_density: float = 0.25):
+        self.tile_max_side = tile_max_side
+        self.overlap = round(tile_max_side * min(max(overlap, 0.0), 0.5))
+        self.max_tiles = max(1, max_tiles)
+        self.crop = crop
+        self.min_edge_density = min_edge_density
+
+    @classmethod
+    def from_settings(cls) -> "PageTiler":
+        """Build the tiler from application settings"""
+        return cls(
+            tile_max_side=settings.TILE_MAX_SIDE,
+            overlap=settings.TILE_OVERLAP,
+            max_tiles=settings.TILING_MAX_TILES,
+            crop=settings.ROI_CROP_ENABLED,
+            min_edge_density=settings.TILING_MIN_EDGE_DENSITY,
+        )
+
+    def detect_content_box(self, image: "PIL.Image.Image") -> Box:
+        """Bounding box of the page content (ink that differs from the background), padded"""
+        import PIL.ImageFilter
+        width, height = image.size
+        gray = image if image.mode == "L" else image.convert("L")
+        factor = max(1, math.ceil(max(width, height) / ROI_DETECTION_SIZE))
+        histogram = gray.reduce(factor).histogram()
+        background = histogram.index(max(histogram))
+        # Threshold at full resolution: downscaling first would fade thin
+        # strokes into the background. Any ink in a block survives the reduce.
+        ink = gray.point(lambda v: 255 if abs(v - background) > ROI_INK_THRESHOLD else 0)
+        mask = ink.reduce(factor).point(lambda v: 255 if v else 0)
+        # Drop isolated specks (scanner dust) so they don't stretch the box
+        bbox = mask.filter(PIL.ImageFilter.MedianFilter(3)).getbbox()
+        if bbox is None:
+            return (0, 0, width, height)
+        pad = ROI_PADDING * min(width, height)
+        box = (
+            max(0, math.floor(bbox[0] * factor - pad)),
+            max(0, math.floor(bbox[1] * factor - pad)),
+            min(width, math.ceil(bbox[2] * factor + pad)),
+            min(height, math.ceil(bbox[3] * factor + pad)),
+        )
+        saved = 1 - (box[2] - box[0]) * (box[3] - box[1]) / (width * height)
+        return box if saved >= ROI_MIN_AREA_SAVED else (0, 0, width, height)
+
+    def edge_density(self, gray: "PIL.Image.Image", box: Box) -> float:
+        """Share of edge pixels in a region of a grayscale page, reduced to DENSITY_DETECTION_SIZE"""
+        import PIL.ImageFilter
+        factor = max(1, math.ceil(max(box[2] - box[0], box[3] - box[1]) / DENSITY_DETECTION_SIZE))
+        small = gray.reduce(factor, box=box)
+        edges = small.filter(PIL.ImageFilter.FIND_EDGES).histogram()
+        return sum(edges[DENSITY_EDGE_THRESHOLD:]) / max(1, small.width * small.height)
+
+    def plan(self, image: "PIL.Image.Image") -> PagePlan:
+        """Decide the crop and tiles for a page image (CPU-bound; run off the event loop)"""
+        width, height = image.size
+        gray = image if image.mode == "L" else image.convert("L")
+        box = self.detect_content_box(gray) if self.crop else (0, 0, width, height)
+        region_width, region_height = box[2] - box[0], box[3] - box[1]
+        if max(region_width, region_height) <= self.tile_max_side * SINGLE_TILE_SLACK:
+            return PagePlan(width, height, box)
+
+        # Sparse pages read fine downsized: one call instead of one per tile
+        density = self.edge_density(gray, box)
+        if density < self.min_edge_density:
+            return PagePlan(width, height, box, edge_density=density)
+
+        scale = 1.0
+        while True:
+            scaled_width = max(1, round(region_width * scale))
+            scaled_height = max(1, round(region_height * scale))
+            columns = _axis_spans(scaled_width, self.tile_max_side, self.overlap)
+            rows = _axis_spans(scaled_height, self.tile_max_side, self.overlap)
+            if len(columns) * len(rows) <= self.max_tiles:
+                break
+            scale *= 0.9
+
+        if len(columns) * len(rows) == 1:
+            return PagePlan(width, height, box, scale, edge_density=density)
+        tiles = [(left, top, right, bottom) for top, bottom in rows for left, right in columns]
+        return PagePlan(width, height, box, scale, tiles, edge_density=density)
+
+
+def _edge_fragment(part: FieldData, whole: FieldData, part_box: Box, whole_box: Box) -> bool:
+    """
+    Whether ``part`` is ``whole`` cut at the edge of its tile
+
+    A tile left of (or above) the other one cuts off a value's end, so the
+    fragment is a prefix; one right of (or below) it cuts off the start, a
+    suffix. Cuts between rows of tiles fall between lines, so they keep
+    whole words. Any other substring is a different value.
+    """
+    if part_box[0] != whole_box[0]:
+        fragment, complete = _normalize_text(part.value), _normalize_text(whole.value)
+        before = part_box[0] < whole_box[0]
+    else:
+        fragment, complete = _words(part.value), _words(whole.value)
+        before = part_box[1] < whole_box[1]
+    if not fragment or len(fragment) >= len(complete):
+        return False
+    return complete[:len(fragment)] == fragment if before else complete[-len(fragment):] == fragment
+
+
+def _same_field(a: FieldData, b: FieldData, box_a: Box, box_b: Box) -> bool:
+    """Whether two readings from overlapping tiles are the same field"""
+    if _normalize_text(a.field) != _normalize_text(b.field):
+        return False
+    value_a, value_b = _normalize_text(a.value), _normalize_text(b.value)
+    if value_a == value_b:
+        return True
+    if not value_a or not value_b:
+        return False
+    if _edge_fragment(a, b, box_a, box_b) or _edge_fragment(b, a, box_b, box_a):
+        return True
+    return (
+        min(len(value_a), len(value_b)) >= SIMILAR_VALUE_MIN_CHARS
+        and SequenceMatcher(None, value_a, value_b).ratio() >= DUPLICATE_VALUE_SIMILARITY
+    )
+
+
+def _better_reading(a: FieldData, b: FieldData, box_a: Box, box_b: Box) -> FieldData:
+    """The complete reading over one cut at a tile edge, otherwise the more confident one"""
+    if _edge_fragment(a, b, box_a, box_b):
+        return b
+    if _edge_fragment(b, a, box_b, box_a):
+        return a
+    return a if a.confidence >= b.confidence else b
+
+
+class TileMerger:
+    """
+    Merges the fields extracted from each tile of a page
+
+    Overlap bands are read twice, so a field read in two tiles that share
+    pixels is kept once: the complete reading wins over one cut at a tile
+    edge, otherwise the more confident one. Fields with the same name from
+    one tile, or from tiles that don't touch (e.g. line items), are kept.
+    Tiles may arrive in any order; ``fields()`` is in reading order.
+    """
+
+    def __init__(self, plan: PagePlan):
+        self.tiles = plan.tiles
+        self.neighbours = plan.overlapping()
+        self._entries: List[Tuple[int, FieldData]] = []
+        self._responses: Dict[int, ParsedModelResponse] = {}
+        self._texts: Dict[int, str] = {}
+
+    def add(self, index: int, parsed_response: ParsedModelResponse, text: str) -> List[FieldData]:
+        """Add one tile's result; returns the fields not already seen in a neighbouring tile"""
+        self._responses[index] = parsed_response
+        self._texts[index] = text
+        neighbours = set(self.neighbours[index])
+        box = self.tiles[index]
+        new_fields = []
+        for field in parsed_response.fields:
+            for position, (tile, existing) in enumerate(self._entries):
+                if tile in neighbours and _same_field(existing, field, self.tiles[tile], box):
+                    if _better_reading(existing, field, self.tiles[tile], box) is field:
+                        self._entries[position] = (index, field)
+                    break
+            else:
+                self._entries.append((index, field))
+                new_fields.append(field)
+        return new_fields
+
+    def fields(self) -> List[FieldData]:
+        """Merged fields in reading order"""
+        return [field for _, field in sorted(self._entries, key=lambda entry: entry[0])]
+
+    def result(self) -> Tuple[ParsedModelResponse, str]:
+        """The merged parsed response and the tiles' raw texts"""
+        order = sorted(self._responses)
+        changes: List[FormattingChange] = []
+        seen = set()
+        for index in order:
+            for change in self._responses[index].formatting_changes:
+                if (change.type, change.message) not in seen:
+                    seen.add((change.type, change.message))
+                    changes.append(change)
+        # The explanation of the tile that contributed the most fields
+        contributed = {index: 0 for index in order}
+        for tile, _ in self._entries:
+            contributed[tile] += 1
+        explanations = [
+            (contributed[index], self._responses[index].explanation)
+            for index in order if self._responses[index].explanation
+        ]
+        explanation = max(explanations, key=lambda item: item[0])[1] if explanations else None
+        merged = ParsedModelResponse(
+            self.fields(),
+            changes,
+            explanation,
+            None,
+            repaired=any(self._responses[index].repaired for index in order)
+        )
+        return merged, "\n".join(self._texts[index] for index in order)
+
+
+# Global page tiler instance
+page_tiler = PageTiler.from_settings() if settings.TILING_ENABLED else None
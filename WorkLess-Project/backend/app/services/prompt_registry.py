@@ -0,0 +1,202 @@
+"""
+Prompt Registry
+Named, versioned extraction prompts per document type, compiled once at
+startup, with token estimates and deterministic A/B selection
+"""
+
+import hashlib
+import math
+from typing import List, Dict, Any, Optional
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+GENERIC = "generic"
+DOCUMENT_TYPES = [GENERIC, "receipt", "invoice", "id", "form"]
+
+# Rough characters per token for English prompt text
+CHARS_PER_TOKEN = 4
+
+# How each document type is referred to in its prompt
+DOCUMENT_LABELS = {
+    GENERIC: "this document",
+    "receipt": "this receipt",
+    "invoice": "this invoice",
+    "id": "this identity document",
+    "form": "this form",
+}
+
+# Fields worth naming explicitly for each document type
+FIELD_HINTS = {
+    GENERIC: "Name, Date, Amount, Description, Reference, etc.",
+    "receipt": "Merchant, Date, Time, Items, Subtotal, Tax, Tip, Total, Currency, Payment Method",
+    "invoice": (
+        "Vendor, Invoice Number, Invoice Date, Due Date, Bill To, PO Number, "
+        "Subtotal, Tax, Total, Currency, Payment Terms"
+    ),
+    "id": "Full Name, Date of Birth, ID Number, Issue Date, Expiry Date, Nationality, Address",
+    "form": "every labeled field, using the printed label as the field name",
+}
+
+# Dates, amounts, phone numbers, IDs and OCR fixes are normalized locally
+# after parsing (see normalizer), so prompts only ask for values as printed
+RESPONSE_FORMAT = """Return your analysis in the following JSON format:
+{
+  "fields": [
+    {
+      "field": "field_name",
+      "value": "extracted_value",
+      "confidence": 95
+    }
+  ],
+  "explanation": "Brief explanation of what was found",
+  "overall_confidence": 95
+}"""
+
+COMPACT_RESPONSE_FORMAT = """Reply with JSON only:
+{"fields": [{"field": "...", "value": "...", "confidence": 0-100}], "explanation": "one sentence"}"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text prompt"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class PromptTemplate:
+    """One compiled prompt version"""
+
+    __slots__ = ("document_type", "version", "text", "token_estimate", "fingerprint")
+
+    def __init__(self, document_type: str, version: str, sections: List[str]):
+        self.document_type = document_type
+        self.version = version
+        # Compiled once; every request reuses the same string object
+        self.text = "\n\n".join(section.strip() for section in sections)
+        self.token_estimate = estimate_tokens(self.text)
+        self.fingerprint = hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def key(self) -> str:
+        """Name and version, e.g. "invoice@v1", used in metrics"""
+        return f"{self.document_type}@{self.version}"
+
+    @property
+    def cache_key(self) -> str:
+        """Key for cached results; changes whenever the prompt text does"""
+        return f"{self.key}#{self.fingerprint}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Describe the template for metrics"""
+        return {
+            "version": self.version,
+            "token_estimate": self.token_estimate,
+            "fingerprint": self.fingerprint,
+        }
+
+
+def _standard_prompt(document_type: str) -> PromptTemplate:
+    return PromptTemplate(document_type, "v1", [
+        f"Analyze {DOCUMENT_LABELS[document_type]} and extract structured data.",
+        f"""Please:
+1. Extract all relevant fields ({FIELD_HINTS[document_type]})
+2. Copy each value as it appears in the document
+3. Provide confidence scores for each extracted field (0-100)
+4. Briefly explain what data points you identified""",
+        RESPONSE_FORMAT,
+        "Focus on accuracy and provide clear, structured data.",
+    ])
+
+
+def _compact_prompt(document_type: str) -> PromptTemplate:
+    return PromptTemplate(document_type, "v2-compact", [
+        f"Extract the fields of this document ({FIELD_HINTS[document_type]}) "
+        "with values exactly as printed and a 0-100 confidence each.",
+        COMPACT_RESPONSE_FORMAT,
+    ])
+
+
+class PromptRegistry:
+    """
+    Versioned prompts per document type
+
+    The active version of a type is the first one registered unless
+    overridden in ``versions``. ``experiments`` sends a share of users to
+    other versions ({"invoice": {"v2-compact": 0.5}}); a user's bucket is a
+    hash of their id, so they keep seeing the same variant.
+    """
+
+    def __init__(
+        self,
+        versions: Optional[Dict[str, str]] = None,
+        experiments: Optional[Dict[str, Dict[str, float]]] = None
+    ):
+        self._templates: Dict[str, Dict[str, PromptTemplate]] = {}
+        self.versions = {k.lower(): v for k, v in (versions or {}).items()}
+        self.experiments = {k.lower(): v for k, v in (experiments or {}).items()}
+
+    @classmethod
+    def from_settings(cls) -> "PromptRegistry":
+        """Registry with the built-in prompts and configured versions/experiments"""
+        registry = cls(versions=settings.PROMPT_VERSIONS, experiments=settings.PROMPT_EXPERIMENTS)
+        for document_type in DOCUMENT_TYPES:
+            registry.register(_standard_prompt(document_type))
+            registry.register(_compact_prompt(document_type))
+        registry.validate()
+        return registry
+
+    def register(self, template: PromptTemplate) -> None:
+        """Add a prompt version"""
+        self._templates.setdefault(template.document_type, {})[template.version] = template
+
+    def validate(self) -> None:
+        """Drop configured versions and experiments that name unknown prompts"""
+        for document_type, version in list(self.versions.items()):
+            if version not in self._templates.get(document_type, {}):
+                logger.warning(f"Unknown prompt version {document_type}@{version}; using the default")
+                del self.versions[document_type]
+        for document_type, shares in list(self.experiments.items()):
+            known = {v: s for v, s in shares.items() if v in self._templates.get(document_type, {})}
+            if known != shares:
+                logger.warning(f"Ignoring unknown prompt versions in the {document_type} experiment")
+            self.experiments[document_type] = known
+
+    def _resolve_type(self, document_type: Optional[str]) -> str:
+        document_type = (document_type or GENERIC).lower()
+        return document_type if document_type in self._templates else GENERIC
+
+    def get(self, document_type: Optional[str] = None, version: Optional[str] = None) -> PromptTemplate:
+        """A specific version, or the active one, for a document type"""
+        templates = self._templates[self._resolve_type(document_type)]
+        if version:
+            return templates[version]
+        active = self.versions.get(self._resolve_type(document_type))
+        return templates[active] if active else next(iter(templates.values()))
+
+    def select(self, document_type: Optional[str] = None, user_id: Optional[str] = None) -> PromptTemplate:
+        """Prompt for one request, honouring running experiments"""
+        resolved = self._resolve_type(document_type)
+        shares = self.experiments.get(resolved)
+        if shares and user_id:
+            digest = hashlib.sha256(f"{resolved}:{user_id}".encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:8], "big") / 2 ** 64
+            for version, share in shares.items():
+                if bucket < share:
+                    return self._templates[resolved][version]
+                bucket -= share
+        return self.get(resolved)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Registered prompts with the active version and experiments, for metrics"""
+        return {
+            document_type: {
+                "active": self.get(document_type).version,
+                "experiment": self.experiments.get(document_type) or None,
+                "versions": [template.to_dict() for template in templates.values()],
+            }
+            for document_type, templates in self._templates.items()
+        }
+
+
+# Global prompt registry instance
+prompt_registry = PromptRegistry.from_settings()
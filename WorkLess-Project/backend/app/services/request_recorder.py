@@ -0,0 +1,346 @@
+"""
+Request Recorder
+Captures a sampled share of requests (sanitized request shape, stage timings,
+model and database responses) to a compact binary log that
+benchmarks/replay_traffic.py plays back against the fake backends
+"""
+
+import asyncio
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Set
+import orjson
+from app.core.config import settings
+from app.core.storage import data_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Each frame of the log is one zlib-compressed JSON array of records behind a
+# fixed header (magic, format version, payload length). Frames are appended
+# with a single write, so the workers of one host can share a log.
+FRAME_MAGIC = b"WR"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBxI")
+
+# String values under these keys are kept as recorded (field names, change
+# types, statuses, tiers); every other string is masked
+KEEP_KEYS = frozenset({"field", "type", "status", "subscription_tier", "document_type"})
+# Words kept outside JSON strings in model output
+_JSON_WORDS = frozenset({"true", "false", "null", "json"})
+
+_MASK_RE = re.compile(r"\\u[0-9a-fA-F]{4}|\\.|[^\W_]")
+# A JSON string literal (and the colon when it is a key), or a bare word
+_MODEL_TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"(\s*:)?|[^\W\d_]+')
+
+
+def _mask_char(match: "re.Match") -> str:
+    token = match.group()
+    if token[0] == "\\":
+        return token
+    if token.isdigit():
+        return "9"
+    return "X" if token.isupper() else "x"
+
+
+def mask(text: str) -> str:
+    """Same length and shape without the content: letters become x/X, digits 9"""
+    return _MASK_RE.sub(_mask_char, text)
+
+
+def redact_model_text(text: str) -> str:
+    """
+    Model output with its content masked
+
+    Keys, field names, numbers and JSON structure are kept, so the replayed
+    text costs the same to parse and normalize (a masked date or amount
+    still looks like one) without carrying what the document said.
+    """
+    key = None
+
+    def replace(match: "re.Match") -> str:
+        nonlocal key
+        if match.group(1) is None:
+            word = match.group()
+            return word if word in _JSON_WORDS else mask(word)
+        if match.group(2):
+            key = match.group(1)
+            return match.group()
+        value = match.group(1) if key in KEEP_KEYS else mask(match.group(1))
+        key = None
+        return f'"{value}"'
+
+    return _MODEL_TOKEN_RE.sub(replace, text)
+
+
+def redact_value(value: Any, key: Optional[str] = None) -> Any:
+    """A database result with its strings masked (column names, numbers and flags kept)"""
+    if isinstance(value, str):
+        return value if key in KEEP_KEYS else mask(value)
+    if isinstance(value, dict):
+        return {k: redact_value(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact_value(v, key) for v in value]
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return mask(str(value))
+
+
+def encode_frame(records: List[Dict[str, Any]]) -> bytes:
+    """One log frame holding a batch of records"""
+    payload = zlib.compress(orjson.dumps(records), 6)
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, len(payload)) + payload
+
+
+def read_log(path: str) -> Iterator[Dict[str, Any]]:
+    """Records of a log, in the order they were written (a truncated last frame is skipped)"""
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            magic, version, length = FRAME_HEADER.unpack(header)
+            if magic != FRAME_MAGIC or version != FRAME_VERSION:
+                raise ValueError(f"{path} is not a request log (or has an unsupported version)")
+            payload = f.read(length)
+            if len(payload) < length:
+                logger.warning(f"{path}: skipping a truncated final frame")
+                return
+            yield from orjson.loads(zlib.decompress(payload))
+
+
+class Recording:
+    """What one sampled request did, filled in by the code it runs through"""
+
+    __slots__ = ("at", "started", "method", "path", "shape", "stages", "model_calls", "db_calls")
+
+    def __init__(self, method: str, path: str):
+        self.at = time.time()
+        self.started = time.perf_counter()
+        self.method = method
+        self.path = path
+        self.shape: Dict[str, Any] = {}
+        self.stages: Dict[str, float] = {}
+        self.model_calls: List[Dict[str, Any]] = []
+        self.db_calls: List[Dict[str, Any]] = []
+
+    def note(self, **shape: Any) -> None:
+        """Add to the request's shape (upload size, mime type, pages, tier, ...)"""
+        self.shape.update((key, value) for key, value in shape.items() if value is not None)
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        """Add time spent in a pipeline stage (repeated stages are summed)"""
+        self.stages[name] = round(self.stages.get(name, 0.0) + seconds * 1000, 2)
+
+    def add_model_call(self, model: str, seconds: float, text: str = "", prompt_tokens: int = 0,
+                       output_tokens: int = 0, error: bool = False, stream: bool = False) -> None:
+        """Add one model call and its (redacted) output"""
+        self.model_calls.append({
+            "model": model,
+            "ms": round(seconds * 1000, 2),
+            "text": redact_model_text(text) if text else "",
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "error": error,
+            "stream": stream,
+        })
+
+    def add_db_call(self, call: str, seconds: float, result: Any = None, error: bool = False) -> None:
+        """Add one database call and its (redacted) result"""
+        self.db_calls.append({
+            "call": call,
+            "ms": round(seconds * 1000, 2),
+            "result": redact_value(result),
+            "error": error,
+        })
+
+    def to_dict(self, route: Optional[str], status: int, response_bytes: int) -> Dict[str, Any]:
+        """The log record"""
+        return {
+            "at": round(self.at, 3),
+            "method": self.method,
+            "route": route or self.path,
+            "status": status,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "response_bytes": response_bytes,
+            "shape": self.shape,
+            "stages": self.stages,
+            "model": self.model_calls,
+            "db": self.db_calls,
+        }
+
+
+_current: ContextVar[Optional[Recording]] = ContextVar("recording", default=None)
+
+
+def current_recording() -> Optional[Recording]:
+    """The recording of the request being handled, if it was sampled"""
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage into the current recording (no-op when not recording)"""
+    recording = _current.get()
+    if recording is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recording.add_stage(name, time.perf_counter() - start)
+
+
+def record_model_call(model: str, seconds: float, text: str = "", prompt_tokens: int = 0,
+                      output_tokens: int = 0, error: bool = False, stream: bool = False) -> None:
+    """Add a model call to the current recording, if any"""
+    recording = _current.get()
+    if recording is not None:
+        recording.add_model_call(model, seconds, text, prompt_tokens, output_tokens, error, stream)
+
+
+class RecordedDatabase:
+    """Database service wrapper that adds each call to the current recording"""
+
+    def __init__(self, service: Any):
+        self._service = service
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._service, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            recording = _current.get()
+            if recording is None:
+                return attribute(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+            except BaseException:
+                recording.add_db_call(name, time.perf_counter() - start, error=True)
+                raise
+            recording.add_db_call(name, time.perf_counter() - start, result)
+            return result
+
+        return call
+
+
+class RequestRecorder:
+    """
+    Samples requests on the recorded routes and batches their records to the log
+
+    Only request shapes are kept: no file content, user IDs, headers or
+    query values, and model and database responses are masked. Records are
+    buffered and written ``batch_size`` at a time off the event loop; the
+    rest is written at shutdown. The log is rotated to ``<path>.1`` once it
+    passes ``max_bytes``.
+    """
+
+    def __init__(self, path: str, sample_rate: float = 0.01, routes: Iterable[str] = (),
+                 batch_size: int = 50, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.routes = frozenset(routes)
+        self.batch_size = max(1, batch_size)
+        self.max_bytes = max_bytes
+        self._buffer: List[Dict[str, Any]] = []
+        self._writes: Set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self.sampled = 0
+        self.written = 0
+        self.bytes_written = 0
+        self.write_errors = 0
+
+    @classmethod
+    def from_settings(cls) -> "RequestRecorder":
+        """Build the recorder from application settings"""
+        return cls(
+            path=settings.RECORDER_LOG_PATH or data_path("requests.wrlog"),
+            sample_rate=settings.RECORDER_SAMPLE_RATE,
+            routes=settings.RECORDER_ROUTES,
+            batch_size=settings.RECORDER_BATCH_SIZE,
+            max_bytes=settings.RECORDER_MAX_LOG_MB * 1024 * 1024,
+        )
+
+    def sample(self, method: str, path: str) -> Optional[Recording]:
+        """A recording for this request if it is on a recorded route and sampled"""
+        if path not in self.routes or random.random() >= self.sample_rate:
+            return None
+        self.sampled += 1
+        return Recording(method, path)
+
+    @staticmethod
+    def activate(recording: Recording) -> Token:
+        """Make ``recording`` current for the request's context"""
+        return _current.set(recording)
+
+    @staticmethod
+    def deactivate(token: Token) -> None:
+        _current.reset(token)
+
+    def finish(self, recording: Recording, route: Optional[str], status: int, response_bytes: int) -> None:
+        """Buffer a finished request's record, writing a full batch in the background"""
+        self._buffer.append(recording.to_dict(route, status, response_bytes))
+        if len(self._buffer) < self.batch_size:
+            return
+        batch, self._buffer = self._buffer, []
+        task = asyncio.create_task(asyncio.to_thread(self._write, batch))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        frame = encode_frame(records)
+        with self._lock:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                try:
+                    if os.path.getsize(self.path) + len(frame) > self.max_bytes:
+                        os.replace(self.path, f"{self.path}.1")
+                except FileNotFoundError:
+                    pass
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, frame)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                self.write_errors += 1
+                logger.error(f"Could not write {len(records)} request records to {self.path}: {e}")
+                return
+            self.written += len(records)
+            self.bytes_written += len(frame)
+
+    async def stop(self) -> None:
+        """Write pending batches and the partial one (app shutdown)"""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            await asyncio.to_thread(self._write, batch)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Recorder counters"""
+        return {
+            "path": self.path,
+            "sample_rate": self.sample_rate,
+            "sampled": self.sampled,
+            "written": self.written,
+            "buffered": len(self._buffer),
+            "bytes_written": self.bytes_written,
+            "write_errors": self.write_errors,
+        }
+
+
+# Global request recorder instance (None when recording is off)
+request_recorder = RequestRecorder.from_settings() if settings.RECORDER_ENABLED else None
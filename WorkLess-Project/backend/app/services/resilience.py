@@ -0,0 +1,300 @@
+"""
+Resilience Utilities
+Deadlines, jittered retries, hedged requests and circuit breaking for
+upstream model calls
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upstream exception class names that are worth retrying. Matched by name so
+# the SDK's transport exceptions (google.api_core) need not be imported here.
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "GatewayTimeout",
+    "DeadlineExceeded",
+    "Aborted",
+    "RetryError",
+}
+
+
+class UpstreamError(Exception):
+    """The upstream model service failed or is unavailable"""
+
+
+class DeadlineExceededError(UpstreamError):
+    """The request deadline passed before the upstream answered"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The circuit breaker is open; the upstream is considered degraded"""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether an exception is a transient upstream failure"""
+    if isinstance(exc, (DeadlineExceededError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency: float) -> None:
+        """Record a latency in seconds"""
+        with self._lock:
+            self._samples.append(latency)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Return the p-th percentile (0-100), or None without samples"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    closed -> open after ``failure_threshold`` consecutive upstream failures;
+    open -> half-open after ``recovery_timeout`` seconds, letting a single
+    probe call through; the probe's outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state, moving open -> half-open once the timeout passed"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may proceed now"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            with self._lock:
+                if not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    return True
+        return False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call"""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Count an upstream failure, opening the circuit at the threshold"""
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(
+                        f"Circuit '{self.name}' opened after {self._failures} consecutive failures"
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def available(self) -> bool:
+        """Whether a call would be let through now, without taking the half-open probe slot"""
+        state = self.state
+        with self._lock:
+            return state == self.CLOSED or (state == self.HALF_OPEN and not self._probe_in_flight)
+
+    def release_probe(self) -> None:
+        """
+        Give back the half-open probe slot of a call abandoned without an
+        outcome (e.g. a stream whose client disconnected), so the next call
+        can probe instead
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        """State for metrics"""
+        return {"state": self.state, "consecutive_failures": self._failures}
+
+
+class ResilientCaller:
+    """
+    Runs blocking upstream calls with a deadline, retries, hedging and a breaker
+
+    Calls run in worker threads so they never block the event loop. A thread
+    that outlives its deadline cannot be interrupted; its result is discarded.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        deadline: float = 60.0,
+        attempt_timeout: float = 30.0,
+        max_retries: int = 2,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.name = name
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker(name)
+        self.latencies = LatencyTracker()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def check(self) -> None:
+        """Fail fast if the circuit is open"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Upstream '{self.name}' is temporarily unavailable")
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Delay after which a hedged duplicate is sent, if hedging applies"""
+        if not self.hedge_enabled or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.percentile(self.hedge_percentile)
+
+    async def _run_attempt(self, func: Callable[..., Any], args: tuple, kwargs: dict, timeout: float) -> Any:
+        """Run one attempt, optionally hedged, within ``timeout`` seconds"""
+        start = time.monotonic()
+        primary = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        tasks = {primary}
+        hedge_delay = self._hedge_delay()
+
+        try:
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    self.hedges_sent += 1
+                    logger.info(f"Hedging '{self.name}' call after {hedge_delay:.2f}s")
+                    tasks.add(asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs)))
+
+            remaining = timeout - (time.monotonic() - start)
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, timeout=max(0.0, remaining), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise DeadlineExceededError(
+                        f"Upstream '{self.name}' did not respond within {timeout:.1f}s"
+                    )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedges_won += 1
+                        self.latencies.add(time.monotonic() - start)
+                        return task.result()
+                # Every finished task failed; surface the error if none remain
+                if not tasks:
+                    raise next(iter(done)).exception()
+                remaining = timeout - (time.monotonic() - start)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call ``func`` with the full resilience policy"""
+        self.check()
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceededError(
+                    f"Upstream '{self.name}' deadline of {self.deadline:.1f}s exceeded"
+                )
+            try:
+                result = await self._run_attempt(
+                    func, args, kwargs, min(self.attempt_timeout, remaining)
+                )
+            except asyncio.CancelledError:
+                # No outcome: a probe held by this call is freed for the next one
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    # Caller errors (bad request, safety blocks) are not
+                    # outages: the upstream answered, so the circuit is healthy
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                delay = self._backoff(attempt)
+                out_of_budget = deadline_at - time.monotonic() <= delay
+                if attempt >= self.max_retries or out_of_budget or not self.breaker.allow():
+                    if isinstance(e, UpstreamError):
+                        raise
+                    raise UpstreamError(f"Upstream '{self.name}' failed: {e}") from e
+                attempt += 1
+                logger.warning(
+                    f"Retrying '{self.name}' call (attempt {attempt + 1}) in {delay:.2f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def snapshot(self) -> dict:
+        """Caller state for metrics"""
+        return {
+            "circuit": self.breaker.snapshot(),
+            "latency_p50": self.latencies.percentile(50),
+            "latency_p95": self.latencies.percentile(95),
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+        }
@@ -0,0 +1,476 @@
+"""
+Model Response Parser
+Fast, tolerant extraction of structured JSON from Gemini responses
+"""
+
+import json
+import math
+import re
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import TypeAdapter
+from app.models.schemas import FieldData, FormattingChange
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+
+    def _loads(text: str) -> Any:
+        return orjson.loads(text)
+except ImportError:  # pragma: no cover - orjson is optional
+    _loads = json.loads
+
+
+# Structural characters the scanner needs to look at; everything else is
+# skipped by the regex engine instead of a Python-level loop.
+_STRUCTURE_RE = re.compile(r'[{}\[\]"]')
+_STRING_TOKEN_RE = re.compile(r'["\\]')
+# Repair additionally tracks commas as safe cut points
+_TOKEN_RE = re.compile(r'[{}\[\]",\\]')
+
+# Upper bound on decode attempts when repairing truncated output
+_MAX_REPAIR_ATTEMPTS = 64
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+_RAW_DECODER = json.JSONDecoder()
+
+_FIELD_LIST_ADAPTER = TypeAdapter(List[FieldData])
+_CHANGE_LIST_ADAPTER = TypeAdapter(List[FormattingChange])
+
+
+class BraceScanner:
+    """
+    Incremental brace-matching scanner
+
+    Feed text as it arrives; every balanced top-level JSON object is returned
+    as soon as its closing brace is seen. Braces inside strings are ignored,
+    so markdown fences and surrounding prose never confuse it.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack: List[Tuple[str, int]] = []
+        self._in_string = False
+
+    @property
+    def depth(self) -> int:
+        """Current container nesting depth"""
+        return len(self._stack)
+
+    @property
+    def in_string(self) -> bool:
+        """Whether the scanner is inside a JSON string"""
+        return self._in_string
+
+    def feed(self, chunk: str) -> List[str]:
+        """Scan a chunk and return the top-level objects it completed"""
+        completed = []
+        self._text += chunk
+        text = self._text
+        length = len(text)
+        pos = self._pos
+        stack = self._stack
+
+        while pos < length:
+            if self._in_string:
+                match = _STRING_TOKEN_RE.search(text, pos)
+                if match is None:
+                    pos = length
+                    break
+                index = match.start()
+                if match.group() == "\\":
+                    # Skip the escaped character, even across chunk boundaries
+                    pos = index + 2
+                else:
+                    self._in_string = False
+                    pos = index + 1
+                continue
+
+            if not stack:
+                # Outside any object only an opening brace matters
+                index = text.find("{", pos)
+                if index == -1:
+                    pos = length
+                    break
+                stack.append(("{", index))
+                pos = index + 1
+                continue
+
+            match = _STRUCTURE_RE.search(text, pos)
+            if match is None:
+                pos = length
+                break
+            index = match.start()
+            char = match.group()
+            pos = index + 1
+
+            if char == '"':
+                self._in_string = True
+            elif char == "{" or char == "[":
+                stack.append((char, index))
+            elif char == "}" or char == "]":
+                opener, start = stack[-1]
+                if _CLOSERS[opener] != char:
+                    # Mismatched closer: not JSON, abandon this candidate
+                    stack.clear()
+                    continue
+                stack.pop()
+                self.on_close(opener, start, index)
+                if not stack:
+                    completed.append(text[start:index + 1])
+
+        self._pos = pos
+        self._compact()
+        return completed
+
+    def on_close(self, opener: str, start: int, end: int) -> None:
+        """Hook called whenever a container closes (for subclasses)"""
+
+    def pending(self) -> Optional[str]:
+        """Return the unterminated object text, if the input ended mid-object"""
+        if not self._stack:
+            return None
+        return self._text[self._stack[0][1]:]
+
+    def _compact(self) -> None:
+        """Drop text that can no longer be part of an object"""
+        if self._stack:
+            return
+        self._pos -= len(self._text)
+        self._text = ""
+
+
+def iter_json_candidates(text: str) -> Tuple[List[str], Optional[str]]:
+    """Split text into balanced top-level objects and an unterminated tail"""
+    scanner = BraceScanner()
+    candidates = scanner.feed(text)
+    return candidates, scanner.pending()
+
+
+def _decode(text: str) -> Optional[Any]:
+    """Decode JSON, returning None instead of raising"""
+    try:
+        return _loads(text)
+    except ValueError:
+        return None
+
+
+def repair_truncated(fragment: str) -> Optional[Any]:
+    """
+    Best-effort repair of a JSON object that was cut off mid-stream
+
+    Tries cutting back to the most recent structural comma and closing the
+    open containers; falls back to closing an unterminated string.
+    """
+    stack: List[str] = []
+    cut_points: List[Tuple[int, str]] = []
+    in_string = False
+    escape_pos = -1
+
+    for match in _TOKEN_RE.finditer(fragment):
+        index = match.start()
+        char = match.group()
+        if index == escape_pos:
+            continue
+        if in_string:
+            if char == "\\":
+                escape_pos = index + 1
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            cut_points.append((index + 1, "".join(_CLOSERS[c] for c in reversed(stack))))
+        elif char in "}]":
+            if stack:
+                stack.pop()
+        elif char == ",":
+            cut_points.append((index, "".join(_CLOSERS[c] for c in reversed(stack))))
+
+    attempts = 0
+    for index, closers in reversed(cut_points):
+        if attempts >= _MAX_REPAIR_ATTEMPTS:
+            break
+        attempts += 1
+        parsed = _decode(fragment[:index] + closers)
+        if isinstance(parsed, dict):
+            return parsed
+
+    # Last resort: terminate the open string and close everything
+    tail = fragment + ('"' if in_string else "")
+    tail = tail.rstrip().rstrip(",")
+    parsed = _decode(tail + "".join(_CLOSERS[c] for c in reversed(stack)))
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _coerce_confidence(value: Any) -> float:
+    """Coerce a model-provided confidence into the 0-100 range"""
+    if isinstance(value, str):
+        value = value.strip().rstrip("%")
+    try:
+        confidence = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if math.isnan(confidence):
+        return 0.0
+    return min(100.0, max(0.0, confidence))
+
+
+def _coerce_text(value: Any, default: str = "") -> str:
+    """Coerce a scalar into a string"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _field_payload(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerce a raw model item into a payload that satisfies FieldData"""
+    field = item.get("field")
+    value = item.get("value")
+    return {
+        "field": (field if type(field) is str else _coerce_text(field)) or "Unknown",
+        "value": value if type(value) is str else _coerce_text(value),
+        "confidence": _coerce_confidence(item.get("confidence", 0)),
+    }
+
+
+def _change_payload(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerce a raw model item into a payload that satisfies FormattingChange"""
+    change_type = item.get("type")
+    message = item.get("message")
+    return {
+        "type": (change_type if type(change_type) is str else _coerce_text(change_type)) or "formatting",
+        "message": message if type(message) is str else _coerce_text(message),
+    }
+
+
+def build_field(item: Dict[str, Any]) -> FieldData:
+    """Build a single validated FieldData from a raw model item"""
+    return FieldData.model_validate(_field_payload(item))
+
+
+def build_fields(items: List[Dict[str, Any]]) -> List[FieldData]:
+    """
+    Validate a batch of raw model items into FieldData
+
+    Items are coerced up front and validated in a single pydantic-core
+    call; callers can then build responses without validating again.
+    """
+    return _FIELD_LIST_ADAPTER.validate_python([_field_payload(item) for item in items])
+
+
+def build_formatting_changes(items: List[Dict[str, Any]]) -> List[FormattingChange]:
+    """Validate a batch of raw model items into FormattingChange"""
+    return _CHANGE_LIST_ADAPTER.validate_python([_change_payload(item) for item in items])
+
+
+class ParsedModelResponse:
+    """Validated content of a model response"""
+
+    __slots__ = ("fields", "formatting_changes", "explanation", "overall_confidence", "repaired")
+
+    def __init__(
+        self,
+        fields: List[FieldData],
+        formatting_changes: List[FormattingChange],
+        explanation: Optional[str],
+        overall_confidence: Optional[float],
+        repaired: bool = False
+    ):
+        self.fields = fields
+        self.formatting_changes = formatting_changes
+        self.explanation = explanation
+        self.overall_confidence = overall_confidence
+        self.repaired = repaired
+
+    @property
+    def is_empty(self) -> bool:
+        """True when nothing structured could be recovered"""
+        return not self.fields and self.explanation is None
+
+
+def _collect(objects: List[Dict[str, Any]], repaired: bool) -> ParsedModelResponse:
+    """Merge one or more decoded objects into a single parsed response"""
+    field_items: List[Dict[str, Any]] = []
+    change_items: List[Dict[str, Any]] = []
+    explanations: List[str] = []
+    confidences: List[float] = []
+
+    for obj in objects:
+        for item in obj.get("fields") or []:
+            if not isinstance(item, dict):
+                continue
+            # Items cut off by truncation carry no value; drop them
+            if repaired and "value" not in item:
+                continue
+            field_items.append(item)
+
+        for item in obj.get("formatting_changes") or []:
+            if isinstance(item, dict):
+                change_items.append(item)
+
+        explanation = obj.get("explanation")
+        if explanation:
+            explanations.append(_coerce_text(explanation))
+
+        if "overall_confidence" in obj:
+            confidences.append(_coerce_confidence(obj["overall_confidence"]))
+
+    return ParsedModelResponse(
+        fields=build_fields(field_items),
+        formatting_changes=build_formatting_changes(change_items),
+        explanation="\n\n".join(explanations) if explanations else None,
+        overall_confidence=sum(confidences) / len(confidences) if confidences else None,
+        repaired=repaired,
+    )
+
+
+def _is_result_object(obj: Any) -> bool:
+    """Whether a decoded object looks like an extraction result"""
+    return isinstance(obj, dict) and (
+        "fields" in obj or "explanation" in obj or "formatting_changes" in obj
+    )
+
+
+def _raw_decode_scan(text: str) -> List[Dict[str, Any]]:
+    """Slow path: try decoding at every opening brace (stray prose braces)"""
+    objects = []
+    index = text.find("{")
+    while index != -1:
+        try:
+            parsed, end = _RAW_DECODER.raw_decode(text, index)
+        except ValueError:
+            index = text.find("{", index + 1)
+            continue
+        if _is_result_object(parsed):
+            objects.append(parsed)
+        index = text.find("{", end)
+    return objects
+
+
+def parse_model_response(text: str) -> ParsedModelResponse:
+    """
+    Parse a model response into validated schema objects
+
+    Handles fenced code blocks, trailing prose, several JSON blocks (their
+    fields are merged) and output truncated by the token limit.
+    """
+    # Fastest path: a single object spanning first "{" to last "}"
+    first, last = text.find("{"), text.rfind("}")
+    if first != -1 and last > first:
+        parsed = _decode(text[first:last + 1])
+        if _is_result_object(parsed):
+            return _collect([parsed], repaired=False)
+
+    objects = []
+
+    # Fast path: well-formed objects decode in one C-level pass each, and
+    # raw_decode stops at the closing brace so trailing prose costs nothing
+    index = text.find("{")
+    while index != -1:
+        try:
+            parsed, end = _RAW_DECODER.raw_decode(text, index)
+        except ValueError:
+            break
+        if _is_result_object(parsed):
+            objects.append(parsed)
+        index = text.find("{", end)
+    else:
+        if objects:
+            return _collect(objects, repaired=False)
+
+    # Slow path: brace-scan the remainder, then repair truncated output
+    candidates, tail = iter_json_candidates(text[index:] if index != -1 else "")
+    for candidate in candidates:
+        parsed = _decode(candidate)
+        if _is_result_object(parsed):
+            objects.append(parsed)
+
+    if not objects and tail is not None:
+        # An unbalanced brace in prose can hide a valid object behind it
+        objects = _raw_decode_scan(tail)
+
+    if objects:
+        return _collect(objects, repaired=False)
+
+    if tail is not None:
+        repaired = repair_truncated(tail)
+        if _is_result_object(repaired):
+            logger.info("Recovered truncated model response")
+            return _collect([repaired], repaired=True)
+
+    logger.warning("Failed to parse model response as JSON")
+    return ParsedModelResponse(
+        fields=[],
+        formatting_changes=[],
+        explanation=None,
+        overall_confidence=None,
+    )
+
+
+class IncrementalFieldParser(BraceScanner):
+    """
+    Streaming parser that emits each FieldData as soon as it closes
+
+    Feed response chunks as they arrive from the model; every object that
+    closes directly inside a top-level ``"fields"`` array is validated and
+    returned immediately. ``finish`` parses the full text for the result.
+    """
+
+    _FIELDS_KEY_RE = re.compile(r'"fields"\s*:\s*$')
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[str] = []
+        self._ready: List[FieldData] = []
+        self._fields_arrays: Dict[int, bool] = {}
+
+    def feed_fields(self, chunk: str) -> List[FieldData]:
+        """Scan a chunk and return the fields it completed"""
+        self._chunks.append(chunk)
+        self.feed(chunk)
+        ready, self._ready = self._ready, []
+        return ready
+
+    def on_close(self, opener: str, start: int, end: int) -> None:
+        """Emit objects that close inside the top-level fields array"""
+        if opener != "{" or len(self._stack) != 2:
+            return
+        parent, parent_start = self._stack[-1]
+        if parent != "[" or not self._is_fields_array(parent_start):
+            return
+        item = _decode(self._text[start:end + 1])
+        if isinstance(item, dict):
+            self._ready.append(build_field(item))
+
+    def _is_fields_array(self, start: int) -> bool:
+        """Whether the array opening at ``start`` is the value of "fields\""""
+        cached = self._fields_arrays.get(start)
+        if cached is None:
+            prefix = self._text[max(0, start - 32):start]
+            cached = self._fields_arrays[start] = bool(self._FIELDS_KEY_RE.search(prefix))
+        return cached
+
+    def _compact(self) -> None:
+        """Array offsets are only valid until the buffer is compacted"""
+        if not self._stack:
+            self._fields_arrays.clear()
+        super()._compact()
+
+    @property
+    def text(self) -> str:
+        """Full response text received so far"""
+        return "".join(self._chunks)
+
+    def finish(self) -> ParsedModelResponse:
+        """Parse the complete response once the stream has ended"""
+        return parse_model_response(self.text)
@@ -0,0 +1,168 @@
+"""
+Extraction Result Cache
+Reuses the processing result of an identical upload processed with the same
+prompt version, skipping the model call
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from app.core.config import settings
+from app.core.workers import shared_store
+from app.models.schemas import FieldData, FormattingChange
+from app.services.prompt_registry import PromptTemplate
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def result_cache_key(file_content: bytes, mime_type: str, prompt: PromptTemplate) -> str:
+    """
+    Cache key of one extraction
+
+    The prompt's cache key carries its version and a fingerprint of its
+    text, so editing or switching a prompt never serves stale results.
+    """
+    digest = hashlib.sha256(file_content).hexdigest()
+    return f"{digest}:{mime_type}:{prompt.cache_key}"
+
+
+def dump_result(result: Dict[str, Any]) -> str:
+    """Serialize a processing result (with its field models) to JSON"""
+    payload = dict(result)
+    payload["refined_data"] = [field.model_dump() for field in result.get("refined_data") or []]
+    payload["formatting_changes"] = [change.model_dump() for change in result.get("formatting_changes") or []]
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def load_result(text: str) -> Dict[str, Any]:
+    """Inverse of dump_result"""
+    result = json.loads(text)
+    result["refined_data"] = [FieldData(**field) for field in result.get("refined_data") or []]
+    result["formatting_changes"] = [FormattingChange(**change) for change in result.get("formatting_changes") or []]
+    return result
+
+
+def _cacheable(result: Dict[str, Any]) -> bool:
+    # Only successful model results (not fallbacks or empty extractions)
+    return bool(result.get("model") and result.get("refined_data"))
+
+
+class ResultCache:
+    """
+    In-memory LRU of processing results with a TTL
+
+    Only successful model results are stored. Entries are copied on the way
+    in and out so callers can't mutate cached data.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached result, if fresh"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy_result(entry[1])
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Cache a result produced by a model"""
+        if not self.enabled or not _cacheable(result):
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), _copy_result(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cache statistics for metrics"""
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _copy_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    # Field and change models are never mutated in place; copying the lists
+    # is enough to isolate entries
+    copy = dict(result)
+    copy["refined_data"] = list(result.get("refined_data") or [])
+    copy["formatting_changes"] = list(result.get("formatting_changes") or [])
+    return copy
+
+
+class SharedResultCache(ResultCache):
+    """
+    Result cache shared by all workers of a host (SQLite in DATA_DIR)
+    
+    Same interface and LRU/TTL policy as ResultCache; entries are stored as
+    JSON, so every hit returns fresh objects. Hit and miss counts are per
+    worker.
+    """
+    
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0):
+        super().__init__(max_entries, ttl)
+        self.store = shared_store()
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a cached result, if fresh"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        rows = self.store.query(
+            "SELECT result FROM result_cache WHERE key = ? AND stored_at > ?", (key, now - self.ttl)
+        )
+        if not rows:
+            self.misses += 1
+            return None
+        self.store.execute("UPDATE result_cache SET used_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return load_result(rows[0]["result"])
+    
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Cache a result produced by a model, evicting the least recently used"""
+        if not self.enabled or not _cacheable(result):
+            return
+        now = time.time()
+        self.store.transaction([
+            (
+                "INSERT OR REPLACE INTO result_cache (key, result, stored_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, dump_result(result), now, now)
+            ),
+            (
+                "DELETE FROM result_cache WHERE key IN (SELECT key FROM result_cache "
+                "ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ),
+        ])
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Cache statistics for metrics"""
+        entries = self.store.query("SELECT COUNT(*) AS n FROM result_cache")[0]["n"]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses, "shared": True}
+
+
+# Global result cache instance (shared by the workers of a host in multi-worker mode)
+result_cache = (SharedResultCache if settings.SHARED_STATE_ENABLED else ResultCache)(
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    ttl=settings.RESULT_CACHE_TTL_SECONDS
+)
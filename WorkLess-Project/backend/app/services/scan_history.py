@@ -0,0 +1,120 @@
+"""
+Scan History Helpers
+Cursor encoding, column projection and a per-user first-page cache for the
+paginated scan history API
+"""
+
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns clients may request; id and created_at are always returned because
+# they form the pagination key
+SCAN_COLUMNS = [
+    "id",
+    "created_at",
+    "file_name",
+    "file_size",
+    "status",
+    "confidence_score",
+    "fields_extracted",
+]
+KEY_COLUMNS = ["id", "created_at"]
+DEFAULT_COLUMNS = ["id", "created_at", "file_name", "status", "confidence_score"]
+
+
+class InvalidCursorError(ValueError):
+    """The pagination cursor could not be decoded"""
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past ``row`` in (created_at, id) order"""
+    raw = json.dumps([row["created_at"], row["id"]], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor into its (created_at, id) key"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, scan_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+    if not isinstance(created_at, str) or not isinstance(scan_id, str):
+        raise InvalidCursorError("Invalid cursor")
+    return created_at, scan_id
+
+
+def project_columns(fields: Optional[str]) -> List[str]:
+    """Resolve a comma-separated field list into the columns to select"""
+    if not fields:
+        return list(DEFAULT_COLUMNS)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in SCAN_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    # Keep a stable order with the key columns first
+    wanted = set(requested) | set(KEY_COLUMNS)
+    return [column for column in SCAN_COLUMNS if column in wanted]
+
+
+class ScanHistoryCache:
+    """
+    Per-user cache of the first history page
+
+    Most history reads are the dashboard's first page, so only cursorless
+    requests are cached. Entries are dropped whenever a scan record of that
+    user is written, with a TTL as a safety net for writes made elsewhere
+    (e.g. directly from the frontend).
+    """
+
+    def __init__(self, ttl: float = 30.0, max_users: int = 10000):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._entries: "OrderedDict[str, Dict[tuple, Tuple[float, Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, key: tuple) -> Optional[Dict[str, Any]]:
+        """Return a cached page, if fresh"""
+        with self._lock:
+            entry = self._entries.get(user_id, {}).get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, user_id: str, key: tuple, page: Dict[str, Any]) -> None:
+        """Cache a first page"""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.setdefault(user_id, {})[key] = (time.monotonic(), page)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[str]) -> None:
+        """Drop every cached page of a user"""
+        if not user_id:
+            return
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Cache statistics for metrics"""
+        return {"users": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Global scan history cache instance
+scan_history_cache = ScanHistoryCache(ttl=settings.SCAN_HISTORY_CACHE_TTL_SECONDS)
@@ -3,14 +3,43 @@ Supabase Service
 Handles all Supabase database operations
 """
 
-from supabase import create_client, Client
+from postgrest import SyncPostgrestClient
+from postgrest.utils import SyncClient
+from supabase import Client
+from supabase.lib.client_options import ClientOptions
 from typing import Optional, Dict, Any, List, Tuple
 from app.core.config import settings
+from app.core.http import http_transport
+from app.services.request_recorder import RecordedDatabase
+from app.services.scan_history import scan_history_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class PooledPostgrestClient(SyncPostgrestClient):
+    """PostgREST client whose requests go through the shared connection pool"""
+    
+    def create_session(self, base_url, headers, timeout) -> SyncClient:
+        # Timeouts come from the HTTP_* settings, like every outbound client
+        return http_transport.client(base_url=base_url, headers=headers, client_class=SyncClient)
+
+
+class PooledClient(Client):
+    """Supabase client with pooled PostgREST sessions"""
+    
+    @staticmethod
+    def _init_postgrest_client(rest_url, headers, schema, timeout=None) -> SyncPostgrestClient:
+        return PooledPostgrestClient(rest_url, headers=headers, schema=schema)
+
+
+def create_pooled_client(url: str, key: str) -> Client:
+    """Create a Supabase client that shares the outbound connection pool"""
+    # A fresh ClientOptions each time: the SDK's default instance is shared
+    # by every client, and each client writes its API key into its headers
+    return PooledClient(url, key, ClientOptions())
+
+
 class SupabaseService:
     """Supabase database service"""
     
@@ -18,7 +47,7 @@ class SupabaseService:
         if not settings.SUPABASE_URL or not settings.SUPABASE_KEY:
             raise ValueError("Supabase URL and Key must be configured")
         
-        self.client: Client = create_client(
+        self.client: Client = create_pooled_client(
             settings.SUPABASE_URL,
             settings.SUPABASE_KEY
         )
@@ -26,7 +55,7 @@ class SupabaseService:
         # Service role client for admin operations (if needed)
         self.service_client: Optional[Client] = None
         if settings.SUPABASE_SERVICE_ROLE_KEY:
-            self.service_client = create_client(
+            self.service_client = create_pooled_client(
                 settings.SUPABASE_URL,
                 settings.SUPABASE_SERVICE_ROLE_KEY
             )
@@ -46,6 +75,7 @@ class SupabaseService:
                 "file_size": file_size,
                 "status": status
             }).execute()
+            scan_history_cache.invalidate(user_id)
             
             if result.data:
                 return result.data[0]
@@ -58,7 +88,8 @@ class SupabaseService:
         self,
         scan_id: str,
         status: str,
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        user_id: Optional[str] = None
     ) -> bool:
         """Update scan status and metadata"""
         try:
@@ -70,11 +101,76 @@ class SupabaseService:
                 "id", scan_id
             ).execute()
             
+            # The updated row carries its owner when the caller didn't say
+            if not user_id and result.data:
+                user_id = result.data[0].get("user_id")
+            scan_history_cache.invalidate(user_id)
+            
             return bool(result.data)
         except Exception as e:
             logger.error(f"Error updating scan record: {e}")
             return False
     
+    def list_scans(
+        self,
+        user_id: str,
+        columns: List[str],
+        limit: int,
+        cursor: Optional[Tuple[str, str]] = None,
+        status: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        List a user's scans newest first, keyset-paginated on (created_at, id)
+        
+        Served by the (user_id, created_at desc, id desc) index, so every page
+        costs the same regardless of how deep the cursor is.
+        """
+        query = self.client.table("scans").select(",".join(columns)).eq("user_id", user_id)
+        if status:
+            query = query.eq("status", status)
+        if cursor:
+            created_at, scan_id = cursor
+            query.params = query.params.add(
+                "or",
+                f'(created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt."{scan_id}"))'
+            )
+        # A single order parameter with both keys: created_at.desc,id.desc
+        result = query.order("created_at.desc,id", desc=True).limit(limit).execute()
+        return result.data or []
+    
+    def list_scans_by_status(
+        self,
+        status: str,
+        created_before: str,
+        limit: int = 500
+    ) -> List[Dict[str, Any]]:
+        """Scans of any user in a status, created before an ISO timestamp"""
+        try:
+            result = self.client.table("scans").select("id,user_id,created_at").eq(
+                "status", status
+            ).lt("created_at", created_before).order("created_at").limit(limit).execute()
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error listing {status} scans: {e}")
+            return []
+    
+    def count_scans(self) -> int:
+        """Number of scans of all users (one exact count; raises on failure)"""
+        result = self.client.table("scans").select("id", count="exact").limit(1).execute()
+        return result.count or 0
+    
+    def list_user_tiers(self, limit: int = 1000, after: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Users' subscription tiers, keyset-paginated on user_id (raises on failure)"""
+        query = self.client.table("users_metadata").select("user_id,subscription_tier")
+        if after:
+            query = query.gt("user_id", after)
+        result = query.order("user_id").limit(limit).execute()
+        return result.data or []
+    
+    def ping(self) -> None:
+        """Cheapest round trip to the database, for health probes (raises on failure)"""
+        self.client.table("scans").select("id").limit(1).execute()
+    
     def get_user_metadata(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user metadata"""
         try:
@@ -124,3 +220,26 @@ class SupabaseService:
         
         # Pro tier: unlimited
         return True, metadata
+
+
+def create_database_service():
+    """Create the database service for the configured backend"""
+    backend = settings.DATABASE_BACKEND
+    if backend == "none":
+        return None
+    if backend == "memory":
+        from app.services.fake_backends import InMemoryDatabaseService
+        logger.info("Using the in-memory database backend")
+        service = InMemoryDatabaseService.from_settings()
+    else:
+        try:
+            service = SupabaseService()
+        except ValueError as e:
+            logger.warning(f"Supabase disabled: {e}")
+            return None
+    # Sampled requests record each database call
+    return RecordedDatabase(service) if settings.RECORDER_ENABLED else service
+
+
+# Global database service instance (None when no database is configured)
+supabase_service = create_database_service()
@@ -0,0 +1,421 @@
+"""
+Upload Sessions
+Resumable chunked uploads: chunks are hashed and written in place into a
+preallocated file as they stream in, and tracked in SQLite so a client can
+resume after a dropped connection
+"""
+
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import List, Dict, Any, AsyncIterator, Optional, Set
+from app.core.config import settings
+from app.core.storage import SQLiteStore, data_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    file_name TEXT,
+    mime_type TEXT NOT NULL,
+    document_type TEXT,
+    size INTEGER NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    sha256 TEXT,
+    status TEXT NOT NULL,
+    file_path TEXT,
+    response TEXT,
+    claimed_at REAL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS upload_sessions_user ON upload_sessions (user_id, status);
+CREATE INDEX IF NOT EXISTS upload_sessions_expiry ON upload_sessions (expires_at);
+
+CREATE TABLE IF NOT EXISTS upload_chunks (
+    session_id TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    claimed_at REAL,
+    PRIMARY KEY (session_id, offset)
+) WITHOUT ROWID;
+"""
+
+# Session states: chunks are accepted while open; complete moves it to
+# processing, then completed (response kept for retried completes) or back
+# to failed (complete may be retried from the assembled file). A chunk row
+# with claimed_at set is a write in flight, not a received chunk.
+OPEN = "open"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+
+MIN_CHUNK_SIZE = 64 * 1024
+
+# Open sessions a user may hold at once (each reserves disk space)
+MAX_OPEN_SESSIONS_PER_USER = 5
+
+
+class UploadSessionError(Exception):
+    """A session request that can't be served; ``status_code`` is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadSession:
+    """One upload session read from the store"""
+
+    __slots__ = (
+        "session_id", "user_id", "file_name", "mime_type", "document_type", "size", "chunk_size",
+        "sha256", "status", "file_path", "response", "claimed_at", "created_at", "expires_at",
+    )
+
+    def __init__(self, row):
+        for name in self.__slots__:
+            setattr(self, name, row[name])
+
+    @property
+    def chunk_count(self) -> int:
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_length(self, offset: int) -> int:
+        """Expected length of the chunk starting at ``offset``"""
+        return min(self.chunk_size, self.size - offset)
+
+
+class UploadSessionStore:
+    """
+    Upload sessions staged under DATA_DIR
+
+    Each session owns a sparse file of the declared size. Chunks are fixed
+    size (the last one may be shorter) and addressed by byte offset; a chunk
+    is streamed straight into its region while its SHA-256 is computed and
+    only recorded once the hash matches, so memory use is one network read.
+    Re-sending a recorded chunk with the same hash succeeds without reading
+    the body, which makes client retries cheap and idempotent. The staging
+    directory is outside UPLOAD_DIR, so partial files are never served.
+    """
+
+    def __init__(
+        self,
+        store: SQLiteStore,
+        directory: str,
+        max_file_size: int,
+        chunk_size: int,
+        max_chunk_size: int,
+        ttl_seconds: int = 86400
+    ):
+        self.store = store
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_file_size = max_file_size
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max(max_chunk_size, MIN_CHUNK_SIZE)
+        self.ttl_seconds = ttl_seconds
+        self._last_prune = 0.0
+
+    @classmethod
+    def from_settings(cls) -> Optional["UploadSessionStore"]:
+        """Open the session store, or None when resumable uploads are disabled"""
+        if not settings.UPLOAD_SESSIONS_ENABLED:
+            return None
+        try:
+            store = SQLiteStore(data_path("upload_sessions.db"), SCHEMA)
+        except Exception as e:
+            logger.warning(f"Resumable uploads disabled: cannot open store: {e}")
+            return None
+        return cls(
+            store,
+            data_path("upload_sessions"),
+            max_file_size=settings.UPLOAD_SESSION_MAX_FILE_SIZE,
+            chunk_size=settings.UPLOAD_SESSION_CHUNK_SIZE,
+            max_chunk_size=settings.UPLOAD_SESSION_MAX_CHUNK_SIZE,
+            ttl_seconds=settings.UPLOAD_SESSION_TTL_SECONDS,
+        )
+
+    def part_path(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}.part"
+
+    def create(
+        self,
+        user_id: str,
+        file_name: Optional[str],
+        mime_type: str,
+        size: int,
+        chunk_size: Optional[int] = None,
+        sha256: Optional[str] = None,
+        document_type: Optional[str] = None
+    ) -> UploadSession:
+        """Open a session and reserve its file"""
+        self.prune()
+        if size <= 0 or size > self.max_file_size:
+            raise UploadSessionError(
+                f"File size must be between 1 byte and {self.max_file_size / (1024*1024)}MB", 413
+            )
+        chunk_size = min(max(chunk_size or self.chunk_size, MIN_CHUNK_SIZE), self.max_chunk_size)
+        open_sessions = self.store.query(
+            "SELECT COUNT(*) AS n FROM upload_sessions WHERE user_id = ? AND status = ? AND expires_at > ?",
+            (user_id, OPEN, time.time())
+        )[0]["n"]
+        if open_sessions >= MAX_OPEN_SESSIONS_PER_USER:
+            raise UploadSessionError(f"Too many open upload sessions (max {MAX_OPEN_SESSIONS_PER_USER})", 429)
+
+        session_id = str(uuid.uuid4())
+        with open(self.part_path(session_id), "wb") as f:
+            f.truncate(size)
+        now = time.time()
+        self.store.execute(
+            "INSERT INTO upload_sessions (session_id, user_id, file_name, mime_type, document_type, size, "
+            "chunk_size, sha256, status, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                session_id, user_id, file_name, mime_type, document_type, size, chunk_size,
+                sha256.lower() if sha256 else None, OPEN, now, now + self.ttl_seconds,
+            )
+        )
+        return self.get(session_id)
+
+    def get(self, session_id: str) -> UploadSession:
+        """Load a live session; raises UploadSessionError (404) if unknown or expired"""
+        rows = self.store.query(
+            "SELECT * FROM upload_sessions WHERE session_id = ? AND expires_at > ?", (session_id, time.time())
+        )
+        if not rows:
+            raise UploadSessionError("Upload session not found or expired", 404)
+        return UploadSession(rows[0])
+
+    def received(self, session_id: str) -> Dict[int, str]:
+        """Recorded chunks: offset -> SHA-256"""
+        rows = self.store.query(
+            "SELECT offset, sha256 FROM upload_chunks WHERE session_id = ? AND claimed_at IS NULL", (session_id,)
+        )
+        return {row["offset"]: row["sha256"] for row in rows}
+
+    def missing_offsets(self, session: UploadSession) -> List[int]:
+        """Offsets of chunks not received yet, in order"""
+        received = self.received(session.session_id)
+        return [offset for offset in range(0, session.size, session.chunk_size) if offset not in received]
+
+    async def write_chunk(
+        self,
+        session: UploadSession,
+        offset: int,
+        sha256: str,
+        body: AsyncIterator[bytes]
+    ) -> bool:
+        """
+        Stream one chunk into place and record it once its hash matches
+
+        Returns False when the chunk was already recorded with this hash (the
+        body is not read). Raises UploadSessionError for a closed session, a
+        misaligned offset, a wrong length or hash, a different chunk already
+        recorded at this offset, or another request still writing it.
+        """
+        if session.status != OPEN:
+            raise UploadSessionError(f"Upload session is {session.status}", 409)
+        if offset < 0 or offset >= session.size or offset % session.chunk_size:
+            raise UploadSessionError(f"Offset must be a multiple of {session.chunk_size} below {session.size}")
+        sha256 = sha256.lower()
+        if not self._claim_chunk(session.session_id, offset, sha256):
+            return False
+
+        try:
+            expected = session.chunk_length(offset)
+            digest = hashlib.sha256()
+            written = 0
+            fd = os.open(self.part_path(session.session_id), os.O_WRONLY)
+            try:
+                async for piece in body:
+                    if written + len(piece) > expected:
+                        raise UploadSessionError(f"Chunk at offset {offset} must be {expected} bytes", 413)
+                    os.pwrite(fd, piece, offset + written)
+                    digest.update(piece)
+                    written += len(piece)
+            finally:
+                os.close(fd)
+            if written != expected:
+                raise UploadSessionError(f"Chunk at offset {offset} must be {expected} bytes, got {written}")
+            if digest.hexdigest() != sha256:
+                raise UploadSessionError("Chunk SHA-256 does not match its content", 422)
+        except BaseException:
+            self.store.execute(
+                "DELETE FROM upload_chunks WHERE session_id = ? AND offset = ? AND claimed_at IS NOT NULL",
+                (session.session_id, offset)
+            )
+            raise
+
+        self.store.execute(
+            "UPDATE upload_chunks SET claimed_at = NULL WHERE session_id = ? AND offset = ?",
+            (session.session_id, offset)
+        )
+        return True
+
+    def _claim_chunk(self, session_id: str, offset: int, sha256: str) -> bool:
+        """
+        Reserve an offset for one writer before any byte is written
+
+        Without it two requests sending different chunks to the same offset
+        would both write into its region, and the loser could overwrite bytes
+        whose hash is already recorded. Returns False when this chunk is
+        already recorded.
+        """
+        with self.store.write_transaction() as conn:
+            row = conn.execute(
+                "SELECT sha256, claimed_at FROM upload_chunks WHERE session_id = ? AND offset = ?",
+                (session_id, offset)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO upload_chunks (session_id, offset, sha256, claimed_at) VALUES (?, ?, ?, ?)",
+                    (session_id, offset, sha256, time.time())
+                )
+                return True
+        if row["claimed_at"] is not None:
+            raise UploadSessionError("This chunk is being received by another request", 409)
+        if row["sha256"] != sha256:
+            raise UploadSessionError("A different chunk was already received at this offset", 409)
+        return False
+
+    def claim(self, session: UploadSession) -> bool:
+        """Move a fully received session to processing; False if another request holds it"""
+        claimed = self.store.execute(
+            "UPDATE upload_sessions SET status = ?, claimed_at = ? WHERE session_id = ? AND status IN (?, ?)",
+            (PROCESSING, time.time(), session.session_id, OPEN, FAILED)
+        )
+        if claimed:
+            session.status = PROCESSING
+        return bool(claimed)
+
+    def assemble(self, session: UploadSession) -> bytes:
+        """
+        Read the assembled upload, checked against the session's SHA-256 if one was declared
+
+        On a mismatch every chunk is forgotten and the session reopened, so
+        the client can upload the file again without a new session.
+        """
+        content = Path(session.file_path or self.part_path(session.session_id)).read_bytes()
+        if session.sha256 and not session.file_path and hashlib.sha256(content).hexdigest() != session.sha256:
+            self.store.transaction([
+                ("DELETE FROM upload_chunks WHERE session_id = ?", (session.session_id,)),
+                ("UPDATE upload_sessions SET status = ? WHERE session_id = ?", (OPEN, session.session_id)),
+            ])
+            session.status = OPEN
+            raise UploadSessionError("File SHA-256 does not match the assembled chunks; upload them again", 422)
+        return content
+
+    def promote(self, session: UploadSession, destination: Path) -> str:
+        """Move the assembled file to its final location (once) and return its path"""
+        if session.file_path:
+            return session.file_path
+        shutil.move(str(self.part_path(session.session_id)), str(destination))
+        session.file_path = str(destination)
+        self.store.execute(
+            "UPDATE upload_sessions SET file_path = ? WHERE session_id = ?", (session.file_path, session.session_id)
+        )
+        return session.file_path
+
+    def release(self, session: UploadSession, status: str) -> None:
+        """Hand a claimed session back (open or failed) so complete can be retried"""
+        self.store.execute(
+            "UPDATE upload_sessions SET status = ? WHERE session_id = ?", (status, session.session_id)
+        )
+        session.status = status
+
+    def complete(self, session: UploadSession, response: str) -> None:
+        """Keep the processing result for retried completes and drop the chunk records"""
+        self.settle(session.session_id, response)
+        session.status = COMPLETED
+        session.response = response
+
+    def settle(self, session_id: str, response: Optional[str]) -> None:
+        """
+        Finish a processed session by id: completed with its response, or
+        failed (complete may be retried) when there is none
+
+        Used for jobs replayed after a restart, whose request is long gone.
+        """
+        if response is None:
+            self.store.execute(
+                "UPDATE upload_sessions SET status = ? WHERE session_id = ? AND status = ?",
+                (FAILED, session_id, PROCESSING)
+            )
+            return
+        self.store.transaction([
+            (
+                "UPDATE upload_sessions SET status = ?, response = ? WHERE session_id = ?",
+                (COMPLETED, response, session_id),
+            ),
+            ("DELETE FROM upload_chunks WHERE session_id = ?", (session_id,)),
+        ])
+
+    def recover(self, launched_at: float, journaled: Set[str]) -> int:
+        """
+        Release what a lost process held: sessions it claimed that no journaled
+        job will settle, and chunk writes it had in flight; returns how many
+        sessions were released
+        """
+        released = 0
+        rows = self.store.query(
+            "SELECT session_id, file_path FROM upload_sessions WHERE status = ? AND claimed_at < ?",
+            (PROCESSING, launched_at)
+        )
+        for row in rows:
+            if row["session_id"] in journaled:
+                continue
+            # Once promoted, complete is retried from the assembled file
+            released += self.store.execute(
+                "UPDATE upload_sessions SET status = ? WHERE session_id = ? AND status = ?",
+                (FAILED if row["file_path"] else OPEN, row["session_id"], PROCESSING)
+            )
+        self.store.execute("DELETE FROM upload_chunks WHERE claimed_at < ?", (launched_at,))
+        if released:
+            logger.warning(f"Released {released} upload session(s) left in processing")
+        return released
+
+    def prune(self) -> None:
+        """Delete expired sessions and their staged files, at most every few minutes"""
+        now = time.time()
+        if now - self._last_prune < 300:
+            return
+        self._last_prune = now
+        try:
+            expired = self.store.query(
+                "SELECT session_id FROM upload_sessions WHERE expires_at <= ?", (now,)
+            )
+            for row in expired:
+                self.part_path(row["session_id"]).unlink(missing_ok=True)
+            self.store.transaction([
+                (
+                    "DELETE FROM upload_chunks WHERE session_id IN "
+                    "(SELECT session_id FROM upload_sessions WHERE expires_at <= ?)",
+                    (now,),
+                ),
+                ("DELETE FROM upload_sessions WHERE expires_at <= ?", (now,)),
+            ])
+        except Exception as e:
+            logger.warning(f"Error pruning upload sessions: {e}")
+
+    def describe(self, session: UploadSession) -> Dict[str, Any]:
+        """Session state for clients resuming an upload"""
+        missing = self.missing_offsets(session) if session.status == OPEN else []
+        return {
+            "session_id": session.session_id,
+            "status": session.status,
+            "size": session.size,
+            "chunk_size": session.chunk_size,
+            "chunk_count": session.chunk_count,
+            "received_bytes": session.size - sum(session.chunk_length(offset) for offset in missing),
+            "missing_offsets": missing,
+            "expires_at": session.expires_at,
+        }
+
+
+# Global upload session store instance (None when resumable uploads are disabled)
+upload_sessions = UploadSessionStore.from_settings()
@@ -0,0 +1,309 @@
+"""
+Usage Meter
+Token, image payload and cost accounting per user, subscription tier,
+document type, model and day, accumulated in memory and flushed to SQLite
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+from app.core.config import settings
+from app.core.storage import SQLiteStore, data_path
+from app.services.model_router import estimate_cost
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    tier TEXT NOT NULL,
+    document_type TEXT NOT NULL,
+    model TEXT NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    cached INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    image_bytes INTEGER NOT NULL DEFAULT 0,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    latency_ms REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, tier, document_type, model)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS usage_daily_user ON usage_daily (user_id, day);
+"""
+
+_UPSERT_USAGE = """
+INSERT INTO usage_daily (day, user_id, tier, document_type, model, calls, cached, errors,
+                         prompt_tokens, output_tokens, image_bytes, cost_usd, latency_ms)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, user_id, tier, document_type, model) DO UPDATE SET
+    calls = calls + excluded.calls,
+    cached = cached + excluded.cached,
+    errors = errors + excluded.errors,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    output_tokens = output_tokens + excluded.output_tokens,
+    image_bytes = image_bytes + excluded.image_bytes,
+    cost_usd = cost_usd + excluded.cost_usd,
+    latency_ms = latency_ms + excluded.latency_ms
+"""
+
+# Counter order of an accumulator entry and of the usage_daily value columns
+COUNTERS = (
+    "calls", "cached", "errors", "prompt_tokens", "output_tokens", "image_bytes", "cost_usd", "latency_ms"
+)
+
+_SUM_COLUMNS = ", ".join(f"SUM({c}) AS {c}" for c in COUNTERS)
+
+# Placeholder for unknown users and document types (part of the primary key)
+UNKNOWN = "unknown"
+
+UsageKey = Tuple[str, str, str, str, str]
+
+
+def _totals(row) -> Dict[str, Any]:
+    """Counters of a summed row, with derived averages"""
+    totals = {c: (row[c] or 0) for c in COUNTERS if c != "latency_ms"}
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+    totals["total_tokens"] = totals["prompt_tokens"] + totals["output_tokens"]
+    totals["avg_latency_ms"] = round((row["latency_ms"] or 0) / totals["calls"], 1) if totals["calls"] else None
+    return totals
+
+
+class UsageMeter:
+    """
+    Per-call usage accumulator with periodic flushes
+
+    ``record`` only adds to an in-memory entry keyed by (day, user, tier,
+    document type, model), so metering costs a dict update per model call.
+    A background task flushes the entries every ``flush_interval`` seconds as
+    additive upserts, which also makes flushes from several workers sum
+    correctly. Token budgets read the stored day total for a user (cached
+    for one flush interval) plus what this worker hasn't flushed yet.
+    """
+
+    def __init__(
+        self,
+        store: SQLiteStore,
+        flush_interval: float = 30.0,
+        retention_days: int = 400,
+        daily_token_budgets: Optional[Dict[str, int]] = None
+    ):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.daily_token_budgets = dict(daily_token_budgets or {})
+        self._pending: Dict[UsageKey, List[float]] = {}
+        self._pending_tokens: Dict[Tuple[str, str], int] = {}
+        self._stored_tokens: Dict[Tuple[str, str], Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_prune: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self.totals: Dict[str, List[float]] = {}
+        self.flushes = 0
+        self.flush_errors = 0
+        self.last_flush: Optional[float] = None
+
+    @classmethod
+    def from_settings(cls) -> Optional["UsageMeter"]:
+        """Open the usage store, or None when metering is disabled"""
+        if not settings.USAGE_METERING_ENABLED:
+            return None
+        try:
+            store = SQLiteStore(data_path("usage.db"), SCHEMA)
+        except Exception as e:
+            logger.warning(f"Usage metering disabled: cannot open store: {e}")
+            return None
+        return cls(
+            store,
+            flush_interval=settings.USAGE_FLUSH_INTERVAL_SECONDS,
+            retention_days=settings.USAGE_RETENTION_DAYS,
+            daily_token_budgets=settings.TOKEN_DAILY_BUDGETS,
+        )
+
+    def record(
+        self,
+        user_id: Optional[str],
+        tier: Optional[str],
+        document_type: Optional[str],
+        model: Optional[str],
+        prompt_tokens: int = 0,
+        output_tokens: int = 0,
+        image_bytes: int = 0,
+        latency: float = 0.0,
+        cached: bool = False,
+        error: bool = False
+    ) -> None:
+        """Add one model call (or one cache hit) to the accumulator"""
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        user_id = user_id or UNKNOWN
+        tier = tier or settings.ADMISSION_DEFAULT_TIER
+        key = (day, user_id, tier, (document_type or UNKNOWN).lower(), model or UNKNOWN)
+        values = (
+            0 if cached else 1,
+            1 if cached else 0,
+            1 if error else 0,
+            prompt_tokens,
+            output_tokens,
+            image_bytes,
+            estimate_cost(model, prompt_tokens, output_tokens) if model else 0.0,
+            latency * 1000,
+        )
+        tokens = prompt_tokens + output_tokens
+        with self._lock:
+            for counters in (self._pending.setdefault(key, [0] * len(COUNTERS)),
+                             self.totals.setdefault(tier, [0] * len(COUNTERS))):
+                for index, value in enumerate(values):
+                    counters[index] += value
+            if tokens:
+                self._pending_tokens[(day, user_id)] = self._pending_tokens.get((day, user_id), 0) + tokens
+
+    def flush(self) -> int:
+        """Write the accumulated entries to the store; returns how many"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                pending_tokens, self._pending_tokens = self._pending_tokens, {}
+            if not pending:
+                return 0
+            try:
+                self.store.transaction([(_UPSERT_USAGE, (*key, *values)) for key, values in pending.items()])
+            except Exception as e:
+                # Keep the entries for the next flush rather than losing spend
+                logger.error(f"Error flushing usage: {e}")
+                self.flush_errors += 1
+                with self._lock:
+                    for key, values in pending.items():
+                        counters = self._pending.setdefault(key, [0] * len(COUNTERS))
+                        for index, value in enumerate(values):
+                            counters[index] += value
+                    for key, tokens in pending_tokens.items():
+                        self._pending_tokens[key] = self._pending_tokens.get(key, 0) + tokens
+                return 0
+            with self._lock:
+                # Flushed tokens are now in the store: reload those totals on next use
+                for key in pending_tokens:
+                    self._stored_tokens.pop(key, None)
+            self.flushes += 1
+            self.last_flush = time.time()
+        self._maybe_prune()
+        return len(pending)
+
+    def _maybe_prune(self) -> None:
+        """Drop days past the retention period, at most daily"""
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        if self._last_prune == today:
+            return
+        self._last_prune = today
+        cutoff = (datetime.utcnow() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+        try:
+            self.store.execute("DELETE FROM usage_daily WHERE day < ?", (cutoff,))
+        except Exception as e:
+            logger.warning(f"Error pruning usage: {e}")
+
+    def start(self) -> None:
+        """Start the periodic flush task (call from the running event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop flushing periodically and flush what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def tokens_today(self, user_id: str) -> int:
+        """Tokens a user consumed today (UTC): stored total plus this worker's unflushed calls"""
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        key = (day, user_id)
+        now = time.monotonic()
+        with self._lock:
+            stored = self._stored_tokens.get(key)
+            pending = self._pending_tokens.get(key, 0)
+        if stored is None or now - stored[1] > self.flush_interval:
+            row = self.store.query(
+                "SELECT SUM(prompt_tokens + output_tokens) AS tokens FROM usage_daily "
+                "WHERE user_id = ? AND day = ?",
+                (user_id, day)
+            )[0]
+            stored = (row["tokens"] or 0, now)
+            with self._lock:
+                self._stored_tokens[key] = stored
+        return stored[0] + pending
+
+    def budget_for(self, tier: str) -> Optional[int]:
+        """Daily token budget of a subscription tier, or None when unlimited"""
+        budget = self.daily_token_budgets.get(tier)
+        return budget if budget and budget > 0 else None
+
+    def over_budget(self, user_id: str, tier: str) -> bool:
+        """Whether a user has used up their tier's daily token budget"""
+        budget = self.budget_for(tier)
+        if budget is None:
+            return False
+        try:
+            return self.tokens_today(user_id) >= budget
+        except Exception as e:
+            # Metering must never fail a document request
+            logger.error(f"Error reading token usage: {e}")
+            return False
+
+    def summary(self, days: int = 7, user_id: Optional[str] = None, top: int = 20) -> Dict[str, Any]:
+        """Usage for the last ``days`` days: totals, daily series, breakdowns and top users"""
+        self.flush()
+        now = datetime.utcnow()
+        day_start = (now - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        where = "WHERE day >= ?" + (" AND user_id = ?" if user_id else "")
+        params = (day_start, user_id) if user_id else (day_start,)
+
+        def grouped(column: str, order: str = "", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+            sql = f"SELECT {column} AS name, {_SUM_COLUMNS} FROM usage_daily {where} GROUP BY {column} {order}"
+            if limit:
+                sql += f" LIMIT {int(limit)}"
+            return [{column: row["name"], **_totals(row)} for row in self.store.query(sql, params)]
+
+        total = self.store.query(f"SELECT {_SUM_COLUMNS} FROM usage_daily {where}", params)[0]
+        return {
+            "days": days,
+            "user_id": user_id,
+            "totals": _totals(total),
+            "daily": grouped("day", "ORDER BY day"),
+            "by_tier": grouped("tier", "ORDER BY SUM(cost_usd) DESC"),
+            "by_document_type": grouped("document_type", "ORDER BY SUM(cost_usd) DESC"),
+            "by_model": grouped("model", "ORDER BY SUM(cost_usd) DESC"),
+            "top_users": grouped("user_id", "ORDER BY SUM(prompt_tokens + output_tokens) DESC", top),
+            "budgets": {tier: budget for tier, budget in self.daily_token_budgets.items() if budget > 0},
+            "generated_at": now,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Usage recorded by this worker since startup and flush state, for metrics"""
+        with self._lock:
+            tiers = {tier: dict(zip(COUNTERS, counters)) for tier, counters in self.totals.items()}
+            pending = len(self._pending)
+        for counters in tiers.values():
+            counters["cost_usd"] = round(counters["cost_usd"], 6)
+            counters["latency_ms"] = round(counters["latency_ms"], 1)
+        return {
+            "tiers": tiers,
+            "pending_entries": pending,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "last_flush": self.last_flush,
+        }
+
+
+# Global usage meter instance (None when metering is disabled)
+usage_meter = UsageMeter.from_settings()
@@ -0,0 +1,534 @@
+"""
+Webhooks
+Per-user callback registrations and a durable outbox of signed deliveries,
+sent by a background dispatcher when a scan is completed or failed
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import random
+import secrets
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Set, Tuple
+from urllib.parse import urlsplit
+import httpx
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.http import http_transport
+from app.core.storage import SQLiteStore, data_path
+from app.models.schemas import ProcessingStatus, WebhookEvent
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhooks (
+    user_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    secret TEXT NOT NULL,
+    events TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    delivery_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_deliveries_user ON deliveries (user_id, status);
+"""
+
+# Delivery states (delivered callbacks are deleted)
+PENDING = "pending"
+DEAD = "dead"
+
+SIGNATURE_HEADER = "X-WorkLess-Signature"
+# Client errors worth retrying; any other 3xx/4xx answer is final
+RETRYABLE_STATUSES = frozenset({408, 409, 425, 429})
+# A claimed delivery is offered again if its worker hasn't recorded an outcome by then
+CLAIM_GRACE_SECONDS = 30
+PRUNE_INTERVAL_SECONDS = 3600
+MAX_ERROR_LENGTH = 300
+
+
+class WebhookError(Exception):
+    """A registration that can't be accepted; ``status_code`` is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class Webhook:
+    """One user's callback registration"""
+
+    __slots__ = ("user_id", "url", "secret", "events", "created_at", "updated_at")
+
+    def __init__(self, row):
+        self.user_id = row["user_id"]
+        self.url = row["url"]
+        self.secret = row["secret"]
+        self.events = row["events"].split(",")
+        self.created_at = row["created_at"]
+        self.updated_at = row["updated_at"]
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    """Signature header value: HMAC-SHA256 of "<timestamp>.<body>" with the user's secret"""
+    digest = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("ascii") + body, hashlib.sha256)
+    return f"t={timestamp},v1={digest.hexdigest()}"
+
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    return ip.is_global and not ip.is_multicast
+
+
+def validate_url(url: str, allow_insecure: bool = False) -> str:
+    """
+    Check a callback URL: https, with a host that isn't a loopback, private
+    or link-local address (both allowed with ``allow_insecure``)
+    """
+    try:
+        parts = urlsplit(url.strip())
+        host = parts.hostname
+        parts.port
+    except ValueError:
+        raise WebhookError("Invalid webhook URL")
+    if parts.scheme not in (("https", "http") if allow_insecure else ("https",)):
+        raise WebhookError("Webhook URL must use https")
+    if not host:
+        raise WebhookError("Webhook URL has no host")
+    if parts.username or parts.password:
+        raise WebhookError("Webhook URL must not carry credentials")
+    if not allow_insecure:
+        if host == "localhost" or host.endswith(".localhost"):
+            raise WebhookError("Webhook URL must be publicly reachable")
+        try:
+            public = _is_public_address(host)
+        except ValueError:
+            public = True  # A host name: resolved and checked again before each delivery
+        if not public:
+            raise WebhookError("Webhook URL must be publicly reachable")
+    return parts.geturl()
+
+
+class WebhookDispatcher:
+    """
+    Registrations plus an outbox of callbacks, delivered in the background
+
+    Queuing a callback is one local insert, made when a scan finishes; the
+    dispatcher task claims due deliveries, POSTs them through the shared
+    async connection pool and records the outcome. Failed attempts are
+    retried with exponential backoff and jitter until ``max_attempts``, then
+    kept as dead for ``dead_retention`` seconds. The outbox lives in DATA_DIR,
+    so queued callbacks survive restarts, and claims are atomic across the
+    workers sharing it. Delivery is at least once: receivers should ignore
+    a repeated X-WorkLess-Delivery ID.
+    """
+
+    def __init__(
+        self,
+        store: SQLiteStore,
+        timeout: float = 10.0,
+        max_attempts: int = 8,
+        retry_base: float = 10.0,
+        retry_max: float = 3600.0,
+        concurrency: int = 8,
+        poll_interval: float = 5.0,
+        dead_retention: float = 7 * 86400,
+        allow_insecure: bool = False,
+        public_base_url: str = ""
+    ):
+        self.store = store
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.dead_retention = dead_retention
+        self.allow_insecure = allow_insecure
+        self.public_base_url = public_base_url.rstrip("/")
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._claimed: Dict[asyncio.Task, str] = {}
+        self._pruned_at = 0.0
+        self.enqueued = 0
+        self.enqueue_errors = 0
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dead = 0
+        self.delivery_ms = 0.0
+
+    @classmethod
+    def from_settings(cls) -> Optional["WebhookDispatcher"]:
+        """Open the webhook store, or None when disabled"""
+        if not settings.WEBHOOKS_ENABLED:
+            return None
+        try:
+            store = SQLiteStore(data_path("webhooks.db"), SCHEMA)
+        except Exception as e:
+            logger.warning(f"Webhooks disabled: cannot open store: {e}")
+            return None
+        return cls(
+            store,
+            timeout=settings.WEBHOOK_TIMEOUT_SECONDS,
+            max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+            retry_base=settings.WEBHOOK_RETRY_BASE_SECONDS,
+            retry_max=settings.WEBHOOK_RETRY_MAX_SECONDS,
+            concurrency=settings.WEBHOOK_MAX_CONCURRENCY,
+            poll_interval=settings.WEBHOOK_POLL_INTERVAL_SECONDS,
+            dead_retention=settings.WEBHOOK_DEAD_RETENTION_DAYS * 86400,
+            allow_insecure=settings.WEBHOOK_ALLOW_INSECURE_URLS,
+            public_base_url=settings.WEBHOOK_PUBLIC_BASE_URL
+        )
+
+    # Registrations
+
+    def register(self, user_id: str, url: str, events: List[str], rotate_secret: bool = False) -> Tuple[Webhook, bool]:
+        """Create or update a user's webhook; returns it and whether a new secret was issued"""
+        url = validate_url(url, self.allow_insecure)
+        now = time.time()
+        with self.store.write_transaction() as conn:
+            existing = conn.execute("SELECT secret FROM webhooks WHERE user_id = ?", (user_id,)).fetchone()
+            issued = existing is None or rotate_secret
+            secret = secrets.token_urlsafe(32) if issued else existing["secret"]
+            conn.execute(
+                "INSERT INTO webhooks (user_id, url, secret, events, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(user_id) DO UPDATE SET "
+                "url = excluded.url, secret = excluded.secret, events = excluded.events, "
+                "updated_at = excluded.updated_at",
+                (user_id, url, secret, ",".join(events), now, now)
+            )
+        return self.get(user_id), issued
+
+    def get(self, user_id: str) -> Optional[Webhook]:
+        """A user's webhook, if registered"""
+        rows = self.store.query("SELECT * FROM webhooks WHERE user_id = ?", (user_id,))
+        return Webhook(rows[0]) if rows else None
+
+    def delete(self, user_id: str) -> bool:
+        """Remove a user's webhook and drop its queued callbacks"""
+        with self.store.write_transaction() as conn:
+            conn.execute("DELETE FROM deliveries WHERE user_id = ?", (user_id,))
+            return conn.execute("DELETE FROM webhooks WHERE user_id = ?", (user_id,)).rowcount > 0
+
+    def delivery_state(self, user_id: str) -> Dict[str, Any]:
+        """Queued and dead callbacks of a user, and the latest failure"""
+        row = self.store.query(
+            "SELECT SUM(status = ?) AS pending, SUM(status = ?) AS dead FROM deliveries WHERE user_id = ?",
+            (PENDING, DEAD, user_id)
+        )[0]
+        error = self.store.query(
+            "SELECT last_error FROM deliveries WHERE user_id = ? AND last_error IS NOT NULL "
+            "ORDER BY created_at DESC LIMIT 1",
+            (user_id,)
+        )
+        return {
+            "pending_deliveries": row["pending"] or 0,
+            "dead_deliveries": row["dead"] or 0,
+            "last_error": error[0]["last_error"] if error else None,
+        }
+
+    # Queuing
+
+    def enqueue(
+        self,
+        user_id: str,
+        status: ProcessingStatus,
+        scan_id: Optional[str] = None,
+        data: Optional[BaseModel] = None
+    ) -> Optional[str]:
+        """
+        Queue a scan's callback if the user registered for its status; returns the delivery ID
+
+        Called on the processing path, so it never raises: a failure is
+        logged and counted, and the scan is unaffected.
+        """
+        try:
+            rows = self.store.query("SELECT events FROM webhooks WHERE user_id = ?", (user_id,))
+            if not rows or status.value not in rows[0]["events"].split(","):
+                return None
+            delivery_id = str(uuid.uuid4())
+            payload = WebhookEvent.model_construct(
+                id=delivery_id,
+                event=f"scan.{status.value}",
+                created_at=datetime.utcnow(),
+                scan_id=scan_id,
+                status=status,
+                data=data
+            ).model_dump_json().encode("utf-8")
+            now = time.time()
+            self.store.execute(
+                "INSERT INTO deliveries (delivery_id, user_id, event, payload, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (delivery_id, user_id, f"scan.{status.value}", payload, now, now)
+            )
+        except Exception as e:
+            self.enqueue_errors += 1
+            logger.error(f"Could not queue webhook for user {user_id}: {e}")
+            return None
+        self.enqueued += 1
+        self._wake()
+        return delivery_id
+
+    def file_url(self, path: str) -> str:
+        """Public URL of an uploaded file, for callback payloads"""
+        return self.public_base_url + path
+
+    def _wake(self) -> None:
+        loop, wakeup = self._loop, self._wakeup
+        if loop is None or wakeup is None:
+            return
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            pass  # Loop closed: the delivery is picked up on the next start
+
+    # Dispatching
+
+    def start(self) -> None:
+        """Start delivering queued callbacks (app startup)"""
+        if self._task:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._client = http_transport.async_client(
+            headers={"User-Agent": f"WorkLess-Webhooks/{settings.VERSION}", "Content-Type": "application/json"},
+            timeout=httpx.Timeout(self.timeout)
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Let in-flight deliveries finish (up to their timeout) and stop (app shutdown)"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._in_flight:
+            _, unfinished = await asyncio.wait(self._in_flight, timeout=self.timeout)
+            for task in unfinished:
+                task.cancel()
+            if unfinished:
+                await asyncio.gather(*unfinished, return_exceptions=True)
+                # Offer them again right away instead of after the claim expires
+                claimed = [self._claimed.pop(task) for task in unfinished if task in self._claimed]
+                await asyncio.to_thread(self._release, claimed)
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        self._loop = self._wakeup = None
+
+    async def _run(self) -> None:
+        while True:
+            wait = self.poll_interval
+            try:
+                free = self.concurrency - len(self._in_flight)
+                rows, next_due = await asyncio.to_thread(self._claim, free)
+                for row in rows:
+                    task = asyncio.create_task(self._deliver(row))
+                    self._in_flight.add(task)
+                    self._claimed[task] = row["delivery_id"]
+                    task.add_done_callback(self._delivery_done)
+                if next_due is not None and free > len(rows):
+                    wait = min(wait, max(0.0, next_due - time.time()))
+                if time.time() - self._pruned_at > PRUNE_INTERVAL_SECONDS:
+                    self._pruned_at = time.time()
+                    await asyncio.to_thread(self._prune)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Webhook dispatcher error: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _delivery_done(self, task: asyncio.Task) -> None:
+        self._in_flight.discard(task)
+        self._claimed.pop(task, None)
+        if self._wakeup:
+            # A slot is free: claim more if any are due
+            self._wakeup.set()
+
+    def _claim(self, limit: int) -> Tuple[List[Dict[str, Any]], Optional[float]]:
+        """Due deliveries (up to ``limit``), claimed for this worker, and when the next one is due"""
+        now = time.time()
+        with self.store.write_transaction() as conn:
+            rows = []
+            if limit > 0:
+                rows = [dict(row) for row in conn.execute(
+                    "SELECT d.delivery_id, d.user_id, d.event, d.payload, d.attempts, w.url, w.secret "
+                    "FROM deliveries d JOIN webhooks w ON w.user_id = d.user_id "
+                    "WHERE d.status = ? AND d.next_attempt_at <= ? ORDER BY d.next_attempt_at LIMIT ?",
+                    (PENDING, now, limit)
+                )]
+                lease = now + self.timeout + CLAIM_GRACE_SECONDS
+                conn.executemany(
+                    "UPDATE deliveries SET next_attempt_at = ? WHERE delivery_id = ?",
+                    [(lease, row["delivery_id"]) for row in rows]
+                )
+            next_due = conn.execute(
+                "SELECT MIN(next_attempt_at) AS due FROM deliveries WHERE status = ?", (PENDING,)
+            ).fetchone()["due"]
+        return rows, next_due
+
+    async def _deliver(self, row: Dict[str, Any]) -> None:
+        body = row["payload"]
+        headers = {
+            "X-WorkLess-Event": row["event"],
+            "X-WorkLess-Delivery": row["delivery_id"],
+            SIGNATURE_HEADER: sign(row["secret"], int(time.time()), body),
+        }
+        started = time.perf_counter()
+        retry_after = None
+        try:
+            url, extensions = row["url"], None
+            if not self.allow_insecure:
+                address = await self._resolve_public(url)
+                url, extensions = _pin_address(url, address, headers)
+            response = await self._client.post(url, content=body, headers=headers, extensions=extensions)
+        except WebhookError as e:
+            error, retryable = str(e), False
+        except (httpx.HTTPError, OSError) as e:
+            error, retryable = f"{type(e).__name__}: {e}", True
+        else:
+            if response.is_success:
+                error, retryable = None, False
+            else:
+                error = f"HTTP {response.status_code}"
+                retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUSES
+                retry_after = _retry_after(response)
+        self.delivery_ms += (time.perf_counter() - started) * 1000
+        try:
+            await asyncio.to_thread(self._record, row, error, retryable, retry_after)
+        except Exception as e:
+            # The claim expires and the delivery is attempted again
+            logger.error(f"Could not record outcome of webhook {row['delivery_id']}: {e}")
+
+    async def _resolve_public(self, url: str) -> str:
+        """
+        Resolve a callback host to the address to connect to, refusing hosts
+        that resolve to loopback, private or link-local addresses
+        """
+        parts = urlsplit(url)
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or 443, type=socket.SOCK_STREAM
+        )
+        if not infos or not all(_is_public_address(info[4][0]) for info in infos):
+            raise WebhookError(f"{parts.hostname} resolves to a non-public address")
+        return infos[0][4][0]
+
+    def _backoff(self, attempts: int) -> float:
+        """Delay before the next attempt: doubles per attempt, capped, with jitter"""
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return random.uniform(delay / 2, delay)
+
+    def _record(self, row: Dict[str, Any], error: Optional[str], retryable: bool,
+                retry_after: Optional[float]) -> None:
+        """Store a delivery attempt's outcome"""
+        delivery_id = row["delivery_id"]
+        if error is None:
+            self.store.execute("DELETE FROM deliveries WHERE delivery_id = ?", (delivery_id,))
+            self.delivered += 1
+            return
+        self.failed_attempts += 1
+        attempts = row["attempts"] + 1
+        error = error[:MAX_ERROR_LENGTH]
+        if retryable and attempts < self.max_attempts:
+            delay = max(self._backoff(attempts), min(retry_after or 0.0, self.retry_max))
+            self.store.execute(
+                "UPDATE deliveries SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE delivery_id = ?",
+                (attempts, time.time() + delay, error, delivery_id)
+            )
+            logger.info(f"Webhook {delivery_id} attempt {attempts} failed ({error}); retrying in {delay:.0f}s")
+            return
+        self.dead += 1
+        self.store.execute(
+            "UPDATE deliveries SET status = ?, attempts = ?, last_error = ? WHERE delivery_id = ?",
+            (DEAD, attempts, error, delivery_id)
+        )
+        logger.warning(f"Webhook {delivery_id} for user {row['user_id']} given up after {attempts} attempt(s): {error}")
+
+    def _release(self, delivery_ids: List[str]) -> None:
+        """Make claimed deliveries due again"""
+        self.store.transaction(
+            ("UPDATE deliveries SET next_attempt_at = ? WHERE delivery_id = ?", (time.time(), delivery_id))
+            for delivery_id in delivery_ids
+        )
+
+    def _prune(self) -> None:
+        """Delete dead deliveries past their retention"""
+        cutoff = time.time() - self.dead_retention
+        removed = self.store.execute(
+            "DELETE FROM deliveries WHERE status = ? AND created_at < ?", (DEAD, cutoff)
+        )
+        if removed:
+            logger.info(f"Pruned {removed} dead webhook deliveries")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Outbox size and delivery counters, for metrics"""
+        row = self.store.query(
+            "SELECT SUM(status = ?) AS pending, SUM(status = ?) AS dead FROM deliveries", (PENDING, DEAD)
+        )[0]
+        attempts = self.delivered + self.failed_attempts
+        return {
+            "registered": self.store.query("SELECT COUNT(*) AS n FROM webhooks")[0]["n"],
+            "pending": row["pending"] or 0,
+            "dead": row["dead"] or 0,
+            "in_flight": len(self._in_flight),
+            "enqueued": self.enqueued,
+            "enqueue_errors": self.enqueue_errors,
+            "delivered": self.delivered,
+            "failed_attempts": self.failed_attempts,
+            "given_up": self.dead,
+            "avg_delivery_ms": round(self.delivery_ms / attempts, 1) if attempts else None,
+        }
+
+
+def _pin_address(url: str, address: str, headers: Dict[str, str]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Point a request at an address that was checked, instead of the host name
+
+    Resolving the name again to connect would let a DNS-rebinding receiver
+    answer the check with a public address and the connection with a
+    private one. The Host header and TLS SNI (and so certificate
+    verification) still use the name. Adds the Host header to ``headers``;
+    returns the URL and the request extensions.
+    """
+    parts = urlsplit(url)
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    host = f"[{ip}]" if ip.version == 6 else str(ip)
+    netloc = f"{host}:{parts.port}" if parts.port else host
+    headers["Host"] = parts.netloc
+    return parts._replace(netloc=netloc).geturl(), {"sni_hostname": parts.hostname}
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds from a Retry-After header (the delay form only)"""
+    value = response.headers.get("Retry-After", "")
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+# Global webhook dispatcher instance (None when disabled)
+webhook_dispatcher = WebhookDispatcher.from_settings()
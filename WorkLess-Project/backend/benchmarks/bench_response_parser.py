@@ -0,0 +1,134 @@
+"""
+Response Parser Fuzz & Benchmark
+Runs the model-output corpus through the parser, fuzzes it, and compares
+parse time against the previous greedy-regex implementation
+
+Usage (from the backend directory):
+    python benchmarks/bench_response_parser.py [--iterations 2000] [--fuzz 5000]
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models.schemas import FieldData  # noqa: E402
+from app.services.response_parser import parse_model_response  # noqa: E402
+
+CORPUS_PATH = Path(__file__).with_name("response_parser_corpus.jsonl")
+
+
+def load_corpus():
+    """Load the recorded model outputs"""
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def legacy_parse(text: str):
+    """The original greedy-regex + json.loads + validation path, for comparison"""
+    match = re.search(r'\{[\s\S]*\}', text)
+    try:
+        parsed = json.loads(match.group(0) if match else text)
+    except json.JSONDecodeError:
+        return None
+    try:
+        return [
+            FieldData(
+                field=field.get("field", "Unknown"),
+                value=field.get("value", ""),
+                confidence=float(field.get("confidence", 0))
+            )
+            for field in parsed.get("fields", [])
+        ]
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def mutate(text: str, rng: random.Random) -> str:
+    """Apply one random, realistic corruption to a model output"""
+    choice = rng.randrange(6)
+    if choice == 0 and text:
+        return text[:rng.randrange(len(text))]
+    if choice == 1:
+        return text + "\n\n" + "Additional notes follow. " * rng.randrange(1, 50)
+    if choice == 2:
+        return "Here is the result:\n```json\n" + text + "\n```"
+    if choice == 3 and text:
+        index = rng.randrange(len(text))
+        return text[:index] + rng.choice('{}[]",\\:') + text[index:]
+    if choice == 4:
+        return text + "\n" + text
+    return rng.choice(["{", "}", "```", ""]) + text
+
+
+def run_fuzz(corpus, count: int, seed: int) -> int:
+    """Fuzz the parser; it must never raise"""
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(count):
+        text = rng.choice(corpus)["text"]
+        for _ in range(rng.randrange(1, 4)):
+            text = mutate(text, rng)
+        try:
+            result = parse_model_response(text)
+            for field in result.fields:
+                assert 0 <= field.confidence <= 100
+                assert isinstance(field.value, str)
+        except Exception as e:  # noqa: BLE001 - report every failure
+            failures += 1
+            print(f"FUZZ FAILURE: {e!r} on {text[:120]!r}")
+    return failures
+
+
+def bench(func, texts, iterations: int) -> float:
+    """Return mean microseconds per parse"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            func(text)
+    elapsed = time.perf_counter() - start
+    return elapsed / (iterations * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--fuzz", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+
+    recovered = 0
+    for entry in corpus:
+        result = parse_model_response(entry["text"])
+        legacy = legacy_parse(entry["text"])
+        recovered += bool(result.fields)
+        print(
+            f"{entry['name']:<28} fields={len(result.fields):<3} "
+            f"repaired={str(result.repaired):<5} legacy_ok={legacy is not None}"
+        )
+    print(f"\nRecovered fields from {recovered}/{len(corpus)} corpus entries")
+
+    failures = run_fuzz(corpus, args.fuzz, args.seed)
+    print(f"Fuzz: {args.fuzz} cases, {failures} failures")
+
+    # Only time inputs the legacy path can handle, so failures don't look fast
+    texts = [entry["text"] for entry in corpus if legacy_parse(entry["text"]) is not None]
+    long_tail = texts[0] + "\n\n" + ("Trailing commentary from the model. " * 5000)
+    for label, sample in (("well-formed", texts), ("long trailing prose", [long_tail])):
+        iterations = args.iterations if label == "well-formed" else max(1, args.iterations // 20)
+        new_us = bench(parse_model_response, sample, iterations)
+        old_us = bench(legacy_parse, sample, iterations)
+        print(f"{label:<20} parser={new_us:8.1f}us  legacy={old_us:8.1f}us")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Cold-Start Benchmark
+Boots the server in a fresh process (uvicorn, fake backends) and measures
+time to first response, then the first and a warm /process-document call
+
+Usage (from the backend directory):
+    python benchmarks/cold_start.py [--runs 5] [--warmup]
+    python benchmarks/cold_start.py --save-baseline cold_start.json
+    python benchmarks/cold_start.py --compare cold_start.json --tolerance 0.25
+
+A cold start on a scale-to-zero host costs "ready" plus "first request";
+--warmup boots with WARMUP_ENABLED=true to move work from one to the other.
+"""
+
+import argparse
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+CHILD_ENV = {
+    "MODEL_BACKEND": "fake",
+    "DATABASE_BACKEND": "memory",
+    "FAKE_MODEL_LATENCY_MS": "50",
+    "FAKE_DB_LATENCY_MS": "0",
+    "RATE_LIMIT_CALLS": "1000000",
+    "RESULT_CACHE_MAX_ENTRIES": "0",
+    "LOG_LEVEL": "WARNING",
+    "SECRET_KEY": "cold-start-benchmark-secret",
+}
+os.environ.update(CHILD_ENV)
+
+sys.path.insert(0, str(BACKEND_DIR))
+
+import httpx  # noqa: E402
+import PIL.Image  # noqa: E402
+import PIL.ImageDraw  # noqa: E402
+
+from app.services.auth_service import AuthService  # noqa: E402
+
+ENDPOINT = "/v1/documents/process-document"
+METRICS = ("ready_ms", "first_request_ms", "warm_request_ms")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def sample_upload() -> bytes:
+    """A small invoice-like PNG page"""
+    image = PIL.Image.new("L", (850, 1100), 255)
+    draw = PIL.ImageDraw.Draw(image)
+    for y in range(80, 1000, 32):
+        draw.rectangle([80, y, 80 + (y * 7) % 600 + 100, y + 12], fill=30)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def post_upload(client: httpx.Client, payload: bytes, user_id: str) -> float:
+    """Seconds taken by one /process-document call"""
+    token = AuthService.create_access_token({"sub": user_id})
+    start = time.perf_counter()
+    response = client.post(
+        ENDPOINT,
+        files={"file": ("page.png", payload, "image/png")},
+        data={"user_id": user_id},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    return elapsed
+
+
+def run_once(payload: bytes, warmup: bool, timeout: float, index: int) -> dict:
+    """Boot one server process and time its first responses"""
+    port = free_port()
+    env = {
+        **os.environ,
+        "WARMUP_ENABLED": "true" if warmup else "false",
+        "UPLOAD_DIR": tempfile.mkdtemp(prefix="workless-cold-"),
+        "DATA_DIR": tempfile.mkdtemp(prefix="workless-cold-data-"),
+    }
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            while True:
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError(f"Server not ready after {timeout}s")
+                if server.poll() is not None:
+                    raise RuntimeError(f"Server exited with code {server.returncode}")
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.01)
+            ready = time.perf_counter() - start
+            first = post_upload(client, payload, f"cold-{index}-a")
+            warm = post_upload(client, payload, f"cold-{index}-b")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return {
+        "ready_ms": round(ready * 1000, 1),
+        "first_request_ms": round(first * 1000, 1),
+        "warm_request_ms": round(warm * 1000, 1),
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """Return human-readable regressions against a saved baseline"""
+    return [
+        f"{key} {result[key]} > {baseline[key]}"
+        for key in METRICS
+        if key in baseline and result[key] > baseline[key] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warmup", action="store_true", help="Boot with WARMUP_ENABLED=true")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Baseline to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    payload = sample_upload()
+    runs = [run_once(payload, args.warmup, args.timeout, index) for index in range(args.runs)]
+    # Medians: single cold starts are noisy
+    result = {key: round(statistics.median(run[key] for run in runs), 1) for key in METRICS}
+    result["runs"] = args.runs
+    result["warmup"] = args.warmup
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"warm-up {'on' if args.warmup else 'off'}, median of {args.runs} runs")
+        for key in METRICS:
+            print(f"{key:>18} {result[key]:>9.1f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Import-Time Profile
+Imports the app in a fresh interpreter under ``python -X importtime`` and
+reports where startup time goes, by top-level package and by app module
+
+Usage (from the backend directory):
+    python benchmarks/import_profile.py [--top 15] [--module main] [--json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Heavy modules that must stay off the import path (loaded on first use)
+LAZY_MODULES = ["google.generativeai", "PIL"]
+
+
+def profile(module: str):
+    """Per-module (self µs, cumulative µs, depth) from -X importtime, plus lazy-import leaks"""
+    probe = (
+        f"import sys, json; import {module}; "
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "| cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    leaked = json.loads(proc.stdout.strip().splitlines()[-1])
+    return entries, leaked
+
+
+def summarize(entries, top: int):
+    """Total time, the costliest top-level packages and the app's own modules"""
+    packages = {}
+    for name, self_us, _, _ in entries:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    app_modules = sorted(
+        ((name, cumulative_us) for name, _, cumulative_us, _ in entries
+         if name.split(".")[0] in ("app", "main")),
+        key=lambda item: -item[1]
+    )
+    return {
+        "total_ms": round(sum(self_us for _, self_us, _, _ in entries) / 1000, 1),
+        "packages": [
+            {"package": package, "ms": round(us / 1000, 1)}
+            for package, us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        ],
+        "app_modules": [
+            {"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us in app_modules[:top]
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="main", help="Module to import")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    entries, leaked = profile(args.module)
+    report = summarize(entries, args.top)
+    report["eager_heavy_imports"] = leaked
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {args.module}: {report['total_ms']} ms")
+        print(f"\n{'package':<28} {'ms':>8}")
+        for row in report["packages"]:
+            print(f"{row['package']:<28} {row['ms']:>8.1f}")
+        print(f"\n{'app module':<44} {'cum ms':>8}")
+        for row in report["app_modules"]:
+            print(f"{row['module']:<44} {row['cumulative_ms']:>8.1f}")
+
+    if leaked:
+        print(f"\nImported eagerly (should be lazy): {', '.join(leaked)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
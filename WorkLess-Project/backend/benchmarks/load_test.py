@@ -0,0 +1,292 @@
+"""
+End-to-End Load Benchmark
+Drives /process-document with a realistic upload mix against the fake model
+and in-memory database backends, reporting throughput, tail latency and memory
+
+Usage (from the backend directory):
+    python benchmarks/load_test.py [--concurrency 1 4 16] [--requests 48]
+    python benchmarks/load_test.py --save-baseline baseline.json
+    python benchmarks/load_test.py --compare baseline.json --tolerance 0.15
+    python benchmarks/load_test.py --concurrency 64 --pro-fraction 0.3  # tier isolation
+
+By default the app runs in-process (ASGI transport, fake backends); pass
+--url to load a running server instead. Fake latencies come from the
+FAKE_* settings, e.g. FAKE_MODEL_LATENCY_MS=300 for faster runs.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Configure the fakes before the app (and its settings) are imported
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("DATABASE_BACKEND", "memory")
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="workless-load-"))
+os.environ.setdefault("RATE_LIMIT_CALLS", "1000000")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="workless-load-data-"))
+# Repeated payloads would otherwise be served from the result cache
+os.environ.setdefault("RESULT_CACHE_MAX_ENTRIES", "0")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx  # noqa: E402
+import PIL.Image  # noqa: E402
+import PIL.ImageDraw  # noqa: E402
+
+ENDPOINT = "/v1/documents/process-document"
+
+# (kind, weight): phone-photo JPEGs dominate, then PNG scans, then PDFs
+PAYLOAD_MIX = [("jpeg", 50), ("png", 30), ("pdf", 20)]
+
+# Regression thresholds are relative; memory is allowed a fixed slack
+MEMORY_SLACK_MB = 32
+
+
+def _page(rng: random.Random, size=(1240, 1754)) -> PIL.Image.Image:
+    """Render a synthetic document page with text-like bars"""
+    image = PIL.Image.new("RGB", size, "white")
+    draw = PIL.ImageDraw.Draw(image)
+    y = 80
+    while y < size[1] - 80:
+        width = rng.randint(size[0] // 5, size[0] - 160)
+        draw.rectangle([80, y, 80 + width, y + 14], fill=(rng.randint(0, 60),) * 3)
+        y += rng.randint(28, 48)
+    return image
+
+
+def build_payloads(seed: int, variants: int = 4):
+    """Pre-render upload payloads for each kind in the mix"""
+    rng = random.Random(seed)
+    payloads = {}
+    for kind, _ in PAYLOAD_MIX:
+        payloads[kind] = []
+        for i in range(variants):
+            buffer = io.BytesIO()
+            if kind == "jpeg":
+                _page(rng, (1080, 1920)).save(buffer, "JPEG", quality=85)
+                payloads[kind].append((f"photo-{i}.jpg", buffer.getvalue(), "image/jpeg"))
+            elif kind == "png":
+                _page(rng).convert("L").save(buffer, "PNG")
+                payloads[kind].append((f"scan-{i}.png", buffer.getvalue(), "image/png"))
+            else:
+                pages = [_page(rng, (620, 877)) for _ in range(3)]
+                pages[0].save(buffer, "PDF", save_all=True, append_images=pages[1:])
+                payloads[kind].append((f"doc-{i}.pdf", buffer.getvalue(), "application/pdf"))
+    return payloads
+
+
+def request_plan(payloads, total: int, seed: int, pro_fraction: float = 0.0):
+    """Deterministic sequence of (tier, upload) following the payload mix"""
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in PAYLOAD_MIX]
+    weights = [weight for _, weight in PAYLOAD_MIX]
+    return [
+        (
+            "pro" if rng.random() < pro_fraction else "basic",
+            rng.choice(payloads[rng.choices(kinds, weights)[0]]),
+        )
+        for _ in range(total)
+    ]
+
+
+def seed_users(total: int) -> None:
+    """Give the in-memory database pro users for the plan's pro requests"""
+    from app.services.supabase_service import supabase_service
+
+    if not hasattr(supabase_service, "users"):
+        return
+    for index in range(total):
+        user_id = f"load-pro-{index}"
+        supabase_service.users[user_id] = {"user_id": user_id, "subscription_tier": "pro"}
+
+
+def latency_stats(latencies) -> dict:
+    """Percentiles of a list of latencies, in milliseconds"""
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def percentile(samples, p: float) -> float:
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def memory_mb() -> dict:
+    """Current and peak resident memory of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        current = peak
+    return {"rss_mb": round(current, 1), "peak_rss_mb": round(peak, 1)}
+
+
+async def run_level(client: httpx.AsyncClient, plan, concurrency: int) -> dict:
+    """Send the plan with a fixed number of in-flight requests"""
+    latencies = []
+    errors = {}
+    tiers = {}
+    queue = list(enumerate(plan))
+
+    async def worker():
+        while queue:
+            index, (tier, (name, data, mime_type)) = queue.pop()
+            start = time.perf_counter()
+            try:
+                # One user per request keeps basic users under the daily scan limit
+                response = await client.post(
+                    ENDPOINT,
+                    files={"file": (name, data, mime_type)},
+                    data={"user_id": f"load-{tier}-{index}"},
+                )
+                outcome = response.status_code
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            latency = time.perf_counter() - start
+            latencies.append(latency)
+            stats = tiers.setdefault(tier, {"latencies": [], "errors": 0})
+            if outcome != 200:
+                errors[str(outcome)] = errors.get(str(outcome), 0) + 1
+                stats["errors"] += 1
+            else:
+                stats["latencies"].append(latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(plan),
+        "errors": errors,
+        "error_rate": round(sum(errors.values()) / len(plan), 4),
+        "throughput_rps": round(len(plan) / elapsed, 2),
+        **latency_stats(latencies),
+        "tiers": {
+            tier: {
+                "requests": len(stats["latencies"]) + stats["errors"],
+                "error_rate": round(stats["errors"] / (len(stats["latencies"]) + stats["errors"]), 4),
+                **latency_stats(stats["latencies"]),
+            }
+            for tier, stats in sorted(tiers.items())
+        },
+        **memory_mb(),
+    }
+
+
+async def run(args) -> list:
+    """Run every concurrency level and return the per-level results"""
+    payloads = build_payloads(args.seed)
+    timeout = httpx.Timeout(args.timeout)
+    results = []
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            for level in args.concurrency:
+                plan = request_plan(payloads, args.requests, args.seed, args.pro_fraction)
+                results.append(await run_level(client, plan, level))
+        return results
+
+    import main
+
+    seed_users(args.requests)
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            # Warm-up: first requests pay for lazy initialization
+            await run_level(client, request_plan(payloads, 2, args.seed), 1)
+            for level in args.concurrency:
+                plan = request_plan(payloads, args.requests, args.seed, args.pro_fraction)
+                results.append(await run_level(client, plan, level))
+    return results
+
+
+def compare(results, baseline, tolerance: float) -> list:
+    """Return human-readable regressions against a saved baseline"""
+    previous = {r["concurrency"]: r for r in baseline["results"]}
+    regressions = []
+    for current in results:
+        base = previous.get(current["concurrency"])
+        if not base:
+            continue
+        level = f"c={current['concurrency']}"
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{level}: throughput {current['throughput_rps']} < {base['throughput_rps']} rps"
+            )
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{level}: {key} {current[key]} > {base[key]}")
+        if current["error_rate"] > base["error_rate"] + tolerance / 10:
+            regressions.append(f"{level}: error rate {current['error_rate']} > {base['error_rate']}")
+        if current["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance) + MEMORY_SLACK_MB:
+            regressions.append(f"{level}: peak RSS {current['peak_rss_mb']}MB > {base['peak_rss_mb']}MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=48, help="Requests per concurrency level")
+    parser.add_argument("--url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--pro-fraction", type=float, default=0.0, help="Share of requests from pro users")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="Baseline to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'conc':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'peak MB':>8}")
+        for r in results:
+            print(
+                f"{r['concurrency']:>5} {r['throughput_rps']:>8.2f} {r['p50_ms']:>9.1f} "
+                f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['error_rate']:>7.1%} {r['peak_rss_mb']:>8.1f}"
+            )
+            for tier, t in r["tiers"].items():
+                print(
+                    f"{'':>5} {tier:>8} {t['p50_ms']:>9.1f} {t['p95_ms']:>9.1f} "
+                    f"{t['p99_ms']:>9.1f} {t['error_rate']:>7.1%}"
+                )
+
+    if args.save_baseline:
+        backend = {key: os.environ.get(key) for key in ("MODEL_BACKEND", "DATABASE_BACKEND")}
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"backend": backend, "results": results}, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
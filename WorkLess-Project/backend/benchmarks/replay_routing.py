@@ -0,0 +1,66 @@
+"""
+Routing Threshold Replay
+Re-evaluates a recorded routing decision log (ROUTING_LOG_PATH) under
+different thresholds to tune escalation offline
+
+Usage (from the backend directory):
+    python benchmarks/replay_routing.py routing.jsonl \
+        --overall 70 75 80 85 90 --field 40 50 60 70 --pro-types id form
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.model_router import RoutingPolicy, replay, summarize  # noqa: E402
+
+
+def load_log(path: str):
+    """Load routing decisions from a JSONL log"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("log", help="JSONL routing decision log")
+    parser.add_argument("--overall", type=float, nargs="+", default=[70, 75, 80, 85, 90])
+    parser.add_argument("--field", type=float, nargs="+", default=[40, 50, 60, 70])
+    parser.add_argument("--pro-types", nargs="*", default=["id", "form"])
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    entries = load_log(args.log)
+    recorded = summarize(entries)
+
+    results = []
+    for overall in args.overall:
+        for field in args.field:
+            policy = RoutingPolicy(overall, field, args.pro_types)
+            results.append({"overall": overall, "field": field, **replay(entries, policy)})
+
+    if args.json:
+        print(json.dumps({"recorded": recorded, "replayed": results}, indent=2))
+        return
+
+    print(
+        f"Recorded: {recorded.get('documents', 0)} documents, "
+        f"escalation {recorded.get('escalation_rate', 0):.1%}, "
+        f"avg {recorded.get('avg_latency_ms', 0)}ms, "
+        f"${recorded.get('total_cost_usd', 0):.4f}\n"
+    )
+    if results and results[0].get("not_replayed"):
+        print(f"{results[0]['not_replayed']} tiled documents kept as recorded\n")
+    print(f"{'overall':>8} {'field':>6} {'escalation':>11} {'avg ms':>9} {'cost $':>10}")
+    for r in results:
+        print(
+            f"{r['overall']:>8.0f} {r['field']:>6.0f} {r.get('escalation_rate', 0):>10.1%} "
+            f"{r.get('avg_latency_ms', 0):>9.1f} {r.get('total_cost_usd', 0):>10.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
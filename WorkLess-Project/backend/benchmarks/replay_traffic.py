@@ -0,0 +1,230 @@
+"""
+Recorded Traffic Replay
+Feeds a request recorder log (RECORDER_ENABLED) back into the app against the
+fake backends, at the recorded arrival rate or scaled, and compares the
+replayed latency profile with the recorded one
+
+Usage (from the backend directory):
+    python benchmarks/replay_traffic.py data/requests.wrlog
+    python benchmarks/replay_traffic.py requests.wrlog --speed 2          # arrivals twice as fast
+    python benchmarks/replay_traffic.py requests.wrlog --speed 0 --concurrency 16  # back to back
+    python benchmarks/replay_traffic.py requests.wrlog --latency-scale 0.5  # upstreams twice as fast
+
+Each recorded upload is replaced by a synthetic document of the same type,
+page count and roughly the same size; the fake model returns the recorded
+(masked) outputs after the recorded latencies and the in-memory database
+takes the recorded time per call. Records without an upload (rejected
+before the file was read) are skipped. Runs in-process only: the recorded
+responses are handed to the fakes per request.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+
+# Configure the fakes before the app (and its settings) are imported.
+# Retries and hedges already happened inside the recorded latencies.
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("DATABASE_BACKEND", "memory")
+os.environ.setdefault("GEMINI_MAX_RETRIES", "0")
+os.environ.setdefault("GEMINI_HEDGE_ENABLED", "false")
+os.environ.setdefault("RECORDER_ENABLED", "false")
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="workless-replay-"))
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="workless-replay-data-"))
+
+sys.path.insert(0, str(BENCHMARK_DIR))
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+import httpx  # noqa: E402
+
+from load_test import _page, latency_stats, memory_mb  # noqa: E402
+from app.services.request_recorder import read_log  # noqa: E402
+
+STREAM_SUFFIX = "/stream"
+ENDPOINT = "/v1/documents/process-document"
+
+# Synthetic uploads are reused for recorded sizes within this ratio
+SIZE_BUCKET_RATIO = 1.25
+BASE_PAGE = (1240, 1754)
+EXTENSIONS = {"image/jpeg": "jpg", "image/jpg": "jpg", "image/png": "png", "application/pdf": "pdf"}
+
+
+def _encode(mime_type: str, pages: int, scale: float, rng) -> bytes:
+    size = (max(64, round(BASE_PAGE[0] * scale)), max(64, round(BASE_PAGE[1] * scale)))
+    buffer = io.BytesIO()
+    if mime_type == "application/pdf":
+        images = [_page(rng, size) for _ in range(max(1, pages))]
+        images[0].save(buffer, "PDF", save_all=True, append_images=images[1:])
+    elif mime_type == "image/png":
+        _page(rng, size).convert("L").save(buffer, "PNG")
+    else:
+        _page(rng, size).save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class SyntheticUploads:
+    """Documents standing in for recorded uploads, cached by type, pages and size"""
+
+    def __init__(self, seed: int):
+        self.rng = random.Random(seed)
+        self.cache = {}
+
+    def get(self, shape: dict) -> tuple:
+        mime_type = shape.get("mime_type", "image/jpeg")
+        pages = shape.get("pages", 1)
+        target = max(1, shape.get("file_size", 200_000))
+        key = (mime_type, pages, round(math.log(target, SIZE_BUCKET_RATIO)))
+        if key not in self.cache:
+            # Bytes grow with page area: one correction gets close to the target
+            data = _encode(mime_type, pages, 1.0, self.rng)
+            scale = min(4.0, max(0.1, math.sqrt(target / len(data))))
+            if abs(scale - 1.0) > 0.05:
+                data = _encode(mime_type, pages, scale, self.rng)
+            self.cache[key] = (f"replay.{EXTENSIONS.get(mime_type, 'bin')}", data, mime_type)
+        return self.cache[key]
+
+
+def load_records(path: str, limit: int = 0) -> list:
+    """Replayable records (those with an upload), oldest first"""
+    records = [r for r in read_log(path) if r["shape"].get("file_size")]
+    records.sort(key=lambda r: r["at"])
+    return records[:limit] if limit else records
+
+
+def seed_users(records: list) -> list:
+    """One in-memory user per record, on its recorded tier (basic users stay under the scan limit)"""
+    from app.services.supabase_service import supabase_service
+
+    user_ids = []
+    for index, record in enumerate(records):
+        tier = record["shape"].get("tier", "basic")
+        user_id = f"replay-{tier}-{index}"
+        user_ids.append(user_id)
+        if hasattr(supabase_service, "users"):
+            supabase_service.users[user_id] = {"user_id": user_id, "subscription_tier": tier}
+    return user_ids
+
+
+def profile(records: list, latencies: list, statuses: list) -> dict:
+    """Latency percentiles and status mix for a set of requests"""
+    mix = {}
+    for status in statuses:
+        mix[str(status)] = mix.get(str(status), 0) + 1
+    return {"requests": len(records), **latency_stats(latencies), "statuses": mix}
+
+
+def stage_means(records: list) -> dict:
+    """Mean recorded time per stage, in milliseconds"""
+    totals = {}
+    for record in records:
+        for name, ms in record["stages"].items():
+            totals.setdefault(name, []).append(ms)
+    return {name: round(sum(values) / len(values), 1) for name, values in sorted(totals.items())}
+
+
+async def replay(args, records: list) -> list:
+    """Send every record at its (scaled) offset; returns (latency, status) per record"""
+    import main
+    from app.services.fake_backends import ReplayScript, replay_script
+
+    uploads = SyntheticUploads(args.seed)
+    user_ids = seed_users(records)
+    payloads = [uploads.get(record["shape"]) for record in records]
+    results = [None] * len(records)
+    gate = asyncio.Semaphore(args.concurrency) if args.speed <= 0 else None
+
+    async def send(client: httpx.AsyncClient, index: int) -> None:
+        record = records[index]
+        if args.speed > 0:
+            await asyncio.sleep((record["at"] - records[0]["at"]) / args.speed)
+        else:
+            await gate.acquire()
+        # The app runs in this task (ASGI transport), so the fakes see the script
+        replay_script.set(ReplayScript(record["model"], record["db"], args.latency_scale))
+        shape = record["shape"]
+        data = {"user_id": user_ids[index]}
+        if shape.get("document_type"):
+            data["document_type"] = shape["document_type"]
+        endpoint = ENDPOINT + (STREAM_SUFFIX if record["route"].endswith(STREAM_SUFFIX) else "")
+        start = time.perf_counter()
+        try:
+            response = await client.post(endpoint, files={"file": payloads[index]}, data=data)
+            outcome = response.status_code
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        finally:
+            if gate:
+                gate.release()
+        results[index] = (time.perf_counter() - start, outcome)
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        timeout = httpx.Timeout(args.timeout)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=timeout) as client:
+            await asyncio.gather(*(send(client, index) for index in range(len(records))))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("log", help="Request recorder log (RECORDER_LOG_PATH)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Arrival rate multiplier; 0 sends back to back with --concurrency in flight")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight with --speed 0")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier on recorded upstream latencies")
+    parser.add_argument("--limit", type=int, default=0, help="Replay only the first N records")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    records = load_records(args.log, args.limit)
+    if not records:
+        print(f"No replayable records in {args.log}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    results = asyncio.run(replay(args, records))
+    elapsed = time.perf_counter() - started
+
+    routes = sorted({record["route"] for record in records})
+    report = {"routes": {}, "elapsed_s": round(elapsed, 2), **memory_mb()}
+    for route in routes + [None]:
+        indexes = [i for i, record in enumerate(records) if route is None or record["route"] == route]
+        subset = [records[i] for i in indexes]
+        report["routes"][route or "all"] = {
+            "recorded": profile(subset, [r["total_ms"] / 1000 for r in subset], [r["status"] for r in subset]),
+            "replayed": profile(subset, [results[i][0] for i in indexes], [results[i][1] for i in indexes]),
+            "recorded_stages_ms": stage_means(subset),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Replayed {len(records)} requests in {report['elapsed_s']}s (speed {args.speed or 'max'}, "
+          f"latency x{args.latency_scale}), peak RSS {report['peak_rss_mb']}MB\n")
+    print(f"{'route':<44} {'':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  statuses")
+    for route, entry in report["routes"].items():
+        for label in ("recorded", "replayed"):
+            r = entry[label]
+            print(
+                f"{route if label == 'recorded' else '':<44} {label:>9} {r['p50_ms']:>9.1f} "
+                f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}  {r['statuses']}"
+            )
+        stages = ", ".join(f"{name} {ms}" for name, ms in entry["recorded_stages_ms"].items())
+        print(f"{'':<44} {'stages':>9} {stages}")
+
+
+if __name__ == "__main__":
+    main()
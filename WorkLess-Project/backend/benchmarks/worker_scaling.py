@@ -0,0 +1,152 @@
+"""
+Worker Scaling Benchmark
+Starts the server through its multi-worker launcher (python main.py) with 1
+to N workers and drives /process-document at fixed concurrency, reporting
+throughput, latency, scaling efficiency and total server memory
+
+Usage (from the backend directory):
+    python benchmarks/worker_scaling.py [--workers 1 2 4] [--concurrency 32] [--requests 192]
+
+Uses the fake model (FAKE_MODEL_LATENCY_MS, default 300 here) and no
+database. Model latency is I/O wait, so scaling comes from spreading the CPU
+work (decoding, classification, parsing, serialization) over cores: expect
+efficiency near 100% up to the number of available CPUs and flat beyond.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = BENCHMARK_DIR.parent
+
+SERVER_ENV = {
+    "ENVIRONMENT": "benchmark",
+    "MODEL_BACKEND": "fake",
+    "DATABASE_BACKEND": "none",
+    "FAKE_MODEL_LATENCY_MS": os.environ.get("FAKE_MODEL_LATENCY_MS", "300"),
+    "RATE_LIMIT_CALLS": "1000000",
+    "RESULT_CACHE_MAX_ENTRIES": "0",
+    "LOG_LEVEL": "WARNING",
+}
+
+sys.path.insert(0, str(BENCHMARK_DIR))
+
+import httpx  # noqa: E402
+
+from load_test import build_payloads, request_plan, run_level  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def tree_rss_mb(pid: int) -> float:
+    """Resident memory of a process and its children (Linux /proc)"""
+    children = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+        except (OSError, IndexError, ValueError):
+            continue
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            total += int(Path(f"/proc/{current}/statm").read_text().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            pass
+        pending.extend(children.get(current, []))
+    return round(total / (1024 * 1024), 1)
+
+
+async def wait_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise TimeoutError(f"Server not ready after {timeout}s")
+
+
+async def run_workers(workers: int, payloads, args) -> dict:
+    """Boot a server with ``workers`` processes and load it"""
+    port = free_port()
+    env = {
+        **os.environ,
+        **SERVER_ENV,
+        "WORKERS": str(workers),
+        "PORT": str(port),
+        "HOST": "127.0.0.1",
+        "UPLOAD_DIR": tempfile.mkdtemp(prefix="workless-scale-"),
+        "DATA_DIR": tempfile.mkdtemp(prefix="workless-scale-data-"),
+    }
+    server = subprocess.Popen([sys.executable, "main.py"], cwd=BACKEND_DIR, env=env)
+    try:
+        timeout = httpx.Timeout(args.timeout)
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=timeout, limits=limits) as client:
+            await wait_ready(client, server, args.timeout)
+            # Warm every worker (connections are spread over them by the kernel)
+            await run_level(client, request_plan(payloads, workers * 4, args.seed), args.concurrency)
+            result = await run_level(client, request_plan(payloads, args.requests, args.seed), args.concurrency)
+            result["server_rss_mb"] = tree_rss_mb(server.pid)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    result["workers"] = workers
+    return result
+
+
+async def run(args) -> list:
+    payloads = build_payloads(args.seed)
+    return [await run_workers(workers, payloads, args) for workers in args.workers]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=192)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    base = results[0]["throughput_rps"] / results[0]["workers"]
+    for result in results:
+        result["efficiency"] = round(result["throughput_rps"] / (base * result["workers"]), 3)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'workers':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} {'eff':>6} {'RSS MB':>8}")
+    for r in results:
+        print(
+            f"{r['workers']:>7} {r['throughput_rps']:>8.2f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+            f"{r['p99_ms']:>9.1f} {r['error_rate']:>7.1%} {r['efficiency']:>6.0%} {r['server_rss_mb']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,14 +9,29 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
+import asyncio
 import time
 import logging
 from contextlib import asynccontextmanager
 
 from app.core.config import settings
+from app.core.http import http_transport
 from app.core.logging_config import setup_logging
+from app.core.responses import CompressionMiddleware, DefaultJSONResponse
 from app.api.v1.router import api_router
+from app.api.v1.endpoints.documents import resume_interrupted_jobs
+from app.services.analytics_service import analytics_service
+from app.services.drain import drain_coordinator
+from app.services.gemini_service import gemini_service
+from app.services.health import health_monitor
+from app.services.local_ocr import local_text_extractor
+from app.services.model_router import routing_recorder
+from app.services.request_recorder import request_recorder
+from app.services.supabase_service import supabase_service
+from app.services.usage_meter import usage_meter
+from app.services.webhooks import webhook_dispatcher
 from app.middleware.rate_limiter import RateLimitMiddleware
+from app.middleware.recorder import RecorderMiddleware
 from app.middleware.security import SecurityMiddleware
 
 # Setup logging
@@ -24,6 +39,15 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
+def log_recovery_outcome(task: asyncio.Task) -> None:
+    """Surface a crash of the background job recovery, which nothing awaits"""
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error:
+        logger.error("Recovery of interrupted jobs failed", exc_info=error)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle events for the application"""
@@ -32,10 +56,55 @@ async def lifespan(app: FastAPI):
     logger.info(f"Environment: {settings.ENVIRONMENT}")
     logger.info(f"API Version: {settings.API_V1_PREFIX}")
     
+    # Outbound clients (Supabase, webhooks) share one keep-alive connection pool
+    http_transport.start()
+    
+    if settings.WARMUP_ENABLED:
+        # Runs on the default thread pool, which also creates it before traffic arrives
+        timings = await asyncio.to_thread(gemini_service.warm_up)
+        if local_text_extractor:
+            # Spawned OCR processes import the app modules once, before the first upload
+            await local_text_extractor.warm_up()
+        logger.info(f"Warm-up finished: {timings}")
+    
+    # Jobs interrupted by the last shutdown are finished in the background
+    drain_coordinator.reopen()
+    recovery = asyncio.create_task(resume_interrupted_jobs())
+    recovery.add_done_callback(log_recovery_outcome)
+    # Totals from before the analytics rollups existed are copied once
+    if analytics_service and supabase_service and not analytics_service.backfilled():
+        backfill = asyncio.create_task(asyncio.to_thread(analytics_service.backfill, supabase_service))
+    
+    # Dependency probes and loop lag sampling for /ready and /health/deep
+    health_monitor.start()
+    if usage_meter:
+        usage_meter.start()
+    # Callbacks queued before the restart are delivered first
+    if webhook_dispatcher:
+        webhook_dispatcher.start()
+    
     yield
     
     # Shutdown
     logger.info("🛑 Shutting down WorkLess AI Backend...")
+    # Refuse new work and let in-flight jobs finish; unfinished ones stay journaled
+    drain = await drain_coordinator.drain()
+    recovery.cancel()
+    await health_monitor.stop()
+    if usage_meter:
+        # After the drain, so the jobs it finished are counted
+        await usage_meter.stop()
+    if request_recorder:
+        await request_recorder.stop()
+    await routing_recorder.stop()
+    if webhook_dispatcher:
+        # After the drain, so finished jobs' callbacks get a chance to go out
+        await webhook_dispatcher.stop()
+    if local_text_extractor:
+        local_text_extractor.shutdown()
+    # Last, after everything that still talks to upstreams
+    await http_transport.aclose()
+    logger.info(f"Drain finished: {drain}")
 
 
 # Initialize FastAPI app
@@ -46,6 +115,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_PREFIX}/openapi.json",
     docs_url=f"{settings.API_V1_PREFIX}/docs",
     redoc_url=f"{settings.API_V1_PREFIX}/redoc",
+    default_response_class=DefaultJSONResponse,
     lifespan=lifespan
 )
 
@@ -66,6 +136,16 @@ app.add_middleware(
     expose_headers=["X-Request-ID", "X-RateLimit-Limit", "X-RateLimit-Remaining"]
 )
 
+# Response Compression (NDJSON streams and uploaded files are sent as-is)
+if settings.GZIP_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.GZIP_MINIMUM_SIZE,
+        compresslevel=settings.GZIP_COMPRESS_LEVEL,
+        exclude_prefixes=["/uploads/", f"{settings.API_V1_PREFIX}/documents/uploads/"],
+        exclude_suffixes=["/stream"]
+    )
+
 # Custom Security Middleware
 app.add_middleware(SecurityMiddleware)
 
@@ -73,9 +153,14 @@ app.add_middleware(SecurityMiddleware)
 app.add_middleware(
     RateLimitMiddleware,
     calls=settings.RATE_LIMIT_CALLS,
-    period=settings.RATE_LIMIT_PERIOD
+    period=settings.RATE_LIMIT_PERIOD,
+    shared=settings.SHARED_STATE_ENABLED
 )
 
+# Request Recorder (sampled request shapes and upstream responses, for replay)
+if request_recorder:
+    app.add_middleware(RecorderMiddleware, recorder=request_recorder)
+
 
 # Request ID Middleware
 @app.middleware("http")
@@ -125,6 +210,28 @@ async def health_check():
     }
 
 
+# Readiness Endpoint (cached probe results; 503 steers load balancers away)
+@app.get("/ready")
+async def readiness_check():
+    """Readiness check: dependencies reachable, queue and event loop not saturated"""
+    readiness = health_monitor.readiness()
+    if readiness["reasons"]:
+        return DefaultJSONResponse(
+            status_code=503,
+            content=readiness,
+            headers={"Retry-After": str(max(1, round(settings.HEALTH_PROBE_INTERVAL_SECONDS)))}
+        )
+    return readiness
+
+
+# Deep Health Endpoint
+@app.get("/health/deep")
+async def deep_health_check():
+    """Detailed health: probe results, loop lag, queue depth and jobs"""
+    report = health_monitor.report()
+    return DefaultJSONResponse(status_code=503 if report["status"] == "unhealthy" else 200, content=report)
+
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_PREFIX)
 
@@ -135,11 +242,23 @@ app.mount("/uploads", StaticFiles(directory=str(upload_dir)), name="uploads")
 
 
 if __name__ == "__main__":
+    import os
     import uvicorn
+    from app.core.workers import LAUNCH_TIME_ENV, resolve_worker_count
+    
+    workers = resolve_worker_count(settings.WORKERS)
+    if workers > 1:
+        # Workers inherit the environment: they share rate limits, the result
+        # cache and the inference budget through DATA_DIR
+        os.environ["SHARED_STATE_ENABLED"] = "true"
+        os.environ[LAUNCH_TIME_ENV] = str(time.time())
+        logger.info(f"Starting {workers} workers")
     uvicorn.run(
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.ENVIRONMENT == "development",
+        # Reload runs a single process
+        reload=settings.ENVIRONMENT == "development" and workers == 1,
+        workers=workers,
         log_level=settings.LOG_LEVEL.lower()
     )
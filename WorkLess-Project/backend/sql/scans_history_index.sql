@@ -0,0 +1,8 @@
+-- Index backing GET /v1/documents/scans (keyset pagination on created_at, id)
+-- Run once in the Supabase SQL editor.
+create index concurrently if not exists scans_user_created_id_idx
+    on public.scans (user_id, created_at desc, id desc);
+
+-- Optional: speeds up ?status= filtering for users with long histories
+create index concurrently if not exists scans_user_status_created_id_idx
+    on public.scans (user_id, status, created_at desc, id desc);
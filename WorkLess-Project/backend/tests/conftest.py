@@ -0,0 +1,18 @@
+"""
+Test Configuration
+Runs the app against the in-process fakes, with local state in a temporary directory
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Settings are read at import time: configure them before the app is imported
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("DATABASE_BACKEND", "memory")
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="workless-test-data-"))
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="workless-test-uploads-"))
+os.environ.setdefault("WARMUP_ENABLED", "false")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,112 @@
+"""
+Admission Control Tests
+Slots by subscription tier, priority between queued requests, and shedding
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected
+
+
+def controller(max_concurrency: int = 2, queue_timeout: float = 5.0, max_queue_depth: int = 10) -> AdmissionController:
+    return AdmissionController(
+        max_concurrency=max_concurrency,
+        tier_priority=["pro", "basic"],
+        tier_shares={"pro": 1.0, "basic": 0.5},
+        queue_timeouts={"pro": queue_timeout, "basic": queue_timeout},
+        max_queue_depth={"pro": max_queue_depth, "basic": max_queue_depth},
+    )
+
+
+def test_unknown_tiers_are_scheduled_as_the_default():
+    admission = controller()
+    assert admission.resolve_tier({"subscription_tier": "pro"}) == "pro"
+    assert admission.resolve_tier({"subscription_tier": "enterprise"}) == "basic"
+    assert admission.resolve_tier(None) == "basic"
+
+
+def test_lower_tier_is_capped_at_its_share():
+    admission = controller(max_concurrency=4)
+
+    async def run():
+        held = [await admission.acquire("basic") for _ in range(2)]
+        # Half of the slots: a third basic request queues while pro is admitted
+        queued = asyncio.create_task(admission.acquire("basic"))
+        await asyncio.sleep(0)
+        pro = await asyncio.wait_for(admission.acquire("pro"), 1)
+        assert not queued.done()
+        held[0].release()
+        return [await queued, pro, held[1]]
+
+    tickets = asyncio.run(run())
+    assert [ticket.tier for ticket in tickets] == ["basic", "pro", "basic"]
+    assert admission.snapshot()["tiers"]["basic"]["in_flight"] == 2
+
+
+def test_freed_slot_goes_to_the_higher_tier():
+    admission = controller(max_concurrency=1)
+
+    async def run():
+        held = await admission.acquire("pro")
+        basic = asyncio.create_task(admission.acquire("basic"))
+        await asyncio.sleep(0)
+        pro = asyncio.create_task(admission.acquire("pro"))
+        await asyncio.sleep(0)
+        held.release()
+        # The pro request queued later is granted the slot
+        assert admission.tiers["pro"].in_flight == 1 and len(admission.tiers["basic"].waiters) == 1
+        (await pro).release()
+        (await basic).release()
+
+    asyncio.run(run())
+    assert admission.in_flight == 0
+
+
+def test_full_queue_sheds_new_requests():
+    admission = controller(max_concurrency=1, max_queue_depth=1)
+
+    async def run():
+        held = await admission.acquire("pro")
+        queued = asyncio.create_task(admission.acquire("pro"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as shed:
+            await admission.acquire("pro")
+        held.release()
+        (await queued).release()
+        return shed.value
+
+    shed = asyncio.run(run())
+    assert (shed.tier, shed.reason, shed.retry_after) == ("pro", "queue_full", 5.0)
+    assert admission.snapshot()["tiers"]["pro"]["rejected"] == {"queue_full": 1}
+
+
+def test_request_waiting_past_its_deadline_is_shed():
+    admission = controller(max_concurrency=1, queue_timeout=0.05)
+
+    async def run():
+        async with admission.slot("pro"):
+            with pytest.raises(AdmissionRejected) as shed:
+                await admission.acquire("pro")
+        return shed.value
+
+    assert asyncio.run(run()).reason == "queue_timeout"
+    assert (admission.in_flight, admission.queue_depth()) == (0, 0)
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    admission = controller(max_concurrency=1)
+
+    async def run():
+        held = await admission.acquire("pro")
+        queued = asyncio.create_task(admission.acquire("pro"))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        held.release()
+        # Released twice: the slot is only returned once
+        held.release()
+
+    asyncio.run(run())
+    assert (admission.in_flight, admission.queue_depth()) == (0, 0)
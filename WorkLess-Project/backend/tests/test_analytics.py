@@ -0,0 +1,65 @@
+"""
+Analytics Tests
+Rollup totals, and the one-off backfill of what happened before they existed
+"""
+
+import pytest
+
+from app.core.storage import SQLiteStore
+from app.services import analytics_service
+from app.services.analytics_service import SCHEMA, AnalyticsService
+from app.services.fake_backends import InMemoryDatabaseService, LatencyModel
+
+
+@pytest.fixture
+def database() -> InMemoryDatabaseService:
+    database = InMemoryDatabaseService(LatencyModel(0, sigma=0))
+    for index in range(5):
+        user_id = f"user-{index}"
+        database.users[user_id] = {"user_id": user_id, "subscription_tier": "pro" if index < 2 else "basic"}
+        for _ in range(3):
+            database.create_scan_record(user_id, "scan.png", 100)
+    return database
+
+
+def test_backfill_makes_totals_exact(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_service, "BACKFILL_PAGE_SIZE", 2)
+    analytics = AnalyticsService(SQLiteStore(str(tmp_path / "analytics.db"), SCHEMA))
+    # Scans recorded since the rollups were deployed are also in the database
+    analytics.record_scan_started("user-0", "pro")
+    analytics.record_scan_started("user-4", "basic")
+
+    assert analytics.backfill(database)
+    summary = analytics.summary()
+    assert summary["total_scans"] == 15
+    assert summary["total_users"] == 5
+    assert summary["tier_counts"] == {"pro": 2, "basic": 3}
+
+    # Later scans add to the copied totals
+    analytics.record_scan_started("user-5", "basic")
+    summary = analytics.summary()
+    assert (summary["total_scans"], summary["total_users"]) == (16, 6)
+
+
+def test_backfill_runs_once_per_store(database, tmp_path):
+    path = str(tmp_path / "analytics.db")
+    first = AnalyticsService(SQLiteStore(path, SCHEMA))
+    # Another worker of the same host
+    second = AnalyticsService(SQLiteStore(path, SCHEMA))
+    assert first.backfill(database)
+    assert not second.backfill(database)
+    assert second.backfilled()
+    assert second.summary()["total_scans"] == 15
+
+
+def test_failed_backfill_is_retried(database, tmp_path, monkeypatch):
+    analytics = AnalyticsService(SQLiteStore(str(tmp_path / "analytics.db"), SCHEMA))
+
+    def unreachable():
+        raise ConnectionError("supabase unreachable")
+
+    monkeypatch.setattr(database, "count_scans", unreachable)
+    assert not analytics.backfill(database)
+    assert not analytics.backfilled()
+    monkeypatch.undo()
+    assert analytics.backfill(database)
@@ -0,0 +1,44 @@
+"""
+Document Classifier Tests
+"""
+
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.services.document_classifier import ID_CARD, DocumentClassifier
+
+
+def text_page(size, fmt=None):
+    line = Image.new("RGB", (200, 14), "white")
+    ImageDraw.Draw(line).text((0, 2), "NAME SURNAME 1234", fill="black")
+    image = Image.new("RGB", size, "white")
+    for y in range(10, size[1] - 24, 14):
+        for x in range(10, size[0] - 210, 200):
+            image.paste(line, (x, y))
+    if fmt is None:
+        return image, None
+    buffer = io.BytesIO()
+    image.save(buffer, fmt)
+    data = buffer.getvalue()
+    return Image.open(io.BytesIO(data)), data
+
+
+def test_scanned_card_is_an_id():
+    image, _ = text_page((1011, 638))
+    assert DocumentClassifier().classify(image).label == ID_CARD
+
+
+@pytest.mark.parametrize("size", [(1920, 1080), (3840, 2160), (4032, 2688)])
+def test_landscape_photos_are_not_ids(size):
+    image, _ = text_page(size)
+    assert DocumentClassifier().classify(image).label != ID_CARD
+
+
+def test_jpeg_is_measured_without_decoding_the_upload():
+    image, data = text_page((4000, 3000), "JPEG")
+    result = DocumentClassifier().classify(image, 1, data)
+    assert (result.features.width, result.features.height) == (4000, 3000)
+    # The image handed to the model is left undecoded
+    assert image.tile and image.size == (4000, 3000) and image.mode == "RGB"
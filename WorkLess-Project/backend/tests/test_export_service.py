@@ -0,0 +1,34 @@
+"""
+Export Service Tests
+CSV exports that are safe to open in a spreadsheet
+"""
+
+import csv
+import io
+
+from app.core.storage import SQLiteStore
+from app.services.export_service import ExtractionExport
+from app.services.extraction_index import SCHEMA, ExtractionIndex
+
+
+def test_csv_cells_are_never_formulas():
+    index = ExtractionIndex(SQLiteStore(":memory:", SCHEMA))
+    index.index_document(
+        "user-1",
+        [
+            {"field": "Vendor", "value": '=HYPERLINK("http://attacker.example","ACME")', "confidence": 90},
+            {"field": "Total", "value": "-12.50", "confidence": 90},
+            {"field": "@Note", "value": "+1 555 0100", "confidence": 90},
+            {"field": "Memo", "value": "\tpaid", "confidence": 90},
+            {"field": "Reference", "value": "INV-1042", "confidence": 90},
+        ],
+        scan_id="scan-1",
+        confidence_score=90.0
+    )
+    body = b"".join(ExtractionExport(index, "user-1").stream("csv")).decode("utf-8")
+    header, row = list(csv.reader(io.StringIO(body)))
+    cells = dict(zip(header, row))
+    assert "'@Note" in cells
+    assert cells["Vendor"] == '\'=HYPERLINK("http://attacker.example","ACME")'
+    assert (cells["Total"], cells["'@Note"], cells["Memo"]) == ("'-12.50", "'+1 555 0100", "'\tpaid")
+    assert (cells["Reference"], cells["confidence_score"]) == ("INV-1042", "90.0")
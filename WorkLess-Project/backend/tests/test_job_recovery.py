@@ -0,0 +1,117 @@
+"""
+Job Recovery Tests
+Replaying the job journal left by an interrupted process
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.api.v1.endpoints import documents
+from app.core.storage import SQLiteStore
+from app.models.schemas import FieldData
+from app.services.job_journal import SCHEMA, JobJournal
+
+RESULT = {
+    "raw_text": "Total 12.50",
+    "refined_data": [FieldData(field="Total", value="12.50", confidence=90)],
+    "confidence_score": 90,
+    "formatting_changes": [],
+}
+
+
+@pytest.fixture
+def journal(monkeypatch) -> JobJournal:
+    journal = JobJournal(SQLiteStore(":memory:", SCHEMA), max_attempts=2)
+    monkeypatch.setattr(documents, "job_journal", journal)
+    monkeypatch.setattr(documents, "LAUNCH_TIME", time.time() + 60)
+    return journal
+
+
+def checkpointed_job(journal: JobJournal) -> str:
+    job_id = journal.start("user-1", "/nonexistent/upload.png", "upload.png", "image/png")
+    journal.checkpoint(job_id, RESULT)
+    return job_id
+
+
+def test_checkpointed_result_is_recorded(journal, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(documents, "record_result", lambda job, result: (recorded.append(result), job.finish()))
+    checkpointed_job(journal)
+    asyncio.run(documents._replay_journal())
+    assert recorded == [RESULT]
+    assert journal.pending() == []
+
+
+def test_failed_recording_is_kept_for_the_next_start_then_abandoned(journal, monkeypatch):
+    abandoned = []
+
+    def record_result(job, result):
+        raise ConnectionError("supabase unreachable")
+
+    monkeypatch.setattr(documents, "record_result", record_result)
+    monkeypatch.setattr(documents, "abandon_job", lambda job: (abandoned.append(job.job_id), job.finish()))
+    job_id = checkpointed_job(journal)
+    checkpointed_job(journal)
+
+    # Every entry is tried, and the failed ones stay journaled with their result
+    asyncio.run(documents._replay_journal())
+    entries = journal.pending()
+    assert [entry.attempts for entry in entries] == [1, 1]
+    assert all(entry.result == RESULT for entry in entries)
+    assert abandoned == []
+
+    # Out of attempts: the scan is failed and the job dropped
+    asyncio.run(documents._replay_journal())
+    assert abandoned[0] == job_id and len(abandoned) == 2
+    assert journal.pending() == []
+
+
+def started_job(journal: JobJournal) -> documents.ProcessingJob:
+    job = documents.ProcessingJob(
+        user_id="user-1",
+        user_metadata=None,
+        scan_record=None,
+        file_name="upload.png",
+        file_path="/nonexistent/upload.png",
+        mime_type="image/png",
+        document_type=None,
+        file_content=b"page"
+    )
+    job.journal()
+    return job
+
+
+def test_model_failure_abandons_the_job(journal, monkeypatch):
+    abandoned = []
+
+    async def process_document(**kwargs):
+        raise ConnectionError("model unreachable")
+
+    monkeypatch.setattr(documents.gemini_service, "process_document", process_document)
+    monkeypatch.setattr(documents, "abandon_job", lambda job: (abandoned.append(job.job_id), job.finish()))
+    job = started_job(journal)
+    with pytest.raises(ConnectionError):
+        asyncio.run(documents.run_job(job))
+    assert abandoned == [job.job_id]
+    assert journal.pending() == []
+
+
+def test_recording_failure_after_the_model_call_keeps_the_result(journal, monkeypatch):
+    abandoned = []
+
+    async def process_document(**kwargs):
+        return RESULT
+
+    def record_result(job, result):
+        raise ConnectionError("database is locked")
+
+    monkeypatch.setattr(documents.gemini_service, "process_document", process_document)
+    monkeypatch.setattr(documents, "record_result", record_result)
+    monkeypatch.setattr(documents, "abandon_job", lambda job: abandoned.append(job.job_id))
+    job = started_job(journal)
+    assert asyncio.run(documents.run_job(job)) == RESULT
+    assert abandoned == []
+    # Journaled with its result: the next start records it
+    assert [entry.result for entry in journal.pending()] == [RESULT]
@@ -0,0 +1,65 @@
+"""
+Local OCR Tests
+When local text may replace the page image, and timeouts in the process pool
+"""
+
+import asyncio
+import io
+import time
+
+from PIL import Image
+
+from app.services.local_ocr import LocalText, LocalTextExtractor, OCREngine
+
+ENGINE = f"{__name__}:StallingEngine"
+TEXT = "Invoice number: INV-1042\nTotal due: 12.50 USD\n" * 4
+
+
+class StallingEngine(OCREngine):
+    """Reads any image instantly, except 1-pixel-wide ones, on which it hangs"""
+
+    name = "stalling"
+
+    def recognize(self, image):
+        if image.width == 1:
+            time.sleep(60)
+        return TEXT, 95.0
+
+
+def png(width: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (width, 10), 255).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_enough_confident_text_is_sufficient():
+    extractor = LocalTextExtractor(engine_name=None)
+    assert extractor.sufficient(LocalText(TEXT, "pdf_text", 99.0))
+    assert not extractor.sufficient(LocalText("Total: 1", "pdf_text", 99.0))
+    assert not extractor.sufficient(LocalText(TEXT, "tesseract", 60.0))
+
+
+def test_truncated_text_is_not_sufficient():
+    # Past OCR_MAX_PDF_PAGES or OCR_MAX_TEXT_CHARS: the whole document goes to the model
+    extractor = LocalTextExtractor(engine_name=None)
+    assert not extractor.sufficient(LocalText(TEXT, "pdf_text", 99.0, pages=20, truncated=True))
+
+
+def test_a_stuck_extraction_does_not_block_later_ones():
+    extractor = LocalTextExtractor(engine_name=ENGINE, workers=1, timeout=2.0)
+
+    async def run():
+        stuck = await extractor.extract(png(1), "image/png")
+        started = time.monotonic()
+        local_text = await extractor.extract(png(10), "image/png")
+        return stuck, local_text, time.monotonic() - started
+
+    try:
+        stuck, local_text, elapsed = asyncio.run(run())
+    finally:
+        extractor.shutdown()
+    assert stuck is None
+    assert local_text is not None and local_text.text == TEXT
+    assert elapsed < 2.0
+    snapshot = extractor.snapshot()
+    assert (snapshot["timeouts"], snapshot["pool_restarts"]) == (1, 1)
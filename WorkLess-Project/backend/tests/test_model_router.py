@@ -0,0 +1,52 @@
+"""
+Model Routing Tests
+The routing decision log, and replaying it under other thresholds
+"""
+
+import asyncio
+import json
+
+from app.services.model_router import FAST_TIER, PRO_TIER, RoutingDecision, RoutingPolicy, RoutingRecorder, replay
+
+
+def decision(confidence: float, tiles: int = 1, escalated: bool = False) -> RoutingDecision:
+    decision = RoutingDecision("user-1", "invoice", FAST_TIER)
+    decision.tiles = tiles
+    for _ in range(tiles):
+        decision.add_attempt(FAST_TIER, "gemini-1.5-flash", 0.5, 1000, 100, overall_confidence=confidence,
+                             min_field_confidence=confidence, fields_extracted=5)
+    if escalated:
+        decision.escalation_reason = "low_overall_confidence"
+        decision.add_attempt(PRO_TIER, "gemini-1.5-pro", 2.0, 1000, 100, overall_confidence=95,
+                             min_field_confidence=95, fields_extracted=5)
+    return decision
+
+
+def test_log_lines_are_written_in_batches_off_the_loop(tmp_path):
+    path = tmp_path / "routing.jsonl"
+    recorder = RoutingRecorder(str(path), batch_size=2)
+
+    async def record():
+        recorder.record(decision(90))
+        # Buffered: nothing written by the event loop itself
+        assert not path.exists()
+        recorder.record(decision(60, escalated=True))
+        recorder.record(decision(95))
+        await asyncio.sleep(0)
+        await recorder.stop()
+
+    asyncio.run(record())
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["escalated"] for line in lines] == [False, True, False]
+    assert len(recorder.recent()) == 3
+
+
+def test_replay_keeps_tiled_pages_as_recorded():
+    entries = [decision(90).to_dict(), decision(60, escalated=True).to_dict(),
+               decision(90, tiles=4, escalated=True).to_dict()]
+    # Stricter thresholds: the 90% single page would now escalate, the tiled page is left alone
+    summary = replay(entries, RoutingPolicy(95, 95))
+    assert summary["documents"] == 3 and summary["not_replayed"] == 1
+    assert summary["escalated"] == 3
+    # Looser thresholds: nothing escalates except the tiled page, as recorded
+    assert replay(entries, RoutingPolicy(50, 50))["escalated"] == 1
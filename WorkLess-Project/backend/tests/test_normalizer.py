@@ -0,0 +1,75 @@
+"""
+Field Normalization Tests
+"""
+
+import pytest
+
+from app.models.schemas import FieldData
+from app.services.normalizer import AMOUNT, IDENTIFIER, FieldNormalizer, field_kind
+
+
+def normalize(name: str, value: str) -> str:
+    fields, _ = FieldNormalizer().normalize([FieldData(field=name, value=value, confidence=90)])
+    return fields[0].value
+
+
+@pytest.mark.parametrize("name, value", [
+    ("Passport Number", "S1234567D"),
+    ("ID Number", "B1234567"),
+    ("Policy No", "Z123456"),
+    ("Reference", "AB-10B2-99"),
+    ("Invoice Number", "INV-2O26-0042"),
+    ("Tax ID", "12.345.678"),
+])
+def test_identifiers_pass_through_unchanged(name, value):
+    assert normalize(name, value) == value
+
+
+def test_identifier_spacing_is_collapsed():
+    assert normalize("IBAN", "de89 3704 0044 0532 0130 00") == "DE89370400440532013000"
+
+
+@pytest.mark.parametrize("name, value, expected", [
+    ("Invoice Date", "2O26-01-05", "2026-01-05"),
+    ("Total", "1,2S0.00", "1250.00"),
+    ("Phone", "+1 (555) 0l2-3456", "+15550123456"),
+])
+def test_ocr_digit_confusions_fixed_for_numeric_kinds(name, value, expected):
+    assert normalize(name, value) == expected
+
+
+def test_ocr_fix_is_dropped_when_the_value_still_does_not_parse():
+    assert normalize("Due Date", "SO 1I") == "SO 1I"
+
+
+@pytest.mark.parametrize("name, kind", [
+    ("Account Balance", AMOUNT),
+    ("Amount Due", AMOUNT),
+    ("Account Number", IDENTIFIER),
+    ("Tax ID", IDENTIFIER),
+    ("GST Number", IDENTIFIER),
+])
+def test_field_kind(name, kind):
+    assert field_kind(name) == kind
+
+
+def test_amounts_are_standardized():
+    assert normalize("Account Balance", "US$1,234.50") == "1234.50 USD"
+    assert normalize("Total", "(45.00)") == "-45.00"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("$1,234.50", "1234.50"),
+    ("¥12,000", "12000"),
+    ("12.50 dollars", "12.50"),
+    ("€12,50", "12.50 EUR"),
+    ("£12.50", "12.50 GBP"),
+    ("12.50 CAD", "12.50 CAD"),
+])
+def test_currency_code_only_for_unambiguous_markers(value, expected):
+    assert normalize("Total", value) == expected
+
+
+def test_bare_symbol_in_currency_field_is_kept():
+    assert normalize("Currency", "$") == "$"
+    assert normalize("Currency", "usd") == "USD"
@@ -0,0 +1,130 @@
+"""
+Page Tiling Tests
+Which pages are tiled, and how fields read in overlapping tiles are merged
+"""
+
+import asyncio
+import io
+import time
+from unittest.mock import patch
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from app.core.config import settings
+from app.models.schemas import FieldData
+from app.services.fake_backends import FakeGenerativeModel, LatencyModel
+from app.services.gemini_service import GeminiService
+from app.services.page_tiling import PagePlan, PageTiler, TileMerger
+from app.services.resilience import CircuitBreaker, ResilientCaller
+from app.services.response_parser import ParsedModelResponse
+
+A4_300_DPI = (2480, 3508)
+
+
+def printed_page(size, line_spacing: int = 12, rows: float = 1.0) -> Image.Image:
+    """A page covered in small print, every ``line_spacing`` pixels over the top ``rows`` share"""
+    line = Image.new("L", (200, 14), 255)
+    ImageDraw.Draw(line).text((0, 2), "QTY ITEM 12.50 USD", fill=0)
+    image = Image.new("L", size, 255)
+    for y in range(60, int((size[1] - 80) * rows), line_spacing):
+        for x in range(60, size[0] - 260, 200):
+            image.paste(line, (x, y))
+    return image
+
+
+def phone_photo() -> Image.Image:
+    """A 12MP photo: a lit, grainy table with a small receipt on it"""
+    size = (4032, 3024)
+    table = Image.linear_gradient("L").resize(size).point(lambda v: 90 + v * 80 // 255)
+    image = Image.blend(table, Image.effect_noise(size, 12), 0.25)
+    image.paste(printed_page((700, 1800), line_spacing=28), (1600, 600))
+    return image.filter(ImageFilter.GaussianBlur(1.2))
+
+
+def test_densely_printed_scan_is_tiled():
+    plan = PageTiler().plan(printed_page(A4_300_DPI))
+    assert plan.tiled and len(plan.tiles) <= 6
+
+
+def test_sparse_scan_is_sent_whole():
+    plan = PageTiler().plan(printed_page(A4_300_DPI, line_spacing=120, rows=0.5))
+    assert not plan.tiled and plan.edge_density is not None
+
+
+def test_phone_photo_is_sent_whole():
+    plan = PageTiler().plan(phone_photo())
+    assert not plan.tiled
+
+
+def test_small_page_is_not_measured():
+    plan = PageTiler().plan(printed_page((1200, 1600)))
+    assert not plan.tiled and plan.edge_density is None
+
+
+def side_by_side() -> PagePlan:
+    # Two columns overlapping by 200 pixels
+    return PagePlan(2800, 1400, (0, 0, 2800, 1400), tiles=[(0, 0, 1500, 1400), (1300, 0, 2800, 1400)])
+
+
+def stacked() -> PagePlan:
+    return PagePlan(1400, 2800, (0, 0, 1400, 2800), tiles=[(0, 0, 1400, 1500), (0, 1300, 1400, 2800)])
+
+
+def response(*fields) -> ParsedModelResponse:
+    return ParsedModelResponse(
+        [FieldData(field=name, value=value, confidence=confidence) for name, value, confidence in fields],
+        [],
+        None,
+        None
+    )
+
+
+def test_value_cut_at_the_tile_edge_is_merged_into_the_complete_reading():
+    merger = TileMerger(side_by_side())
+    merger.add(0, response(("Invoice Number", "INV-10", 90)), "")
+    merger.add(1, response(("Invoice Number", "INV-1042", 80)), "")
+    assert [field.value for field in merger.fields()] == ["INV-1042"]
+
+
+def test_value_contained_in_another_is_a_different_field():
+    # The left tile's right edge can only cut off a value's end, the right
+    # tile's left edge only its start
+    merger = TileMerger(side_by_side())
+    merger.add(0, response(("Amount", "5.00", 90), ("Tax", "15.00", 90)), "")
+    merger.add(1, response(("Amount", "15.00", 90), ("Tax", "15.0", 90)), "")
+    assert sorted(field.value for field in merger.fields()) == ["15.0", "15.00", "15.00", "5.00"]
+
+
+def test_rows_of_tiles_only_cut_between_words():
+    merger = TileMerger(stacked())
+    merger.add(0, response(("Amount", "15.00", 90), ("Address", "1 Main Street", 90)), "")
+    merger.add(1, response(("Amount", "5.00", 90), ("Address", "1 Main Street Springfield", 85)), "")
+    assert sorted(field.value for field in merger.fields()) == ["1 Main Street Springfield", "15.00", "5.00"]
+
+
+def test_misread_long_values_are_merged_but_short_ones_are_not():
+    merger = TileMerger(side_by_side())
+    merger.add(0, response(("Reference", "ACCT-88213-XQ", 70), ("Total", "12.50", 90)), "")
+    merger.add(1, response(("Reference", "ACCT-88218-XQ", 95), ("Total", "12.58", 90)), "")
+    assert sorted(field.value for field in merger.fields()) == ["12.50", "12.58", "ACCT-88218-XQ"]
+
+
+def test_half_open_circuit_lets_a_tiled_stream_probe():
+    service = GeminiService()
+    breaker = CircuitBreaker("tiles", failure_threshold=1, recovery_timeout=0.01)
+    for name in (settings.GEMINI_MODEL, settings.GEMINI_FAST_MODEL):
+        service._models[name] = FakeGenerativeModel(name, LatencyModel(1, sigma=0))
+        service._callers[name] = ResilientCaller(name, breaker=breaker)
+    breaker.record_failure()
+    time.sleep(0.02)
+    buffer = io.BytesIO()
+    printed_page(A4_300_DPI).save(buffer, "PNG")
+
+    async def stream():
+        return [event async for event in service.stream_document(buffer.getvalue(), "image/png")]
+
+    with patch.object(settings, "TILING_MAX_CONCURRENCY", 1):
+        result = asyncio.run(stream())[-1]["data"]
+    # Served by the model rather than the fallback, and the probe closed the circuit
+    assert result["model"] is not None
+    assert breaker.state == CircuitBreaker.CLOSED
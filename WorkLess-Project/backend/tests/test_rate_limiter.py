@@ -0,0 +1,53 @@
+"""
+Rate Limiter Tests
+Token buckets per process and shared by the workers of a host
+"""
+
+import sqlite3
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware.rate_limiter import MemoryTokenBuckets, RateLimitMiddleware, SharedTokenBuckets
+
+
+def client(shared: bool, calls: int = 2) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, calls=calls, period=60, shared=shared)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_memory_buckets_refuse_past_the_limit():
+    buckets = MemoryTokenBuckets(calls=2, period=60)
+    assert [buckets.take("ip:a") for _ in range(3)] == [(True, 1), (True, 0), (False, 0)]
+    assert buckets.take("ip:b") == (True, 1)
+
+
+def test_shared_buckets_enforce_one_limit_across_workers():
+    # Two workers of the host share DATA_DIR/shared.db
+    first, second = SharedTokenBuckets(calls=3, period=60), SharedTokenBuckets(calls=3, period=60)
+    outcomes = [bucket.take("ip:shared-limit")[0] for bucket in (first, second, first, second)]
+    assert outcomes == [True, True, True, False]
+
+
+def test_middleware_answers_429_with_headers():
+    with client(shared=True) as http:
+        responses = [http.get("/ping", headers={"X-Forwarded-For": "203.0.113.9"}) for _ in range(3)]
+    assert [response.status_code for response in responses] == [200, 200, 429]
+    assert responses[0].headers["X-RateLimit-Remaining"] == "1"
+    assert responses[2].headers["Retry-After"] == "60"
+
+
+def test_locked_database_lets_requests_through(monkeypatch):
+    def locked(self, client_id):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(SharedTokenBuckets, "_take", locked)
+    with client(shared=True, calls=1) as http:
+        statuses = [http.get("/ping", headers={"X-Forwarded-For": "203.0.113.10"}).status_code for _ in range(3)]
+    assert statuses == [200, 200, 200]
@@ -0,0 +1,236 @@
+"""
+Resilience Tests
+ResilientCaller and CircuitBreaker against the fake model with injected
+latency and errors
+"""
+
+import asyncio
+import io
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+from app.core.config import settings
+from app.services.fake_backends import FakeGenerativeModel, LatencyModel, ServiceUnavailable
+from app.services.gemini_service import GeminiService
+from app.services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceededError,
+    ResilientCaller,
+    UpstreamError,
+)
+
+PROMPT = ["Extract the fields"]
+
+
+class CountingModel(FakeGenerativeModel):
+    """Fake model that counts its calls and stops failing after ``failures`` of them"""
+
+    def __init__(self, latency_ms: float = 1, error_rate: float = 0.0, failures: int = -1):
+        super().__init__(settings.GEMINI_MODEL, LatencyModel(latency_ms, sigma=0), error_rate=error_rate)
+        self.calls = 0
+        self.failures = failures
+
+    def generate_content(self, content_parts, generation_config=None, stream: bool = False):
+        self.calls += 1
+        if self.calls > self.failures >= 0:
+            self.error_rate = 0.0
+        return super().generate_content(content_parts, generation_config, stream)
+
+
+def run_timed(awaitable):
+    """(seconds until ``awaitable`` finished, its exception or None), not counting threads left running"""
+    outcome = {}
+
+    async def run():
+        started = time.monotonic()
+        try:
+            await awaitable
+        except Exception as e:
+            outcome["error"] = e
+        outcome["elapsed"] = time.monotonic() - started
+
+    asyncio.run(run())
+    return outcome["elapsed"], outcome.get("error")
+
+
+def caller(**kwargs) -> ResilientCaller:
+    options = {"deadline": 5.0, "attempt_timeout": 2.0, "max_retries": 2, "base_delay": 0.001, "max_delay": 0.01}
+    options.update(kwargs)
+    return ResilientCaller("test", **options)
+
+
+def test_retryable_errors_are_retried():
+    model = CountingModel(error_rate=1.0, failures=2)
+    response = asyncio.run(caller().call(model.generate_content, PROMPT))
+    assert model.calls == 3
+    assert "fields" in response.text
+
+
+def test_retries_are_bounded():
+    model = CountingModel(error_rate=1.0)
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(caller(max_retries=2).call(model.generate_content, PROMPT))
+    assert isinstance(error.value.__cause__, ServiceUnavailable)
+    assert model.calls == 3
+
+
+def test_non_retryable_errors_are_not_retried():
+    calls = []
+
+    def bad_request(*args):
+        calls.append(args)
+        raise ValueError("400 invalid argument")
+
+    resilient = caller(breaker=CircuitBreaker("test", failure_threshold=1))
+    with pytest.raises(ValueError):
+        asyncio.run(resilient.call(bad_request, PROMPT))
+    assert len(calls) == 1
+    # The upstream answered: not an outage
+    assert resilient.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_attempt_timeout():
+    model = CountingModel(latency_ms=300)
+    elapsed, error = run_timed(caller(attempt_timeout=0.05, max_retries=0).call(model.generate_content, PROMPT))
+    assert isinstance(error, DeadlineExceededError)
+    assert elapsed < 0.2
+
+
+def test_total_deadline_bounds_retries():
+    model = CountingModel(latency_ms=300)
+    elapsed, error = run_timed(
+        caller(deadline=0.2, attempt_timeout=0.05, max_retries=50).call(model.generate_content, PROMPT)
+    )
+    assert isinstance(error, DeadlineExceededError)
+    assert 0.15 <= elapsed < 0.35
+    assert 2 <= model.calls < 10
+
+
+def test_hedge_fires_past_the_latency_percentile():
+    slow, fast = CountingModel(latency_ms=500), CountingModel(latency_ms=5)
+    models = iter([slow, fast])
+
+    def call(parts):
+        return next(models).generate_content(parts)
+
+    resilient = caller(hedge_enabled=True, hedge_percentile=95, hedge_min_samples=5)
+    for _ in range(5):
+        resilient.latencies.add(0.02)
+    elapsed, error = run_timed(resilient.call(call, PROMPT))
+    assert error is None and elapsed < 0.3
+    assert (resilient.hedges_sent, resilient.hedges_won) == (1, 1)
+    assert (slow.calls, fast.calls) == (1, 1)
+
+
+def test_no_hedge_without_enough_samples():
+    model = CountingModel(latency_ms=50)
+    resilient = caller(hedge_enabled=True, hedge_min_samples=5)
+    resilient.latencies.add(0.001)
+    asyncio.run(resilient.call(model.generate_content, PROMPT))
+    assert resilient.hedges_sent == 0 and model.calls == 1
+
+
+def test_breaker_opens_then_half_opens():
+    model = CountingModel(error_rate=1.0)
+    resilient = caller(max_retries=0, breaker=CircuitBreaker("test", failure_threshold=2, recovery_timeout=0.1))
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            asyncio.run(resilient.call(model.generate_content, PROMPT))
+    assert resilient.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilient.call(model.generate_content, PROMPT))
+    assert model.calls == 2
+
+    time.sleep(0.12)
+    assert resilient.breaker.state == CircuitBreaker.HALF_OPEN
+    model.error_rate = 0.0
+    asyncio.run(resilient.call(model.generate_content, PROMPT))
+    assert resilient.breaker.state == CircuitBreaker.CLOSED
+
+
+def _page() -> bytes:
+    image = Image.new("RGB", (800, 1000), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(50, 950, 20):
+        draw.text((50, y), "Invoice line item 12.50 USD total" * 2, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_open_circuit_serves_the_fallback_until_it_half_opens():
+    service = GeminiService()
+    models = {}
+    for name in (settings.GEMINI_MODEL, settings.GEMINI_FAST_MODEL):
+        models[name] = service._models[name] = CountingModel(error_rate=1.0)
+        service._callers[name] = caller(
+            max_retries=0, breaker=CircuitBreaker(name, failure_threshold=1, recovery_timeout=0.2)
+        )
+    page = _page()
+
+    def process():
+        return asyncio.run(service.process_document(page, "image/png", user_id="resilience-test"))
+
+    with pytest.raises(UpstreamError):
+        process()
+    calls = sum(model.calls for model in models.values())
+
+    # Open: the fallback is served without calling the model
+    fallback = process()
+    assert fallback["model"] is None and fallback["confidence_score"] == 0
+    assert sum(model.calls for model in models.values()) == calls
+
+    # Half-open: a probe goes through and closes the circuit
+    time.sleep(0.25)
+    for model in models.values():
+        model.error_rate = 0.0
+    result = process()
+    assert result["model"] is not None and result["refined_data"]
+    assert service.caller_for(result["model"]).breaker.state == CircuitBreaker.CLOSED
+
+
+class CountedStreamModel(CountingModel):
+    """Fake model that counts the chunks its streams have produced"""
+
+    def __init__(self, latency_ms: float):
+        super().__init__(latency_ms=latency_ms)
+        self.chunks = 0
+
+    def _stream(self, text, usage, delay):
+        for chunk in super()._stream(text, usage, delay):
+            self.chunks += 1
+            yield chunk
+
+
+def test_abandoned_stream_stops_its_worker_and_frees_the_probe():
+    service = GeminiService()
+    breaker = CircuitBreaker("stream", failure_threshold=1, recovery_timeout=0.01)
+    models = {}
+    for name in (settings.GEMINI_MODEL, settings.GEMINI_FAST_MODEL):
+        models[name] = service._models[name] = CountedStreamModel(latency_ms=4000)
+        service._callers[name] = caller(breaker=breaker)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    async def disconnect_after_first_field():
+        events = service.stream_document(_page(), "image/png", user_id="resilience-test")
+        first = await events.__anext__()
+        started = time.monotonic()
+        # What StreamingResponse does when the client goes away
+        await events.aclose()
+        return first, time.monotonic() - started
+
+    first, closing = asyncio.run(disconnect_after_first_field())
+    assert first["type"] == "field"
+    assert closing < 0.5
+    # The abandoned probe is free for the next call
+    assert breaker.allow()
+    produced = sum(model.chunks for model in models.values())
+    time.sleep(0.6)
+    # The worker stopped after the chunk it was reading
+    assert sum(model.chunks for model in models.values()) <= produced + 1
@@ -0,0 +1,173 @@
+"""
+Upload Session Tests
+Resumed uploads, chunk writes racing for an offset, and sessions left behind by a lost process
+"""
+
+import asyncio
+import hashlib
+import time
+
+import pytest
+
+from app.api.v1.endpoints import documents
+from app.core.storage import SQLiteStore
+from app.services import job_journal as job_journal_module
+from app.services import upload_sessions as upload_sessions_module
+from app.services.upload_sessions import (
+    COMPLETED,
+    FAILED,
+    MIN_CHUNK_SIZE,
+    OPEN,
+    PROCESSING,
+    UploadSessionError,
+    UploadSessionStore,
+)
+
+CHUNK = b"a" * MIN_CHUNK_SIZE
+OTHER_CHUNK = b"b" * MIN_CHUNK_SIZE
+RESULT = {
+    "raw_text": "Total 12.50",
+    "refined_data": [],
+    "ai_explanation": "",
+    "confidence_score": 90,
+    "formatting_changes": [],
+}
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch) -> UploadSessionStore:
+    sessions = UploadSessionStore(
+        SQLiteStore(":memory:", upload_sessions_module.SCHEMA),
+        str(tmp_path / "sessions"),
+        max_file_size=4 * MIN_CHUNK_SIZE,
+        chunk_size=MIN_CHUNK_SIZE,
+        max_chunk_size=MIN_CHUNK_SIZE
+    )
+    monkeypatch.setattr(documents, "upload_sessions", sessions)
+    return sessions
+
+
+@pytest.fixture
+def journal(monkeypatch) -> job_journal_module.JobJournal:
+    journal = job_journal_module.JobJournal(SQLiteStore(":memory:", job_journal_module.SCHEMA))
+    monkeypatch.setattr(documents, "job_journal", journal)
+    monkeypatch.setattr(documents, "LAUNCH_TIME", time.time() + 60)
+    return journal
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+async def body(*pieces: bytes, gate: asyncio.Event = None):
+    for piece in pieces:
+        yield piece
+        if gate:
+            await gate.wait()
+
+
+def test_chunks_received_in_any_order_are_assembled(sessions):
+    content = CHUNK + OTHER_CHUNK + b"tail"
+    session = sessions.create("user-1", "scan.pdf", "application/pdf", len(content), sha256=sha256(content))
+    pieces = {0: CHUNK, MIN_CHUNK_SIZE: OTHER_CHUNK, 2 * MIN_CHUNK_SIZE: b"tail"}
+    # The connection dropped after the last chunk: only it is stored
+    asyncio.run(sessions.write_chunk(session, 2 * MIN_CHUNK_SIZE, sha256(b"tail"), body(b"tail")))
+    assert sessions.missing_offsets(session) == [0, MIN_CHUNK_SIZE]
+
+    for offset in sessions.missing_offsets(session):
+        asyncio.run(sessions.write_chunk(session, offset, sha256(pieces[offset]), body(pieces[offset])))
+    assert sessions.missing_offsets(session) == []
+    assert sessions.claim(session) and not sessions.claim(session)
+    assert sessions.assemble(session) == content
+
+    sessions.complete(session, "{}")
+    assert sessions.get(session.session_id).status == COMPLETED
+    with pytest.raises(UploadSessionError) as refused:
+        asyncio.run(sessions.write_chunk(session, 0, sha256(CHUNK), body(CHUNK)))
+    assert refused.value.status_code == 409
+
+
+def test_file_not_matching_its_checksum_is_reopened(sessions):
+    session = sessions.create("user-1", "scan.pdf", "application/pdf", MIN_CHUNK_SIZE, sha256=sha256(OTHER_CHUNK))
+    asyncio.run(sessions.write_chunk(session, 0, sha256(CHUNK), body(CHUNK)))
+    assert sessions.claim(session)
+    with pytest.raises(UploadSessionError) as refused:
+        sessions.assemble(session)
+    assert refused.value.status_code == 422
+    assert sessions.get(session.session_id).status == OPEN
+    assert sessions.missing_offsets(session) == [0]
+
+
+def test_oversized_upload_is_refused(sessions):
+    with pytest.raises(UploadSessionError) as refused:
+        sessions.create("user-1", "scan.pdf", "application/pdf", 5 * MIN_CHUNK_SIZE)
+    assert refused.value.status_code == 413
+
+
+def test_concurrent_writes_to_one_offset_are_refused(sessions):
+    session = sessions.create("user-1", "scan.pdf", "application/pdf", 2 * MIN_CHUNK_SIZE)
+    half = MIN_CHUNK_SIZE // 2
+
+    async def race():
+        gate = asyncio.Event()
+        first = asyncio.create_task(
+            sessions.write_chunk(session, 0, sha256(CHUNK), body(CHUNK[:half], CHUNK[half:], gate=gate))
+        )
+        await asyncio.sleep(0)
+        # The first request is half-way through writing the region
+        with pytest.raises(UploadSessionError) as refused:
+            await sessions.write_chunk(session, 0, sha256(OTHER_CHUNK), body(OTHER_CHUNK))
+        gate.set()
+        return await first, refused.value.status_code
+
+    stored, status_code = asyncio.run(race())
+    assert stored and status_code == 409
+    assert sessions.received(session.session_id) == {0: sha256(CHUNK)}
+    assert sessions.part_path(session.session_id).read_bytes()[:MIN_CHUNK_SIZE] == CHUNK
+
+
+def test_failed_write_releases_its_offset(sessions):
+    session = sessions.create("user-1", "scan.pdf", "application/pdf", 2 * MIN_CHUNK_SIZE)
+    with pytest.raises(UploadSessionError):
+        asyncio.run(sessions.write_chunk(session, 0, sha256(OTHER_CHUNK), body(CHUNK)))
+    assert sessions.missing_offsets(session) == [0, MIN_CHUNK_SIZE]
+    assert asyncio.run(sessions.write_chunk(session, 0, sha256(CHUNK), body(CHUNK)))
+    # A retry of a recorded chunk is not read again
+    assert not asyncio.run(sessions.write_chunk(session, 0, sha256(CHUNK), body()))
+
+
+def claimed_session(sessions: UploadSessionStore, promoted: bool = False):
+    session = sessions.create("user-1", "scan.pdf", "application/pdf", MIN_CHUNK_SIZE)
+    asyncio.run(sessions.write_chunk(session, 0, sha256(CHUNK), body(CHUNK)))
+    assert sessions.claim(session)
+    if promoted:
+        sessions.promote(session, sessions.directory / "scan.pdf")
+    return session
+
+
+def test_replayed_job_settles_its_upload_session(sessions, journal):
+    completed, abandoned = claimed_session(sessions), claimed_session(sessions, promoted=True)
+    job_id = journal.start("user-1", "/nonexistent/scan.pdf", "scan.pdf", "application/pdf",
+                           session_id=completed.session_id)
+    journal.checkpoint(job_id, RESULT)
+    # Its upload is gone: the scan is failed
+    journal.start("user-1", "/nonexistent/scan.pdf", "scan.pdf", "application/pdf",
+                  session_id=abandoned.session_id)
+
+    asyncio.run(documents._replay_journal())
+    assert journal.pending() == []
+    assert sessions.get(completed.session_id).status == COMPLETED
+    assert sessions.get(abandoned.session_id).status == FAILED
+
+
+def test_sessions_held_by_a_lost_process_are_released(sessions, journal):
+    assembling, promoted, journaled = (
+        claimed_session(sessions), claimed_session(sessions, promoted=True), claimed_session(sessions)
+    )
+    journal.start("user-1", "/nonexistent/scan.pdf", "scan.pdf", "application/pdf",
+                  session_id=journaled.session_id)
+    assert documents.release_lost_uploads() == 2
+    assert sessions.get(assembling.session_id).status == OPEN
+    assert sessions.get(promoted.session_id).status == FAILED
+    # Left for the journal replay to settle
+    assert sessions.get(journaled.session_id).status == PROCESSING
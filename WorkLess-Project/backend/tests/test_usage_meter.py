@@ -0,0 +1,69 @@
+"""
+Usage Meter Tests
+Accumulated usage, its flushes, and daily token budgets by tier
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import documents
+from app.core.storage import SQLiteStore
+from app.services.usage_meter import SCHEMA, UsageMeter
+
+
+@pytest.fixture
+def meter(tmp_path) -> UsageMeter:
+    return UsageMeter(SQLiteStore(str(tmp_path / "usage.db"), SCHEMA), daily_token_budgets={"basic": 1000, "pro": 0})
+
+
+def test_flush_adds_to_the_stored_totals(meter):
+    meter.record("user-1", "basic", "Invoice", "gemini-2.5-flash", prompt_tokens=300, output_tokens=100)
+    meter.record("user-1", "basic", "invoice", "gemini-2.5-flash", prompt_tokens=200, output_tokens=50)
+    meter.record("user-1", "basic", "invoice", "gemini-2.5-flash", cached=True)
+    assert meter.flush() == 1
+    assert meter.flush() == 0
+
+    (row,) = meter.store.query("SELECT * FROM usage_daily")
+    assert (row["document_type"], row["calls"], row["cached"]) == ("invoice", 2, 1)
+    assert (row["prompt_tokens"], row["output_tokens"]) == (500, 150)
+
+
+def test_budget_counts_unflushed_and_stored_tokens(meter):
+    meter.record("user-1", "basic", "invoice", "gemini-2.5-flash", prompt_tokens=600)
+    assert not meter.over_budget("user-1", "basic")
+    meter.flush()
+    meter.record("user-1", "basic", "invoice", "gemini-2.5-flash", prompt_tokens=300, output_tokens=100)
+    assert meter.tokens_today("user-1") == 1000
+    assert meter.over_budget("user-1", "basic")
+    # Budgets are per user, and 0 means unlimited
+    assert not meter.over_budget("user-2", "basic")
+    assert not meter.over_budget("user-1", "pro")
+
+
+def test_budgets_are_shared_by_the_workers_of_a_host(meter):
+    other_worker = UsageMeter(meter.store, flush_interval=0, daily_token_budgets=meter.daily_token_budgets)
+    meter.record("user-1", "basic", "invoice", "gemini-2.5-flash", prompt_tokens=1200)
+    assert not other_worker.over_budget("user-1", "basic")
+    meter.flush()
+    assert other_worker.over_budget("user-1", "basic")
+
+
+def test_unreadable_usage_does_not_block_requests(meter, monkeypatch):
+    def locked(*args, **kwargs):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(meter.store, "query", locked)
+    assert not meter.over_budget("user-1", "basic")
+
+
+def test_exhausted_budget_answers_429(meter, monkeypatch):
+    monkeypatch.setattr(documents, "supabase_service", None)
+    monkeypatch.setattr(documents, "usage_meter", meter)
+    meter.record("user-1", "basic", "invoice", "gemini-2.5-flash", prompt_tokens=1000)
+
+    with pytest.raises(HTTPException) as refused:
+        asyncio.run(documents.check_scan_limit("user-1"))
+    assert refused.value.status_code == 429
+    assert asyncio.run(documents.check_scan_limit("user-2")) is None
@@ -0,0 +1,151 @@
+"""
+Webhook Tests
+Callback deliveries, their signatures and retries, and the addresses they are allowed to reach
+"""
+
+import asyncio
+import hashlib
+import hmac
+import socket
+import time
+
+import httpx
+import pytest
+
+from app.core.storage import SQLiteStore
+from app.models.schemas import ProcessingStatus
+from app.services.webhooks import DEAD, PENDING, SCHEMA, SIGNATURE_HEADER, WebhookDispatcher
+
+URL = "https://hooks.example.com/callbacks"
+
+
+@pytest.fixture
+def dispatcher() -> WebhookDispatcher:
+    dispatcher = WebhookDispatcher(SQLiteStore(":memory:", SCHEMA), max_attempts=3)
+    dispatcher.register("user-1", URL, [ProcessingStatus.COMPLETED.value])
+    return dispatcher
+
+
+def deliver(dispatcher: WebhookDispatcher, handler) -> None:
+    """Claim the due deliveries and send them to ``handler``"""
+    async def run():
+        dispatcher._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        rows, _ = dispatcher._claim(10)
+        await asyncio.gather(*(dispatcher._deliver(row) for row in rows))
+        await dispatcher._client.aclose()
+
+    asyncio.run(run())
+
+
+def resolving(monkeypatch, *answers: str) -> list:
+    """Make host lookups answer each address in turn (the last one from then on)"""
+    lookups = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        lookups.append(host)
+        address = answers[min(len(lookups), len(answers)) - 1]
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    return lookups
+
+
+def test_delivery_connects_to_the_address_that_was_checked(dispatcher, monkeypatch):
+    # A rebinding receiver: public for the check, loopback for any later lookup
+    lookups = resolving(monkeypatch, "93.184.216.34", "127.0.0.1")
+    requests = []
+    dispatcher.enqueue("user-1", ProcessingStatus.COMPLETED, scan_id="scan-1")
+    deliver(dispatcher, lambda request: requests.append(request) or httpx.Response(204))
+
+    assert lookups == ["hooks.example.com"]
+    (request,) = requests
+    assert request.url.host == "93.184.216.34"
+    assert request.headers["Host"] == "hooks.example.com"
+    assert request.extensions["sni_hostname"] == "hooks.example.com"
+    assert dispatcher.snapshot()["delivered"] == 1
+
+
+def test_host_resolving_to_a_private_address_is_not_called(dispatcher, monkeypatch):
+    resolving(monkeypatch, "10.0.0.5")
+    requests = []
+    dispatcher.enqueue("user-1", ProcessingStatus.COMPLETED, scan_id="scan-1")
+    deliver(dispatcher, lambda request: requests.append(request) or httpx.Response(204))
+
+    assert requests == []
+    row = dispatcher.store.query("SELECT status, last_error FROM deliveries")[0]
+    assert row["status"] == DEAD and "non-public" in row["last_error"]
+
+
+def delivery(dispatcher: WebhookDispatcher) -> dict:
+    return dict(dispatcher.store.query("SELECT status, attempts, next_attempt_at, last_error FROM deliveries")[0])
+
+
+def make_due(dispatcher: WebhookDispatcher) -> None:
+    dispatcher.store.execute("UPDATE deliveries SET next_attempt_at = 0")
+
+
+def test_receiver_can_verify_the_signature(dispatcher):
+    requests = []
+    dispatcher.enqueue("user-1", ProcessingStatus.COMPLETED, scan_id="scan-1")
+    dispatcher.allow_insecure = True
+    deliver(dispatcher, lambda request: requests.append(request) or httpx.Response(200))
+
+    (request,) = requests
+    timestamp, signature = (part.split("=", 1)[1] for part in request.headers[SIGNATURE_HEADER].split(","))
+    secret = dispatcher.get("user-1").secret
+    expected = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("ascii") + request.content, hashlib.sha256)
+    assert hmac.compare_digest(signature, expected.hexdigest())
+    assert abs(int(timestamp) - time.time()) < 60
+    assert request.headers["X-WorkLess-Event"] == "scan.completed"
+
+
+def test_server_errors_are_retried_until_max_attempts(dispatcher):
+    dispatcher.allow_insecure = True
+    dispatcher.enqueue("user-1", ProcessingStatus.COMPLETED, scan_id="scan-1")
+    deliver(dispatcher, lambda request: httpx.Response(503))
+    first = delivery(dispatcher)
+    assert (first["status"], first["attempts"], first["last_error"]) == (PENDING, 1, "HTTP 503")
+    assert first["next_attempt_at"] > time.time()
+
+    # Not due yet: nothing is sent before the backoff
+    requests = []
+    deliver(dispatcher, lambda request: requests.append(request) or httpx.Response(503))
+    assert requests == []
+
+    for _ in range(2):
+        make_due(dispatcher)
+        deliver(dispatcher, lambda request: httpx.Response(503))
+    assert (delivery(dispatcher)["status"], delivery(dispatcher)["attempts"]) == (DEAD, 3)
+    assert dispatcher.snapshot()["dead"] == 1
+
+
+def test_retry_after_is_honoured(dispatcher):
+    dispatcher.allow_insecure = True
+    dispatcher.enqueue("user-1", ProcessingStatus.COMPLETED, scan_id="scan-1")
+    deliver(dispatcher, lambda request: httpx.Response(429, headers={"Retry-After": "600"}))
+    row = delivery(dispatcher)
+    assert row["status"] == PENDING and row["next_attempt_at"] >= time.time() + 590
+
+
+def test_retry_succeeds_and_removes_the_delivery(dispatcher):
+    dispatcher.allow_insecure = True
+    dispatcher.enqueue("user-1", ProcessingStatus.COMPLETED, scan_id="scan-1")
+    deliver(dispatcher, lambda request: httpx.Response(502))
+    make_due(dispatcher)
+    deliver(dispatcher, lambda request: httpx.Response(204))
+    assert dispatcher.store.query("SELECT * FROM deliveries") == []
+    assert dispatcher.snapshot()["delivered"] == 1
+
+
+def test_client_errors_are_final(dispatcher):
+    dispatcher.allow_insecure = True
+    dispatcher.enqueue("user-1", ProcessingStatus.COMPLETED, scan_id="scan-1")
+    deliver(dispatcher, lambda request: httpx.Response(400))
+    row = delivery(dispatcher)
+    assert (row["status"], row["attempts"], row["last_error"]) == (DEAD, 1, "HTTP 400")
+
+
+def test_unregistered_events_are_not_queued(dispatcher):
+    assert dispatcher.enqueue("user-1", ProcessingStatus.FAILED, scan_id="scan-1") is None
+    assert dispatcher.enqueue("user-2", ProcessingStatus.COMPLETED, scan_id="scan-1") is None
+    assert dispatcher.store.query("SELECT * FROM deliveries") == []
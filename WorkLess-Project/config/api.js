@@ -6,6 +6,12 @@ export const API_CONFIG = {
   ENDPOINTS: {
     // Backend route: /v1/documents/process-document
     PROCESS_DOCUMENT: '/v1/documents/process-document',
+    // NDJSON stream of fields as they are extracted
+    PROCESS_DOCUMENT_STREAM: '/v1/documents/process-document/stream',
+    // Cursor-paginated scan history (?limit=&cursor=&fields=&status=)
+    SCAN_HISTORY: '/v1/documents/scans',
+    // Admin dashboard rollups (requires an admin user)
+    ADMIN_ANALYTICS: '/v1/admin/analytics',
   },
   // Default headers if needed (e.g., for API keys)
   HEADERS: {
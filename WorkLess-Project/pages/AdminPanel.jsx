@@ -3,6 +3,7 @@ import { Helmet } from 'react-helmet';
 import { motion } from 'framer-motion';
 import { Users, FileText, TrendingUp, Activity } from 'lucide-react';
 import { supabase } from '@/lib/customSupabaseClient';
+import { API_CONFIG } from '@/config/api';
 import Navbar from '@/components/Navbar';
 import StatCard from '@/components/admin/StatCard';
 import UserActivityTable from '@/components/admin/UserActivityTable';
@@ -24,28 +25,18 @@ const AdminPanel = () => {
 
   const fetchAdminData = async () => {
     try {
-      // Fetch total users
-      const { count: userCount } = await supabase
-        .from('users_metadata')
-        .select('*', { count: 'exact', head: true });
-
-      // Fetch total scans
-      const { count: scanCount } = await supabase
-        .from('scans')
-        .select('*', { count: 'exact', head: true });
-
-      // Fetch pro users
-      const { count: proCount } = await supabase
-        .from('users_metadata')
-        .select('*', { count: 'exact', head: true })
-        .eq('subscription_tier', 'pro');
-
-      // Fetch today's active users
-      const today = new Date().toISOString().split('T')[0];
-      const { count: activeCount } = await supabase
-        .from('users_metadata')
-        .select('*', { count: 'exact', head: true })
-        .eq('last_scan_date', today);
+      // Fetch precomputed analytics rollups from the backend
+      const { data: { session } } = await supabase.auth.getSession();
+      const response = await fetch(`${API_CONFIG.BASE_URL}${API_CONFIG.ENDPOINTS.ADMIN_ANALYTICS}?days=7`, {
+        headers: {
+          ...API_CONFIG.HEADERS,
+          ...(session ? { 'Authorization': `Bearer ${session.access_token}` } : {})
+        }
+      });
+      if (!response.ok) {
+        throw new Error(`Analytics request failed: ${response.status}`);
+      }
+      const analytics = await response.json();
 
       // Fetch recent scans with user info
       const { data: recentScans } = await supabase
@@ -57,30 +48,21 @@ const AdminPanel = () => {
         .order('created_at', { ascending: false })
         .limit(20);
 
-      // Fetch daily scan data for chart
-      const { data: dailyScans } = await supabase
-        .from('scans')
-        .select('created_at')
-        .gte('created_at', new Date(Date.now() - 7 * 24 * 60 * 60 * 1000).toISOString());
-
       setStats({
-        totalUsers: userCount || 0,
-        totalScans: scanCount || 0,
-        activeToday: activeCount || 0,
-        proUsers: proCount || 0
+        totalUsers: analytics.total_users || 0,
+        totalScans: analytics.total_scans || 0,
+        activeToday: analytics.active_today || 0,
+        proUsers: analytics.tier_counts?.pro || 0
       });
 
       setRecentActivity(recentScans || []);
 
-      // Process chart data
-      const scansByDay = {};
-      dailyScans?.forEach(scan => {
-        const day = new Date(scan.created_at).toLocaleDateString('en-US', { month: 'short', day: 'numeric' });
-        scansByDay[day] = (scansByDay[day] || 0) + 1;
-      });
-
+      // Daily buckets are UTC dates (YYYY-MM-DD)
       setChartData(
-        Object.entries(scansByDay).map(([day, count]) => ({ day, scans: count }))
+        (analytics.daily || []).map(bucket => ({
+          day: new Date(`${bucket.bucket}T00:00:00Z`).toLocaleDateString('en-US', { month: 'short', day: 'numeric', timeZone: 'UTC' }),
+          scans: bucket.scans
+        }))
       );
     } catch (error) {
       console.error('Error fetching admin data:', error);
@@ -54,15 +54,23 @@ const Dashboard = () => {
   const fetchRecentScans = async () => {
     if (!user) return;
 
-    const { data, error } = await supabase
-      .from('scans')
-      .select('*')
-      .eq('user_id', user.id)
-      .order('created_at', { ascending: false })
-      .limit(10);
+    try {
+      // Paginated history API; only the fields the list renders
+      const { data: { session } } = await supabase.auth.getSession();
+      const params = new URLSearchParams({ limit: '10', fields: 'file_name,status' });
+      const response = await fetch(`${API_CONFIG.BASE_URL}${API_CONFIG.ENDPOINTS.SCAN_HISTORY}?${params}`, {
+        headers: {
+          ...API_CONFIG.HEADERS,
+          ...(session ? { 'Authorization': `Bearer ${session.access_token}` } : {})
+        }
+      });
 
-    if (!error) {
-      setRecentScans(data || []);
+      if (response.ok) {
+        const page = await response.json();
+        setRecentScans(page.items || []);
+      }
+    } catch (error) {
+      console.error('Error fetching recent scans:', error);
     }
   };
 